@@ -16,7 +16,7 @@ def create_app():
     
     Configura:
         - Extensiones (SQLAlchemy, Flask-Login, CSRF, Bcrypt)
-        - Blueprints (auth, admin, profesional, paciente)
+        - Blueprints (auth, admin, profesional, paciente, videos)
         - Filtros de plantilla personalizados
         - Base de datos
     
@@ -35,11 +35,13 @@ def create_app():
     from src.controladores.admin_controlador import admin_bp
     from src.controladores.profesional_controlador import profesional_bp
     from src.controladores.paciente_controlador import paciente_bp
+    from src.controladores.videos_controlador import videos_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(profesional_bp, url_prefix='/profesional')
     app.register_blueprint(paciente_bp, url_prefix='/paciente')
+    app.register_blueprint(videos_bp)
 
     # Filtro para formatear fechas
     @app.template_filter('datetimeformat')
@@ -84,6 +86,24 @@ def create_app():
         if minutos > 0:
             return f"{minutos}m {resto}s"
         return f"{resto}s"
+
+    # Filtro para mostrar tamaños de almacenamiento (bytes -> "1.5 GB")
+    @app.template_filter('tamano_legible')
+    def tamano_legible(num_bytes):
+        """
+        Filtro Jinja2 para convertir bytes a una unidad legible.
+        
+        Args:
+            num_bytes: Tamaño en bytes (int o None)
+            
+        Returns:
+            str: Tamaño formateado (ej. "512 KB" o "1.5 GB")
+        """
+        tamano = float(num_bytes or 0)
+        for unidad in ('B', 'KB', 'MB', 'GB'):
+            if tamano < 1024 or unidad == 'GB':
+                return f"{tamano:.0f} {unidad}" if unidad in ('B', 'KB') else f"{tamano:.1f} {unidad}"
+            tamano /= 1024
     
 
     # Crear tablas si no existen
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del camino de E/S de un almacén de vídeos.
+
+Mide, sobre el almacén indicado por URL (por defecto uno local en un
+directorio temporal), el guardado de vídeos desde un stream, la lectura
+completa y las lecturas por rangos que hace un reproductor al avanzar.
+
+Uso:
+    python benchmarks/bench_almacenamiento.py [num_videos] [tam_mb] [url_almacen]
+
+    url_almacen: local://<subcarpeta> (por defecto) o cloudinary://<carpeta>
+                 (requiere las credenciales CLOUDINARY_* en el entorno)
+"""
+
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from src.servicios.almacenamiento import crear_almacen
+
+TAM_RANGO = 256 * 1024
+
+
+def medir(almacen, num_videos, tam_mb):
+    """Devuelve MB/s de escritura, lectura completa y lectura por rangos."""
+    datos = os.urandom(tam_mb * 1024 * 1024)
+    claves = [f'bench_{i}.mp4' for i in range(num_videos)]
+
+    inicio = time.perf_counter()
+    for clave in claves:
+        almacen.guardar(clave, io.BytesIO(datos))
+    escritura = num_videos * tam_mb / (time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    for clave in claves:
+        with almacen.abrir(clave) as f:
+            while f.read(1024 * 1024):
+                pass
+    lectura = num_videos * tam_mb / (time.perf_counter() - inicio)
+
+    rangos = 0
+    inicio = time.perf_counter()
+    for clave in claves:
+        for _ in range(20):
+            desde = random.randrange(0, len(datos) - TAM_RANGO)
+            rangos += len(almacen.leer_rango(clave, desde, desde + TAM_RANGO - 1))
+    por_rangos = rangos / (1024 * 1024) / (time.perf_counter() - inicio)
+
+    for clave in claves:
+        almacen.borrar(clave)
+    return escritura, lectura, por_rangos
+
+
+def main():
+    num_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    tam_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    url = sys.argv[3] if len(sys.argv) > 3 else 'local://bench'
+
+    app = create_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['UPLOAD_FOLDER'] = tmp
+        almacen = crear_almacen(url, app)
+        escritura, lectura, por_rangos = medir(almacen, num_videos, tam_mb)
+
+    print(f'Almacén {url} ({num_videos} vídeos de {tam_mb} MB)')
+    print(f'  guardar:             {escritura:8.1f} MB/s')
+    print(f'  leer completo:       {lectura:8.1f} MB/s')
+    print(f'  leer rangos 256 KB:  {por_rangos:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
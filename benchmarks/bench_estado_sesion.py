@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de GET /profesional/api/sesion/<id>/estado.
+
+Compara peticiones por segundo con la caché de autorización desactivada
+(antes: Sesion.query.get_or_404 + carga del Usuario por Flask-Login en
+cada petición) y activada (ruta caliente sin base de datos).
+
+Uso:
+    python benchmarks/bench_estado_sesion.py [num_peticiones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from src.extensiones import db
+from src.modelos import Usuario, Paciente, Profesional, Sesion
+
+
+def preparar_app(ruta_bd):
+    """Crea la app sobre una BD SQLite en fichero con un paciente y una sesión."""
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{ruta_bd}',
+    )
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        pro = Usuario(Nombre='Pro', Apellidos='Bench', Email='pro@bench.com', Rol_Id=2)
+        pac = Usuario(Nombre='Pac', Apellidos='Bench', Email='pac@bench.com', Rol_Id=1)
+        for u in (pro, pac):
+            u.set_contraseña('bench123')
+        db.session.add_all([pro, pac])
+        db.session.commit()
+        db.session.add(Profesional(Usuario_Id=pro.Id, Especialidad='Fisio', Tipo_Profesional='TERAPEUTA'))
+        db.session.add(Paciente(Usuario_Id=pac.Id, Fecha_Nacimiento=datetime(1950, 1, 1)))
+        sesion = Sesion(Paciente_Id=pac.Id, Profesional_Id=pro.Id, Estado='PENDIENTE',
+                        Fecha_Programada=datetime.now())
+        db.session.add(sesion)
+        db.session.commit()
+        sesion_id = sesion.Id
+    return app, sesion_id
+
+
+def medir(app, sesion_id, num_peticiones, cache):
+    """Devuelve peticiones/segundo del polling de estado de un paciente."""
+    app.config['ESTADO_CACHE_AUTORIZACION'] = cache
+    app.extensions['sesiones_activas'].limpiar()
+    client = app.test_client()
+    client.post('/login', data={'email': 'pac@bench.com', 'password': 'bench123'})
+
+    url = f'/profesional/api/sesion/{sesion_id}/estado'
+    for _ in range(20):  # calentamiento
+        assert client.get(url).status_code == 200
+
+    inicio = time.perf_counter()
+    for _ in range(num_peticiones):
+        client.get(url)
+    return num_peticiones / (time.perf_counter() - inicio)
+
+
+def main():
+    num_peticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sesion_id = preparar_app(os.path.join(tmp, 'bench.db'))
+        antes = medir(app, sesion_id, num_peticiones, cache=False)
+        despues = medir(app, sesion_id, num_peticiones, cache=True)
+        with app.app_context():
+            db.engine.dispose()
+
+    print(f'GET estado_sesion ({num_peticiones} peticiones)')
+    print(f'  sin caché de autorización: {antes:8.0f} req/s')
+    print(f'  con caché de autorización: {despues:8.0f} req/s')
+    print(f'  mejora: x{despues / antes:.2f}')
+
+
+if __name__ == '__main__':
+    main()
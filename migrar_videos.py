@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Migración única de los vídeos de ejercicios al almacenamiento por contenido.
+
+Los vídeos subidos antes se guardaban como ejercicio_<timestamp>.mp4 en un
+único directorio. Este script los copia (con sus versiones y miniaturas) a
+ab/cd/<sha256>.mp4 en el almacén de ejercicios, deduplicando los que sean
+idénticos, apunta a ellos los ejercicios y borra los originales.
+
+Uso:
+    python migrar_videos.py
+
+Se puede volver a ejecutar sin riesgo: los vídeos ya migrados se saltan.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import create_app
+from src.servicios.contenido_videos import migrar_videos_ejercicios
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        resultado = migrar_videos_ejercicios()
+    print(f"Vídeos migrados: {resultado['migrados']}")
+    print(f"Duplicados (ya había uno idéntico): {resultado['duplicados']}")
+    print(f"Sin fichero en el almacén: {resultado['sin_fichero']}")
+
+
+if __name__ == '__main__':
+    main()
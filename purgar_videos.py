@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Purga manual de los vídeos de respuesta caducados.
+
+La aplicación ya la ejecuta periódicamente en cada worker; este script
+permite lanzarla a mano o desde cron (p. ej. con PURGA_VIDEOS_PROGRAMADA
+desactivado) y muestra lo que se borró.
+
+Uso:
+    python purgar_videos.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import create_app
+from src.servicios.purga_videos import dias_retencion, purgar_videos_caducados
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        print(f"Retención de vídeos: {dias_retencion()} días")
+        resultado = purgar_videos_caducados()
+    print(f"Vídeos eliminados: {resultado['videos']}")
+    print(f"Ficheros borrados del almacén: {resultado['ficheros']}")
+    print(f"Vídeos con errores (se reintentarán): {resultado['errores']}")
+
+
+if __name__ == '__main__':
+    main()
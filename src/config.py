@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -21,6 +22,96 @@ class Config:
     # Configuración para uploads de archivos
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'src/static/uploads'
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max
+
+    # Almacén de cada tipo de vídeo (local://<subcarpeta de UPLOAD_FOLDER> o cloudinary://<carpeta>)
+    ALMACEN_EJERCICIOS_URL = os.environ.get('ALMACEN_EJERCICIOS_URL') or 'local://ejercicios'
+    ALMACEN_RESPUESTAS_URL = os.environ.get('ALMACEN_RESPUESTAS_URL') or 'cloudinary://terapitrack/respuestas'
+
+    # Envío de los vídeos de ejercicios por /videos/<nombre>
+    VIDEOS_CACHE_MAX_AGE = 30 * 24 * 3600  # segundos de caché en el navegador (revalida con ETag)
+    VIDEOS_ENVIO = os.environ.get('VIDEOS_ENVIO') or None  # None, 'x-sendfile' o 'x-accel-redirect'
+    VIDEOS_ACCEL_PREFIJO = os.environ.get('VIDEOS_ACCEL_PREFIJO') or '/_videos'  # locations internas de nginx
+    VIDEOS_INDICE_TTL = 300          # segundos entre recorridos del índice de vídeos en disco
+    VIDEOS_INDICE_AUSENTES = 10000   # nombres sin vídeo en disco que recuerda el índice entre recorridos
+
+    # Subida en segundo plano de los vídeos de respuesta a su almacén
+    SUBIDAS_DIRECTORIO = os.environ.get('SUBIDAS_DIRECTORIO') or os.path.join(tempfile.gettempdir(), 'terapitrack_subidas')
+    SUBIDAS_HILOS = 4                # subidas simultáneas por worker
+    SUBIDAS_HISTORIAL = 1000         # trabajos terminados que se recuerdan para consultar su estado
+    SUBIDAS_SEGUNDO_PLANO = True     # grupo de hilos (desactivado en tests)
+    SUBIDAS_TAM_MAXIMO = 500 * 1024 * 1024  # tamaño máximo de una subida reanudable por fragmentos
+    SUBIDAS_PARCIALES_TTL = 24 * 3600       # segundos sin recibir fragmentos antes de descartarla
+    SUBIDAS_TAM_MAXIMO_FICHERO = None       # bytes por fichero de formulario (None: solo MAX_CONTENT_LENGTH)
+    SUBIDAS_ESPACIO_MINIMO = 200 * 1024 * 1024  # espacio libre que debe quedar en disco al recibir
+    SUBIDAS_RECLAMACION_TTL = 3600          # segundos sin noticias de una subida en curso antes de relevarla
+
+    # Procesado en segundo plano de los vídeos de ejercicios nuevos (duración y almacén)
+    PROCESADO_HILOS = 2               # vídeos procesados a la vez por worker (cada uno lanza ffmpeg)
+    PROCESADO_SEGUNDO_PLANO = True    # grupo de hilos (desactivado en tests)
+
+    # Versiones transcodificadas de los vídeos: (nombre, alto en píxeles, kbps de vídeo), de menor a mayor
+    TRANSCODIFICACION_VERSIONES = (('360p', 360, 700), ('720p', 720, 2000))
+    TRANSCODIFICACION_VERSION_POR_DEFECTO = '720p'  # la más ligera con Save-Data o conexión lenta
+    TRANSCODIFICACION_DOWNLINK_LIGERO = 1.5   # Mbps estimados por el navegador por debajo de los que se usa la más ligera
+    TRANSCODIFICACION_PROCESOS = 2            # procesos ffmpeg a la vez por worker
+    TRANSCODIFICACION_TIMEOUT = 1800          # segundos máximos por versión
+    TRANSCODIFICACION_FFMPEG = os.environ.get('TRANSCODIFICACION_FFMPEG') or None  # None: imageio-ffmpeg o PATH
+    TRANSCODIFICACION_SEGUNDO_PLANO = True    # grupo de hilos (desactivado en tests)
+
+    # Portada y rejilla de miniaturas de cada vídeo (en el mismo trabajo que las versiones)
+    MINIATURAS_ACTIVAS = True
+    MINIATURAS_ANCHO_POSTER = 640     # píxeles de ancho de la portada
+    MINIATURAS_ANCHO_SPRITE = 160     # píxeles de ancho de cada miniatura de la rejilla
+    MINIATURAS_REJILLA = (5, 4)       # columnas y filas de la rejilla
+    MINIATURAS_INTERVALO = 3.0        # segundos entre miniaturas si no se conoce la duración
+
+    # Purga periódica de los vídeos de respuesta caducados (retencion_videos de config/sistema.json)
+    PURGA_VIDEOS_PROGRAMADA = True    # trabajo de APScheduler en cada worker (desactivado en tests)
+    PURGA_VIDEOS_INTERVALO = 6 * 3600 # segundos entre pasadas
+    PURGA_VIDEOS_LOTE = 200           # vídeos por consulta y borrado de filas
+    PURGA_VIDEOS_HILOS = 8            # borrados simultáneos en el almacén
+
+    # Estado en tiempo real de sesiones compartido entre workers
+    # (memoria://, mmap:///ruta/estado.bin o redis://host:6379/0)
+    ESTADO_SESION_URL = os.environ.get('ESTADO_SESION_URL') or 'memoria://'
+
+    # Autorizar GET /api/sesion/<id>/estado sin consultar la base de datos
+    ESTADO_CACHE_AUTORIZACION = True
+    ESTADO_CACHE_USUARIOS_TTL = 60   # segundos que se da por buena una cuenta activa
+
+    # Espera máxima de GET /api/sesion/<id>/estado?since=<version> (segundos)
+    ESTADO_LONG_POLL_MAXIMO = 25
+
+    # Intervalo de sondeo sugerido a los clientes (retry_after_ms)
+    ESTADO_REINTENTO_MINIMO_MS = 500      # mientras el profesional cambia de ejercicio
+    ESTADO_REINTENTO_BASE_MS = 2000       # primer paso del retroceso exponencial
+    ESTADO_REINTENTO_MAXIMO_MS = 15000    # sesión inactiva, sin empezar o terminada
+    ESTADO_REINTENTO_VENTANA_ACTIVA = 60  # segundos tras un cambio en que la sesión se considera activa
+
+    # Máximo de sesiones por petición en GET /api/sesiones/estado
+    ESTADO_LOTE_MAXIMO = 200
+
+    # Caducidad del estado en tiempo real (segundos desde la última escritura)
+    ESTADO_TTL_TERMINADA = 15 * 60      # sesiones marcadas como terminadas
+    ESTADO_TTL_INACTIVA = 4 * 3600      # sesiones sin cambios (abandonadas)
+    ESTADO_INTERVALO_BARRIDO = 3600     # recorrido completo del backend
+    ESTADO_BARRIDO_SEGUNDO_PLANO = True # hilo del recorrido (desactivado en tests)
+
+    # Diario de eventos de sesión (escritura diferida en lotes)
+    DIARIO_SESIONES_LOTE = 50            # eventos por inserción
+    DIARIO_SESIONES_INTERVALO = 2.0      # segundos máximos que espera un evento
+    DIARIO_SESIONES_CAPACIDAD = 10000    # tope del búfer si la base de datos no responde
+    DIARIO_SESIONES_SEGUNDO_PLANO = True # hilo de volcado (desactivado en tests)
+
+    # Canal Server-Sent Events de cambios de sesión (segundos)
+    SSE_INTERVALO_SONDEO = 0.25   # relectura del estado compartido entre workers
+    SSE_KEEPALIVE = 15            # comentario periódico para no cerrar la conexión
+    SSE_DURACION_MAXIMA = 300     # el navegador reconecta solo al cerrarse el stream
+
+    # Streams de eventos, WebSockets y long-polls abiertos a la vez en un worker
+    # (menos que --threads del Procfile: el resto atiende las demás peticiones)
+    CONEXIONES_LARGAS_MAXIMAS = 12
+    CONEXIONES_LARGAS_REINTENTO = 5   # segundos de Retry-After con el cupo lleno
     
     # Configuración de sesiones persistentes
     PERMANENT_SESSION_LIFETIME = timedelta(days=30)
@@ -16,8 +16,10 @@ def register_blueprints(app):
     from .admin_controlador import admin_bp
     from .paciente_controlador import paciente_bp  
     from .profesional_controlador import profesional_bp  
+    from .videos_controlador import videos_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(paciente_bp, url_prefix='/paciente')  
-    app.register_blueprint(profesional_bp, url_prefix='/profesional')  
\ No newline at end of file
+    app.register_blueprint(profesional_bp, url_prefix='/profesional')
+    app.register_blueprint(videos_bp)  
\ No newline at end of file
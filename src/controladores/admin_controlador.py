@@ -11,7 +11,9 @@ from src.modelos.usuario import Usuario
 from src.modelos.paciente import Paciente
 from src.modelos.profesional import Profesional
 from src.modelos.asociaciones import Paciente_Profesional
-from src.extensiones import db
+from src.extensiones import db, estado_tiempo_real
+from src.servicios.uso_almacenamiento import limite_bytes, usos_de
+from src.servicios.sesiones_activas import cache_usuarios_activos
 from datetime import date, datetime, timedelta
 import csv
 from io import StringIO
@@ -20,10 +22,15 @@ import os
 
 admin_bp = Blueprint('admin', __name__)
 
+# Última configuración leída: (ruta, mtime, tamaño) del fichero y su contenido.
+# La cuota y la retención la consultan en cada subida y en cada purga
+_configuracion_leida = {}
+
 def cargar_configuracion():
     """
     Carga la configuración del sistema desde archivo JSON.
-    Si no existe, crea uno con valores por defecto.
+    Si no existe, crea uno con valores por defecto. El fichero solo se
+    vuelve a leer cuando cambia su fecha de modificación o su tamaño.
     
     Returns:
         dict: Configuración del sistema
@@ -43,8 +50,13 @@ def cargar_configuracion():
         os.makedirs('config', exist_ok=True)
         
         if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            estado = os.stat(config_path)
+            firma = (os.path.abspath(config_path), estado.st_mtime_ns, estado.st_size)
+            if _configuracion_leida.get('firma') != firma:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                _configuracion_leida.update(firma=firma, config=config)
+            return dict(_configuracion_leida['config'])
         else:
             with open(config_path, 'w', encoding='utf-8') as f:
                 json.dump(config_default, f, indent=2, ensure_ascii=False)
@@ -112,7 +124,10 @@ def dashboard():
 @login_required
 @admin_required
 def listar_usuarios():
-    """Lista todos los usuarios con filtros de búsqueda, rol y estado."""
+    """
+    Lista todos los usuarios con filtros de búsqueda, rol y estado, y el
+    almacenamiento que ocupan sus vídeos frente al límite por usuario.
+    """
     search = request.args.get('search', '')
     rol_filter = request.args.get('rol', '')
     estado_filter = request.args.get('estado', '')
@@ -138,6 +153,8 @@ def listar_usuarios():
     
     return render_template('admin/usuarios.html',
                          usuarios=usuarios,
+                         usos=usos_de([u.Id for u in usuarios]),
+                         limite=limite_bytes(),
                          search=search,
                          rol_filter=rol_filter,
                          estado_filter=estado_filter)
@@ -274,6 +291,7 @@ def cambiar_estado_usuario(user_id):
     nuevo_estado = 1 - usuario.Estado
     usuario.Estado = nuevo_estado
     db.session.commit()
+    cache_usuarios_activos().invalidar(user_id)
     
     estado_texto = "activada" if nuevo_estado == 1 else "desactivada"
     flash(f'Cuenta de {usuario.Nombre} {usuario.Apellidos} {estado_texto} correctamente', 'success')
@@ -526,6 +544,18 @@ def estadisticas():
     
     return render_template('admin/estadisticas.html', stats=stats)
 
+@admin_bp.route('/api/estado_sesiones')
+@login_required
+@admin_required
+def metricas_estado_sesiones():
+    """
+    Indicadores del almacén de estado en tiempo real de las sesiones.
+    
+    Returns:
+        JSON con el número de entradas y los bytes aproximados que ocupan
+    """
+    return jsonify(estado_tiempo_real.metricas())
+
 @admin_bp.route('/exportar_usuarios')
 @login_required
 @admin_required
@@ -6,36 +6,34 @@ Gestiona dashboard, sesiones, ejercicios y progreso del paciente.
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from src.controladores.decoradores import paciente_required
+from src.controladores.videos_controlador import url_video_ejercicio
 from src.modelos import Sesion, Ejercicio_Sesion, VideoRespuesta, Evaluacion, Paciente, Usuario
 from src.extensiones import db
+from src.servicios.sesiones_activas import cache_sesiones_activas
 from datetime import datetime, timedelta
-import os
 from collections import defaultdict
 
 paciente_bp = Blueprint('paciente', __name__, url_prefix='/paciente')
 
 
-def get_video_path(video_filename):
+def get_video_path(video_filename, versiones=None):
     """
-    Detecta la ubicación correcta del video (uploads/ejercicios o videos).
+    Detecta la ubicación correcta del video con el índice en memoria de los
+    vídeos en disco (sin consultar el sistema de ficheros en cada llamada).
+    Los que están en disco (almacén local de ejercicios o videos de ejemplo
+    de static/videos) se sirven por /videos/<nombre> con soporte de Range;
+    el resto, por la URL del almacén.
+    Si el ejercicio tiene versiones transcodificadas se usa la adecuada a la
+    conexión del paciente.
     
     Args:
         video_filename: Nombre del archivo de video
+        versiones: Versiones transcodificadas del ejercicio ('360p,720p')
         
     Returns:
-        str: Ruta relativa del video para usar en templates
+        str: URL del video para usar en templates
     """
-    from flask import current_app
-    
-    uploads_path = os.path.join(current_app.static_folder, 'uploads', 'ejercicios', video_filename)
-    if os.path.exists(uploads_path):
-        return f'/static/uploads/ejercicios/{video_filename}'
-    
-    videos_path = os.path.join(current_app.static_folder, 'videos', video_filename)
-    if os.path.exists(videos_path):
-        return f'/static/videos/{video_filename}'
-    
-    return f'/static/uploads/ejercicios/{video_filename}'
+    return url_video_ejercicio(video_filename, versiones)
 
 
 @paciente_bp.route('/dashboard')
@@ -118,6 +116,9 @@ def ejecutar_sesion(sesion_id):
 
     ejercicios = Ejercicio_Sesion.query.filter_by(Sesion_Id=sesion_id).order_by(Ejercicio_Sesion.Id).all()
 
+    # El polling de estado de esta sesión se autoriza desde caché
+    cache_sesiones_activas().registrar(sesion)
+
     ejercicios_serializados = []
     for es in ejercicios:
         ejercicios_serializados.append({
@@ -126,7 +127,7 @@ def ejecutar_sesion(sesion_id):
                 'Id': es.ejercicio.Id,
                 'Nombre': es.ejercicio.Nombre,
                 'Tipo': es.ejercicio.Tipo,
-                'Video': get_video_path(es.ejercicio.Video),
+                'Video': get_video_path(es.ejercicio.Video, es.ejercicio.Versiones),
                 'Duracion': es.ejercicio.Duracion
             }
         })
@@ -159,7 +160,7 @@ def ejercicios():
         if es.ejercicio.Id not in ejercicios_unicos:
             ejercicios_unicos[es.ejercicio.Id] = {
                 'ejercicio': es.ejercicio,
-                'video_path': get_video_path(es.ejercicio.Video),
+                'video_path': get_video_path(es.ejercicio.Video, es.ejercicio.Versiones),
                 'veces_asignado': 0,
                 'ultima_sesion': None
             }
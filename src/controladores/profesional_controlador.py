@@ -15,138 +15,551 @@ Estructura del archivo:
 """
 
 
-from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Response, current_app, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_required, current_user
 from src.controladores.decoradores import profesional_required
 from src.forms import CrearEjercicioForm, EvaluacionForm, CrearSesionDirectaForm
-from src.modelos import Ejercicio, Sesion, Evaluacion, VideoRespuesta, Paciente, Ejercicio_Sesion, Profesional, Usuario
+from src.modelos import Ejercicio, Sesion, Evaluacion, VideoRespuesta, Paciente, Ejercicio_Sesion, Profesional, Usuario, EventoSesion
 from src.modelos.asociaciones import Paciente_Profesional, Ejercicio_Profesional
 from datetime import datetime, timedelta
-from src.extensiones import db, csrf
-import cloudinary
-import cloudinary.uploader
+from src.extensiones import db, csrf, login_manager
+from src.servicios.conexiones_largas import cupo_conexiones
+from src.servicios.contenido_videos import clave_contenido, ejercicio_con_video
+from src.servicios.diario_sesiones import diario_sesiones, tiempos_por_ejercicio
+from src.servicios.estado_tiempo_real import BORRAR, estado_tiempo_real
+from src.servicios.ficheros_subidos import guardar_fichero_subido
+from src.servicios.metadatos_video import VideoNoValido, validar_grabacion
+from src.servicios.procesado_ejercicios import cola_procesado
+from src.servicios.sesiones_activas import cache_sesiones_activas, cache_usuarios_activos
+from src.servicios.subidas_reanudables import (
+    DesfaseSubida, SubidaDemasiadoGrande, SubidaNoEncontrada, subidas_reanudables
+)
+from src.servicios.subidas_video import COMPLETADO, ERROR, cola_subidas
+from src.servicios.uso_almacenamiento import cuota_superada, sumar_uso
+from src.servicios.websocket import ConexionWebSocket, RespuestaWebSocket, WebSocketCerrado
+import json
 import os
 import time
 from src.config import Config
 from collections import defaultdict
 from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
 from sqlalchemy import or_
-try:
-    from moviepy.editor import VideoFileClip
-except Exception:
-    VideoFileClip = None
+from urllib.parse import urlparse
 
 profesional_bp = Blueprint('profesional', __name__, url_prefix='/profesional')
 
-# Configuración de Cloudinary para almacenamiento de videos
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY'),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET')
-)
-
-
-# Estado en tiempo real de sesiones (en memoria)
-estado_sesiones_tiempo_real = {}
-estado_sesion_terminada = set()
-ultimo_cambio_sesion = {}
+# Estado en tiempo real de sesiones (compartido entre workers según ESTADO_SESION_URL).
+# Se mantienen los nombres históricos como vistas dict/set sobre el almacén.
+estado_sesiones_tiempo_real = estado_tiempo_real.ejercicio_activo
+estado_sesion_terminada = estado_tiempo_real.terminadas
+ultimo_cambio_sesion = estado_tiempo_real.ultimo_cambio
 MIN_INTERVAL_CAMBIO = 6  # Segundos mínimo entre cambios de ejercicio
 
+def _usuario_id_actual():
+    """
+    Id del usuario autenticado sin cargar el Usuario desde la base de datos.
+    Con la caché activa se lee de la cookie de sesión firmada (la misma que
+    usa Flask-Login) y se comprueba que la cuenta siga existiendo y activa
+    (caché de usuarios activos; una consulta por clave primaria al caducar);
+    si no está, se recurre a current_user.
+    
+    Returns:
+        int o None si no hay usuario autenticado (o su cuenta ya no está activa)
+    """
+    if current_app.config['ESTADO_CACHE_AUTORIZACION']:
+        user_id = session.get('_user_id')
+        if user_id is not None:
+            user_id = int(user_id)
+            usuarios = cache_usuarios_activos()
+            activo = usuarios.activo(user_id)
+            if activo is None:
+                activo = db.session.query(Usuario.Estado).filter(Usuario.Id == user_id).scalar() == 1
+                usuarios.registrar(user_id, activo)
+            return user_id if activo else None
+    if not current_user.is_authenticated or not current_user.usuario_activo():
+        return None
+    return current_user.Id
+
+def _participantes_sesion(sesion_id):
+    """
+    Devuelve (paciente_id, profesional_id) de la sesión.
+    Consulta la caché de sesiones activas y solo va a la base de datos si
+    falla (404 si la sesión no existe).
+    """
+    usar_cache = current_app.config['ESTADO_CACHE_AUTORIZACION']
+    participantes = cache_sesiones_activas().participantes(sesion_id) if usar_cache else None
+    if participantes is None:
+        sesion = Sesion.query.get_or_404(sesion_id)
+        participantes = (sesion.Paciente_Id, sesion.Profesional_Id)
+        if usar_cache and sesion.es_pendiente():
+            cache_sesiones_activas().registrar(sesion)
+    return participantes
+
 @profesional_bp.route('/api/sesion/<int:sesion_id>/estado', methods=['GET', 'POST'])
-@login_required
 def estado_sesion(sesion_id):
     """
     API para gestionar el estado en tiempo real de sesiones activas.
     
     GET: Consulta el estado actual (usado por paciente y profesional).
-    POST: Actualiza ejercicio activo y marca sesión como terminada (solo profesional).
+         Es la ruta caliente del polling: con ESTADO_CACHE_AUTORIZACION no
+         consulta la base de datos (ni para el usuario ni para la sesión)
+         salvo si la sesión no tiene estado en tiempo real ni está en la
+         caché; entonces se mira si ya terminó (ver _estado_o_cerrada).
+         Admite peticiones condicionales: responde 304 si la versión coincide
+         con If-None-Match, y con ?since=<version> espera (como máximo
+         ESTADO_LONG_POLL_MAXIMO o ?espera=<s>) a que la versión cambie;
+         con el cupo de conexiones largas lleno responde sin esperar.
+         Incluye retry_after_ms (también en la cabecera X-Retry-After-Ms,
+         presente en los 304): el intervalo que el cliente debe esperar
+         antes de la siguiente consulta. El cliente devuelve el último
+         recibido en ?reintento=<ms> para que el servidor lo vaya doblando
+         mientras la sesión esté inactiva.
+    POST: Actualiza ejercicio activo, grabación y marca sesión como terminada
+          (solo profesional).
     
     Args:
         sesion_id: ID de la sesión
         
     Returns:
-        JSON con estado actual: ejercicio_activo_id y terminada
+        JSON con estado actual: ejercicio_activo_id, terminada y version
     """
-    sesion = Sesion.query.get_or_404(sesion_id)
-
     # --- GET: lectura de estado (paciente y profesional) ---
     if request.method == 'GET':
-        ejercicio_activo_id = estado_sesiones_tiempo_real.get(sesion_id)
-        terminada = sesion_id in estado_sesion_terminada
-        return jsonify({
-            'sesion_id': sesion_id,
-            'ejercicio_activo_id': ejercicio_activo_id,
-            'terminada': terminada
-        })
+        usuario_id = _usuario_id_actual()
+        if usuario_id is None:
+            return login_manager.unauthorized()
+        if usuario_id not in _participantes_sesion(sesion_id):
+            return jsonify({"error": "Sin permisos"}), 403
+
+        leido = estado_tiempo_real.leer(sesion_id)
+        estado = _estado_o_cerrada(sesion_id, leido)
+        cerrada = estado is not leido
+        since = request.args.get('since', type=int)
+
+        if since is not None and not cerrada and estado.get('version', 0) == since:
+            maximo = current_app.config['ESTADO_LONG_POLL_MAXIMO']
+            espera = min(max(request.args.get('espera', maximo, type=float), 0), maximo)
+            cupo = cupo_conexiones()
+            if espera > 0 and cupo.ocupar():
+                try:
+                    # No retener la conexión a la base de datos durante la espera
+                    db.session.close()
+                    estado = estado_tiempo_real.esperar_cambio(
+                        sesion_id, estado, timeout=espera,
+                        intervalo=current_app.config['SSE_INTERVALO_SONDEO']
+                    )
+                finally:
+                    cupo.liberar()
+
+        version = str(estado.get('version', 0))
+        no_modificado = not cerrada and (
+            request.if_none_match.contains(version) or
+            (since is not None and str(since) == version)
+        )
+        reintento = _reintento_ms(estado, request.args.get('reintento', type=int))
+        if no_modificado:
+            respuesta = current_app.response_class(status=304)
+        else:
+            respuesta = jsonify(dict(_estado_publico(sesion_id, estado), retry_after_ms=reintento))
+        respuesta.set_etag(version)
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        respuesta.headers['X-Retry-After-Ms'] = str(reintento)
+        return respuesta
 
     # --- POST: solo profesional que lleva la sesión ---
+    if not current_user.is_authenticated:
+        return login_manager.unauthorized()
+
+    sesion = Sesion.query.get_or_404(sesion_id)
     if sesion.Profesional_Id != current_user.Id:
         return jsonify({"error": "Sin permisos"}), 403
 
-    data = request.get_json() or {}
-    ejercicio_activo_id = data.get('ejercicio_activo_id', None)
-    terminada_flag = data.get('terminada', None)
+    return jsonify(_aplicar_cambio_estado(sesion_id, request.get_json() or {}))
 
+def _aplicar_cambio_estado(sesion_id, data):
+    """
+    Aplica un cambio del profesional al estado en tiempo real de la sesión.
+    Lo comparten el POST de estado_sesion y el canal WebSocket.
+    
+    La decisión (mismo ejercicio, anti-rebote, ya terminada...) se toma sobre
+    el estado leído y se escribe con compare-and-set sobre su versión: si otra
+    petición concurrente cambió el estado entre medias, se vuelve a decidir,
+    así que dos cambios simultáneos no pueden superar ambos el anti-rebote.
+    Los cambios aplicados se anotan en el diario de sesiones, que los escribe
+    en la base de datos por lotes fuera de la petición.
+    
+    Args:
+        sesion_id: ID de la sesión
+        data: dict con ejercicio_activo_id, terminada y/o grabacion
+        
+    Returns:
+        dict con ok, sesion_id, ejercicio_activo_id y terminada
+    """
     ahora = time.time()
-    anterior = estado_sesiones_tiempo_real.get(sesion_id)
-    ultimo = ultimo_cambio_sesion.get(sesion_id)
-
-    # 1) Actualizar ejercicio activo si la clave viene en el JSON
-    if 'ejercicio_activo_id' in data:
-        # Si el id es exactamente el mismo que ya teníamos, no hacer nada
-        if ejercicio_activo_id == anterior:
-            return jsonify({
-                "ok": True,
-                "sesion_id": sesion_id,
-                "ejercicio_activo_id": anterior,
-                "terminada": sesion_id in estado_sesion_terminada
-            })
-
-        if ejercicio_activo_id is None:
-            # Permitir poner None explícito (no hay ejercicio activo)
-            estado_sesiones_tiempo_real[sesion_id] = None
-            ultimo_cambio_sesion[sesion_id] = ahora
-        else:
+    aplicados = {}
+
+    def decidir(estado):
+        aplicados.clear()
+        anterior = estado.get('ejercicio_activo_id')
+        ultimo = estado.get('ultimo_cambio')
+        terminada = bool(estado.get('terminada'))
+        cambios = {}
+
+        # 1) Actualizar ejercicio activo si la clave viene en el JSON
+        if 'ejercicio_activo_id' in data:
+            ejercicio_activo_id = data.get('ejercicio_activo_id')
+
+            # Si el id es exactamente el mismo que ya teníamos, no hacer nada
+            if ejercicio_activo_id == anterior:
+                return {}, {
+                    "ok": True,
+                    "sesion_id": sesion_id,
+                    "ejercicio_activo_id": anterior,
+                    "terminada": terminada
+                }
+
             # Anti‑rebote: evitar cambios de id demasiado rápidos
-            if (anterior is not None and
-                ejercicio_activo_id != anterior and
+            if (ejercicio_activo_id is not None and
+                anterior is not None and
                 ultimo is not None and
                 ahora - ultimo < MIN_INTERVAL_CAMBIO):
-                return jsonify({
+                return {}, {
                     "ok": False,
                     "sesion_id": sesion_id,
                     "ejercicio_activo_id": anterior,
-                    "terminada": sesion_id in estado_sesion_terminada
-                })
-
-            estado_sesiones_tiempo_real[sesion_id] = ejercicio_activo_id
-            ultimo_cambio_sesion[sesion_id] = ahora
-
-    # 2) Marcar / desmarcar sesión terminada
-    if terminada_flag is not None:
-        terminada_bool = bool(terminada_flag)
-
-        # Si ya está terminada y vuelven a mandar terminada=true, no hacer nada extra
-        if terminada_bool and (sesion_id in estado_sesion_terminada):
-            return jsonify({
-                "ok": True,
-                "sesion_id": sesion_id,
-                "ejercicio_activo_id": estado_sesiones_tiempo_real.get(sesion_id),
-                "terminada": True
-            })
-
-        if terminada_bool:
-            estado_sesion_terminada.add(sesion_id)
+                    "terminada": terminada
+                }
+
+            # None explícito está permitido (no hay ejercicio activo)
+            cambios['ejercicio_activo_id'] = ejercicio_activo_id
+            cambios['ultimo_cambio'] = ahora
+            anterior = ejercicio_activo_id
+
+        # 2) Marcar / desmarcar sesión terminada
+        terminada_flag = data.get('terminada', None)
+        if terminada_flag is not None:
+            terminada_bool = bool(terminada_flag)
+
+            # Si ya está terminada y vuelven a mandar terminada=true, no hacer nada extra
+            if terminada_bool and terminada:
+                return cambios, {
+                    "ok": True,
+                    "sesion_id": sesion_id,
+                    "ejercicio_activo_id": anterior,
+                    "terminada": True
+                }
+
+            if terminada_bool:
+                cambios['terminada'] = True
+            elif terminada:
+                cambios['terminada'] = BORRAR
+            terminada = terminada_bool
+
+        # 3) Iniciar / detener la grabación del paciente
+        if data.get('grabacion') is not None and bool(data['grabacion']) != estado.get('grabacion'):
+            cambios['grabacion'] = bool(data['grabacion'])
+
+        aplicados.update(cambios)
+        return cambios, {
+            "ok": True,
+            "sesion_id": sesion_id,
+            "ejercicio_activo_id": anterior,
+            "terminada": terminada
+        }
+
+    resultado = estado_tiempo_real.transicion(sesion_id, decidir)
+    _registrar_en_diario(sesion_id, aplicados)
+    return resultado
+
+def _registrar_en_diario(sesion_id, cambios):
+    """Anota en el diario de sesiones los cambios de estado aplicados."""
+    diario = diario_sesiones()
+    if 'ejercicio_activo_id' in cambios:
+        diario.registrar(sesion_id, 'EJERCICIO', ejercicio_sesion_id=cambios['ejercicio_activo_id'])
+    if 'grabacion' in cambios:
+        diario.registrar(sesion_id, 'GRABACION', activa=cambios['grabacion'])
+    if cambios.get('terminada') is True:
+        diario.registrar(sesion_id, 'TERMINADA')
+    elif cambios.get('terminada') is BORRAR:
+        diario.registrar(sesion_id, 'REANUDADA')
+
+def _reintento_ms(estado, anterior=None):
+    """
+    Intervalo de sondeo (ms) que se sugiere al cliente según la actividad.
+    
+    Mientras el profesional está cambiando de ejercicio (último cambio hace
+    menos de ESTADO_REINTENTO_VENTANA_ACTIVA) se usa el mínimo. Con la sesión
+    inactiva o sin empezar se dobla el intervalo anterior del cliente, desde
+    ESTADO_REINTENTO_BASE_MS hasta el máximo; terminada, directamente el máximo.
+    
+    Args:
+        estado: Estado en tiempo real de la sesión
+        anterior: Último intervalo que recibió el cliente (o None)
+        
+    Returns:
+        int: milisegundos
+    """
+    config = current_app.config
+    maximo = config['ESTADO_REINTENTO_MAXIMO_MS']
+    if estado.get('terminada'):
+        return maximo
+
+    ultimo = estado.get('ultimo_cambio')
+    if ultimo is not None and time.time() - ultimo < config['ESTADO_REINTENTO_VENTANA_ACTIVA']:
+        return config['ESTADO_REINTENTO_MINIMO_MS']
+
+    base = config['ESTADO_REINTENTO_BASE_MS']
+    if anterior is None or anterior < base:
+        return base
+    return min(anterior * 2, maximo)
+
+def _conexiones_agotadas():
+    """Respuesta 503 cuando el worker ya tiene abiertas CONEXIONES_LARGAS_MAXIMAS conexiones."""
+    respuesta = jsonify({"error": "Demasiadas conexiones abiertas, inténtalo más tarde"})
+    respuesta.status_code = 503
+    respuesta.headers['Retry-After'] = str(current_app.config['CONEXIONES_LARGAS_REINTENTO'])
+    return respuesta
+
+def _estado_o_cerrada(sesion_id, estado):
+    """
+    Estado en tiempo real de la sesión o, si no tiene (no ha empezado o su
+    entrada caducó tras ESTADO_TTL_TERMINADA) y en la base de datos ya no
+    está pendiente, un estado terminado para que los clientes que llegan
+    tarde (o a otro worker) sepan que acabó. Las sesiones de la caché de
+    sesiones activas de este worker se dan por pendientes sin consultarla.
+    """
+    if estado:
+        return estado
+    if current_app.config['ESTADO_CACHE_AUTORIZACION'] and sesion_id in cache_sesiones_activas():
+        return estado
+    guardado = db.session.query(Sesion.Estado).filter(Sesion.Id == sesion_id).scalar()
+    if guardado is not None and guardado != 'PENDIENTE':
+        return {'terminada': True}
+    return estado
+
+def _estado_publico(sesion_id, estado):
+    """Campos del estado en tiempo real que se exponen a los clientes."""
+    return {
+        'sesion_id': sesion_id,
+        'ejercicio_activo_id': estado.get('ejercicio_activo_id'),
+        'terminada': bool(estado.get('terminada')),
+        'grabacion': estado.get('grabacion'),
+        'version': estado.get('version', 0)
+    }
+
+def _generar_eventos_sesion(sesion_id, intervalo, keepalive, duracion, estado=None):
+    """
+    Generador Server-Sent Events con los cambios de estado de una sesión.
+    Emite un evento 'estado' en cada cambio y un comentario de keepalive
+    si no hay cambios; termina al finalizar la sesión o pasada `duracion`.
+    `estado` es el estado inicial, si ya se ha leído.
+    """
+    fin = time.monotonic() + duracion
+    if estado is None:
+        estado = estado_tiempo_real.leer(sesion_id)
+    enviado = None
+
+    yield 'retry: 2000\n\n'
+    while True:
+        publico = _estado_publico(sesion_id, estado)
+        if publico != enviado:
+            yield f"id: {publico['version']}\nevent: estado\ndata: {json.dumps(publico)}\n\n"
+            enviado = publico
+            if publico['terminada']:
+                return
         else:
-            estado_sesion_terminada.discard(sesion_id)
+            yield ': keepalive\n\n'
+
+        restante = fin - time.monotonic()
+        if restante <= 0:
+            return
+        estado = estado_tiempo_real.esperar_cambio(
+            sesion_id, estado, timeout=min(keepalive, restante), intervalo=intervalo
+        )
+
+@profesional_bp.route('/api/sesion/<int:sesion_id>/eventos')
+@login_required
+def eventos_sesion(sesion_id):
+    """
+    Canal Server-Sent Events con los cambios de ejercicio activo y fin de sesión.
+    Sustituye al polling de estado_sesion; este se mantiene como alternativa
+    para navegadores sin EventSource o si el canal falla.
+    
+    Args:
+        sesion_id: ID de la sesión
+        
+    Returns:
+        Response text/event-stream con eventos 'estado'; 503 con Retry-After
+        si el worker no admite más conexiones largas
+    """
+    if _usuario_id_actual() not in _participantes_sesion(sesion_id):
+        return jsonify({"error": "Sin permisos"}), 403
+
+    cupo = cupo_conexiones()
+    if not cupo.ocupar():
+        return _conexiones_agotadas()
+
+    generador = _generar_eventos_sesion(
+        sesion_id,
+        intervalo=current_app.config['SSE_INTERVALO_SONDEO'],
+        keepalive=current_app.config['SSE_KEEPALIVE'],
+        duracion=current_app.config['SSE_DURACION_MAXIMA'],
+        estado=_estado_o_cerrada(sesion_id, estado_tiempo_real.leer(sesion_id))
+    )
+    respuesta = Response(generador, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Libera el hueco al cerrarse la respuesta, aunque el stream no llegue a empezar
+    respuesta.call_on_close(cupo.liberar)
+    return respuesta
+
+@profesional_bp.route('/api/sesiones/estado')
+@login_required
+@profesional_required
+def estado_sesiones_lote():
+    """
+    Estado en tiempo real de varias sesiones en una sola petición.
+    Pensado para supervisar una clase de grupo sin un polling por sesión:
+    la propiedad de todas las sesiones se comprueba con una única consulta
+    y los estados se leen del almacén de una vez.
+    
+    Query params:
+        ids: IDs de sesión separados por comas (máximo ESTADO_LOTE_MAXIMO)
+        
+    Returns:
+        JSON con 'sesiones' (estado de cada sesión propia, en el orden pedido),
+        'no_autorizadas' (ids inexistentes o de otro profesional) y
+        'retry_after_ms' (el menor de los intervalos sugeridos; ver ?reintento
+        en estado_sesion)
+    """
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids debe ser una lista de enteros separados por comas"}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > current_app.config['ESTADO_LOTE_MAXIMO']:
+        return jsonify({"error": "Demasiadas sesiones en una sola petición"}), 400
+    anterior = request.args.get('reintento', type=int)
+    if not ids:
+        return jsonify({"sesiones": [], "no_autorizadas": [], "retry_after_ms": _reintento_ms({}, anterior)})
+
+    propias = {
+        fila.Id for fila in db.session.query(Sesion.Id).filter(
+            Sesion.Id.in_(ids),
+            Sesion.Profesional_Id == current_user.Id
+        )
+    }
+    permitidas = [sid for sid in ids if sid in propias]
+    estados = estado_tiempo_real.leer_varios(permitidas)
 
     return jsonify({
-        "ok": True,
-        "sesion_id": sesion_id,
-        "ejercicio_activo_id": estado_sesiones_tiempo_real.get(sesion_id),
-        "terminada": sesion_id in estado_sesion_terminada
+        "sesiones": [_estado_publico(sid, estados[sid]) for sid in permitidas],
+        "no_autorizadas": [sid for sid in ids if sid not in propias],
+        "retry_after_ms": min(
+            (_reintento_ms(estados[sid], anterior) for sid in permitidas),
+            default=_reintento_ms({}, anterior)
+        )
     })
 
+def _canal_websocket_sesion(ws, sesion_id, es_profesional, intervalo, keepalive, estado=None):
+    """
+    Bucle de una conexión WebSocket de sesión.
+    Envía {'tipo': 'estado', ...} en cada cambio de versión y, si quien está
+    conectado es el profesional, aplica los mensajes que recibe (mismo JSON que
+    el POST de estado_sesion) respondiendo {'tipo': 'respuesta', ...}.
+    Termina cuando el cliente cierra o tras comunicar la sesión terminada.
+    `estado` es el estado inicial, si ya se ha leído.
+    """
+    enviado = None
+    ultimo_envio = time.monotonic()
+    try:
+        while True:
+            if estado is None:
+                estado = estado_tiempo_real.leer(sesion_id)
+            publico = _estado_publico(sesion_id, estado)
+            estado = None
+            if publico != enviado:
+                ws.enviar_json(dict(publico, tipo='estado'))
+                enviado = publico
+                ultimo_envio = time.monotonic()
+                if publico['terminada']:
+                    ws.cerrar()
+                    return
+            elif time.monotonic() - ultimo_envio >= keepalive:
+                ws.ping()
+                ultimo_envio = time.monotonic()
+
+            mensaje = ws.recibir(timeout=intervalo)
+            if mensaje is None:
+                continue
+            try:
+                data = json.loads(mensaje)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                ws.enviar_json({'tipo': 'error', 'error': 'Mensaje no válido'})
+            elif not es_profesional:
+                ws.enviar_json({'tipo': 'error', 'error': 'Sin permisos'})
+            else:
+                ws.enviar_json(dict(_aplicar_cambio_estado(sesion_id, data), tipo='respuesta'))
+    except WebSocketCerrado:
+        pass
+
+@profesional_bp.route('/api/sesion/<int:sesion_id>/ws', websocket=True)
+@login_required
+def websocket_sesion(sesion_id):
+    """
+    Canal WebSocket bidireccional de una sesión guiada.
+    El profesional envía por él los cambios de ejercicio, el inicio/fin de la
+    grabación y el fin de sesión; paciente y profesional reciben los cambios
+    de estado. Una conexión persistente por participante sustituye a los
+    POST y lecturas sueltas (que se mantienen como alternativa).
+    
+    Args:
+        sesion_id: ID de la sesión
+        
+    Returns:
+        101 Switching Protocols; 400/403 si no procede abrir el canal y 503
+        con Retry-After si el worker no admite más conexiones largas
+    """
+    paciente_id, profesional_id = _participantes_sesion(sesion_id)
+    usuario_id = _usuario_id_actual()
+    if usuario_id not in (paciente_id, profesional_id):
+        return jsonify({"error": "Sin permisos"}), 403
+
+    # Los navegadores envían cookies en WebSockets de otros orígenes
+    origen = request.headers.get('Origin')
+    if origen and urlparse(origen).netloc != request.host:
+        return jsonify({"error": "Origen no permitido"}), 403
+
+    cupo = cupo_conexiones()
+    if not cupo.ocupar():
+        return _conexiones_agotadas()
+    try:
+        try:
+            ws = ConexionWebSocket.aceptar(request.environ)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 501
+
+        inicial = _estado_o_cerrada(sesion_id, estado_tiempo_real.leer(sesion_id))
+        # La conexión puede durar toda la sesión: no retener la base de datos
+        db.session.close()
+        _canal_websocket_sesion(
+            ws, sesion_id,
+            es_profesional=(usuario_id == profesional_id),
+            intervalo=current_app.config['SSE_INTERVALO_SONDEO'],
+            keepalive=current_app.config['SSE_KEEPALIVE'],
+            estado=inicial
+        )
+        ws.cerrar()
+    finally:
+        cupo.liberar()
+    return RespuestaWebSocket()
+
 # ---------------------------
 # Dashboard profesional
 # ---------------------------
@@ -285,51 +698,76 @@ def listar_ejercicios():
 @profesional_bp.route('/ejercicios/crear', methods=['GET', 'POST'])
 @login_required
 @profesional_required
+@csrf.exempt  # CrearEjercicioForm valida el token después de comprobar la cuota
 def crear_ejercicio():
     """
     Crea un nuevo ejercicio terapéutico con video demostrativo.
-    Calcula automáticamente la duración del video usando MoviePy.
+    El ejercicio queda como Procesando mientras un trabajo en segundo plano
+    lee la duración del video de su cabecera (metadatos_video.leer_metadatos,
+    con MoviePy solo si no se puede leer) y lo guarda en el almacén de
+    ejercicios (ALMACEN_EJERCICIOS_URL) con su SHA-256 como nombre. Si otro
+    ejercicio ya tiene el mismo vídeo, se reutiliza sin volver a procesarlo.
+    El tamaño del vídeo cuenta en el uso de almacenamiento del profesional
+    y se rechaza si supera su límite.
     """
+    # Rechazar sin leer el cuerpo si el vídeo ya no cabe en la cuota
+    if request.method == 'POST' and cuota_superada(current_user.Id, request.content_length):
+        flash('No hay espacio suficiente en tu límite de almacenamiento para este vídeo.', 'error')
+        return render_template('profesional/crear_ejercicio.html', form=CrearEjercicioForm(formdata=None))
+
     form = CrearEjercicioForm()
 
     if form.validate_on_submit():
-        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'ejercicios')
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
+        directorio = current_app.config['SUBIDAS_DIRECTORIO']
+        os.makedirs(directorio, exist_ok=True)
 
         video = form.video.data
-        filename = f"ejercicio_{datetime.now().timestamp()}.mp4"
-        video_path = os.path.join(upload_dir, filename)
-        video.save(video_path)
+        video_path = os.path.join(directorio, f"ejercicio_{datetime.now().timestamp()}.mp4")
+        tamano, sha256 = guardar_fichero_subido(video, video_path)
+        if cuota_superada(current_user.Id, tamano):
+            os.remove(video_path)
+            flash('No hay espacio suficiente en tu límite de almacenamiento para este vídeo.', 'error')
+            return render_template('profesional/crear_ejercicio.html', form=form)
+        clave = clave_contenido(sha256)
+        existente = ejercicio_con_video(clave)
 
-        # Calcular duración real del vídeo si es posible
-        duracion_segundos = 0
-        if VideoFileClip is not None:
-            try:
-                clip = VideoFileClip(video_path)
-                duracion_segundos = int(clip.duration)
-                clip.close()
-            except Exception:
-                duracion_segundos = 0
-
-        nuevo_ejercicio = Ejercicio(
-            Nombre=form.nombre.data,
-            Descripcion=form.descripcion.data,
-            Tipo=form.tipo.data,
-            Video=filename,
-            Duracion=duracion_segundos
-        )
-        db.session.add(nuevo_ejercicio)
-        db.session.commit()
+        try:
+            nuevo_ejercicio = Ejercicio(
+                Nombre=form.nombre.data,
+                Descripcion=form.descripcion.data,
+                Tipo=form.tipo.data,
+                Video=clave,
+                Duracion=existente.Duracion if existente else 0,
+                Procesando=existente is None,
+                Versiones=existente.Versiones if existente else None,
+                Miniaturas=existente.Miniaturas if existente else None,
+                Tamano=tamano
+            )
+            db.session.add(nuevo_ejercicio)
+            db.session.commit()
 
-        asociacion = Ejercicio_Profesional(
-            Profesional_Id=current_user.Id,
-            Ejercicio_Id=nuevo_ejercicio.Id
-        )
-        db.session.add(asociacion)
-        db.session.commit()
+            asociacion = Ejercicio_Profesional(
+                Profesional_Id=current_user.Id,
+                Ejercicio_Id=nuevo_ejercicio.Id
+            )
+            db.session.add(asociacion)
+            sumar_uso(current_user.Id, tamano)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            os.remove(video_path)
+            raise
+
+        if existente is not None:
+            # Mismo vídeo que otro ejercicio: ya está en el almacén
+            os.remove(video_path)
+            flash('Ejercicio creado correctamente.', 'success')
+            return redirect(url_for('profesional.listar_ejercicios'))
+
+        # Duración y guardado en el almacén fuera de la petición
+        cola_procesado().encolar(nuevo_ejercicio.Id, video_path, clave)
 
-        flash('Ejercicio creado correctamente', 'success')
+        flash('Ejercicio creado correctamente. El vídeo se está procesando.', 'success')
         return redirect(url_for('profesional.listar_ejercicios'))
 
     return render_template('profesional/crear_ejercicio.html', form=form)
@@ -540,6 +978,9 @@ def ejecutar_sesion(sesion_id):
         flash('Esta sesión no tiene ejercicios asignados.', 'warning')
         return redirect(url_for('profesional.ver_sesion', sesion_id=sesion_id))
 
+    # Las lecturas de estado de esta sesión ya no necesitan la base de datos
+    cache_sesiones_activas().registrar(sesion)
+
     return render_template('profesional/ejecutar_sesion.html',
                            sesion=sesion,
                            ejercicios=ejercicios)
@@ -559,10 +1000,43 @@ def finalizar_sesion(sesion_id):
     sesion.Estado = 'COMPLETADA'
     db.session.commit()
 
-    # Marcamos terminada en la caché también
-    estado_sesion_terminada.add(sesion_id)
+    # Marcamos terminada en el estado compartido también
+    estado_tiempo_real.actualizar(sesion_id, terminada=True)
+    cache_sesiones_activas().invalidar(sesion_id)
+    diario_sesiones().registrar(sesion_id, 'FINALIZADA')
     return jsonify(success=True)
 
+@profesional_bp.route('/api/sesion/<int:sesion_id>/diario')
+@login_required
+@profesional_required
+def diario_sesion(sesion_id):
+    """
+    Diario de eventos de una sesión y tiempo dedicado a cada ejercicio.
+    Vuelca antes los eventos pendientes para que la respuesta esté completa.
+    
+    Args:
+        sesion_id: ID de la sesión
+        
+    Returns:
+        JSON con 'eventos' y 'tiempos' por ejercicio
+    """
+    sesion = Sesion.query.get_or_404(sesion_id)
+    if sesion.Profesional_Id != current_user.Id:
+        return jsonify({"error": "Sin permisos"}), 403
+
+    diario_sesiones().volcar()
+    eventos = EventoSesion.query.filter_by(Sesion_Id=sesion_id).order_by(
+        EventoSesion.Fecha, EventoSesion.Id
+    ).all()
+    tiempos = [
+        dict(tramo, inicio=tramo['inicio'].isoformat())
+        for tramo in tiempos_por_ejercicio(eventos)
+    ]
+    return jsonify({
+        "eventos": [evento.to_dict() for evento in eventos],
+        "tiempos": tiempos
+    })
+
 # ---------------------------
 # Evaluación de ejercicios
 # ---------------------------
@@ -730,8 +1204,19 @@ def ver_progreso(paciente_id):
 @csrf.exempt
 def guardar_video(ejercicio_sesion_id):
     """
-    Guarda video de respuesta del paciente en Cloudinary.
-    Previene duplicados garantizando solo 1 video por ejercicio_sesion.
+    Recibe el video de respuesta del paciente y encola su subida al almacén
+    de respuestas (Cloudinary por defecto).
+    La grabación se recibe en streaming en un fichero temporal (ver
+    ficheros_subidos), se comprueba su cabecera MP4/WebM (415 si no es un
+    vídeo) y un hilo de la cola de subidas la sube y crea el
+    VideoRespuesta; la petición responde 202 con el id del trabajo
+    (consultable en estado_subida_video).
+    Previene duplicados garantizando solo 1 video por ejercicio_sesion: si
+    ya hay una subida en curso (o la misma Idempotency-Key ya se subió) se
+    responde con ese trabajo sin leer el cuerpo de la petición. La subida
+    se registra antes de leerlo, así que dos peticiones simultáneas no
+    reciben el vídeo entero las dos. Si el vídeo no cabe en el límite de
+    almacenamiento del paciente, 413.
     Caso de uso: CU7 (grabar respuesta de ejercicio).
     """
     try:
@@ -743,69 +1228,280 @@ def guardar_video(ejercicio_sesion_id):
         if paciente.Usuario_Id != current_user.Id:
             return jsonify({'success': False, 'error': 'Sin permisos'}), 403
 
-        # Comprobar si ya existe un vídeo para este ejercicio_sesion
-        video_respuesta_existente = VideoRespuesta.query.filter_by(
-            Ejercicio_Sesion_Id=ejercicio_sesion_id
-        ).first()
+        # Comprobar si ya hay una subida o un vídeo para este ejercicio_sesion
+        existente = _subida_existente(ejercicio_sesion_id)
+        if existente is not None:
+            return existente
+
+        # Rechazar sin leer el cuerpo si ya no cabe en la cuota del paciente
+        sin_cuota = _cuota_superada(request.content_length)
+        if sin_cuota is not None:
+            return sin_cuota
+
+        # Registrar la subida antes de leer el cuerpo: una petición
+        # simultánea del mismo ejercicio recibe este trabajo. El commit del
+        # registro ya devuelve la conexión a la base de datos mientras llega
+        cola = cola_subidas()
+        trabajo, reclamado = cola.reclamar(ejercicio_sesion_id, request.headers.get('Idempotency-Key'))
+        if not reclamado:
+            return _respuesta_trabajo_subida(trabajo)
+
+        lanzado = False
+        try:
+            # Validar presencia de archivo
+            if 'video' not in request.files:
+                return jsonify({'success': False, 'error': 'No se encontró el archivo'}), 400
+
+            video_file = request.files['video']
+
+            if not video_file or video_file.filename == '':
+                return jsonify({'success': False, 'error': 'Archivo vacío'}), 400
+
+            # Guardar en local, comprobar que es un vídeo y lanzar la subida
+            ruta = cola.ruta_temporal(ejercicio_sesion_id)
+            tamano, _ = guardar_fichero_subido(video_file, ruta)
+            no_valido = _grabacion_no_valida(ruta) or _cuota_superada(tamano, ruta)
+            if no_valido is not None:
+                return no_valido
+            cola.lanzar(trabajo, ruta)
+            lanzado = True
+            return _respuesta_trabajo_subida(trabajo)
+        finally:
+            if not lanzado:
+                cola.abandonar(trabajo)
+
+    except HTTPException:
+        # 404, 413 (archivo demasiado grande) o 507 (sin espacio) tal cual
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al guardar video: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        if video_respuesta_existente:
-            return jsonify({
-                'success': True,
-                'mensaje': 'Video ya existente, se ignora nueva subida'
-            }), 200
-
-        # Validar presencia de archivo
-        if 'video' not in request.files:
-            return jsonify({'success': False, 'error': 'No se encontró el archivo'}), 400
-
-        video_file = request.files['video']
-
-        if not video_file or video_file.filename == '':
-            return jsonify({'success': False, 'error': 'Archivo vacío'}), 400
-
-        # Subir a Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            video_file,
-            resource_type="video",
-            folder="terapitrack/respuestas",
-            public_id=f"respuesta_{ejercicio_sesion_id}",
-            overwrite=True,
-            unique_filename=False
-        )
+# ---------------------------
+# Subida reanudable por fragmentos de videos de respuesta
+# ---------------------------
+def _es_paciente_de(ejercicio_sesion_id):
+    """Indica si el usuario actual es el paciente del ejercicio de sesión (404 si no existe)."""
+    ejercicio_sesion = Ejercicio_Sesion.query.get_or_404(ejercicio_sesion_id)
+    return ejercicio_sesion.sesion.paciente.Usuario_Id == current_user.Id
+
+def _info_subida(ejercicio_sesion_id, subida_id):
+    """Datos de una subida reanudable del usuario actual para ese ejercicio (o None)."""
+    try:
+        info = subidas_reanudables().info(subida_id)
+    except SubidaNoEncontrada:
+        return None
+    if info['ejercicio_sesion_id'] != ejercicio_sesion_id or info['usuario_id'] != current_user.Id:
+        return None
+    return info
+
+@profesional_bp.route('/guardar_video/<int:ejercicio_sesion_id>/subidas', methods=['POST'])
+@login_required
+@csrf.exempt
+def iniciar_subida_video(ejercicio_sesion_id):
+    """
+    Abre una subida reanudable del video de respuesta.
+    
+    JSON opcional: {"tamano": bytes totales}
+    
+    Returns:
+        201 con subida_id, offset y url de la subida (202 con el trabajo si
+        ya hay una subida en curso, 200 si ya hay video, 413 si no cabe en
+        el límite de almacenamiento)
+    """
+    if not _es_paciente_de(ejercicio_sesion_id):
+        return jsonify({'success': False, 'error': 'Sin permisos'}), 403
+
+    existente = _subida_existente(ejercicio_sesion_id)
+    if existente is not None:
+        return existente
+
+    tamano = (request.get_json(silent=True) or {}).get('tamano')
+    if tamano is not None and not isinstance(tamano, int):
+        return jsonify({'success': False, 'error': 'tamano debe ser un entero'}), 400
+    sin_cuota = _cuota_superada(tamano)
+    if sin_cuota is not None:
+        return sin_cuota
+    try:
+        subida = subidas_reanudables().iniciar(ejercicio_sesion_id, current_user.Id, tamano,
+                                               request.headers.get('Idempotency-Key'))
+    except SubidaDemasiadoGrande as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+
+    url = url_for('profesional.subida_video', ejercicio_sesion_id=ejercicio_sesion_id,
+                  subida_id=subida['subida_id'])
+    respuesta = jsonify(dict(subida, success=True, url=url))
+    respuesta.status_code = 201
+    respuesta.headers['Location'] = url
+    return respuesta
+
+@profesional_bp.route('/guardar_video/<int:ejercicio_sesion_id>/subidas/<subida_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+@csrf.exempt
+def subida_video(ejercicio_sesion_id, subida_id):
+    """
+    Fragmentos de una subida reanudable.
+    
+    GET: bytes recibidos hasta ahora (para reanudar tras un corte).
+    PUT ?offset=<n>: añade el cuerpo (application/octet-stream) en la
+         posición n; 409 con el offset correcto si no coincide.
+    DELETE: descarta la subida.
+    
+    Returns:
+        JSON con subida_id y offset
+    """
+    if not _es_paciente_de(ejercicio_sesion_id):
+        return jsonify({'success': False, 'error': 'Sin permisos'}), 403
+    info = _info_subida(ejercicio_sesion_id, subida_id)
+    if info is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    db.session.close()
 
+    if request.method == 'DELETE':
+        subidas_reanudables().cancelar(subida_id)
+        return jsonify({'success': True})
 
-        video_url = upload_result.get('secure_url')
-        if not video_url:
-            return jsonify({'success': False, 'error': 'No se obtuvo URL del video'}), 500
+    if request.method == 'GET':
+        return jsonify({'success': True, 'subida_id': subida_id, 'offset': info['offset'],
+                        'tamano': info['tamano']})
 
-        # Crear registro nuevo
-        fecha_expiracion = datetime.now() + timedelta(days=30)
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': 'Falta offset'}), 400
+    try:
+        nuevo_offset = subidas_reanudables().anexar(subida_id, offset, request.stream)
+    except DesfaseSubida as e:
+        return jsonify({'success': False, 'error': 'Desplazamiento incorrecto', 'offset': e.offset}), 409
+    except SubidaDemasiadoGrande as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except SubidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    return jsonify({'success': True, 'subida_id': subida_id, 'offset': nuevo_offset})
+
+@profesional_bp.route('/guardar_video/<int:ejercicio_sesion_id>/subidas/<subida_id>/finalizar', methods=['POST'])
+@login_required
+@csrf.exempt
+def finalizar_subida_video(ejercicio_sesion_id, subida_id):
+    """
+    Completa una subida reanudable y encola su envío al almacén de
+    respuestas, igual que guardar_video.
+    
+    Returns:
+        202 con el trabajo de subida; 409 con el offset si faltan bytes;
+        413 si no cabe en el límite de almacenamiento
+    """
+    if not _es_paciente_de(ejercicio_sesion_id):
+        return jsonify({'success': False, 'error': 'Sin permisos'}), 403
+    info = _info_subida(ejercicio_sesion_id, subida_id)
+    if info is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    if info['offset'] == 0:
+        subidas_reanudables().cancelar(subida_id)
+        return jsonify({'success': False, 'error': 'Archivo vacío'}), 400
+    db.session.close()
+
+    cola = cola_subidas()
+    ruta = cola.ruta_temporal(ejercicio_sesion_id)
+    try:
+        subidas_reanudables().finalizar(subida_id, ruta)
+    except DesfaseSubida as e:
+        return jsonify({'success': False, 'error': 'Subida incompleta', 'offset': e.offset}), 409
+    except SubidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    no_valido = _grabacion_no_valida(ruta) or _cuota_superada(os.path.getsize(ruta), ruta)
+    if no_valido is not None:
+        return no_valido
+    return _respuesta_trabajo_subida(cola.encolar(ejercicio_sesion_id, ruta, info.get('clave_idempotencia')))
+
+def _subida_existente(ejercicio_sesion_id):
+    """
+    Respuesta para una subida del video que no hace falta recibir (o None):
+    202 con el trabajo si hay una en curso en cualquier worker o si la
+    Idempotency-Key de la petición es la de una ya hecha; 200 si el video
+    ya está guardado.
+    """
+    trabajo = cola_subidas().trabajo_de(ejercicio_sesion_id)
+    clave = request.headers.get('Idempotency-Key')
+    if trabajo is not None and (not trabajo.terminado or (clave and clave == trabajo.clave_idempotencia)):
+        return _respuesta_trabajo_subida(trabajo)
+    if VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=ejercicio_sesion_id).first():
+        return jsonify({
+            'success': True,
+            'mensaje': 'Video ya existente, se ignora nueva subida'
+        }), 200
+    return None
 
-        try:
-            video_respuesta = VideoRespuesta(
-                Ejercicio_Sesion_Id=ejercicio_sesion_id,
-                Ruta_Almacenamiento=video_url,
-                Fecha_Expiracion=fecha_expiracion
-            )
-            db.session.add(video_respuesta)
-            db.session.commit()
+def _grabacion_no_valida(ruta):
+    """
+    Lee la cabecera de la grabación recibida (MP4/WebM con pista de vídeo).
+    Si no es válida la borra y devuelve la respuesta 415; si lo es, None.
+    """
+    try:
+        validar_grabacion(ruta)
+    except VideoNoValido as e:
+        os.remove(ruta)
+        return jsonify({'success': False, 'error': f'El archivo no es un vídeo válido: {e}'}), 415
+    return None
 
-            print(f"Video guardado en Cloudinary: {video_url}")
-            return jsonify({'success': True, 'mensaje': 'Video guardado correctamente'}), 200
+def _cuota_superada(tamano, ruta=None):
+    """
+    Respuesta 413 si `tamano` bytes más no caben en el límite de
+    almacenamiento del usuario actual (borrando la grabación `ruta` si ya
+    se recibió); None si caben.
+    """
+    if not cuota_superada(current_user.Id, tamano):
+        return None
+    if ruta is not None:
+        os.remove(ruta)
+    return jsonify({'success': False, 'error': 'Límite de almacenamiento superado'}), 413
+
+def _respuesta_trabajo_subida(trabajo):
+    """Respuesta 202 con el trabajo de subida encolado y la URL de su estado."""
+    url_estado = url_for('profesional.estado_subida_video',
+                         ejercicio_sesion_id=trabajo.ejercicio_sesion_id,
+                         trabajo_id=trabajo.id)
+    respuesta = jsonify(dict(trabajo.to_dict(), success=True, url_estado=url_estado))
+    respuesta.status_code = 202
+    respuesta.headers['Location'] = url_estado
+    return respuesta
+
+@profesional_bp.route('/guardar_video/<int:ejercicio_sesion_id>/trabajos/<trabajo_id>')
+@login_required
+def estado_subida_video(ejercicio_sesion_id, trabajo_id):
+    """
+    Estado de un trabajo de subida creado por guardar_video.
+    Si el trabajo no es de este worker (o ya se olvidó), se toma de su
+    registro compartido o, si no lo hay, se responde según exista o no el
+    VideoRespuesta del ejercicio.
+    
+    Args:
+        ejercicio_sesion_id: ID del Ejercicio_Sesion
+        trabajo_id: ID devuelto por guardar_video
+        
+    Returns:
+        JSON con estado (PENDIENTE, SUBIENDO, COMPLETADO o ERROR), mensaje y error
+    """
+    ejercicio_sesion = Ejercicio_Sesion.query.get_or_404(ejercicio_sesion_id)
+    if ejercicio_sesion.sesion.paciente.Usuario_Id != current_user.Id:
+        return jsonify({'success': False, 'error': 'Sin permisos'}), 403
 
-        except IntegrityError:
-            # Otra petición paralela insertó este registro justo antes del commit
-            db.session.rollback()
-            print(f"Video ya existente (race) para ejercicio_sesion_id={ejercicio_sesion_id}")
-            return jsonify({
-                'success': True,
-                'mensaje': 'Video ya existente (race), se ignora nueva subida'
-            }), 200
+    cola = cola_subidas()
+    trabajo = cola.consultar(trabajo_id) or cola.trabajo_de(ejercicio_sesion_id)
+    if trabajo is not None and trabajo.id == trabajo_id and trabajo.ejercicio_sesion_id == ejercicio_sesion_id:
+        return jsonify(dict(trabajo.to_dict(), success=trabajo.estado != ERROR))
 
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error al guardar video: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    if VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=ejercicio_sesion_id).first():
+        return jsonify({
+            'success': True,
+            'trabajo_id': trabajo_id,
+            'ejercicio_sesion_id': ejercicio_sesion_id,
+            'estado': COMPLETADO,
+            'mensaje': 'Video guardado correctamente',
+            'error': None
+        })
+    return jsonify({'success': False, 'error': 'Trabajo de subida no encontrado'}), 404
 
 
 
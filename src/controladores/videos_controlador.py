@@ -0,0 +1,180 @@
+"""
+Controlador de envío de los vídeos de demostración de los ejercicios y de sus
+portadas y rejillas de miniaturas.
+
+Sirve los vídeos del almacén local de ejercicios y los de ejemplo de
+static/videos con peticiones Range (206), ETag fuerte y caché larga, para
+que el reproductor pueda avanzar sin volver a descargar el vídeo. Con
+VIDEOS_ENVIO la aplicación solo autoriza y resuelve el fichero, y el proxy
+inverso envía los bytes:
+
+    x-sendfile        -> cabecera X-Sendfile con la ruta absoluta (Apache, lighttpd)
+    x-accel-redirect  -> cabecera X-Accel-Redirect con VIDEOS_ACCEL_PREFIJO/<origen>/<nombre> (nginx)
+
+Para nginx, cada origen necesita una location interna, p. ej.:
+
+    location /_videos/ejercicios/ { internal; alias /app/src/static/uploads/ejercicios/; }
+    location /_videos/demo/       { internal; alias /app/src/static/videos/; }
+"""
+
+import mimetypes
+import os
+
+from flask import Blueprint, Response, abort, current_app, redirect, send_file, url_for
+from flask_login import login_required
+
+from src.servicios.almacenamiento import AlmacenLocal, almacen_videos, clave_segura
+from src.servicios.indice_videos import indice_videos
+from src.servicios.miniaturas import clave_poster, clave_sprite, datos_rejilla
+from src.servicios.transcodificacion import clave_version, elegir_version
+
+videos_bp = Blueprint('videos', __name__, url_prefix='/videos')
+
+
+def ruta_video_ejercicio(nombre):
+    """
+    Busca en el índice de vídeos en disco el de un ejercicio: primero en el
+    almacén de ejercicios (si es local) y después entre los de ejemplo de
+    static/videos.
+
+    Args:
+        nombre: Nombre del vídeo (campo Video del ejercicio)
+
+    Returns:
+        tuple: (origen, ruta) con origen 'ejercicios' o 'demo', o None si no está en disco
+    """
+    return indice_videos().buscar(nombre)
+
+
+def _estado(encontrado):
+    """os.stat del vídeo encontrado, o None si ya no existe."""
+    try:
+        return os.stat(encontrado[1])
+    except FileNotFoundError:
+        return None
+
+
+@videos_bp.app_template_global()
+def url_video_ejercicio(nombre, versiones=None):
+    """
+    URL del vídeo de un ejercicio, en la versión transcodificada que
+    convenga a la conexión del navegador si las tiene. Los que están en
+    disco se sirven por /videos/<nombre>; el resto, por la URL del almacén.
+
+    Args:
+        nombre: Campo Video del ejercicio
+        versiones: Campo Versiones del ejercicio
+
+    Returns:
+        str: URL del video para usar en templates
+    """
+    version = elegir_version(versiones)
+    if version is not None:
+        nombre = clave_version(nombre, version)
+    if ruta_video_ejercicio(nombre) is not None:
+        return url_for('videos.video_ejercicio', nombre=nombre)
+    return almacen_videos('ejercicios').url(nombre)
+
+
+@videos_bp.app_template_global()
+def url_version_respuesta(video_respuesta):
+    """
+    URL de la versión transcodificada (MP4) de un vídeo de respuesta que
+    convenga a la conexión del navegador, o None si solo está el original.
+    """
+    version = elegir_version(video_respuesta.Versiones)
+    if version is None:
+        return None
+    clave = clave_version(f"respuesta_{video_respuesta.Ejercicio_Sesion_Id}.webm", version)
+    return almacen_videos('respuestas').url(clave)
+
+
+def _miniaturas(miniaturas, clave, url):
+    rejilla = datos_rejilla(miniaturas)
+    if rejilla is None:
+        return None
+    return dict(rejilla, poster=url(clave_poster(clave)), sprite=url(clave_sprite(clave)))
+
+
+@videos_bp.app_template_global()
+def miniaturas_ejercicio(ejercicio):
+    """
+    Portada y rejilla de miniaturas del vídeo de un ejercicio.
+
+    Returns:
+        dict: poster, sprite (URLs), columnas, filas e intervalo; None si no las tiene
+    """
+    return _miniaturas(ejercicio.Miniaturas, ejercicio.Video, url_video_ejercicio)
+
+
+@videos_bp.app_template_global()
+def miniaturas_respuesta(video_respuesta):
+    """Portada y rejilla de miniaturas de un vídeo de respuesta (como miniaturas_ejercicio)."""
+    return _miniaturas(video_respuesta.Miniaturas, f"respuesta_{video_respuesta.Ejercicio_Sesion_Id}.webm",
+                       almacen_videos('respuestas').url)
+
+
+def _etag(estado):
+    """ETag fuerte con la fecha de modificación y el tamaño, en el mismo formato que nginx."""
+    return f'{int(estado.st_mtime):x}-{estado.st_size:x}'
+
+
+def _respuesta_delegada(modo, origen, clave, ruta, estado):
+    """Respuesta vacía que indica al proxy inverso qué fichero enviar."""
+    respuesta = Response(mimetype=mimetypes.guess_type(clave)[0] or 'application/octet-stream')
+    if modo == 'x-sendfile':
+        respuesta.headers['X-Sendfile'] = os.path.abspath(ruta)
+    else:
+        prefijo = current_app.config['VIDEOS_ACCEL_PREFIJO'].rstrip('/')
+        respuesta.headers['X-Accel-Redirect'] = f'{prefijo}/{origen}/{clave}'
+    respuesta.set_etag(_etag(estado))
+    respuesta.last_modified = int(estado.st_mtime)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = current_app.config['VIDEOS_CACHE_MAX_AGE']
+    return respuesta
+
+
+@videos_bp.route('/<path:nombre>')
+@login_required
+def video_ejercicio(nombre):
+    """
+    Envía el vídeo de demostración de un ejercicio.
+
+    Atiende Range/If-Range (206 y 416), If-None-Match (304) y deja que el
+    navegador lo guarde en caché VIDEOS_CACHE_MAX_AGE segundos. Si el vídeo
+    no está en disco y el almacén de ejercicios es remoto, redirige a su URL.
+
+    Args:
+        nombre: Nombre del vídeo
+
+    Returns:
+        Response: Vídeo (200/206/304), delegado al proxy, redirección o 404
+    """
+    encontrado = ruta_video_ejercicio(nombre)
+    estado = _estado(encontrado) if encontrado else None
+    if encontrado is not None and estado is None:
+        # Se borró después de indexarlo: se vuelve a buscar en disco
+        indice_videos().olvidar(nombre)
+        encontrado = ruta_video_ejercicio(nombre)
+        estado = _estado(encontrado) if encontrado else None
+    if estado is None:
+        almacen = almacen_videos('ejercicios')
+        if isinstance(almacen, AlmacenLocal):
+            abort(404)
+        return redirect(almacen.url(nombre))
+
+    origen, ruta = encontrado
+    modo = (current_app.config.get('VIDEOS_ENVIO') or '').lower()
+    if modo in ('x-sendfile', 'x-accel-redirect'):
+        return _respuesta_delegada(modo, origen, clave_segura(nombre), ruta, estado)
+
+    respuesta = send_file(
+        ruta,
+        conditional=True,
+        etag=_etag(estado),
+        last_modified=estado.st_mtime,
+        max_age=current_app.config['VIDEOS_CACHE_MAX_AGE']
+    )
+    # Werkzeug solo lo anuncia al responder a un Range; el navegador lo necesita antes para avanzar
+    respuesta.accept_ranges = 'bytes'
+    return respuesta
@@ -3,6 +3,8 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from datetime import timedelta
+from src.servicios.estado_tiempo_real import estado_tiempo_real
+from src.servicios import sesiones_activas, diario_sesiones, subidas_video, subidas_reanudables, ficheros_subidos, procesado_ejercicios, transcodificacion, purga_videos, indice_videos, conexiones_largas
 
 # Instancias globales de extensiones
 db = SQLAlchemy()
@@ -21,6 +23,17 @@ def init_extensions(app):
     bcrypt.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app) 
+    estado_tiempo_real.init_app(app)
+    sesiones_activas.init_app(app)
+    diario_sesiones.init_app(app)
+    subidas_video.init_app(app)
+    subidas_reanudables.init_app(app)
+    ficheros_subidos.init_app(app)
+    procesado_ejercicios.init_app(app)
+    transcodificacion.init_app(app)
+    purga_videos.init_app(app)
+    indice_videos.init_app(app)
+    conexiones_largas.init_app(app)
 
     # Configuración de sesiones
     app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
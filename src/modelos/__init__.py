@@ -12,11 +12,15 @@ from .evaluacion import Evaluacion
 from .asociaciones import Paciente_Profesional, Ejercicio_Profesional
 from .ejercicio_sesion import Ejercicio_Sesion
 from .videoRespuesta import VideoRespuesta
+from .evento_sesion import EventoSesion
+from .subida_respuesta import SubidaRespuesta
+from .uso_almacenamiento import UsoAlmacenamiento
 
 
 __all__ = [
     'Usuario', 'Paciente', 'Profesional', 'Ejercicio',
     'Sesion', 'Ejercicio_Sesion', 'Evaluacion', 'VideoRespuesta',
-    'Paciente_Profesional', 'Ejercicio_Profesional'
+    'Paciente_Profesional', 'Ejercicio_Profesional', 'EventoSesion', 'SubidaRespuesta',
+    'UsoAlmacenamiento'
 ]
 
@@ -13,6 +13,14 @@ class Ejercicio(db.Model):
     Tipo = db.Column(db.String(50), nullable=False)  
     Video = db.Column(db.String(255), nullable=True)  
     Duracion = db.Column(db.Integer, nullable=False)  
+    # Vídeo pendiente de procesar en segundo plano (duración y almacén)
+    Procesando = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # Versiones transcodificadas disponibles en el almacén ('360p,720p')
+    Versiones = db.Column(db.String(100), nullable=True)
+    # Rejilla de miniaturas generada junto a la portada ('5x4@1.5'); None si no las tiene
+    Miniaturas = db.Column(db.String(50), nullable=True)
+    # Bytes del vídeo original (cuenta en el uso de almacenamiento de su usuario)
+    Tamano = db.Column(db.BigInteger, nullable=True)
     
     # Relación N:M con Profesionales (usando tabla intermedia)
     profesionales = db.relationship('Profesional', secondary='Ejercicio_Profesional',
@@ -50,5 +58,9 @@ class Ejercicio(db.Model):
             "Descripcion": self.Descripcion,
             "Tipo": self.Tipo,
             "Video": self.Video,
-            "Duracion": self.Duracion
+            "Duracion": self.Duracion,
+            "Procesando": self.Procesando,
+            "Versiones": self.Versiones,
+            "Miniaturas": self.Miniaturas,
+            "Tamano": self.Tamano
         }
\ No newline at end of file
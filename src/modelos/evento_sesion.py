@@ -0,0 +1,46 @@
+from src.extensiones import db
+from datetime import datetime
+import json
+
+class EventoSesion(db.Model):
+    """
+    Modelo de Evento de Sesión.
+    Diario (solo inserciones) de lo ocurrido durante una sesión guiada:
+    cambios de ejercicio, órdenes de grabación y fin de sesión.
+    Se escribe en lotes desde el diario de sesiones (src.servicios.diario_sesiones).
+    """
+    __tablename__ = 'Evento_Sesion'
+
+    TIPOS = ('EJERCICIO', 'GRABACION', 'TERMINADA', 'REANUDADA', 'FINALIZADA')
+
+    Id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    Sesion_Id = db.Column(db.Integer, db.ForeignKey('Sesion.Id'), nullable=False, index=True)
+    Tipo = db.Column(db.String(20), nullable=False)
+    Datos = db.Column(db.Text)
+    Fecha = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.CheckConstraint(
+            '"Tipo" IN (\'EJERCICIO\', \'GRABACION\', \'TERMINADA\', \'REANUDADA\', \'FINALIZADA\')',
+            name='check_tipo_evento_sesion'
+        ),
+    )
+
+    # Relación N:1 con Sesion
+    sesion = db.relationship('Sesion')
+
+    def datos(self):
+        """Datos del evento como diccionario."""
+        return json.loads(self.Datos) if self.Datos else {}
+
+    def __repr__(self):
+        return f"<EventoSesion Id={self.Id} Sesion_Id={self.Sesion_Id} Tipo={self.Tipo}>"
+
+    def to_dict(self):
+        return {
+            "Id": self.Id,
+            "Sesion_Id": self.Sesion_Id,
+            "Tipo": self.Tipo,
+            "Datos": self.datos(),
+            "Fecha": self.Fecha.isoformat()
+        }
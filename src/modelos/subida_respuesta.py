@@ -0,0 +1,31 @@
+from src.extensiones import db
+from datetime import datetime
+
+class SubidaRespuesta(db.Model):
+    """
+    Modelo de Subida de Respuesta.
+    Registro compartido por todos los workers de la subida del vídeo de un
+    ejercicio de sesión: como mucho una por Ejercicio_Sesion (clave primaria),
+    con el trabajo que la hace y la clave de idempotencia del navegador.
+    Lo gestiona la cola de subidas (src.servicios.subidas_video).
+    """
+    __tablename__ = 'Subida_Respuesta'
+
+    Ejercicio_Sesion_Id = db.Column(db.Integer, db.ForeignKey('Ejercicio_Sesion.Id', ondelete='CASCADE'),
+                                    primary_key=True)
+    Trabajo_Id = db.Column(db.String(32), nullable=False)
+    Clave_Idempotencia = db.Column(db.String(255), nullable=True)
+    Estado = db.Column(db.String(20), nullable=False)
+    Actualizado = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f"<SubidaRespuesta Ejercicio_Sesion_Id={self.Ejercicio_Sesion_Id} Estado={self.Estado}>"
+
+    def to_dict(self):
+        return {
+            "Ejercicio_Sesion_Id": self.Ejercicio_Sesion_Id,
+            "Trabajo_Id": self.Trabajo_Id,
+            "Clave_Idempotencia": self.Clave_Idempotencia,
+            "Estado": self.Estado,
+            "Actualizado": self.Actualizado.isoformat()
+        }
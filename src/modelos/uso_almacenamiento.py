@@ -0,0 +1,26 @@
+from src.extensiones import db
+
+class UsoAlmacenamiento(db.Model):
+    """
+    Modelo de Uso de Almacenamiento.
+    Contador por usuario de los bytes y vídeos que ocupan sus respuestas
+    (pacientes) o ejercicios (profesionales). Se actualiza en la misma
+    transacción que cada vídeo que se guarda o se borra
+    (src.servicios.uso_almacenamiento), así que la cuota se comprueba sin
+    recorrer el almacén.
+    """
+    __tablename__ = 'Uso_Almacenamiento'
+
+    Usuario_Id = db.Column(db.Integer, db.ForeignKey('Usuario.Id', ondelete='CASCADE'), primary_key=True)
+    Bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    Videos = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UsoAlmacenamiento Usuario_Id={self.Usuario_Id} Bytes={self.Bytes}>"
+
+    def to_dict(self):
+        return {
+            "Usuario_Id": self.Usuario_Id,
+            "Bytes": self.Bytes,
+            "Videos": self.Videos
+        }
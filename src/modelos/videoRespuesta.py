@@ -10,7 +10,13 @@ class VideoRespuesta(db.Model):
     
     Ejercicio_Sesion_Id = db.Column(db.Integer, db.ForeignKey('Ejercicio_Sesion.Id'), primary_key=True)
     Ruta_Almacenamiento = db.Column(db.String(255), nullable=False)
-    Fecha_Expiracion = db.Column(db.Date)
+    Fecha_Expiracion = db.Column(db.Date, index=True)  # la purga busca los caducados
+    # Versiones transcodificadas disponibles en el almacén ('360p,720p')
+    Versiones = db.Column(db.String(100), nullable=True)
+    # Rejilla de miniaturas generada junto a la portada ('5x4@1.5'); None si no las tiene
+    Miniaturas = db.Column(db.String(50), nullable=True)
+    # Bytes del vídeo original (cuenta en el uso de almacenamiento de su usuario)
+    Tamano = db.Column(db.BigInteger, nullable=True)
     
     # Relación 1:1 con EjercicioSesion
     ejercicio_sesion = db.relationship('Ejercicio_Sesion', back_populates='video_respuesta')
@@ -26,5 +32,8 @@ class VideoRespuesta(db.Model):
         return {
             "Ejercicio_Sesion_Id": self.Ejercicio_Sesion_Id,
             "Ruta_Almacenamiento": self.Ruta_Almacenamiento,
-            "Fecha_Expiracion": str(self.Fecha_Expiracion)
+            "Fecha_Expiracion": str(self.Fecha_Expiracion),
+            "Versiones": self.Versiones,
+            "Miniaturas": self.Miniaturas,
+            "Tamano": self.Tamano
         }
\ No newline at end of file
@@ -0,0 +1,5 @@
+"""
+Módulo de servicios de TerapiTrack.
+Contiene la lógica de soporte que no pertenece a un controlador concreto
+(estado en tiempo real de sesiones, almacenamiento, tareas en segundo plano).
+"""
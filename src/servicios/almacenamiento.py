@@ -0,0 +1,267 @@
+"""
+Almacenamiento de vídeos (ejercicios y respuestas de pacientes).
+
+Cada tipo de vídeo se guarda en un almacén elegido por configuración con una
+URL, igual que el estado en tiempo real:
+
+    local://ejercicios                  -> UPLOAD_FOLDER/ejercicios en disco
+    cloudinary://terapitrack/respuestas -> carpeta de Cloudinary
+
+ALMACEN_EJERCICIOS_URL y ALMACEN_RESPUESTAS_URL seleccionan el de cada uno.
+Todos ofrecen la misma interfaz (guardar, abrir, leer_rango, tamano, existe,
+borrar, url), así que los controladores no dependen del proveedor y el
+camino de E/S se puede medir en local.
+"""
+
+import os
+import posixpath
+import shutil
+import urllib.request
+import uuid
+from urllib.parse import urlparse
+
+from flask import current_app
+
+
+class AlmacenVideos:
+    """
+    Interfaz de un almacén de vídeos.
+
+    Las claves son nombres relativos con '/' como separador
+    (p. ej. 'ejercicio_1700000000.0.mp4').
+    """
+
+    esquema = None
+
+    def guardar(self, clave, origen):
+        """
+        Guarda un vídeo.
+
+        Args:
+            clave: Nombre del vídeo en el almacén
+            origen: Ruta de un fichero local o objeto con read(n)
+
+        Returns:
+            str: URL pública del vídeo (None si el proveedor no la devuelve)
+        """
+        raise NotImplementedError
+
+    def abrir(self, clave):
+        """Devuelve un objeto binario con read(n) para leer el vídeo entero."""
+        raise NotImplementedError
+
+    def leer_rango(self, clave, inicio, fin):
+        """Devuelve los bytes [inicio, fin] (ambos incluidos) del vídeo."""
+        raise NotImplementedError
+
+    def tamano(self, clave):
+        """Tamaño del vídeo en bytes."""
+        raise NotImplementedError
+
+    def existe(self, clave):
+        raise NotImplementedError
+
+    def borrar(self, clave):
+        """Borra el vídeo (no falla si no existe)."""
+        raise NotImplementedError
+
+    def url(self, clave):
+        """URL con la que el navegador puede reproducir el vídeo."""
+        raise NotImplementedError
+
+
+def clave_segura(clave):
+    """Normaliza la clave y rechaza rutas absolutas o que salgan del almacén."""
+    normalizada = posixpath.normpath(clave.replace('\\', '/'))
+    if normalizada.startswith(('/', '../')) or normalizada in ('.', '..'):
+        raise ValueError(f'Clave de vídeo no válida: {clave!r}')
+    return normalizada
+
+
+class AlmacenLocal(AlmacenVideos):
+    """Vídeos en un directorio local, servidos como ficheros estáticos."""
+
+    esquema = 'local'
+    TAM_BLOQUE = 1024 * 1024
+
+    def __init__(self, raiz, url_base=None):
+        self.raiz = raiz
+        self.url_base = url_base
+
+    def ruta(self, clave):
+        """Ruta en disco del vídeo."""
+        return os.path.join(self.raiz, *clave_segura(clave).split('/'))
+
+    def guardar(self, clave, origen):
+        destino = self.ruta(clave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if isinstance(origen, (str, os.PathLike)):
+            shutil.move(os.fspath(origen), destino)
+        else:
+            # Se escribe aparte y se renombra para no dejar vídeos a medias
+            temporal = f'{destino}.{uuid.uuid4().hex}.tmp'
+            try:
+                with open(temporal, 'wb') as f:
+                    shutil.copyfileobj(origen, f, self.TAM_BLOQUE)
+                os.replace(temporal, destino)
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+        return self.url(clave)
+
+    def abrir(self, clave):
+        return open(self.ruta(clave), 'rb')
+
+    def leer_rango(self, clave, inicio, fin):
+        with open(self.ruta(clave), 'rb') as f:
+            f.seek(inicio)
+            return f.read(fin - inicio + 1)
+
+    def tamano(self, clave):
+        return os.path.getsize(self.ruta(clave))
+
+    def existe(self, clave):
+        return os.path.isfile(self.ruta(clave))
+
+    def borrar(self, clave):
+        try:
+            os.remove(self.ruta(clave))
+        except FileNotFoundError:
+            pass
+
+    def url(self, clave):
+        if self.url_base is None:
+            return None
+        return f'{self.url_base.rstrip("/")}/{clave_segura(clave)}'
+
+
+_cloudinary_configurado = False
+
+
+def _cloudinary():
+    """
+    Importa el SDK de Cloudinary la primera vez que se usa (no al arrancar
+    cada worker) y le pasa las credenciales CLOUDINARY_* del entorno.
+    """
+    global _cloudinary_configurado
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.utils
+
+    if not _cloudinary_configurado:
+        credenciales = {
+            'cloud_name': os.environ.get('CLOUDINARY_CLOUD_NAME'),
+            'api_key': os.environ.get('CLOUDINARY_API_KEY'),
+            'api_secret': os.environ.get('CLOUDINARY_API_SECRET')
+        }
+        # Sin pisar lo que ya haya (p. ej. desde CLOUDINARY_URL)
+        cloudinary.config(**{k: v for k, v in credenciales.items() if v})
+        _cloudinary_configurado = True
+    return cloudinary
+
+
+class AlmacenCloudinary(AlmacenVideos):
+    """Vídeos en una carpeta de Cloudinary (credenciales CLOUDINARY_* del entorno)."""
+
+    esquema = 'cloudinary'
+    TIMEOUT = 30
+    # Portadas y rejillas de miniaturas que se guardan junto a los vídeos
+    EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.webp')
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta.strip('/')
+
+    def public_id(self, clave):
+        """public_id de Cloudinary (carpeta + clave sin extensión)."""
+        sin_extension = posixpath.splitext(clave_segura(clave))[0]
+        return posixpath.join(self.carpeta, sin_extension) if self.carpeta else sin_extension
+
+    def tipo_recurso(self, clave):
+        """resource_type de Cloudinary: 'image' para las imágenes, 'video' para el resto."""
+        return 'image' if posixpath.splitext(clave)[1].lower() in self.EXTENSIONES_IMAGEN else 'video'
+
+    def guardar(self, clave, origen):
+        carpeta, nombre = posixpath.split(self.public_id(clave))
+        resultado = _cloudinary().uploader.upload(
+            origen,
+            resource_type=self.tipo_recurso(clave),
+            folder=carpeta,
+            public_id=nombre,
+            overwrite=True,
+            unique_filename=False
+        )
+        return resultado.get('secure_url')
+
+    def _peticion(self, clave, metodo='GET', cabeceras=None):
+        peticion = urllib.request.Request(self.url(clave), method=metodo, headers=cabeceras or {})
+        return urllib.request.urlopen(peticion, timeout=self.TIMEOUT)
+
+    def abrir(self, clave):
+        return self._peticion(clave)
+
+    def leer_rango(self, clave, inicio, fin):
+        with self._peticion(clave, cabeceras={'Range': f'bytes={inicio}-{fin}'}) as respuesta:
+            datos = respuesta.read()
+        # Si el CDN ignora Range devuelve el vídeo entero
+        return datos if respuesta.status == 206 else datos[inicio:fin + 1]
+
+    def tamano(self, clave):
+        with self._peticion(clave, 'HEAD') as respuesta:
+            return int(respuesta.headers['Content-Length'])
+
+    def existe(self, clave):
+        try:
+            with self._peticion(clave, 'HEAD'):
+                return True
+        except OSError:
+            return False
+
+    def borrar(self, clave):
+        _cloudinary().uploader.destroy(self.public_id(clave), resource_type=self.tipo_recurso(clave),
+                                       invalidate=True)
+
+    def url(self, clave):
+        extension = posixpath.splitext(clave)[1].lstrip('.') or None
+        return _cloudinary().utils.cloudinary_url(
+            self.public_id(clave), resource_type=self.tipo_recurso(clave), format=extension, secure=True
+        )[0]
+
+
+def crear_almacen(url, app):
+    """
+    Crea el almacén indicado por una URL de configuración.
+
+    Args:
+        url: local://<subcarpeta de UPLOAD_FOLDER> o cloudinary://<carpeta>
+        app: Aplicación Flask (UPLOAD_FOLDER y carpeta estática)
+
+    Returns:
+        AlmacenVideos
+    """
+    partes = urlparse(url)
+    ruta = (partes.netloc + partes.path).strip('/')
+
+    if partes.scheme == 'local':
+        raiz = os.path.join(app.config['UPLOAD_FOLDER'], ruta)
+        url_base = None
+        relativa = os.path.relpath(os.path.abspath(raiz), os.path.abspath(app.static_folder))
+        if not relativa.startswith('..'):
+            url_base = app.static_url_path + '/' + relativa.replace(os.sep, '/')
+        return AlmacenLocal(raiz, url_base)
+    if partes.scheme == 'cloudinary':
+        return AlmacenCloudinary(ruta)
+    raise ValueError(f'Almacén de vídeos no soportado: {url}')
+
+
+def almacen_videos(tipo):
+    """
+    Almacén configurado para un tipo de vídeo de la aplicación actual.
+    Se construye con la configuración del momento (es un objeto ligero).
+
+    Args:
+        tipo: 'ejercicios' o 'respuestas'
+
+    Returns:
+        AlmacenVideos
+    """
+    return crear_almacen(current_app.config[f'ALMACEN_{tipo.upper()}_URL'], current_app)
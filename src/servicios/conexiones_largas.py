@@ -0,0 +1,62 @@
+"""
+Cupo de conexiones de larga duración de cada worker.
+
+Con gunicorn gthread cada stream de eventos, WebSocket o long-poll de
+estado_sesion ocupa uno de los hilos del worker mientras dura. Para que las
+conexiones abiertas de una clase no dejen sin hilos al resto de peticiones,
+como mucho CONEXIONES_LARGAS_MAXIMAS de ellas esperan a la vez en un worker
+(debe ser menor que --threads del Procfile). Con el cupo lleno, el stream de
+eventos y el WebSocket responden 503 con Retry-After (los clientes vuelven
+al polling de estado_sesion) y el long-poll contesta sin esperar.
+"""
+
+import threading
+
+from flask import current_app
+
+
+class CupoConexiones:
+    """Contador de conexiones de larga duración abiertas en el proceso."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._abiertas = 0
+
+    def ocupar(self):
+        """
+        Reserva un hueco para una conexión.
+
+        Returns:
+            bool: False si el cupo está lleno (no se reserva nada)
+        """
+        with self._lock:
+            if self._abiertas >= self.maximo:
+                return False
+            self._abiertas += 1
+            return True
+
+    def liberar(self):
+        """Devuelve el hueco de una conexión que ha terminado."""
+        with self._lock:
+            self._abiertas = max(self._abiertas - 1, 0)
+
+    @property
+    def abiertas(self):
+        with self._lock:
+            return self._abiertas
+
+
+def init_app(app):
+    """
+    Crea el cupo de conexiones de larga duración de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['conexiones_largas'] = CupoConexiones(app.config.get('CONEXIONES_LARGAS_MAXIMAS', 12))
+
+
+def cupo_conexiones():
+    """Devuelve el cupo de conexiones de larga duración de la aplicación actual."""
+    return current_app.extensions['conexiones_largas']
@@ -0,0 +1,150 @@
+"""
+Almacenamiento por contenido de los vídeos de ejercicios.
+
+Cada vídeo subido se guarda en el almacén de ejercicios con el SHA-256 que
+se calcula mientras se recibe (ficheros_subidos) como nombre, repartido en
+dos niveles de subcarpetas para que ningún directorio crezca sin límite:
+
+    ab/cd/abcd...<64 hex>.mp4
+
+Dos profesionales que suben el mismo vídeo comparten así un único fichero
+(y sus versiones y miniaturas). Las referencias son los Ejercicio cuyo
+campo Video es esa clave: el fichero solo se borra cuando ya no queda
+ninguno (liberar_video). migrar_videos_ejercicios() pasa a este esquema
+los vídeos guardados antes con nombre ejercicio_<timestamp>.mp4.
+"""
+
+import hashlib
+import posixpath
+import re
+
+from flask import current_app
+
+PATRON_CLAVE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[0-9a-z]+$')
+
+
+def clave_contenido(sha256, extension='.mp4'):
+    """Clave en el almacén de un vídeo a partir de su SHA-256 hexadecimal."""
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def es_clave_contenido(clave):
+    """Indica si la clave ya sigue el esquema por contenido."""
+    return bool(clave) and PATRON_CLAVE.match(clave) is not None
+
+
+def referencias(clave):
+    """Número de ejercicios que usan el vídeo `clave`."""
+    from src.modelos import Ejercicio
+
+    return Ejercicio.query.filter_by(Video=clave).count()
+
+
+def ejercicio_con_video(clave):
+    """
+    Un ejercicio ya procesado con el vídeo `clave` (para reutilizar su
+    duración, versiones y miniaturas). None si no lo hay o si el vídeo no
+    llegó al almacén (falló su procesado): entonces se procesa de nuevo, lo
+    que también arregla los ejercicios que ya apuntaban a él.
+    """
+    from src.modelos import Ejercicio
+    from src.servicios.almacenamiento import almacen_videos
+
+    ejercicio = Ejercicio.query.filter_by(Video=clave, Procesando=False).order_by(Ejercicio.Id).first()
+    if ejercicio is None or not almacen_videos('ejercicios').existe(clave):
+        return None
+    return ejercicio
+
+
+def claves_derivadas(clave):
+    """Claves de las versiones, la portada y la rejilla que pueden acompañar al vídeo."""
+    from src.servicios.miniaturas import clave_poster, clave_sprite
+    from src.servicios.transcodificacion import clave_version
+
+    versiones = [clave_version(clave, nombre) for nombre, _, _ in current_app.config['TRANSCODIFICACION_VERSIONES']]
+    return versiones + [clave_poster(clave), clave_sprite(clave)]
+
+
+def liberar_video(clave):
+    """
+    Borra del almacén de ejercicios el vídeo y sus derivados si ya no lo
+    usa ningún ejercicio.
+
+    Returns:
+        bool: True si se borró
+    """
+    from src.servicios.almacenamiento import almacen_videos
+
+    if not es_clave_contenido(clave) or referencias(clave) > 0:
+        return False
+    almacen = almacen_videos('ejercicios')
+    for derivada in [clave] + claves_derivadas(clave):
+        almacen.borrar(derivada)
+    return True
+
+
+def _sha256(ruta):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def _copiar(almacen, origen, destino):
+    """Copia `origen` en `destino` dentro del almacén si `destino` no existe ya."""
+    from src.servicios.transcodificacion import copia_local
+
+    if almacen.existe(destino):
+        return False
+    with copia_local(almacen, origen) as ruta, open(ruta, 'rb') as f:
+        almacen.guardar(destino, f)
+    return True
+
+
+def migrar_videos_ejercicios():
+    """
+    Pasa los vídeos de ejercicios con nombre plano al esquema por contenido.
+
+    Por cada vídeo: calcula su SHA-256, lo copia (con sus versiones y
+    miniaturas) a su clave por contenido si no estaba ya, apunta a ella los
+    ejercicios y solo entonces borra el original, así que se puede volver a
+    ejecutar si se interrumpe. Los vídeos de ejemplo de static/videos y las
+    URL externas no se tocan.
+
+    Returns:
+        dict: migrados, duplicados (ya había uno idéntico) y sin_fichero
+    """
+    from src.extensiones import db
+    from src.modelos import Ejercicio
+    from src.servicios.almacenamiento import almacen_videos
+    from src.servicios.transcodificacion import copia_local
+
+    almacen = almacen_videos('ejercicios')
+    resultado = {'migrados': 0, 'duplicados': 0, 'sin_fichero': 0}
+    claves = sorted(v for (v,) in db.session.query(Ejercicio.Video).distinct() if v)
+
+    for vieja in claves:
+        if vieja.startswith('http') or es_clave_contenido(vieja):
+            continue
+        if not almacen.existe(vieja):
+            resultado['sin_fichero'] += 1
+            continue
+
+        with copia_local(almacen, vieja) as ruta:
+            nueva = clave_contenido(_sha256(ruta), posixpath.splitext(vieja)[1] or '.mp4')
+        if _copiar(almacen, vieja, nueva):
+            resultado['migrados'] += 1
+        else:
+            resultado['duplicados'] += 1
+        for derivada_vieja, derivada_nueva in zip(claves_derivadas(vieja), claves_derivadas(nueva)):
+            if almacen.existe(derivada_vieja):
+                _copiar(almacen, derivada_vieja, derivada_nueva)
+
+        Ejercicio.query.filter_by(Video=vieja).update({'Video': nueva})
+        db.session.commit()
+        for derivada in [vieja] + claves_derivadas(vieja):
+            almacen.borrar(derivada)
+        current_app.logger.info('Vídeo de ejercicio %s -> %s', vieja, nueva)
+
+    return resultado
@@ -0,0 +1,214 @@
+"""
+Diario de eventos de las sesiones guiadas con escritura diferida.
+
+Los cambios de estado en tiempo real (ejercicio activo, grabación, fin de
+sesión) se anotan en un búfer en memoria y se vuelcan a la tabla
+Evento_Sesion en inserciones por lotes (group commit): cuando el búfer
+alcanza DIARIO_SESIONES_LOTE eventos o han pasado DIARIO_SESIONES_INTERVALO
+segundos desde el primero pendiente. Así las peticiones de estado_sesion no
+añaden una escritura síncrona en la base de datos.
+"""
+
+import atexit
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+
+class DiarioSesiones:
+    """
+    Búfer de eventos de una aplicación (uno por worker) y su hilo de volcado.
+
+    Con DIARIO_SESIONES_SEGUNDO_PLANO desactivado (tests) no se arranca el
+    hilo: se vuelca al llenarse el lote o al llamar a volcar().
+    """
+
+    MAX_INTENTOS = 5
+
+    def __init__(self, app):
+        self.app = app
+        self._pendientes = []
+        self._cambios = threading.Condition()
+        self._lock_volcado = threading.Lock()
+        self._hilo = None
+        self._primero_pendiente = None
+
+    @property
+    def tam_lote(self):
+        return self.app.config.get('DIARIO_SESIONES_LOTE', 50)
+
+    @property
+    def intervalo(self):
+        return self.app.config.get('DIARIO_SESIONES_INTERVALO', 2.0)
+
+    @property
+    def capacidad(self):
+        return self.app.config.get('DIARIO_SESIONES_CAPACIDAD', 10000)
+
+    def registrar(self, sesion_id, tipo, **datos):
+        """
+        Anota un evento (no toca la base de datos salvo que se llene el lote
+        sin hilo de volcado).
+
+        Args:
+            sesion_id: ID de la sesión
+            tipo: Uno de EventoSesion.TIPOS
+            **datos: Información del evento (se guarda como JSON)
+        """
+        fila = {
+            'Sesion_Id': sesion_id,
+            'Tipo': tipo,
+            'Datos': json.dumps(datos) if datos else None,
+            'Fecha': datetime.now(),
+        }
+        with self._cambios:
+            if len(self._pendientes) >= self.capacidad:
+                # Base de datos caída demasiado tiempo: se descarta lo más antiguo
+                self._pendientes.pop(0)
+            self._pendientes.append((fila, 0))
+            primero = self._primero_pendiente is None
+            if primero:
+                self._primero_pendiente = time.monotonic()
+            lleno = len(self._pendientes) >= self.tam_lote
+            if primero or lleno:
+                # El hilo espera sin plazo con el búfer vacío
+                self._cambios.notify()
+
+        if self.app.config.get('DIARIO_SESIONES_SEGUNDO_PLANO', True):
+            self._arrancar_hilo()
+        elif lleno:
+            self.volcar()
+
+    def pendientes(self):
+        """Número de eventos en el búfer sin volcar."""
+        with self._cambios:
+            return len(self._pendientes)
+
+    def volcar(self):
+        """
+        Inserta en un único lote todos los eventos pendientes.
+
+        Si el lote falla se reintenta fila a fila; las que vuelven a fallar se
+        devuelven al búfer (hasta MAX_INTENTOS) para el siguiente volcado.
+
+        Returns:
+            int: Número de eventos guardados
+        """
+        from src.extensiones import db
+        from src.modelos.evento_sesion import EventoSesion
+
+        with self._lock_volcado:
+            with self._cambios:
+                lote, self._pendientes = self._pendientes, []
+                self._primero_pendiente = None
+            if not lote:
+                return 0
+
+            with self.app.app_context():
+                tabla = EventoSesion.__table__
+                try:
+                    with db.engine.begin() as conexion:
+                        conexion.execute(tabla.insert(), [fila for fila, _ in lote])
+                    return len(lote)
+                except Exception:
+                    self.app.logger.exception('Error volcando %d eventos de sesión; se reintenta fila a fila', len(lote))
+
+                guardados = 0
+                fallidos = []
+                for fila, intentos in lote:
+                    try:
+                        with db.engine.begin() as conexion:
+                            conexion.execute(tabla.insert(), [fila])
+                        guardados += 1
+                    except Exception:
+                        if intentos + 1 < self.MAX_INTENTOS:
+                            fallidos.append((fila, intentos + 1))
+                        else:
+                            self.app.logger.error('Evento de sesión descartado tras %d intentos: %r', self.MAX_INTENTOS, fila)
+
+            if fallidos:
+                with self._cambios:
+                    self._pendientes[:0] = fallidos
+                    if self._primero_pendiente is None:
+                        self._primero_pendiente = time.monotonic()
+            return guardados
+
+    # ---------------------------
+    # Hilo de volcado
+    # ---------------------------
+
+    def _arrancar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._cambios:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name='diario-sesiones', daemon=True)
+            self._hilo.start()
+            atexit.register(self.volcar)
+
+    def _bucle(self):
+        while True:
+            with self._cambios:
+                while True:
+                    if len(self._pendientes) >= self.tam_lote:
+                        break
+                    if self._primero_pendiente is not None:
+                        restante = self._primero_pendiente + self.intervalo - time.monotonic()
+                        if restante <= 0:
+                            break
+                        self._cambios.wait(restante)
+                    else:
+                        self._cambios.wait()
+            try:
+                self.volcar()
+            except Exception:
+                self.app.logger.exception('Error en el hilo del diario de sesiones')
+                time.sleep(self.intervalo)
+
+
+def tiempos_por_ejercicio(eventos):
+    """
+    Calcula cuánto tiempo estuvo activo cada ejercicio a partir del diario.
+
+    Un ejercicio está activo desde su evento EJERCICIO hasta el siguiente
+    cambio de ejercicio o el fin de la sesión (TERMINADA / FINALIZADA).
+
+    Args:
+        eventos: Lista de EventoSesion ordenados por fecha
+
+    Returns:
+        list[dict]: {'ejercicio_sesion_id', 'inicio', 'segundos'} en orden;
+                    'segundos' es None para el ejercicio aún en curso
+    """
+    tramos = []
+    actual = None
+    for evento in eventos:
+        if evento.Tipo in ('EJERCICIO', 'TERMINADA', 'FINALIZADA'):
+            if actual is not None and actual['segundos'] is None:
+                actual['segundos'] = (evento.Fecha - actual['inicio']).total_seconds()
+            actual = None
+        if evento.Tipo == 'EJERCICIO':
+            ejercicio_id = evento.datos().get('ejercicio_sesion_id')
+            if ejercicio_id is not None:
+                actual = {'ejercicio_sesion_id': ejercicio_id, 'inicio': evento.Fecha, 'segundos': None}
+                tramos.append(actual)
+    return tramos
+
+
+def init_app(app):
+    """
+    Crea el diario de eventos de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['diario_sesiones'] = DiarioSesiones(app)
+
+
+def diario_sesiones():
+    """Devuelve el diario de eventos de la aplicación actual."""
+    return current_app.extensions['diario_sesiones']
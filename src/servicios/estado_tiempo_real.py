@@ -0,0 +1,962 @@
+"""
+Almacén del estado en tiempo real de las sesiones guiadas.
+
+Guarda, por sesión, el ejercicio activo, la marca de sesión terminada y el
+instante del último cambio, junto con un número de versión que crece con
+cada modificación (lo usan los clientes para peticiones condicionales y
+long-polling). Las entradas caducan solas: las de sesiones terminadas tras
+ESTADO_TTL_TERMINADA segundos y las inactivas tras ESTADO_TTL_INACTIVA,
+para que un worker de larga duración no acumule sesiones de meses. El backend se elige con ESTADO_SESION_URL para
+que todos los workers (y nodos) de gunicorn compartan el mismo estado:
+
+    - memoria://                 Diccionario del propio proceso (por defecto)
+    - mmap:///ruta/estado.bin    Fichero mapeado en memoria, compartido por
+                                 los workers de una misma máquina
+    - redis://host:6379/0        Cualquier servidor que hable el protocolo
+                                 Redis (RESP), compartido entre nodos
+"""
+
+import heapq
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from collections.abc import MutableMapping, MutableSet
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo hay exclusión entre hilos del proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_AUSENTE = object()
+
+
+class _Borrar:
+    """Valor especial de comparar_y_actualizar(): elimina el campo."""
+
+    def __repr__(self):
+        return 'BORRAR'
+
+
+BORRAR = _Borrar()
+
+
+def _mezclar(estado, campos):
+    """Aplica `campos` sobre `estado` (los valores BORRAR eliminan el campo)."""
+    for campo, valor in campos.items():
+        if valor is BORRAR:
+            estado.pop(campo, None)
+        else:
+            estado[campo] = valor
+
+
+# ---------------------------
+# Backend en memoria del proceso
+# ---------------------------
+
+class BackendMemoria:
+    """
+    Backend por defecto: un diccionario por proceso.
+    Solo es válido con un único worker (o para desarrollo y tests).
+    """
+
+    # Solo lo modifica este proceso: todo cambio pasa por EstadoTiempoReal
+    COMPARTIDO = False
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.RLock()
+
+    def leer(self, sesion_id):
+        """Devuelve una copia del estado de la sesión ({} si no existe)."""
+        with self._lock:
+            return dict(self._datos.get(sesion_id, {}))
+
+    def leer_varios(self, sesion_ids):
+        """Estados de varias sesiones en una sola operación ({id: estado})."""
+        with self._lock:
+            return {sid: dict(self._datos.get(sid, {})) for sid in sesion_ids}
+
+    def actualizar(self, sesion_id, campos):
+        """Mezcla los campos indicados en el estado e incrementa su versión."""
+        with self._lock:
+            estado = self._datos.setdefault(sesion_id, {})
+            estado.update(campos)
+            estado['version'] = estado.get('version', 0) + 1
+
+    def comparar_y_actualizar(self, sesion_id, version, campos):
+        """
+        Aplica `campos` solo si la versión actual es `version` (0 si no existe).
+
+        Returns:
+            bool: True si se escribió, False si otro escritor se adelantó
+        """
+        with self._lock:
+            estado = self._datos.get(sesion_id, {})
+            if estado.get('version', 0) != version:
+                return False
+            nuevo = dict(estado)
+            _mezclar(nuevo, campos)
+            nuevo['version'] = version + 1
+            self._datos[sesion_id] = nuevo
+            return True
+
+    def quitar(self, sesion_id, campos):
+        """Elimina campos concretos del estado (la versión se conserva e incrementa)."""
+        with self._lock:
+            estado = self._datos.get(sesion_id)
+            if estado is None:
+                return
+            quitados = [campo for campo in campos if estado.pop(campo, _AUSENTE) is not _AUSENTE]
+            if quitados:
+                estado['version'] = estado.get('version', 0) + 1
+
+    def eliminar(self, sesion_id):
+        """Elimina por completo el estado de la sesión."""
+        with self._lock:
+            self._datos.pop(sesion_id, None)
+
+    def ids(self):
+        """Ids de las sesiones con estado almacenado."""
+        with self._lock:
+            return list(self._datos)
+
+    def bytes_aproximados(self):
+        """Memoria aproximada ocupada por los estados (sys.getsizeof)."""
+        with self._lock:
+            total = sys.getsizeof(self._datos)
+            for estado in self._datos.values():
+                total += sys.getsizeof(estado)
+                total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in estado.items())
+            return total
+
+    def cerrar(self):
+        pass
+
+
+# ---------------------------
+# Backend en fichero mapeado en memoria (mmap)
+# ---------------------------
+
+class BackendMmap:
+    """
+    Tabla hash de tamaño fijo sobre un fichero mapeado en memoria.
+
+    Cada worker mapea el mismo fichero, así que una escritura de un worker es
+    visible inmediatamente para el resto. La exclusión entre procesos se hace
+    con flock sobre el fichero y entre hilos con un lock local.
+
+    Formato: cabecera de 64 bytes seguida de `num_slots` slots de 256 bytes
+    (id de sesión int64, longitud uint16 y el estado serializado en JSON).
+    """
+
+    COMPARTIDO = True
+
+    MAGIC = b'TTES'
+    VERSION = 2
+    TAM_CABECERA = 64
+    TAM_SLOT = 256
+    _SLOT = struct.Struct('<qH')
+    _CABECERA = struct.Struct('<4sII')
+    MAX_PAYLOAD = TAM_SLOT - _SLOT.size
+
+    VACIO = 0
+    BORRADO = -1
+
+    def __init__(self, ruta, num_slots=4096):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600)
+        self._mapa = None
+
+        with self._bloqueo(exclusivo=True):
+            tam = os.fstat(self._fd).st_size
+            if tam == 0:
+                os.ftruncate(self._fd, self.TAM_CABECERA + num_slots * self.TAM_SLOT)
+                self._mapa = mmap.mmap(self._fd, 0)
+                self._CABECERA.pack_into(self._mapa, 0, self.MAGIC, self.VERSION, num_slots)
+            else:
+                self._mapa = mmap.mmap(self._fd, 0)
+
+            magic, version, num_slots = self._CABECERA.unpack_from(self._mapa, 0)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f'El fichero {ruta} no es un almacén de estado válido')
+            self.num_slots = num_slots
+
+    @contextmanager
+    def _bloqueo(self, exclusivo):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, indice):
+        return self.TAM_CABECERA + indice * self.TAM_SLOT
+
+    def _id_slot(self, indice):
+        return self._SLOT.unpack_from(self._mapa, self._offset(indice))[0]
+
+    def _buscar(self, sesion_id, para_insertar=False):
+        """Sondeo lineal: devuelve el índice del slot de la sesión (o uno libre)."""
+        inicio = sesion_id % self.num_slots
+        primer_libre = None
+        for i in range(self.num_slots):
+            indice = (inicio + i) % self.num_slots
+            sid = self._id_slot(indice)
+            if sid == sesion_id:
+                return indice
+            if sid == self.BORRADO and primer_libre is None:
+                primer_libre = indice
+            elif sid == self.VACIO:
+                if not para_insertar:
+                    return None
+                return primer_libre if primer_libre is not None else indice
+        return primer_libre if para_insertar else None
+
+    def _leer_slot(self, indice):
+        offset = self._offset(indice)
+        _, longitud = self._SLOT.unpack_from(self._mapa, offset)
+        inicio = offset + self._SLOT.size
+        return json.loads(self._mapa[inicio:inicio + longitud].decode('utf-8'))
+
+    def _escribir_slot(self, indice, sesion_id, estado):
+        payload = json.dumps(estado, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.MAX_PAYLOAD:
+            raise ValueError(f'Estado de la sesión {sesion_id} demasiado grande para el almacén')
+        offset = self._offset(indice)
+        self._SLOT.pack_into(self._mapa, offset, sesion_id, len(payload))
+        inicio = offset + self._SLOT.size
+        self._mapa[inicio:inicio + len(payload)] = payload
+
+    def _validar_id(self, sesion_id):
+        if not isinstance(sesion_id, int) or sesion_id <= 0:
+            raise ValueError('El almacén mmap solo admite ids de sesión enteros positivos')
+
+    def leer(self, sesion_id):
+        self._validar_id(sesion_id)
+        with self._bloqueo(exclusivo=False):
+            indice = self._buscar(sesion_id)
+            return self._leer_slot(indice) if indice is not None else {}
+
+    def leer_varios(self, sesion_ids):
+        for sesion_id in sesion_ids:
+            self._validar_id(sesion_id)
+        resultado = {}
+        with self._bloqueo(exclusivo=False):
+            for sesion_id in sesion_ids:
+                indice = self._buscar(sesion_id)
+                resultado[sesion_id] = self._leer_slot(indice) if indice is not None else {}
+        return resultado
+
+    def actualizar(self, sesion_id, campos):
+        self._validar_id(sesion_id)
+        with self._bloqueo(exclusivo=True):
+            indice = self._buscar(sesion_id, para_insertar=True)
+            if indice is None:
+                raise RuntimeError('El almacén de estado de sesiones está lleno')
+            estado = self._leer_slot(indice) if self._id_slot(indice) == sesion_id else {}
+            estado.update(campos)
+            estado['version'] = estado.get('version', 0) + 1
+            self._escribir_slot(indice, sesion_id, estado)
+
+    def comparar_y_actualizar(self, sesion_id, version, campos):
+        self._validar_id(sesion_id)
+        with self._bloqueo(exclusivo=True):
+            indice = self._buscar(sesion_id, para_insertar=True)
+            if indice is None:
+                raise RuntimeError('El almacén de estado de sesiones está lleno')
+            estado = self._leer_slot(indice) if self._id_slot(indice) == sesion_id else {}
+            if estado.get('version', 0) != version:
+                return False
+            _mezclar(estado, campos)
+            estado['version'] = version + 1
+            self._escribir_slot(indice, sesion_id, estado)
+            return True
+
+    def quitar(self, sesion_id, campos):
+        self._validar_id(sesion_id)
+        with self._bloqueo(exclusivo=True):
+            indice = self._buscar(sesion_id)
+            if indice is None:
+                return
+            estado = self._leer_slot(indice)
+            quitados = [campo for campo in campos if estado.pop(campo, _AUSENTE) is not _AUSENTE]
+            if quitados:
+                estado['version'] = estado.get('version', 0) + 1
+                self._escribir_slot(indice, sesion_id, estado)
+
+    def eliminar(self, sesion_id):
+        self._validar_id(sesion_id)
+        with self._bloqueo(exclusivo=True):
+            indice = self._buscar(sesion_id)
+            if indice is not None:
+                self._SLOT.pack_into(self._mapa, self._offset(indice), self.BORRADO, 0)
+
+    def ids(self):
+        with self._bloqueo(exclusivo=False):
+            return [
+                sid for sid in (self._id_slot(i) for i in range(self.num_slots))
+                if sid > 0
+            ]
+
+    def bytes_aproximados(self):
+        """Bytes de los slots ocupados (el fichero completo tiene tamaño fijo)."""
+        return len(self.ids()) * self.TAM_SLOT
+
+    def cerrar(self):
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+# ---------------------------
+# Backend con protocolo Redis (RESP)
+# ---------------------------
+
+class ErrorRESP(Exception):
+    """Error devuelto por el servidor (respuestas que empiezan por '-')."""
+
+
+class ClienteRESP:
+    """
+    Cliente mínimo del protocolo Redis (RESP2) sobre un socket TCP.
+    Evita añadir una dependencia para los pocos comandos que necesitamos.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock = None
+        self._fichero = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _codificar(args):
+        partes = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                dato = arg
+            else:
+                dato = str(arg).encode('utf-8')
+            partes.append(b'$%d\r\n%s\r\n' % (len(dato), dato))
+        return b''.join(partes)
+
+    def _leer_respuesta(self):
+        linea = self._fichero.readline()
+        if not linea:
+            raise ConnectionError('Conexión cerrada por el servidor')
+        tipo, resto = linea[:1], linea[1:-2]
+        if tipo == b'+':
+            return resto.decode('utf-8')
+        if tipo == b'-':
+            raise ErrorRESP(resto.decode('utf-8'))
+        if tipo == b':':
+            return int(resto)
+        if tipo == b'$':
+            longitud = int(resto)
+            if longitud == -1:
+                return None
+            dato = self._fichero.read(longitud + 2)
+            return dato[:-2]
+        if tipo == b'*':
+            longitud = int(resto)
+            if longitud == -1:
+                return None
+            return [self._leer_respuesta() for _ in range(longitud)]
+        raise ErrorRESP(f'Respuesta RESP no reconocida: {linea!r}')
+
+    def _comando(self, *args):
+        self._sock.sendall(self._codificar(args))
+        return self._leer_respuesta()
+
+    def _conectar(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._fichero = self._sock.makefile('rb')
+        if self.password:
+            self._comando('AUTH', self.password)
+        if self.db:
+            self._comando('SELECT', self.db)
+
+    def ejecutar(self, *args, reintentar=True):
+        """Envía un comando y devuelve la respuesta (reintenta una vez si se cayó la conexión)."""
+        return self.ejecutar_varios([args], reintentar=reintentar)[0]
+
+    def ejecutar_varios(self, comandos, reintentar=True):
+        """
+        Envía varios comandos de una vez (pipelining) y devuelve sus respuestas
+        en el mismo orden: un único viaje de ida y vuelta al servidor.
+
+        Con reintentar=False no se reconecta en silencio: dentro de una
+        transacción (WATCH ... EXEC) una conexión nueva perdería el WATCH.
+        """
+        if not comandos:
+            return []
+        with self._lock:
+            for intento in range(2 if reintentar else 1):
+                try:
+                    if self._sock is None:
+                        if not reintentar:
+                            raise ConnectionError('Conexión perdida durante una transacción')
+                        self._conectar()
+                    self._sock.sendall(b''.join(self._codificar(args) for args in comandos))
+                    respuestas = []
+                    for _ in comandos:
+                        try:
+                            respuestas.append(self._leer_respuesta())
+                        except ErrorRESP as e:
+                            respuestas.append(e)
+                    break
+                except (OSError, ConnectionError):
+                    self._cerrar_socket()
+                    if intento or not reintentar:
+                        raise
+        for respuesta in respuestas:
+            if isinstance(respuesta, ErrorRESP):
+                raise respuesta
+        return respuestas
+
+    @contextmanager
+    def exclusivo(self):
+        """Reserva la conexión para una secuencia de comandos (p. ej. WATCH/MULTI/EXEC)."""
+        with self._lock:
+            yield self
+
+    def _cerrar_socket(self):
+        if self._fichero is not None:
+            self._fichero.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._fichero = None
+
+    def cerrar(self):
+        with self._lock:
+            self._cerrar_socket()
+
+
+class BackendRedis:
+    """
+    Guarda cada sesión como un hash `<prefijo>:<id>` (un campo JSON por clave)
+    y mantiene el conjunto `<prefijo>:ids` para poder enumerarlas.
+    HSET mezcla campos y HINCRBY incrementa la versión (un entero es también
+    JSON válido); cada escritura se envía como una transacción MULTI/EXEC en
+    un solo viaje, así que ningún lector ve los campos nuevos sin su versión.
+    """
+
+    COMPARTIDO = True
+
+    def __init__(self, cliente, prefijo='terapitrack:estado'):
+        self.cliente = cliente
+        self.prefijo = prefijo
+
+    def _clave(self, sesion_id):
+        return f'{self.prefijo}:{sesion_id}'
+
+    @staticmethod
+    def _decodificar(plano):
+        plano = plano or []
+        return {
+            plano[i].decode('utf-8'): json.loads(plano[i + 1])
+            for i in range(0, len(plano), 2)
+        }
+
+    def leer(self, sesion_id):
+        return self._decodificar(self.cliente.ejecutar('HGETALL', self._clave(sesion_id)))
+
+    def leer_varios(self, sesion_ids):
+        sesion_ids = list(sesion_ids)
+        respuestas = self.cliente.ejecutar_varios(
+            [('HGETALL', self._clave(sid)) for sid in sesion_ids]
+        )
+        return {sid: self._decodificar(plano) for sid, plano in zip(sesion_ids, respuestas)}
+
+    def actualizar(self, sesion_id, campos):
+        if not campos:
+            return
+        args = []
+        for campo, valor in campos.items():
+            args.extend([campo, json.dumps(valor)])
+        clave = self._clave(sesion_id)
+        self.cliente.ejecutar_varios([
+            ('MULTI',),
+            ('HSET', clave, *args),
+            ('HINCRBY', clave, 'version', 1),
+            ('SADD', f'{self.prefijo}:ids', sesion_id),
+            ('EXEC',)
+        ])
+
+    def comparar_y_actualizar(self, sesion_id, version, campos):
+        """CAS optimista con WATCH/MULTI/EXEC: EXEC se anula si la clave cambió."""
+        clave = self._clave(sesion_id)
+        poner, borrar = [], []
+        for campo, valor in campos.items():
+            if valor is BORRAR:
+                borrar.append(campo)
+            else:
+                poner.extend([campo, json.dumps(valor)])
+
+        with self.cliente.exclusivo():
+            self.cliente.ejecutar('WATCH', clave)
+            actual = self.cliente.ejecutar('HGET', clave, 'version', reintentar=False)
+            if int(actual or 0) != version:
+                self.cliente.ejecutar('UNWATCH', reintentar=False)
+                return False
+            comandos = [('MULTI',)]
+            if poner:
+                comandos.append(('HSET', clave, *poner))
+            if borrar:
+                comandos.append(('HDEL', clave, *borrar))
+            comandos.append(('HINCRBY', clave, 'version', 1))
+            comandos.append(('SADD', f'{self.prefijo}:ids', sesion_id))
+            comandos.append(('EXEC',))
+            return self.cliente.ejecutar_varios(comandos, reintentar=False)[-1] is not None
+
+    def quitar(self, sesion_id, campos):
+        """HDEL e HINCRBY en un MULTI/EXEC vigilado con WATCH; sin cambios si no había ningún campo."""
+        if not campos:
+            return
+        clave = self._clave(sesion_id)
+        while True:
+            with self.cliente.exclusivo():
+                self.cliente.ejecutar('WATCH', clave)
+                valores = self.cliente.ejecutar('HMGET', clave, *campos, reintentar=False)
+                if all(valor is None for valor in valores):
+                    self.cliente.ejecutar('UNWATCH', reintentar=False)
+                    return
+                if self.cliente.ejecutar_varios([
+                    ('MULTI',),
+                    ('HDEL', clave, *campos),
+                    ('HINCRBY', clave, 'version', 1),
+                    ('EXEC',)
+                ], reintentar=False)[-1] is not None:
+                    return
+
+    def eliminar(self, sesion_id):
+        self.cliente.ejecutar_varios([
+            ('MULTI',),
+            ('DEL', self._clave(sesion_id)),
+            ('SREM', f'{self.prefijo}:ids', sesion_id),
+            ('EXEC',)
+        ])
+
+    def ids(self):
+        miembros = self.cliente.ejecutar('SMEMBERS', f'{self.prefijo}:ids') or []
+        return [int(m) for m in miembros]
+
+    def bytes_aproximados(self):
+        """Tamaño de los estados serializados (sin la sobrecarga del servidor)."""
+        return sum(len(json.dumps(self.leer(sid))) for sid in self.ids())
+
+    def cerrar(self):
+        self.cliente.cerrar()
+
+
+def crear_backend(url):
+    """
+    Crea el backend indicado por la URL de configuración.
+
+    Args:
+        url: memoria://, mmap:///ruta[?slots=N] o redis://[:clave@]host:puerto/db[?prefijo=...]
+
+    Returns:
+        Backend de estado listo para usar
+    """
+    partes = urlparse(url or 'memoria://')
+    opciones = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+
+    if partes.scheme in ('', 'memoria'):
+        return BackendMemoria()
+
+    if partes.scheme == 'mmap':
+        ruta = partes.netloc + partes.path
+        return BackendMmap(ruta, num_slots=int(opciones.get('slots', 4096)))
+
+    if partes.scheme == 'redis':
+        db = int(partes.path.lstrip('/') or 0)
+        cliente = ClienteRESP(
+            host=partes.hostname or 'localhost',
+            port=partes.port or 6379,
+            db=db,
+            password=partes.password,
+            timeout=float(opciones.get('timeout', 5.0)),
+        )
+        return BackendRedis(cliente, prefijo=opciones.get('prefijo', 'terapitrack:estado'))
+
+    raise ValueError(f'Backend de estado de sesión no soportado: {partes.scheme}')
+
+
+# ---------------------------
+# Vistas de compatibilidad (dict / set)
+# ---------------------------
+
+class _VistaCampo(MutableMapping):
+    """Expone un campo del estado como diccionario {sesion_id: valor}."""
+
+    def __init__(self, almacen, campo):
+        self._almacen = almacen
+        self._campo = campo
+
+    def __getitem__(self, sesion_id):
+        estado = self._almacen.leer(sesion_id)
+        if self._campo not in estado:
+            raise KeyError(sesion_id)
+        return estado[self._campo]
+
+    def __setitem__(self, sesion_id, valor):
+        self._almacen.actualizar(sesion_id, **{self._campo: valor})
+
+    def __delitem__(self, sesion_id):
+        if sesion_id not in self:
+            raise KeyError(sesion_id)
+        self._almacen.quitar(sesion_id, self._campo)
+
+    def __iter__(self):
+        return iter([sid for sid in self._almacen.ids() if self._campo in self._almacen.leer(sid)])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+class _VistaTerminadas(MutableSet):
+    """Expone las sesiones marcadas como terminadas como un conjunto."""
+
+    def __init__(self, almacen):
+        self._almacen = almacen
+
+    def __contains__(self, sesion_id):
+        return bool(self._almacen.leer(sesion_id).get('terminada'))
+
+    def __iter__(self):
+        return iter([sid for sid in self._almacen.ids() if sid in self])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def add(self, sesion_id):
+        self._almacen.actualizar(sesion_id, terminada=True)
+
+    def discard(self, sesion_id):
+        self._almacen.quitar(sesion_id, 'terminada')
+
+
+# ---------------------------
+# Fachada configurable
+# ---------------------------
+
+class EstadoTiempoReal:
+    """
+    Punto de acceso único al estado en tiempo real de las sesiones.
+    Se configura con init_app() como el resto de extensiones.
+    """
+
+    TTL_TERMINADA = 15 * 60
+    TTL_INACTIVA = 4 * 3600
+    INTERVALO_BARRIDO = 3600
+
+    def __init__(self, reloj=time.time):
+        self._backend = None
+        self._url = None
+        self._cambios = threading.Condition()
+        self._reloj = reloj
+        self.ttl_terminada = self.TTL_TERMINADA
+        self.ttl_inactiva = self.TTL_INACTIVA
+        self.intervalo_barrido = self.INTERVALO_BARRIDO
+        # Montículo de (instante de caducidad, sesion_id) con borrado perezoso:
+        # solo es válida la entrada que coincide con _caducidades[sesion_id]
+        self._caducidades = {}
+        self._monticulo = []
+        self._lock_caducidad = threading.Lock()
+        self._config = None
+        self._hilo_barrido = None
+        self._fin_barrido = threading.Event()
+        self.ejercicio_activo = _VistaCampo(self, 'ejercicio_activo_id')
+        self.ultimo_cambio = _VistaCampo(self, 'ultimo_cambio')
+        self.terminadas = _VistaTerminadas(self)
+
+    def init_app(self, app):
+        """
+        Configura el backend a partir de app.config['ESTADO_SESION_URL'] y los
+        plazos de caducidad de ESTADO_TTL_TERMINADA / ESTADO_TTL_INACTIVA.
+
+        Args:
+            app: Instancia de la aplicación Flask
+        """
+        self.configurar(app.config.get('ESTADO_SESION_URL', 'memoria://'))
+        self.ttl_terminada = app.config.get('ESTADO_TTL_TERMINADA', self.TTL_TERMINADA)
+        self.ttl_inactiva = app.config.get('ESTADO_TTL_INACTIVA', self.TTL_INACTIVA)
+        self.intervalo_barrido = app.config.get('ESTADO_INTERVALO_BARRIDO', self.INTERVALO_BARRIDO)
+        self._config = app.config
+        app.extensions['estado_tiempo_real'] = self
+
+    def configurar(self, url):
+        """Cambia de backend (no hace nada si la URL no ha cambiado)."""
+        if self._backend is not None and url == self._url:
+            return
+        if self._backend is not None:
+            self._backend.cerrar()
+        self._backend = crear_backend(url)
+        self._url = url
+        with self._lock_caducidad:
+            self._caducidades.clear()
+            self._monticulo = []
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self.configurar('memoria://')
+        return self._backend
+
+    def leer(self, sesion_id):
+        """Estado completo de la sesión como diccionario."""
+        return self.backend.leer(sesion_id)
+
+    def leer_varios(self, sesion_ids):
+        """Estados de varias sesiones de una vez ({sesion_id: estado})."""
+        return self.backend.leer_varios(sesion_ids)
+
+    def actualizar(self, sesion_id, **campos):
+        """
+        Actualiza uno o varios campos del estado de la sesión.
+        Registra el instante en 'actualizado' y programa su caducidad.
+        """
+        ahora = self._reloj()
+        campos['actualizado'] = ahora
+        self.backend.actualizar(sesion_id, campos)
+        self._tras_escribir(sesion_id, ahora)
+
+    def transicion(self, sesion_id, decidir, intentos=20):
+        """
+        Aplica una transición de estado de forma atómica (compare-and-set).
+
+        `decidir(estado)` recibe el estado actual y devuelve (cambios, resultado).
+        Los cambios se escriben solo si la versión no ha cambiado desde la
+        lectura; si otro hilo o worker se adelantó, se vuelve a decidir con el
+        estado nuevo. Así una comprobación como el anti-rebote no puede
+        superarse dos veces a la vez.
+
+        Args:
+            sesion_id: ID de la sesión
+            decidir: Función estado -> (dict de cambios, resultado); los valores
+                     BORRAR eliminan el campo y un dict vacío no escribe nada
+            intentos: Máximo de reintentos por conflicto
+
+        Returns:
+            El resultado devuelto por la decisión que se aplicó
+        """
+        for _ in range(intentos):
+            estado = self.backend.leer(sesion_id)
+            cambios, resultado = decidir(estado)
+            if not cambios:
+                return resultado
+            ahora = self._reloj()
+            cambios = dict(cambios, actualizado=ahora)
+            if self.backend.comparar_y_actualizar(sesion_id, estado.get('version', 0), cambios):
+                self._tras_escribir(sesion_id, ahora)
+                return resultado
+        raise RuntimeError(f'Conflicto persistente al actualizar el estado de la sesión {sesion_id}')
+
+    def _tras_escribir(self, sesion_id, ahora):
+        """Programa la caducidad, despierta a los que esperan y purga lo vencido."""
+        self._programar_caducidad(sesion_id, ahora + min(self.ttl_terminada, self.ttl_inactiva))
+        self._notificar()
+        self.purgar_caducadas(ahora)
+        self._arrancar_barrido()
+
+    def quitar(self, sesion_id, *campos):
+        """Elimina campos del estado de la sesión."""
+        self.backend.quitar(sesion_id, campos)
+        self._notificar()
+
+    def eliminar(self, sesion_id):
+        """Elimina todo el estado de la sesión."""
+        self.backend.eliminar(sesion_id)
+        with self._lock_caducidad:
+            self._caducidades.pop(sesion_id, None)
+        self._notificar()
+
+    def _notificar(self):
+        with self._cambios:
+            self._cambios.notify_all()
+
+    def esperar_cambio(self, sesion_id, estado_conocido, timeout, intervalo=0.25):
+        """
+        Bloquea hasta que el estado de la sesión difiera de `estado_conocido`.
+
+        Los cambios hechos en este proceso despiertan la espera al instante;
+        los de otros workers se detectan releyendo el backend cada `intervalo`.
+        Con un backend que no comparte otro proceso no se relee: se espera
+        solo el aviso.
+
+        Args:
+            sesion_id: ID de la sesión
+            estado_conocido: Último estado visto por el llamante
+            timeout: Segundos máximos de espera
+            intervalo: Segundos entre relecturas del backend
+
+        Returns:
+            dict: Estado actual (igual a `estado_conocido` si venció el timeout)
+        """
+        limite = time.monotonic() + timeout
+        compartido = getattr(self.backend, 'COMPARTIDO', True)
+        while True:
+            if compartido:
+                estado = self.leer(sesion_id)
+            with self._cambios:
+                if not compartido:
+                    # Leído con el lock tomado, ningún aviso llega entre la lectura y la espera
+                    estado = self.leer(sesion_id)
+                restante = limite - time.monotonic()
+                if estado != estado_conocido or restante <= 0:
+                    return estado
+                self._cambios.wait(min(intervalo, restante) if compartido else restante)
+
+    def ids(self):
+        """Ids de las sesiones con estado almacenado."""
+        return self.backend.ids()
+
+    # ---------------------------
+    # Caducidad
+    # ---------------------------
+
+    def _caducidad(self, estado):
+        """Instante en el que caduca un estado según esté terminado o no."""
+        ttl = self.ttl_terminada if estado.get('terminada') else self.ttl_inactiva
+        return estado.get('actualizado', 0) + ttl
+
+    def _programar_caducidad(self, sesion_id, instante):
+        with self._lock_caducidad:
+            self._caducidades[sesion_id] = instante
+            heapq.heappush(self._monticulo, (instante, sesion_id))
+            # Cada escritura deja una entrada obsoleta; se compacta si dominan
+            if len(self._monticulo) > 2 * len(self._caducidades) + 64:
+                self._monticulo = [(t, sid) for sid, t in self._caducidades.items()]
+                heapq.heapify(self._monticulo)
+
+    def _extraer_vencida(self, ahora):
+        """Saca del montículo la siguiente sesión vencida (o None)."""
+        with self._lock_caducidad:
+            while self._monticulo and self._monticulo[0][0] <= ahora:
+                instante, sesion_id = heapq.heappop(self._monticulo)
+                if self._caducidades.get(sesion_id) == instante:
+                    del self._caducidades[sesion_id]
+                    return sesion_id
+            return None
+
+    def purgar_caducadas(self, ahora=None):
+        """
+        Elimina las sesiones cuyo plazo ha vencido.
+
+        Las escrituras de este proceso se siguen con un montículo ordenado por
+        caducidad, así que el coste es proporcional a las entradas vencidas.
+        Lo que el montículo no ve (escrituras de otros workers o anteriores a
+        un reinicio) lo elimina barrer() desde el hilo de barrido.
+
+        Args:
+            ahora: Instante de referencia (por defecto, el reloj actual)
+
+        Returns:
+            int: Número de sesiones eliminadas
+        """
+        ahora = self._reloj() if ahora is None else ahora
+        eliminadas = 0
+        while True:
+            sesion_id = self._extraer_vencida(ahora)
+            if sesion_id is None:
+                break
+            estado = self.backend.leer(sesion_id)
+            if not estado:
+                continue
+            caducidad = self._caducidad(estado)
+            if caducidad <= ahora:
+                self.eliminar(sesion_id)
+                eliminadas += 1
+            else:
+                # Se tocó después (quizá desde otro worker): se reprograma
+                self._programar_caducidad(sesion_id, caducidad)
+        return eliminadas
+
+    def barrer(self, ahora=None):
+        """Recorre todo el backend eliminando los estados caducados."""
+        ahora = self._reloj() if ahora is None else ahora
+        eliminadas = 0
+        for sesion_id in self.backend.ids():
+            estado = self.backend.leer(sesion_id)
+            if estado and self._caducidad(estado) <= ahora:
+                self.eliminar(sesion_id)
+                eliminadas += 1
+        return eliminadas
+
+    def _arrancar_barrido(self):
+        """
+        Arranca (con la primera escritura, no al importar la aplicación) el
+        hilo que recorre el backend completo al empezar y cada
+        `intervalo_barrido` segundos, fuera de las peticiones. Solo con
+        init_app() y ESTADO_BARRIDO_SEGUNDO_PLANO activado.
+        """
+        if self._config is None or not self._config.get('ESTADO_BARRIDO_SEGUNDO_PLANO', True):
+            return
+        if self._hilo_barrido is not None and self._hilo_barrido.is_alive():
+            return
+        with self._lock_caducidad:
+            if self._hilo_barrido is not None and self._hilo_barrido.is_alive():
+                return
+            self._fin_barrido.clear()
+            self._hilo_barrido = threading.Thread(target=self._bucle_barrido, name='barrido-estado', daemon=True)
+            self._hilo_barrido.start()
+
+    def detener_barrido(self):
+        """Detiene el hilo de barrido si está en marcha."""
+        self._fin_barrido.set()
+        if self._hilo_barrido is not None:
+            self._hilo_barrido.join()
+
+    def _bucle_barrido(self):
+        while True:
+            try:
+                self.barrer()
+            except Exception:
+                logger.exception('Error barriendo el estado en tiempo real')
+            if self._fin_barrido.wait(self.intervalo_barrido):
+                return
+
+    def metricas(self):
+        """
+        Indicadores del tamaño del almacén.
+
+        Returns:
+            dict: entradas, bytes aproximados y caducidades programadas en este proceso
+        """
+        backend = self.backend
+        return {
+            'backend': type(backend).__name__,
+            'entradas': len(backend.ids()),
+            'bytes_aproximados': backend.bytes_aproximados(),
+            'caducidades_programadas': len(self._caducidades),
+        }
+
+
+# Instancia global, configurada desde init_extensions()
+estado_tiempo_real = EstadoTiempoReal()
@@ -0,0 +1,158 @@
+"""
+Recepción en streaming de los ficheros subidos en formularios multipart.
+
+Por defecto Werkzeug guarda cada fichero del formulario en un temporal
+(o en memoria si la petición es pequeña) y la vista lo vuelve a copiar con
+FileStorage.save(). Con PeticionTerapiTrack como clase de petición, cada
+fichero se escribe según llega, por bloques, en un fichero del directorio de
+subidas. A la vez se calculan su tamaño y su SHA-256 y se aplican los
+límites (tamaño máximo y espacio libre mínimo en disco), así que la memoria
+por subida es constante. guardar_fichero_subido() lo mueve después a su
+destino con un simple renombrado.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+
+class EspacioInsuficiente(HTTPException):
+    """No queda espacio en disco para seguir recibiendo la subida."""
+
+    code = 507
+    description = 'No hay espacio suficiente para guardar el archivo.'
+
+
+class FicheroEntrante:
+    """
+    Fichero de un formulario que se está recibiendo, escrito en disco.
+
+    Attributes:
+        ruta: Ruta del fichero (None una vez movido a su destino)
+        tamano: Bytes recibidos
+    """
+
+    # Cada cuántos bytes recibidos se vuelve a mirar el espacio libre
+    INTERVALO_ESPACIO = 8 * 1024 * 1024
+
+    def __init__(self, directorio, tam_maximo=None, espacio_minimo=0):
+        os.makedirs(directorio, exist_ok=True)
+        fd, self.ruta = tempfile.mkstemp(dir=directorio, suffix='.subida')
+        self._fichero = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.directorio = directorio
+        self.tam_maximo = tam_maximo
+        self.espacio_minimo = espacio_minimo
+        self.tamano = 0
+        self._proxima_comprobacion = 0
+
+    @property
+    def sha256(self):
+        """SHA-256 (hexadecimal) de lo recibido."""
+        return self._hash.hexdigest()
+
+    def write(self, datos):
+        self.tamano += len(datos)
+        if self.tam_maximo is not None and self.tamano > self.tam_maximo:
+            self.close()
+            raise RequestEntityTooLarge('El archivo supera el tamaño máximo permitido.')
+        if self.espacio_minimo and self.tamano >= self._proxima_comprobacion:
+            self._proxima_comprobacion = self.tamano + self.INTERVALO_ESPACIO
+            if shutil.disk_usage(self.directorio).free < self.espacio_minimo:
+                self.close()
+                raise EspacioInsuficiente()
+        self._hash.update(datos)
+        return self._fichero.write(datos)
+
+    # Lectura y posición (FileStorage.save, stream.read...)
+    def read(self, *args):
+        return self._fichero.read(*args)
+
+    def readline(self, *args):
+        return self._fichero.readline(*args)
+
+    def seek(self, *args):
+        return self._fichero.seek(*args)
+
+    def tell(self):
+        return self._fichero.tell()
+
+    def flush(self):
+        self._fichero.flush()
+
+    def __iter__(self):
+        return iter(self._fichero)
+
+    @property
+    def closed(self):
+        return self._fichero.closed
+
+    def mover(self, destino):
+        """Cierra el fichero y lo mueve a `destino` (renombrado si es el mismo disco)."""
+        self._fichero.close()
+        shutil.move(self.ruta, destino)
+        self.ruta = None
+
+    def close(self):
+        """Cierra y borra el fichero si no se movió a su destino."""
+        self._fichero.close()
+        if self.ruta is not None:
+            try:
+                os.remove(self.ruta)
+            except FileNotFoundError:
+                pass
+            self.ruta = None
+
+
+class PeticionTerapiTrack(Request):
+    """Petición de Flask que recibe los ficheros del formulario con FicheroEntrante."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return FicheroEntrante(
+            config['SUBIDAS_DIRECTORIO'],
+            tam_maximo=config.get('SUBIDAS_TAM_MAXIMO_FICHERO'),
+            espacio_minimo=config.get('SUBIDAS_ESPACIO_MINIMO', 0)
+        )
+
+
+def guardar_fichero_subido(fichero, destino):
+    """
+    Guarda un fichero del formulario en `destino`.
+    Si ya se recibió en disco se mueve sin copiarlo; si no (otra clase de
+    petición), se copia por bloques calculando igualmente el SHA-256.
+
+    Args:
+        fichero: FileStorage de request.files o de un formulario WTForms
+        destino: Ruta final
+
+    Returns:
+        tuple: (tamaño en bytes, SHA-256 hexadecimal)
+    """
+    stream = fichero.stream
+    if isinstance(stream, FicheroEntrante) and stream.ruta is not None:
+        stream.mover(destino)
+        return stream.tamano, stream.sha256
+
+    resumen = hashlib.sha256()
+    tamano = 0
+    with open(destino, 'wb') as f:
+        for bloque in iter(lambda: stream.read(64 * 1024), b''):
+            resumen.update(bloque)
+            tamano += len(bloque)
+            f.write(bloque)
+    return tamano, resumen.hexdigest()
+
+
+def init_app(app):
+    """
+    Recibe los ficheros de los formularios de la aplicación en streaming.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.request_class = PeticionTerapiTrack
@@ -0,0 +1,169 @@
+"""
+Índice en memoria de los vídeos de ejercicios que hay en disco.
+
+url_video_ejercicio y /videos/<nombre> necesitan saber si cada vídeo está
+en el almacén local de ejercicios o entre los de ejemplo de static/videos.
+En lugar de comprobarlo con dos llamadas al sistema de ficheros por vídeo
+(lentas en un disco de red), cada worker recorre ambos directorios una vez
+y resuelve cada nombre con una consulta a un diccionario.
+
+El índice se construye con la primera búsqueda y se vuelve a construir cada
+VIDEOS_INDICE_TTL segundos o si cambia la configuración del almacén; el
+recorrido se hace fuera del lock (uno solo a la vez, mientras tanto se usa
+el índice anterior) y el resultado se cambia de una vez. Un nombre que no
+está en el índice se busca en disco, así que los vídeos que guarda otro
+worker aparecen en cuanto se piden. Los que no están se recuerdan hasta el
+siguiente recorrido, como mucho VIDEOS_INDICE_AUSENTES (los menos usados se
+olvidan antes), de modo que un vídeo que se pidió antes de guardarlo se
+sirve con la URL del almacén hasta entonces. El procesado de ejercicios
+olvida (olvidar()) el vídeo que guarda, igual que /videos/<nombre> el que
+ya no está en disco al enviarlo.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from src.servicios.almacenamiento import AlmacenLocal, almacen_videos, clave_segura
+
+
+class IndiceVideos:
+    """Nombres de vídeo -> (origen, ruta) de los vídeos en disco de una aplicación."""
+
+    AUSENTES = 10000
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._lock_recorrido = threading.Lock()
+        self._rutas = {}
+        self._ausentes = OrderedDict()
+        self._raices = None
+        self._ajustes = None
+        self._construido = None
+
+    def buscar(self, nombre):
+        """
+        Ubicación en disco de un vídeo de ejercicio.
+
+        Args:
+            nombre: Nombre del vídeo (campo Video del ejercicio o una de sus versiones)
+
+        Returns:
+            tuple: (origen, ruta) con origen 'ejercicios' o 'demo', o None si no está en disco
+        """
+        try:
+            clave = clave_segura(nombre)
+        except ValueError:
+            return None
+
+        config = self.app.config
+        ajustes = (config['ALMACEN_EJERCICIOS_URL'], config['UPLOAD_FOLDER'], self.app.static_folder)
+        self._actualizar(ajustes)
+        with self._lock:
+            if clave in self._rutas:
+                return self._rutas[clave]
+            if clave in self._ausentes:
+                self._ausentes.move_to_end(clave)
+                return None
+            raices = self._raices
+
+        encontrado = self._comprobar(raices, clave)
+        with self._lock:
+            if self._raices == raices:
+                if encontrado is not None:
+                    self._rutas[clave] = encontrado
+                else:
+                    self._ausentes[clave] = True
+                    while len(self._ausentes) > config.get('VIDEOS_INDICE_AUSENTES', self.AUSENTES):
+                        self._ausentes.popitem(last=False)
+        return encontrado
+
+    def olvidar(self, nombre):
+        """Quita un vídeo del índice para que la próxima búsqueda mire el disco."""
+        try:
+            clave = clave_segura(nombre)
+        except ValueError:
+            return
+        with self._lock:
+            self._rutas.pop(clave, None)
+            self._ausentes.pop(clave, None)
+
+    def _vigente(self, ajustes):
+        with self._lock:
+            return (ajustes == self._ajustes
+                    and time.monotonic() - self._construido < self.app.config.get('VIDEOS_INDICE_TTL', 300))
+
+    def _actualizar(self, ajustes):
+        """Vuelve a recorrer los directorios si el índice caducó o cambió la configuración."""
+        if self._vigente(ajustes):
+            return
+        # Un solo recorrido a la vez; con el índice caducado pero de la misma
+        # configuración, el resto de hilos sigue con el anterior mientras tanto
+        with self._lock:
+            esperar = ajustes != self._ajustes
+        if not self._lock_recorrido.acquire(blocking=esperar):
+            return
+        try:
+            if self._vigente(ajustes):
+                return
+            raices = self._raices_actuales()
+            rutas = self._recorrer(raices)
+            with self._lock:
+                self._rutas = rutas
+                self._ausentes = OrderedDict()
+                self._raices = raices
+                self._ajustes = ajustes
+                self._construido = time.monotonic()
+        finally:
+            self._lock_recorrido.release()
+
+    def _raices_actuales(self):
+        """Directorios a indexar: (origen, raíz), primero el almacén local de ejercicios."""
+        raices = []
+        almacen = almacen_videos('ejercicios')
+        if isinstance(almacen, AlmacenLocal):
+            raices.append(('ejercicios', os.path.abspath(almacen.raiz)))
+        raices.append(('demo', os.path.abspath(os.path.join(self.app.static_folder, 'videos'))))
+        return tuple(raices)
+
+    @staticmethod
+    def _recorrer(raices):
+        rutas = {}
+        # Las raíces anteriores tienen preferencia
+        for origen, raiz in reversed(raices):
+            for directorio, _, ficheros in os.walk(raiz):
+                relativo = os.path.relpath(directorio, raiz)
+                for fichero in ficheros:
+                    if fichero.endswith('.tmp'):
+                        # Vídeo a medio escribir por AlmacenLocal.guardar
+                        continue
+                    clave = fichero if relativo == '.' else f"{relativo.replace(os.sep, '/')}/{fichero}"
+                    rutas[clave] = (origen, os.path.join(directorio, fichero))
+        return rutas
+
+    @staticmethod
+    def _comprobar(raices, clave):
+        for origen, raiz in raices:
+            ruta = os.path.join(raiz, *clave.split('/'))
+            if os.path.isfile(ruta):
+                return origen, ruta
+        return None
+
+
+def init_app(app):
+    """
+    Crea el índice de vídeos en disco de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['indice_videos'] = IndiceVideos(app)
+
+
+def indice_videos():
+    """Devuelve el índice de vídeos de la aplicación actual."""
+    return current_app.extensions['indice_videos']
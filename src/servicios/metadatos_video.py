@@ -0,0 +1,335 @@
+"""
+Lectura de los metadatos de un vídeo MP4 o WebM sin decodificarlo.
+
+Recorre las cajas de MP4 (moov/mvhd y las pistas moov/trak) y los elementos
+EBML de WebM/Matroska (Segment/Info y Segment/Tracks) saltando con seek
+por encima de los datos de imagen y sonido, así que solo lee unos pocos KB
+sea cual sea el tamaño del vídeo. Sirve para conocer la duración sin
+importar MoviePy (numpy, imageio, ffmpeg) y para comprobar que una subida
+es realmente un vídeo.
+"""
+
+import os
+import struct
+
+
+class VideoNoValido(ValueError):
+    """El fichero no es un MP4 ni un WebM que se pueda leer."""
+
+
+class MetadatosVideo:
+    """
+    Metadatos del contenedor de un vídeo.
+
+    Attributes:
+        formato: 'mp4', 'webm' o 'matroska'
+        duracion_ms: Duración en milisegundos (None si la cabecera no la trae,
+            como en las grabaciones de MediaRecorder)
+        ancho: Ancho en píxeles de la pista de vídeo (None si no hay)
+        alto: Alto en píxeles de la pista de vídeo (None si no hay)
+        codec: Códec de la pista de vídeo ('avc1', 'V_VP8'...; None si no hay)
+    """
+
+    def __init__(self, formato, duracion_ms=None, ancho=None, alto=None, codec=None):
+        self.formato = formato
+        self.duracion_ms = duracion_ms
+        self.ancho = ancho
+        self.alto = alto
+        self.codec = codec
+
+    @property
+    def tiene_video(self):
+        return self.codec is not None
+
+    def to_dict(self):
+        return {
+            "formato": self.formato,
+            "duracion_ms": self.duracion_ms,
+            "ancho": self.ancho,
+            "alto": self.alto,
+            "codec": self.codec
+        }
+
+    def __repr__(self):
+        return (f"<MetadatosVideo {self.formato} {self.duracion_ms} ms "
+                f"{self.ancho}x{self.alto} {self.codec}>")
+
+
+def leer_metadatos(origen):
+    """
+    Lee la duración, la resolución y el códec de un vídeo MP4 o WebM.
+
+    Args:
+        origen: Ruta del fichero u objeto binario con read y seek
+
+    Returns:
+        MetadatosVideo
+
+    Raises:
+        VideoNoValido: Si no es un MP4/WebM o la cabecera está incompleta
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, 'rb') as f:
+            return leer_metadatos(f)
+
+    origen.seek(0, os.SEEK_END)
+    fin = origen.tell()
+    origen.seek(0)
+    inicio = origen.read(12)
+    if inicio[:4] == _EBML:
+        return _leer_webm(origen, fin)
+    if len(inicio) >= 8 and inicio[4:8] in _CAJAS_INICIALES_MP4:
+        return _leer_mp4(origen, fin)
+    raise VideoNoValido('El archivo no es un vídeo MP4 ni WebM')
+
+
+def validar_grabacion(ruta):
+    """
+    Comprueba que un fichero subido es un vídeo MP4/WebM con pista de vídeo.
+
+    Returns:
+        MetadatosVideo
+
+    Raises:
+        VideoNoValido
+    """
+    metadatos = leer_metadatos(ruta)
+    if not metadatos.tiene_video:
+        raise VideoNoValido('El archivo no contiene una pista de vídeo')
+    return metadatos
+
+
+# ---------------------------
+# MP4 (ISO BMFF)
+# ---------------------------
+
+# Cajas con las que puede empezar un MP4/MOV
+_CAJAS_INICIALES_MP4 = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide')
+
+
+def _leer(f, n):
+    datos = f.read(n)
+    if len(datos) < n:
+        raise VideoNoValido('Cabecera de vídeo incompleta')
+    return datos
+
+
+def _cajas(f, inicio, fin):
+    """Recorre las cajas entre inicio y fin: (tipo, inicio de los datos, fin de la caja)."""
+    pos = inicio
+    while pos + 8 <= fin:
+        f.seek(pos)
+        tam, tipo = struct.unpack('>I4s', _leer(f, 8))
+        datos = pos + 8
+        if tam == 1:
+            tam = struct.unpack('>Q', _leer(f, 8))[0]
+            datos += 8
+        elif tam == 0:
+            # Hasta el final del contenedor
+            tam = fin - pos
+        if tam < datos - pos or pos + tam > fin:
+            raise VideoNoValido(f'Caja MP4 {tipo!r} corrupta')
+        yield tipo, datos, pos + tam
+        pos += tam
+
+
+def _hija(f, tipo, inicio, fin):
+    """Primera caja `tipo` entre inicio y fin (None si no está)."""
+    for encontrado, datos, final in _cajas(f, inicio, fin):
+        if encontrado == tipo:
+            return datos, final
+    return None
+
+
+def _leer_mp4(f, fin):
+    moov = _hija(f, b'moov', 0, fin)
+    if moov is None:
+        raise VideoNoValido('El MP4 no tiene caja moov')
+    metadatos = MetadatosVideo('mp4')
+
+    mvhd = _hija(f, b'mvhd', *moov)
+    if mvhd is not None:
+        f.seek(mvhd[0])
+        version = _leer(f, 1)[0]
+        if version == 1:
+            f.seek(mvhd[0] + 20)
+            escala, duracion = struct.unpack('>IQ', _leer(f, 12))
+            desconocida = duracion == 0xFFFFFFFFFFFFFFFF
+        else:
+            f.seek(mvhd[0] + 12)
+            escala, duracion = struct.unpack('>II', _leer(f, 8))
+            desconocida = duracion == 0xFFFFFFFF
+        if escala and not desconocida:
+            metadatos.duracion_ms = duracion * 1000 // escala
+
+    for tipo, datos, final in _cajas(f, *moov):
+        if tipo != b'trak':
+            continue
+        mdia = _hija(f, b'mdia', datos, final)
+        hdlr = mdia and _hija(f, b'hdlr', *mdia)
+        if hdlr is None:
+            continue
+        f.seek(hdlr[0] + 8)
+        if _leer(f, 4) != b'vide':
+            continue
+        minf = _hija(f, b'minf', *mdia)
+        stbl = minf and _hija(f, b'stbl', *minf)
+        stsd = stbl and _hija(f, b'stsd', *stbl)
+        if stsd is None:
+            continue
+        # stsd: versión y flags, número de entradas y la primera entrada visual
+        f.seek(stsd[0] + 8)
+        entrada = _leer(f, 36)
+        metadatos.codec = entrada[4:8].decode('ascii', 'replace')
+        metadatos.ancho, metadatos.alto = struct.unpack('>HH', entrada[32:36])
+        break
+    return metadatos
+
+
+# ---------------------------
+# WebM / Matroska (EBML)
+# ---------------------------
+
+_EBML = b'\x1a\x45\xdf\xa3'
+
+ID_EBML = 0x1A45DFA3
+ID_DOCTYPE = 0x4282
+ID_SEGMENT = 0x18538067
+ID_INFO = 0x1549A966
+ID_TIMECODE_SCALE = 0x2AD7B1
+ID_DURACION = 0x4489
+ID_TRACKS = 0x1654AE6B
+ID_TRACK_ENTRY = 0xAE
+ID_TRACK_TYPE = 0x83
+ID_CODEC = 0x86
+ID_VIDEO = 0xE0
+ID_ANCHO = 0xB0
+ID_ALTO = 0xBA
+ID_CLUSTER = 0x1F43B675
+
+# Tamaño máximo de un valor que se lee en memoria (cadenas y números)
+_MAX_VALOR = 1024
+
+
+def _vint(f, conservar_marca):
+    """Entero de longitud variable de EBML; None si es un tamaño desconocido."""
+    primero = _leer(f, 1)[0]
+    if primero == 0:
+        raise VideoNoValido('Entero EBML no válido')
+    longitud = 1
+    while not primero & (0x80 >> (longitud - 1)):
+        longitud += 1
+    valor = primero if conservar_marca else primero & (0xFF >> longitud)
+    resto = _leer(f, longitud - 1)
+    for byte in resto:
+        valor = (valor << 8) | byte
+    if not conservar_marca and valor == (1 << (7 * longitud)) - 1:
+        return None
+    return valor
+
+
+def _elementos(f, inicio, fin):
+    """Recorre los elementos entre inicio y fin: (id, inicio de los datos, fin o None si es desconocido)."""
+    pos = inicio
+    while pos < fin:
+        f.seek(pos)
+        id_elemento = _vint(f, True)
+        tam = _vint(f, False)
+        datos = f.tell()
+        final = None if tam is None else datos + tam
+        if final is not None and final > fin:
+            # Fichero truncado: se usa lo que haya
+            final = fin
+        yield id_elemento, datos, final
+        if final is None:
+            return
+        pos = final
+
+
+def _valor(f, datos, final):
+    if final - datos > _MAX_VALOR:
+        raise VideoNoValido('Valor EBML demasiado grande')
+    f.seek(datos)
+    return _leer(f, final - datos)
+
+
+def _entero(f, datos, final):
+    return int.from_bytes(_valor(f, datos, final), 'big')
+
+
+def _leer_webm(f, fin):
+    elementos = _elementos(f, 0, fin)
+    id_cabecera, datos, final = next(elementos)
+    if id_cabecera != ID_EBML or final is None:
+        raise VideoNoValido('Cabecera EBML no válida')
+    formato = None
+    for id_elemento, d, fi in _elementos(f, datos, final):
+        if id_elemento == ID_DOCTYPE and fi is not None:
+            formato = _valor(f, d, fi).rstrip(b'\x00').decode('ascii', 'replace')
+    if formato not in ('webm', 'matroska'):
+        raise VideoNoValido(f'Tipo de documento EBML no soportado: {formato}')
+
+    segmento = None
+    for id_elemento, d, fi in _elementos(f, final, fin):
+        if id_elemento == ID_SEGMENT:
+            # Las grabaciones en directo no conocen el tamaño del segmento
+            segmento = (d, fi if fi is not None else fin)
+            break
+    if segmento is None:
+        raise VideoNoValido('El WebM no tiene segmento')
+
+    metadatos = MetadatosVideo(formato)
+    for id_elemento, d, fi in _elementos(f, *segmento):
+        if id_elemento == ID_CLUSTER or fi is None:
+            # Empiezan los datos (o un elemento que no se puede saltar)
+            break
+        if id_elemento == ID_INFO:
+            _leer_info(f, d, fi, metadatos)
+        elif id_elemento == ID_TRACKS:
+            _leer_pistas(f, d, fi, metadatos)
+    return metadatos
+
+
+def _leer_info(f, inicio, fin, metadatos):
+    escala = 1000000  # nanosegundos por unidad de tiempo (valor por defecto)
+    duracion = None
+    for id_elemento, d, fi in _elementos(f, inicio, fin):
+        if fi is None:
+            break
+        if id_elemento == ID_TIMECODE_SCALE:
+            escala = _entero(f, d, fi)
+        elif id_elemento == ID_DURACION:
+            valor = _valor(f, d, fi)
+            if len(valor) == 4:
+                duracion = struct.unpack('>f', valor)[0]
+            elif len(valor) == 8:
+                duracion = struct.unpack('>d', valor)[0]
+    if duracion is not None:
+        metadatos.duracion_ms = int(duracion * escala / 1000000)
+
+
+def _leer_pistas(f, inicio, fin, metadatos):
+    for id_elemento, d, fi in _elementos(f, inicio, fin):
+        if fi is None:
+            break
+        if id_elemento != ID_TRACK_ENTRY:
+            continue
+        tipo = codec = ancho = alto = None
+        for id_campo, dc, fc in _elementos(f, d, fi):
+            if fc is None:
+                break
+            if id_campo == ID_TRACK_TYPE:
+                tipo = _entero(f, dc, fc)
+            elif id_campo == ID_CODEC:
+                codec = _valor(f, dc, fc).rstrip(b'\x00').decode('ascii', 'replace')
+            elif id_campo == ID_VIDEO:
+                for id_video, dv, fv in _elementos(f, dc, fc):
+                    if fv is None:
+                        break
+                    if id_video == ID_ANCHO:
+                        ancho = _entero(f, dv, fv)
+                    elif id_video == ID_ALTO:
+                        alto = _entero(f, dv, fv)
+        if tipo == 1:
+            metadatos.codec, metadatos.ancho, metadatos.alto = codec, ancho, alto
+            return
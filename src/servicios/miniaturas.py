@@ -0,0 +1,130 @@
+"""
+Fotogramas de portada y rejillas de miniaturas de los vídeos.
+
+Junto a las versiones transcodificadas se genera, con el mismo ffmpeg y la
+misma copia local del vídeo, una portada (<nombre>_poster.jpg) que las
+páginas usan como poster del <video> con preload="none", para no pedir
+los metadatos de cada vídeo al abrir la página, y una rejilla de
+miniaturas (<nombre>_sprite.jpg) con un fotograma cada cierto intervalo
+para previsualizar la posición al pasar el ratón por la barra de avance.
+
+El campo Miniaturas del Ejercicio o del VideoRespuesta guarda la rejilla
+como '<columnas>x<filas>@<segundos por miniatura>' (p. ej. '5x4@1.5').
+"""
+
+import os
+import posixpath
+import subprocess
+import uuid
+
+from flask import current_app
+
+from src.servicios.metadatos_video import VideoNoValido, leer_metadatos
+
+
+def clave_poster(clave):
+    """Clave en el almacén de la portada: 'ejercicio_1.mp4' -> 'ejercicio_1_poster.jpg'."""
+    return f'{posixpath.splitext(clave)[0]}_poster.jpg'
+
+
+def clave_sprite(clave):
+    """Clave en el almacén de la rejilla: 'ejercicio_1.mp4' -> 'ejercicio_1_sprite.jpg'."""
+    return f'{posixpath.splitext(clave)[0]}_sprite.jpg'
+
+
+def datos_rejilla(miniaturas):
+    """
+    Interpreta el campo Miniaturas.
+
+    Args:
+        miniaturas: '5x4@1.5', o None si el vídeo no tiene miniaturas
+
+    Returns:
+        dict: columnas, filas e intervalo (segundos), o None
+    """
+    try:
+        rejilla, intervalo = miniaturas.split('@')
+        columnas, filas = rejilla.split('x')
+        return {'columnas': int(columnas), 'filas': int(filas), 'intervalo': float(intervalo)}
+    except (AttributeError, ValueError):
+        return None
+
+
+def comando_poster(ffmpeg, origen, destino, ancho):
+    """Argumentos de ffmpeg para la portada: el fotograma más representativo del principio."""
+    return [
+        ffmpeg, '-nostdin', '-y', '-loglevel', 'error',
+        '-i', origen,
+        '-vf', f'thumbnail,scale={ancho}:-2',
+        '-frames:v', '1', '-q:v', '4',
+        destino
+    ]
+
+
+def comando_sprite(ffmpeg, origen, destino, intervalo, ancho, columnas, filas):
+    """Argumentos de ffmpeg para una rejilla de columnas x filas miniaturas, una cada `intervalo` s."""
+    return [
+        ffmpeg, '-nostdin', '-y', '-loglevel', 'error',
+        '-i', origen,
+        '-vf', f'fps=1/{intervalo:g},scale={ancho}:-2,tile={columnas}x{filas}',
+        '-frames:v', '1', '-q:v', '5',
+        destino
+    ]
+
+
+def intervalo_rejilla(ruta, miniaturas, por_defecto):
+    """
+    Segundos entre miniaturas para repartir `miniaturas` por todo el vídeo
+    (como mínimo 1 s). Las grabaciones de MediaRecorder no indican su
+    duración en la cabecera: se usa `por_defecto`.
+    """
+    try:
+        duracion_ms = leer_metadatos(ruta).duracion_ms
+    except (VideoNoValido, OSError):
+        duracion_ms = None
+    if not duracion_ms:
+        return por_defecto
+    return max(1.0, round(duracion_ms / 1000 / miniaturas, 1))
+
+
+def generar_miniaturas(almacen, clave, origen, ffmpeg):
+    """
+    Genera y guarda la portada y la rejilla de miniaturas de un vídeo.
+
+    Args:
+        almacen: Almacén del vídeo (las imágenes se guardan junto a él)
+        clave: Nombre del vídeo en el almacén
+        origen: Ruta de una copia local del vídeo
+        ffmpeg: Ejecutable de ffmpeg
+
+    Returns:
+        str: Valor para el campo Miniaturas, o None si no se pudieron generar
+    """
+    app = current_app._get_current_object()
+    config = app.config
+    columnas, filas = config['MINIATURAS_REJILLA']
+    intervalo = intervalo_rejilla(origen, columnas * filas, config['MINIATURAS_INTERVALO'])
+    directorio = config['SUBIDAS_DIRECTORIO']
+    os.makedirs(directorio, exist_ok=True)
+
+    poster = os.path.join(directorio, f'poster_{uuid.uuid4().hex}.jpg')
+    sprite = os.path.join(directorio, f'sprite_{uuid.uuid4().hex}.jpg')
+    try:
+        for comando, destino in (
+            (comando_poster(ffmpeg, origen, poster, config['MINIATURAS_ANCHO_POSTER']), poster),
+            (comando_sprite(ffmpeg, origen, sprite, intervalo, config['MINIATURAS_ANCHO_SPRITE'],
+                            columnas, filas), sprite),
+        ):
+            resultado = subprocess.run(comando, capture_output=True,
+                                       timeout=config.get('TRANSCODIFICACION_TIMEOUT', 1800))
+            if resultado.returncode != 0 or not os.path.exists(destino):
+                app.logger.error('ffmpeg no pudo generar las miniaturas de %s: %s', clave,
+                                 resultado.stderr.decode('utf-8', 'replace')[-500:])
+                return None
+        almacen.guardar(clave_poster(clave), poster)
+        almacen.guardar(clave_sprite(clave), sprite)
+        return f'{columnas}x{filas}@{intervalo:g}'
+    finally:
+        for ruta in (poster, sprite):
+            if os.path.exists(ruta):
+                os.remove(ruta)
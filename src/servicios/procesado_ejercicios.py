@@ -0,0 +1,175 @@
+"""
+Procesado en segundo plano de los vídeos de ejercicios recién subidos.
+
+crear_ejercicio guarda el vídeo en un fichero temporal, crea el Ejercicio
+marcado como Procesando (Duracion 0) y encola su procesado. Un grupo de
+hilos (PROCESADO_HILOS por worker) calcula la duración (de la cabecera
+MP4/WebM o, si no viene, con MoviePy, que lanza ffmpeg y puede tardar
+segundos), guarda el vídeo en el almacén de ejercicios y completa el
+Ejercicio. Así el worker que atiende la subida
+responde en cuanto el fichero está en disco.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from src.servicios.metadatos_video import VideoNoValido, leer_metadatos
+
+# MoviePy (numpy, imageio, ffmpeg) se importa la primera vez que hace falta,
+# no al arrancar cada worker. None si no está instalado.
+_SIN_CARGAR = object()
+VideoFileClip = _SIN_CARGAR
+
+
+def _video_file_clip():
+    global VideoFileClip
+    if VideoFileClip is _SIN_CARGAR:
+        try:
+            from moviepy.editor import VideoFileClip as clase
+        except Exception:
+            clase = None
+        VideoFileClip = clase
+    return VideoFileClip
+
+
+def calcular_duracion(ruta):
+    """
+    Duración en segundos de un vídeo. Se lee de la cabecera MP4/WebM y solo
+    si no viene ahí se abre con MoviePy (0 si MoviePy no está o no puede).
+
+    Args:
+        ruta: Fichero de vídeo local
+
+    Returns:
+        int: Segundos completos
+    """
+    try:
+        duracion_ms = leer_metadatos(ruta).duracion_ms
+    except (VideoNoValido, OSError):
+        duracion_ms = None
+    if duracion_ms is not None:
+        return duracion_ms // 1000
+
+    clase = _video_file_clip()
+    if clase is None:
+        return 0
+    try:
+        clip = clase(ruta)
+        try:
+            return int(clip.duration)
+        finally:
+            clip.close()
+    except Exception:
+        return 0
+
+
+class ColaProcesado:
+    """
+    Grupo de hilos que procesa los vídeos de ejercicios de una aplicación.
+
+    Con PROCESADO_SEGUNDO_PLANO desactivado (tests) el vídeo se procesa al
+    encolarlo, en el hilo de la petición.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._ejecutor = None
+
+    def encolar(self, ejercicio_id, ruta, clave):
+        """
+        Lanza el procesado del vídeo de un ejercicio ya creado.
+
+        Args:
+            ejercicio_id: ID del Ejercicio (marcado como Procesando)
+            ruta: Fichero temporal con el vídeo (se mueve o borra al terminar)
+            clave: Nombre del vídeo en el almacén de ejercicios
+        """
+        if self.app.config.get('PROCESADO_SEGUNDO_PLANO', True):
+            self._ejecutor_activo().submit(self._ejecutar, ejercicio_id, ruta, clave)
+        else:
+            self._ejecutar(ejercicio_id, ruta, clave)
+
+    def _ejecutor_activo(self):
+        if self._ejecutor is None:
+            with self._lock:
+                if self._ejecutor is None:
+                    self._ejecutor = ThreadPoolExecutor(
+                        max_workers=self.app.config.get('PROCESADO_HILOS', 2),
+                        thread_name_prefix='procesado-ejercicios'
+                    )
+        return self._ejecutor
+
+    def _ejecutar(self, ejercicio_id, ruta, clave):
+        from src.extensiones import db
+
+        with self.app.app_context():
+            try:
+                procesar_video(ejercicio_id, ruta, clave)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Error procesando el vídeo del ejercicio %s', ejercicio_id)
+                # No dejar el ejercicio indefinidamente en proceso
+                _terminar(ejercicio_id, None)
+            finally:
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+
+def procesar_video(ejercicio_id, ruta, clave):
+    """
+    Calcula la duración del vídeo, lo guarda en el almacén de ejercicios,
+    deja el Ejercicio con su Duracion y sin marcar como Procesando y encola
+    la generación de sus versiones. Si el ejercicio se borró mientras tanto
+    y ningún otro usa el vídeo, lo quita del almacén.
+
+    Args:
+        ejercicio_id: ID del Ejercicio
+        ruta: Fichero temporal con el vídeo
+        clave: Nombre del vídeo en el almacén (campo Video del ejercicio)
+    """
+    from src.servicios.almacenamiento import almacen_videos
+    from src.servicios.contenido_videos import liberar_video
+    from src.servicios.indice_videos import indice_videos
+    from src.servicios.transcodificacion import cola_transcodificacion
+
+    duracion = calcular_duracion(ruta)
+    almacen_videos('ejercicios').guardar(clave, ruta)
+    indice_videos().olvidar(clave)
+    if not _terminar(ejercicio_id, duracion):
+        liberar_video(clave)
+        return
+    cola_transcodificacion().encolar('ejercicios', ejercicio_id, clave)
+
+
+def _terminar(ejercicio_id, duracion):
+    from src.extensiones import db
+    from src.modelos import Ejercicio
+
+    ejercicio = db.session.get(Ejercicio, ejercicio_id)
+    if ejercicio is None:
+        # Se borró mientras se procesaba
+        return False
+    if duracion is not None:
+        ejercicio.Duracion = duracion
+    ejercicio.Procesando = False
+    db.session.commit()
+    return True
+
+
+def init_app(app):
+    """
+    Crea la cola de procesado de vídeos de ejercicios de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['procesado_ejercicios'] = ColaProcesado(app)
+
+
+def cola_procesado():
+    """Devuelve la cola de procesado de la aplicación actual."""
+    return current_app.extensions['procesado_ejercicios']
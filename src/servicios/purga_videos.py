@@ -0,0 +1,179 @@
+"""
+Purga periódica de los vídeos de respuesta caducados.
+
+Cada VideoRespuesta caduca a los `retencion_videos` días de config/sistema.json
+(la política que elige el administrador). Un trabajo de APScheduler recorre
+cada PURGA_VIDEOS_INTERVALO segundos los caducados por el índice de
+Fecha_Expiracion, en lotes de PURGA_VIDEOS_LOTE: borra del almacén de
+respuestas el vídeo y sus versiones y miniaturas con PURGA_VIDEOS_HILOS
+borrados a la vez (cada uno espera a la API de Cloudinary) y luego elimina
+de una vez las filas cuyos ficheros se borraron, descontando su tamaño del
+uso de cada paciente. Los que fallan se quedan para la siguiente pasada.
+
+Con varios workers cada uno programa la purga; es idempotente, así que
+como mucho se repite algún borrado.
+"""
+
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+RETENCION_POR_DEFECTO = 30
+
+
+def dias_retencion():
+    """Días que se conservan los vídeos de respuesta (retencion_videos de la configuración del sistema)."""
+    from src.controladores.admin_controlador import cargar_configuracion
+
+    try:
+        dias = int(cargar_configuracion().get('retencion_videos', RETENCION_POR_DEFECTO))
+    except (TypeError, ValueError):
+        return RETENCION_POR_DEFECTO
+    return dias if dias > 0 else RETENCION_POR_DEFECTO
+
+
+def fecha_expiracion(desde=None):
+    """Fecha de expiración de un vídeo de respuesta guardado `desde` (hoy por defecto)."""
+    return (desde or date.today()) + timedelta(days=dias_retencion())
+
+
+def claves_respuesta(video):
+    """Claves en el almacén del vídeo de respuesta y de las versiones y miniaturas que tiene anotadas."""
+    from src.servicios.miniaturas import clave_poster, clave_sprite
+    from src.servicios.transcodificacion import clave_version, lista_versiones
+
+    clave = f'respuesta_{video.Ejercicio_Sesion_Id}.webm'
+    claves = [clave] + [clave_version(clave, v) for v in lista_versiones(video.Versiones)]
+    if video.Miniaturas:
+        claves += [clave_poster(clave), clave_sprite(clave)]
+    return claves
+
+
+def purgar_videos_caducados(hoy=None):
+    """
+    Borra los vídeos de respuesta cuya Fecha_Expiracion ya ha llegado.
+
+    Args:
+        hoy: Fecha de referencia (hoy por defecto)
+
+    Returns:
+        dict: videos (filas eliminadas), ficheros (borrados del almacén) y
+              errores (vídeos que se reintentarán en la siguiente pasada)
+    """
+    from src.extensiones import db
+    from src.modelos import SubidaRespuesta, VideoRespuesta
+    from src.servicios.almacenamiento import almacen_videos
+    from src.servicios.uso_almacenamiento import descontar_respuestas
+
+    app = current_app._get_current_object()
+    hoy = hoy or date.today()
+    lote = app.config.get('PURGA_VIDEOS_LOTE', 200)
+    almacen = almacen_videos('respuestas')
+    resultado = {'videos': 0, 'ficheros': 0, 'errores': 0}
+
+    def borrar(clave):
+        try:
+            almacen.borrar(clave)
+            return True
+        except Exception:
+            app.logger.exception('No se pudo borrar el vídeo caducado %s', clave)
+            return False
+
+    ultimo_id = None
+    with ThreadPoolExecutor(max_workers=app.config.get('PURGA_VIDEOS_HILOS', 8),
+                            thread_name_prefix='purga-videos') as ejecutor:
+        while True:
+            consulta = VideoRespuesta.query.filter(VideoRespuesta.Fecha_Expiracion <= hoy)
+            if ultimo_id is not None:
+                consulta = consulta.filter(VideoRespuesta.Ejercicio_Sesion_Id > ultimo_id)
+            videos = consulta.order_by(VideoRespuesta.Ejercicio_Sesion_Id).limit(lote).all()
+            if not videos:
+                break
+            ultimo_id = videos[-1].Ejercicio_Sesion_Id
+            claves = {v.Ejercicio_Sesion_Id: claves_respuesta(v) for v in videos}
+            db.session.close()
+
+            borrados = dict(zip(
+                [(es_id, clave) for es_id, lista in claves.items() for clave in lista],
+                ejecutor.map(borrar, [clave for lista in claves.values() for clave in lista])
+            ))
+            ids = [es_id for es_id, lista in claves.items() if all(borrados[(es_id, c)] for c in lista)]
+            resultado['ficheros'] += sum(borrados.values())
+            resultado['errores'] += len(claves) - len(ids)
+
+            if ids:
+                descontar_respuestas(ids)
+                VideoRespuesta.query.filter(VideoRespuesta.Ejercicio_Sesion_Id.in_(ids)).delete(
+                    synchronize_session=False)
+                # Sin el vídeo, su registro de subida ya no debe bloquear una nueva
+                SubidaRespuesta.query.filter(SubidaRespuesta.Ejercicio_Sesion_Id.in_(ids)).delete(
+                    synchronize_session=False)
+                db.session.commit()
+                resultado['videos'] += len(ids)
+            if len(videos) < lote:
+                break
+
+    app.logger.info('Purga de vídeos caducados: %(videos)d vídeos, %(ficheros)d ficheros, %(errores)d errores',
+                    resultado)
+    return resultado
+
+
+class PurgaProgramada:
+    """
+    Programador de la purga de una aplicación. Arranca con la primera
+    petición que atiende el worker (no al importar la aplicación en scripts
+    y tests) si PURGA_VIDEOS_PROGRAMADA está activado.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._programador = None
+
+    def arrancar(self):
+        if self._programador is not None or not self.app.config.get('PURGA_VIDEOS_PROGRAMADA', True):
+            return
+        with self._lock:
+            if self._programador is not None:
+                return
+            from apscheduler.schedulers.background import BackgroundScheduler
+
+            programador = BackgroundScheduler(daemon=True)
+            programador.add_job(
+                self._ejecutar, 'interval',
+                seconds=self.app.config.get('PURGA_VIDEOS_INTERVALO', 6 * 3600),
+                next_run_time=datetime.now() + timedelta(seconds=60),
+                id='purga_videos', coalesce=True, max_instances=1
+            )
+            programador.start()
+            atexit.register(self.detener)
+            self._programador = programador
+
+    def detener(self):
+        """Detiene el programador si está en marcha."""
+        if self._programador is not None and self._programador.running:
+            self._programador.shutdown(wait=False)
+
+    def _ejecutar(self):
+        with self.app.app_context():
+            try:
+                purgar_videos_caducados()
+            except Exception:
+                from src.extensiones import db
+                db.session.rollback()
+                self.app.logger.exception('Error purgando los vídeos caducados')
+
+
+def init_app(app):
+    """
+    Crea el programador de la purga de vídeos de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    purga = PurgaProgramada(app)
+    app.extensions['purga_videos'] = purga
+    app.before_request(purga.arrancar)
@@ -0,0 +1,128 @@
+"""
+Caché de autorización de sesiones activas.
+
+Guarda, para cada sesión en curso, quién es su paciente y su profesional,
+de modo que las lecturas de estado en tiempo real (una cada pocos segundos
+por paciente) puedan comprobar existencia y permisos sin ir a la base de
+datos. Los participantes de una sesión no cambian nunca, así que la caché
+de cada worker no necesita invalidación entre procesos: basta con retirar
+la entrada cuando la sesión termina. Las sesiones abandonadas (nunca
+finalizadas) se descartan por orden de llegada al superar la capacidad.
+
+La cookie de sesión firmada solo dice quién era el usuario al entrar; para
+no aceptar la de una cuenta borrada o desactivada sin cargar el Usuario en
+cada lectura, se recuerda también si cada usuario existe y está activo
+durante ESTADO_CACHE_USUARIOS_TTL segundos. El worker que desactiva la
+cuenta la retira al momento; el resto la deja de aceptar al caducar.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class CacheSesionesActivas:
+    """Diccionario {sesion_id: (paciente_id, profesional_id)} seguro entre hilos."""
+
+    CAPACIDAD = 10000
+
+    def __init__(self, capacidad=CAPACIDAD):
+        self.capacidad = capacidad
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def registrar(self, sesion):
+        """Añade una sesión (modelo Sesion) a la caché."""
+        with self._lock:
+            self._datos[sesion.Id] = (sesion.Paciente_Id, sesion.Profesional_Id)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def participantes(self, sesion_id):
+        """Devuelve (paciente_id, profesional_id) o None si no está en caché."""
+        with self._lock:
+            return self._datos.get(sesion_id)
+
+    def invalidar(self, sesion_id):
+        """Retira la sesión de la caché (al finalizarla)."""
+        with self._lock:
+            self._datos.pop(sesion_id, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
+
+    def __contains__(self, sesion_id):
+        with self._lock:
+            return sesion_id in self._datos
+
+
+class CacheUsuariosActivos:
+    """Diccionario {usuario_id: (activo, instante)} seguro entre hilos, con caducidad."""
+
+    CAPACIDAD = 10000
+    TTL = 60
+
+    def __init__(self, ttl=TTL, capacidad=CAPACIDAD, reloj=time.monotonic):
+        self.ttl = ttl
+        self.capacidad = capacidad
+        self._reloj = reloj
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def activo(self, usuario_id):
+        """True/False si se comprobó hace menos de `ttl` segundos; None si hay que consultarlo."""
+        with self._lock:
+            entrada = self._datos.get(usuario_id)
+        if entrada is None or self._reloj() - entrada[1] >= self.ttl:
+            return None
+        return entrada[0]
+
+    def registrar(self, usuario_id, activo):
+        """Anota si el usuario existe y está activo."""
+        with self._lock:
+            self._datos.pop(usuario_id, None)
+            self._datos[usuario_id] = (activo, self._reloj())
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, usuario_id):
+        """Olvida al usuario (al cambiar su estado) para que se vuelva a consultar."""
+        with self._lock:
+            self._datos.pop(usuario_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
+
+
+def init_app(app):
+    """
+    Crea las cachés de la aplicación (una por worker).
+    
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['sesiones_activas'] = CacheSesionesActivas(
+        app.config.get('ESTADO_CACHE_CAPACIDAD', CacheSesionesActivas.CAPACIDAD)
+    )
+    app.extensions['usuarios_activos'] = CacheUsuariosActivos(
+        app.config.get('ESTADO_CACHE_USUARIOS_TTL', CacheUsuariosActivos.TTL),
+        app.config.get('ESTADO_CACHE_CAPACIDAD', CacheUsuariosActivos.CAPACIDAD)
+    )
+
+
+def cache_sesiones_activas():
+    """Devuelve la caché de sesiones activas de la aplicación actual."""
+    return current_app.extensions['sesiones_activas']
+
+
+def cache_usuarios_activos():
+    """Devuelve la caché de usuarios activos de la aplicación actual."""
+    return current_app.extensions['usuarios_activos']
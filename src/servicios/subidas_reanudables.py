@@ -0,0 +1,275 @@
+"""
+Subida reanudable por fragmentos de las grabaciones de respuesta.
+
+El navegador abre una subida, envía la grabación en fragmentos indicando el
+desplazamiento de cada uno y la finaliza. Los fragmentos se añaden a un
+fichero parcial en disco (SUBIDAS_DIRECTORIO/parciales) leyendo el cuerpo de
+la petición por bloques, así que el servidor nunca tiene el vídeo entero en
+memoria. Si la conexión se corta, el cliente pregunta el desplazamiento
+actual y continúa desde ahí. El estado vive solo en disco (fichero parcial
+más un .json con sus datos), de modo que cualquier worker puede continuar
+una subida empezada en otro. Los fragmentos y el cierre se serializan con
+flock sobre el fichero parcial, así que dos workers no pueden anexar a la
+vez el mismo offset.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo hay exclusión entre hilos del proceso
+    fcntl = None
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+class SubidaNoEncontrada(LookupError):
+    """La subida no existe, ya se finalizó o caducó."""
+
+
+class DesfaseSubida(ValueError):
+    """El desplazamiento del fragmento no coincide con lo ya recibido."""
+
+    def __init__(self, offset):
+        super().__init__(f'Desplazamiento esperado: {offset}')
+        self.offset = offset
+
+
+class SubidaDemasiadoGrande(ValueError):
+    """La subida supera el tamaño anunciado o el máximo permitido."""
+
+
+class SubidasReanudables:
+    """Subidas en curso de una aplicación, guardadas en disco."""
+
+    TAM_BLOQUE = 64 * 1024
+
+    def __init__(self, app):
+        self.app = app
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directorio(self):
+        return os.path.join(self.app.config['SUBIDAS_DIRECTORIO'], 'parciales')
+
+    @property
+    def tam_maximo(self):
+        return self.app.config['SUBIDAS_TAM_MAXIMO']
+
+    def _rutas(self, subida_id):
+        if not _ID_VALIDO.match(subida_id or ''):
+            raise SubidaNoEncontrada(subida_id)
+        base = os.path.join(self.directorio, subida_id)
+        return base + '.part', base + '.json'
+
+    def _lock_de(self, subida_id):
+        with self._lock:
+            return self._locks.setdefault(subida_id, threading.Lock())
+
+    @contextmanager
+    def _parcial_bloqueado(self, subida_id, flags):
+        """
+        Abre el fichero parcial con flock exclusivo (entre hilos ya excluye
+        _lock_de) y comprueba que sigue siendo el de la subida: otro worker
+        pudo finalizarla o cancelarla mientras se esperaba el bloqueo.
+
+        Yields:
+            int: descriptor del fichero parcial
+
+        Raises:
+            SubidaNoEncontrada
+        """
+        parcial, _ = self._rutas(subida_id)
+        try:
+            # Sin O_CREAT: una subida cancelada no se vuelve a crear
+            fd = os.open(parcial, flags)
+        except OSError:
+            raise SubidaNoEncontrada(subida_id)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                vigente = os.stat(parcial).st_ino == os.fstat(fd).st_ino
+            except OSError:
+                vigente = False
+            if not vigente:
+                raise SubidaNoEncontrada(subida_id)
+            yield fd
+        finally:
+            os.close(fd)
+
+    def iniciar(self, ejercicio_sesion_id, usuario_id, tamano=None, clave_idempotencia=None):
+        """
+        Abre una subida nueva.
+
+        Args:
+            ejercicio_sesion_id: ID del Ejercicio_Sesion al que pertenece
+            usuario_id: Usuario que sube (solo él puede continuarla)
+            tamano: Tamaño total anunciado en bytes (opcional)
+            clave_idempotencia: Idempotency-Key de la grabación (se usa al finalizar)
+
+        Returns:
+            dict con subida_id y offset (0)
+
+        Raises:
+            SubidaDemasiadoGrande: si el tamaño anunciado supera el máximo
+        """
+        if tamano is not None and (tamano < 0 or tamano > self.tam_maximo):
+            raise SubidaDemasiadoGrande('El vídeo supera el tamaño máximo permitido')
+        self.limpiar_caducadas()
+        os.makedirs(self.directorio, exist_ok=True)
+
+        subida_id = uuid.uuid4().hex
+        parcial, datos = self._rutas(subida_id)
+        open(parcial, 'wb').close()
+        with open(datos, 'w') as f:
+            json.dump({
+                'ejercicio_sesion_id': ejercicio_sesion_id,
+                'usuario_id': usuario_id,
+                'tamano': tamano,
+                'clave_idempotencia': clave_idempotencia,
+                'creado': time.time()
+            }, f)
+        return {'subida_id': subida_id, 'offset': 0}
+
+    def info(self, subida_id):
+        """
+        Datos de una subida y bytes recibidos hasta ahora ('offset').
+
+        Raises:
+            SubidaNoEncontrada
+        """
+        parcial, datos = self._rutas(subida_id)
+        try:
+            with open(datos) as f:
+                info = json.load(f)
+            info['offset'] = os.path.getsize(parcial)
+        except (OSError, ValueError):
+            raise SubidaNoEncontrada(subida_id)
+        info['subida_id'] = subida_id
+        return info
+
+    def anexar(self, subida_id, offset, stream):
+        """
+        Añade un fragmento leyendo `stream` por bloques hasta agotarlo.
+
+        Si la conexión se corta a mitad, lo recibido se conserva y el
+        cliente continúa desde el nuevo offset.
+
+        Args:
+            subida_id: ID de la subida
+            offset: Posición del fragmento (debe ser igual a lo recibido)
+            stream: Objeto con read(n) (el cuerpo de la petición)
+
+        Returns:
+            int: bytes recibidos tras el fragmento
+
+        Raises:
+            SubidaNoEncontrada, DesfaseSubida, SubidaDemasiadoGrande
+        """
+        with self._lock_de(subida_id):
+            info = self.info(subida_id)
+            maximo = info['tamano'] if info['tamano'] is not None else self.tam_maximo
+
+            with self._parcial_bloqueado(subida_id, os.O_WRONLY | os.O_APPEND) as fd:
+                # Lo recibido se vuelve a medir con el bloqueo tomado
+                recibido = os.fstat(fd).st_size
+                if offset != recibido:
+                    raise DesfaseSubida(recibido)
+                while True:
+                    bloque = stream.read(self.TAM_BLOQUE)
+                    if not bloque:
+                        break
+                    if offset + len(bloque) > maximo:
+                        os.ftruncate(fd, recibido)
+                        raise SubidaDemasiadoGrande('El fragmento supera el tamaño de la subida')
+                    vista = memoryview(bloque)
+                    while vista:
+                        vista = vista[os.write(fd, vista):]
+                    offset += len(bloque)
+            return offset
+
+    def finalizar(self, subida_id, destino):
+        """
+        Cierra la subida y mueve el fichero completo a `destino`.
+
+        Returns:
+            dict con los datos de la subida
+
+        Raises:
+            SubidaNoEncontrada, DesfaseSubida (si faltan bytes del tamaño anunciado)
+        """
+        with self._lock_de(subida_id):
+            info = self.info(subida_id)
+            with self._parcial_bloqueado(subida_id, os.O_RDONLY) as fd:
+                info['offset'] = os.fstat(fd).st_size
+                if info['tamano'] is not None and info['offset'] != info['tamano']:
+                    raise DesfaseSubida(info['offset'])
+                parcial, datos = self._rutas(subida_id)
+                os.replace(parcial, destino)
+                os.remove(datos)
+        with self._lock:
+            self._locks.pop(subida_id, None)
+        return info
+
+    def cancelar(self, subida_id):
+        """Descarta una subida y sus ficheros (idempotente)."""
+        for ruta in self._rutas(subida_id):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        with self._lock:
+            self._locks.pop(subida_id, None)
+
+    def limpiar_caducadas(self, ahora=None):
+        """
+        Borra las subidas abandonadas (sin cambios en SUBIDAS_PARCIALES_TTL).
+
+        Returns:
+            int: subidas borradas
+        """
+        ahora = time.time() if ahora is None else ahora
+        limite = ahora - self.app.config['SUBIDAS_PARCIALES_TTL']
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return 0
+        borradas = 0
+        for nombre in nombres:
+            subida_id, extension = os.path.splitext(nombre)
+            if extension != '.json' or not _ID_VALIDO.match(subida_id):
+                continue
+            parcial, datos = self._rutas(subida_id)
+            try:
+                modificado = max(os.path.getmtime(datos), os.path.getmtime(parcial))
+            except OSError:
+                modificado = 0
+            if modificado < limite:
+                self.cancelar(subida_id)
+                borradas += 1
+        return borradas
+
+
+def init_app(app):
+    """
+    Crea el gestor de subidas reanudables de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['subidas_reanudables'] = SubidasReanudables(app)
+
+
+def subidas_reanudables():
+    """Devuelve el gestor de subidas reanudables de la aplicación actual."""
+    return current_app.extensions['subidas_reanudables']
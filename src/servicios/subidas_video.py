@@ -0,0 +1,379 @@
+"""
+Subida en segundo plano de los vídeos de respuesta de los pacientes.
+
+guardar_video solo copia la grabación a un fichero temporal local y encola
+un trabajo; un grupo de hilos (SUBIDAS_HILOS por worker) la sube al almacén
+de respuestas (Cloudinary por defecto) y crea el VideoRespuesta. Así un
+worker de gunicorn no queda ocupado durante toda la subida remota. El estado
+de cada trabajo se consulta por su id mientras la página del paciente
+continúa con la sesión.
+
+Cada subida se registra además en SubidaRespuesta (una fila por
+Ejercicio_Sesion), visible desde todos los workers: mientras hay una en
+curso, los reintentos y subidas simultáneas del mismo ejercicio reciben ese
+trabajo en lugar de volver a enviar el vídeo al almacén, y un reintento con
+la misma Idempotency-Key recibe el trabajo original aunque ya haya terminado.
+guardar_video reserva el registro (reclamar) antes de leer el cuerpo de la
+petición, así que una subida simultánea recibe el trabajo sin enviar el
+vídeo entero. Si el worker cae a mitad, el registro caduca tras
+SUBIDAS_RECLAMACION_TTL.
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+# Estados de un trabajo de subida
+PENDIENTE = 'PENDIENTE'
+SUBIENDO = 'SUBIENDO'
+COMPLETADO = 'COMPLETADO'
+ERROR = 'ERROR'
+
+
+class TrabajoSubida:
+    """Subida encolada de la grabación de un ejercicio de sesión."""
+
+    def __init__(self, ejercicio_sesion_id, ruta, clave_idempotencia=None):
+        self.id = uuid.uuid4().hex
+        self.ejercicio_sesion_id = ejercicio_sesion_id
+        self.ruta = ruta
+        self.clave_idempotencia = clave_idempotencia
+        self.estado = PENDIENTE
+        self.mensaje = None
+        self.error = None
+        self.url = None
+        self.creado = datetime.now()
+
+    @classmethod
+    def desde_registro(cls, registro):
+        """Trabajo (sin fichero) de la subida registrada por cualquier worker."""
+        trabajo = cls(registro.Ejercicio_Sesion_Id, None, registro.Clave_Idempotencia)
+        trabajo.id = registro.Trabajo_Id
+        trabajo.estado = registro.Estado
+        trabajo.creado = registro.Actualizado
+        return trabajo
+
+    @property
+    def terminado(self):
+        return self.estado in (COMPLETADO, ERROR)
+
+    def to_dict(self):
+        return {
+            "trabajo_id": self.id,
+            "ejercicio_sesion_id": self.ejercicio_sesion_id,
+            "estado": self.estado,
+            "mensaje": self.mensaje,
+            "error": self.error
+        }
+
+
+class ColaSubidas:
+    """
+    Trabajos de subida de una aplicación (uno por worker) y su grupo de hilos.
+
+    Con SUBIDAS_SEGUNDO_PLANO desactivado (tests) el trabajo se ejecuta al
+    encolarlo, en el hilo de la petición.
+    """
+
+    HISTORIAL = 1000
+
+    def __init__(self, app):
+        self.app = app
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+        self._ejecutor = None
+
+    @property
+    def directorio(self):
+        return self.app.config['SUBIDAS_DIRECTORIO']
+
+    def ruta_temporal(self, ejercicio_sesion_id):
+        """Ruta nueva en el directorio de subidas para una grabación."""
+        os.makedirs(self.directorio, exist_ok=True)
+        return os.path.join(self.directorio, f"respuesta_{ejercicio_sesion_id}_{uuid.uuid4().hex}.webm")
+
+    def encolar(self, ejercicio_sesion_id, ruta, clave_idempotencia=None):
+        """
+        Registra y lanza la subida de un fichero ya guardado en disco.
+
+        Si ya hay un trabajo registrado para el mismo ejercicio (sin
+        terminar, en este worker o en otro, o ya completado), se descarta
+        el fichero nuevo y se devuelve ese trabajo.
+
+        Args:
+            ejercicio_sesion_id: ID del Ejercicio_Sesion
+            ruta: Fichero temporal con la grabación (se borra al terminar)
+            clave_idempotencia: Idempotency-Key enviada por el navegador
+
+        Returns:
+            TrabajoSubida
+        """
+        trabajo, reclamado = self.reclamar(ejercicio_sesion_id, clave_idempotencia)
+        if not reclamado:
+            _borrar(ruta)
+            return trabajo
+        self.lanzar(trabajo, ruta)
+        return trabajo
+
+    def reclamar(self, ejercicio_sesion_id, clave_idempotencia=None):
+        """
+        Registra la subida del ejercicio antes de recibir la grabación.
+        El trabajo queda PENDIENTE y sin fichero hasta lanzar() (o
+        abandonar() si la grabación no llega a ser válida).
+
+        Args:
+            ejercicio_sesion_id: ID del Ejercicio_Sesion
+            clave_idempotencia: Idempotency-Key enviada por el navegador
+
+        Returns:
+            tuple: (trabajo, reclamado); si ya había un trabajo registrado
+                   para el ejercicio, ese trabajo y False
+        """
+        existente = self.en_curso(ejercicio_sesion_id)
+        if existente is not None:
+            return existente, False
+        # Sin el lock: entre dos peticiones simultáneas decide la clave
+        # primaria de SubidaRespuesta, no hace falta serializar el INSERT
+        trabajo = TrabajoSubida(ejercicio_sesion_id, None, clave_idempotencia)
+        existente = _reclamar(trabajo)
+        if existente is not None:
+            return existente, False
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+            self._recortar_historial()
+        return trabajo, True
+
+    def lanzar(self, trabajo, ruta):
+        """Lanza la subida de un trabajo reclamado con su grabación ya en disco."""
+        trabajo.ruta = ruta
+        if self.app.config.get('SUBIDAS_SEGUNDO_PLANO', True):
+            self._ejecutor_activo().submit(self._ejecutar, trabajo)
+        else:
+            self._ejecutar(trabajo)
+
+    def abandonar(self, trabajo, error='No se recibió una grabación válida'):
+        """Deja en ERROR un trabajo reclamado y libera su registro para permitir reintentos."""
+        trabajo.error = error
+        trabajo.estado = ERROR
+        _actualizar_registro(trabajo)
+
+    def consultar(self, trabajo_id):
+        """Devuelve el trabajo o None si no es de este worker (o ya se olvidó)."""
+        return self._trabajos.get(trabajo_id)
+
+    def en_curso(self, ejercicio_sesion_id):
+        """Trabajo sin terminar del ejercicio indicado, si lo hay."""
+        with self._lock:
+            trabajos = list(self._trabajos.values())
+        for trabajo in trabajos:
+            if trabajo.ejercicio_sesion_id == ejercicio_sesion_id and not trabajo.terminado:
+                return trabajo
+        return None
+
+    def trabajo_de(self, ejercicio_sesion_id):
+        """
+        Trabajo de subida del ejercicio: el que está en curso en este worker
+        o el registrado en SubidaRespuesta por cualquiera (None si no hay o
+        el registro caducó).
+        """
+        from src.extensiones import db
+        from src.modelos import SubidaRespuesta
+
+        en_curso = self.en_curso(ejercicio_sesion_id)
+        if en_curso is not None:
+            return en_curso
+        registro = db.session.get(SubidaRespuesta, ejercicio_sesion_id)
+        if registro is None or _caducado(registro):
+            return None
+        return TrabajoSubida.desde_registro(registro)
+
+    def _recortar_historial(self):
+        # Se olvidan los trabajos terminados más antiguos
+        sobrantes = len(self._trabajos) - self.app.config.get('SUBIDAS_HISTORIAL', self.HISTORIAL)
+        for trabajo_id in [t.id for t in self._trabajos.values() if t.terminado][:max(sobrantes, 0)]:
+            del self._trabajos[trabajo_id]
+
+    def _ejecutor_activo(self):
+        if self._ejecutor is None:
+            with self._lock:
+                if self._ejecutor is None:
+                    self._ejecutor = ThreadPoolExecutor(
+                        max_workers=self.app.config.get('SUBIDAS_HILOS', 4),
+                        thread_name_prefix='subidas-video'
+                    )
+        return self._ejecutor
+
+    def _ejecutar(self, trabajo):
+        from src.extensiones import db
+
+        with self.app.app_context():
+            trabajo.estado = SUBIENDO
+            _actualizar_registro(trabajo)
+            try:
+                subir_respuesta(trabajo)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception('Error subiendo el vídeo del ejercicio_sesion %s', trabajo.ejercicio_sesion_id)
+                trabajo.error = str(e)
+                trabajo.estado = ERROR
+            finally:
+                _borrar(trabajo.ruta)
+                _actualizar_registro(trabajo)
+
+
+def subir_respuesta(trabajo):
+    """
+    Sube la grabación del trabajo al almacén de respuestas, crea su
+    VideoRespuesta sumando su tamaño al uso del paciente (y encola sus
+    versiones transcodificadas). Deja el trabajo COMPLETADO (también si otro
+    ya guardó el vídeo) o en ERROR si el almacén no devuelve URL.
+
+    Args:
+        trabajo: TrabajoSubida en curso (requiere contexto de aplicación)
+    """
+    from sqlalchemy.exc import IntegrityError
+    from src.extensiones import db
+    from src.modelos import VideoRespuesta
+    from src.servicios.almacenamiento import almacen_videos
+    from src.servicios.purga_videos import fecha_expiracion
+    from src.servicios.transcodificacion import cola_transcodificacion
+    from src.servicios.uso_almacenamiento import paciente_de, sumar_uso
+
+    if VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=trabajo.ejercicio_sesion_id).first():
+        trabajo.mensaje = 'Video ya existente, se ignora nueva subida'
+        trabajo.estado = COMPLETADO
+        return
+
+    # Cerrar la sesión de base de datos durante la subida remota
+    db.session.close()
+    almacen = almacen_videos('respuestas')
+    clave = f"respuesta_{trabajo.ejercicio_sesion_id}.webm"
+    tamano = os.path.getsize(trabajo.ruta)
+    video_url = almacen.guardar(clave, trabajo.ruta)
+    if not video_url:
+        trabajo.error = 'No se obtuvo URL del video'
+        trabajo.estado = ERROR
+        return
+
+    try:
+        db.session.add(VideoRespuesta(
+            Ejercicio_Sesion_Id=trabajo.ejercicio_sesion_id,
+            Ruta_Almacenamiento=video_url,
+            Fecha_Expiracion=fecha_expiracion(),
+            Tamano=tamano
+        ))
+        paciente_id = paciente_de(trabajo.ejercicio_sesion_id)
+        if paciente_id is not None:
+            sumar_uso(paciente_id, tamano)
+        db.session.commit()
+        trabajo.url = video_url
+        trabajo.mensaje = 'Video guardado correctamente'
+        print(f"Video guardado en {almacen.esquema}: {video_url}")
+        cola_transcodificacion().encolar('respuestas', trabajo.ejercicio_sesion_id, clave)
+    except IntegrityError:
+        # Otra subida paralela insertó este registro justo antes del commit
+        db.session.rollback()
+        print(f"Video ya existente (race) para ejercicio_sesion_id={trabajo.ejercicio_sesion_id}")
+        trabajo.mensaje = 'Video ya existente (race), se ignora nueva subida'
+    trabajo.estado = COMPLETADO
+
+
+def _caducado(registro):
+    """Registro de una subida sin terminar cuyo worker dejó de dar señales."""
+    ttl = current_app.config.get('SUBIDAS_RECLAMACION_TTL', 3600)
+    return registro.Estado in (PENDIENTE, SUBIENDO) and registro.Actualizado < datetime.now() - timedelta(seconds=ttl)
+
+
+def _reclamar(trabajo):
+    """
+    Registra el trabajo como la subida del ejercicio en SubidaRespuesta.
+    La clave primaria hace que solo un worker lo consiga; si ya había un
+    registro caducado, se toma el relevo comparando su Trabajo_Id.
+
+    Returns:
+        TrabajoSubida: El trabajo registrado por otro, o None si el registro es de `trabajo`
+    """
+    from sqlalchemy.exc import IntegrityError
+    from src.extensiones import db
+    from src.modelos import SubidaRespuesta
+
+    campos = {
+        'Trabajo_Id': trabajo.id,
+        'Clave_Idempotencia': trabajo.clave_idempotencia,
+        'Estado': PENDIENTE,
+        'Actualizado': datetime.now()
+    }
+    for _ in range(2):
+        try:
+            db.session.add(SubidaRespuesta(Ejercicio_Sesion_Id=trabajo.ejercicio_sesion_id, **campos))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        registro = db.session.get(SubidaRespuesta, trabajo.ejercicio_sesion_id)
+        if registro is None:
+            # Se liberó entre medias: se vuelve a intentar
+            continue
+        if not _caducado(registro):
+            return TrabajoSubida.desde_registro(registro)
+        relevo = SubidaRespuesta.query.filter_by(
+            Ejercicio_Sesion_Id=trabajo.ejercicio_sesion_id, Trabajo_Id=registro.Trabajo_Id
+        ).update(campos)
+        db.session.commit()
+        if relevo:
+            return None
+    registro = db.session.get(SubidaRespuesta, trabajo.ejercicio_sesion_id)
+    return TrabajoSubida.desde_registro(registro) if registro is not None else None
+
+
+def _actualizar_registro(trabajo):
+    """
+    Pasa el estado del trabajo a su registro; uno en ERROR se borra para
+    permitir reintentos. Un fallo aquí no interrumpe la subida (la clave
+    primaria de VideoRespuesta sigue evitando duplicados).
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from src.extensiones import db
+    from src.modelos import SubidaRespuesta
+
+    try:
+        registros = SubidaRespuesta.query.filter_by(
+            Ejercicio_Sesion_Id=trabajo.ejercicio_sesion_id, Trabajo_Id=trabajo.id
+        )
+        if trabajo.estado == ERROR:
+            registros.delete()
+        else:
+            registros.update({'Estado': trabajo.estado, 'Actualizado': datetime.now()})
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception('Error actualizando la subida del ejercicio_sesion %s',
+                                     trabajo.ejercicio_sesion_id)
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+
+def init_app(app):
+    """
+    Crea la cola de subidas de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['subidas_video'] = ColaSubidas(app)
+
+
+def cola_subidas():
+    """Devuelve la cola de subidas de la aplicación actual."""
+    return current_app.extensions['subidas_video']
@@ -0,0 +1,296 @@
+"""
+Transcodificación en segundo plano de los vídeos a una escalera de versiones.
+
+Cuando un vídeo de ejercicio o de respuesta ya está en su almacén se encola
+su transcodificación: un grupo de TRANSCODIFICACION_PROCESOS hilos por
+worker lanza un proceso ffmpeg (el de imageio-ffmpeg o el del PATH) por
+cada versión de TRANSCODIFICACION_VERSIONES más pequeña que el original y
+guarda el resultado (H.264/AAC en MP4 con faststart) en el mismo almacén
+como <nombre>_<versión>.mp4. Las versiones generadas se anotan en el campo
+Versiones del Ejercicio o del VideoRespuesta, y elegir_version() escoge la
+adecuada para cada petición según las pistas de red del navegador
+(Save-Data, ECT, Downlink). El mismo trabajo genera la portada y la
+rejilla de miniaturas del vídeo (src.servicios.miniaturas).
+"""
+
+import os
+import posixpath
+import shutil
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request
+
+from src.servicios.metadatos_video import VideoNoValido, leer_metadatos
+from src.servicios.miniaturas import generar_miniaturas
+
+# Tipos de conexión (cabecera ECT) con los que se sirve la versión más ligera
+ECT_LENTAS = ('slow-2g', '2g', '3g')
+
+
+def clave_version(clave, version):
+    """Clave en el almacén de una versión: 'ejercicio_1.mp4' -> 'ejercicio_1_360p.mp4'."""
+    return f'{posixpath.splitext(clave)[0]}_{version}.mp4'
+
+
+def lista_versiones(versiones):
+    """Nombres de versión del campo Versiones ('360p,720p'), de menor a mayor."""
+    return [v for v in (versiones or '').split(',') if v]
+
+
+def elegir_version(versiones):
+    """
+    Versión que conviene servir en la petición actual.
+
+    Con Save-Data, una conexión lenta (ECT) o un ancho de banda estimado
+    (Downlink, en Mbps) por debajo de TRANSCODIFICACION_DOWNLINK_LIGERO se
+    sirve la más ligera; si no, TRANSCODIFICACION_VERSION_POR_DEFECTO. Si esa
+    no se generó porque el original no es mayor que ella, se sirve el
+    original: las versiones que hay serían una rebaja innecesaria (sin
+    versión por defecto configurada se sirve la mayor disponible).
+
+    Args:
+        versiones: Campo Versiones del vídeo (None o '' si no tiene)
+
+    Returns:
+        str: Nombre de la versión, o None para servir el original
+    """
+    disponibles = lista_versiones(versiones)
+    if not disponibles:
+        return None
+    config = current_app.config
+    if has_request_context() and _conexion_lenta(request.headers, config):
+        return disponibles[0]
+    por_defecto = config.get('TRANSCODIFICACION_VERSION_POR_DEFECTO')
+    if not por_defecto:
+        return disponibles[-1]
+    return por_defecto if por_defecto in disponibles else None
+
+
+def _conexion_lenta(cabeceras, config):
+    if cabeceras.get('Save-Data', '').lower() == 'on':
+        return True
+    if cabeceras.get('ECT', '').lower() in ECT_LENTAS:
+        return True
+    try:
+        return float(cabeceras.get('Downlink', '')) < config.get('TRANSCODIFICACION_DOWNLINK_LIGERO', 1.5)
+    except ValueError:
+        return False
+
+
+def ejecutable_ffmpeg(app):
+    """Ruta de ffmpeg: TRANSCODIFICACION_FFMPEG, el de imageio-ffmpeg o el del PATH (None si no hay)."""
+    configurado = app.config.get('TRANSCODIFICACION_FFMPEG')
+    if configurado:
+        return configurado
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which('ffmpeg')
+
+
+def comando_ffmpeg(ffmpeg, origen, destino, alto, kbps):
+    """Argumentos de ffmpeg para una versión de `alto` píxeles (sin ampliar) a `kbps`."""
+    return [
+        ffmpeg, '-nostdin', '-y', '-loglevel', 'error',
+        '-i', origen,
+        '-vf', f"scale=-2:'min({alto},ih)'",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-b:v', f'{kbps}k', '-maxrate', f'{kbps}k', '-bufsize', f'{2 * kbps}k',
+        '-c:a', 'aac', '-b:a', '96k',
+        '-movflags', '+faststart',
+        destino
+    ]
+
+
+def versiones_a_generar(ruta, escalera):
+    """Peldaños de la escalera más pequeños que el vídeo (todos si no se conoce su alto)."""
+    try:
+        alto = leer_metadatos(ruta).alto
+    except (VideoNoValido, OSError):
+        alto = None
+    return [(nombre, h, kbps) for nombre, h, kbps in escalera if alto is None or h < alto]
+
+
+class ColaTranscodificacion:
+    """
+    Trabajos de transcodificación de una aplicación y su grupo de hilos;
+    cada hilo espera a un proceso ffmpeg, así que como mucho hay
+    TRANSCODIFICACION_PROCESOS procesos a la vez por worker.
+
+    Con TRANSCODIFICACION_SEGUNDO_PLANO desactivado (tests) el trabajo se
+    ejecuta al encolarlo, en el hilo de la petición.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._ejecutor = None
+
+    def encolar(self, tipo, registro_id, clave):
+        """
+        Lanza la transcodificación y las miniaturas de un vídeo ya guardado
+        en su almacén.
+
+        Args:
+            tipo: 'ejercicios' o 'respuestas' (almacén y modelo a actualizar)
+            registro_id: Id del Ejercicio o Ejercicio_Sesion_Id del VideoRespuesta
+            clave: Nombre del vídeo original en el almacén
+        """
+        config = self.app.config
+        if not config.get('TRANSCODIFICACION_VERSIONES') and not config.get('MINIATURAS_ACTIVAS'):
+            return
+        if self.app.config.get('TRANSCODIFICACION_SEGUNDO_PLANO', True):
+            self._ejecutor_activo().submit(self._ejecutar, tipo, registro_id, clave)
+        else:
+            self._ejecutar(tipo, registro_id, clave)
+
+    def _ejecutor_activo(self):
+        if self._ejecutor is None:
+            with self._lock:
+                if self._ejecutor is None:
+                    self._ejecutor = ThreadPoolExecutor(
+                        max_workers=self.app.config.get('TRANSCODIFICACION_PROCESOS', 2),
+                        thread_name_prefix='transcodificacion'
+                    )
+        return self._ejecutor
+
+    def _ejecutar(self, tipo, registro_id, clave):
+        with self.app.app_context():
+            try:
+                generar_derivados(tipo, registro_id, clave)
+            except Exception:
+                from src.extensiones import db
+                db.session.rollback()
+                self.app.logger.exception('Error transcodificando %s/%s', tipo, clave)
+
+
+@contextmanager
+def copia_local(almacen, clave):
+    """
+    Ruta local del vídeo: la del propio fichero si el almacén es local o
+    una copia temporal en SUBIDAS_DIRECTORIO, que se borra al salir.
+    """
+    from src.servicios.almacenamiento import AlmacenLocal
+
+    if isinstance(almacen, AlmacenLocal):
+        yield almacen.ruta(clave)
+        return
+    directorio = current_app.config['SUBIDAS_DIRECTORIO']
+    os.makedirs(directorio, exist_ok=True)
+    origen = os.path.join(directorio, f'origen_{uuid.uuid4().hex}{posixpath.splitext(clave)[1]}')
+    try:
+        with almacen.abrir(clave) as entrada, open(origen, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+        yield origen
+    finally:
+        if os.path.exists(origen):
+            os.remove(origen)
+
+
+def generar_derivados(tipo, registro_id, clave):
+    """
+    Genera las versiones y las miniaturas de un vídeo del almacén `tipo`
+    y las anota en su Ejercicio o VideoRespuesta.
+    """
+    from src.servicios.almacenamiento import almacen_videos
+
+    app = current_app._get_current_object()
+    ffmpeg = ejecutable_ffmpeg(app)
+    if ffmpeg is None:
+        app.logger.warning('ffmpeg no disponible: no se generan versiones ni miniaturas de %s', clave)
+        return
+
+    almacen = almacen_videos(tipo)
+    miniaturas = None
+    with copia_local(almacen, clave) as origen:
+        generadas = transcodificar(almacen, clave, origen, ffmpeg)
+        if app.config.get('MINIATURAS_ACTIVAS'):
+            miniaturas = generar_miniaturas(almacen, clave, origen, ffmpeg)
+    if generadas or miniaturas:
+        _registrar(tipo, registro_id, clave, generadas, miniaturas)
+
+
+def transcodificar(almacen, clave, origen, ffmpeg):
+    """
+    Genera y guarda en `almacen` las versiones de un vídeo.
+
+    Args:
+        almacen: Almacén del vídeo
+        clave: Nombre del vídeo en el almacén
+        origen: Ruta de una copia local del vídeo
+        ffmpeg: Ejecutable de ffmpeg
+
+    Returns:
+        list: Nombres de las versiones guardadas
+    """
+    app = current_app._get_current_object()
+    directorio = app.config['SUBIDAS_DIRECTORIO']
+    os.makedirs(directorio, exist_ok=True)
+    generadas = []
+    for nombre, alto, kbps in versiones_a_generar(origen, app.config['TRANSCODIFICACION_VERSIONES']):
+        destino = os.path.join(directorio, f'version_{uuid.uuid4().hex}.mp4')
+        try:
+            resultado = subprocess.run(
+                comando_ffmpeg(ffmpeg, origen, destino, alto, kbps),
+                capture_output=True,
+                timeout=app.config.get('TRANSCODIFICACION_TIMEOUT', 1800)
+            )
+            if resultado.returncode != 0 or not os.path.exists(destino):
+                app.logger.error('ffmpeg falló en %s (%s): %s', clave, nombre,
+                                 resultado.stderr.decode('utf-8', 'replace')[-500:])
+                continue
+            almacen.guardar(clave_version(clave, nombre), destino)
+            generadas.append(nombre)
+        finally:
+            if os.path.exists(destino):
+                os.remove(destino)
+    return generadas
+
+
+def _registrar(tipo, registro_id, clave, generadas, miniaturas):
+    from src.extensiones import db
+    from src.modelos import Ejercicio, VideoRespuesta
+
+    if tipo == 'ejercicios':
+        # Todos los ejercicios con el mismo vídeo comparten sus derivados
+        registros = Ejercicio.query.filter_by(Video=clave).all()
+    else:
+        registros = [r for r in [db.session.get(VideoRespuesta, registro_id)] if r is not None]
+    if not registros:
+        # Se borró mientras se transcodificaba
+        return
+    for registro in registros:
+        if generadas:
+            orden = [nombre for nombre, _, _ in current_app.config['TRANSCODIFICACION_VERSIONES']]
+            registro.Versiones = ','.join(sorted(set(generadas), key=orden.index))
+        if miniaturas:
+            registro.Miniaturas = miniaturas
+    db.session.commit()
+
+
+def _pedir_pistas_de_red(respuesta):
+    # El navegador solo envía ECT y Downlink si la página los pide
+    if respuesta.mimetype == 'text/html':
+        respuesta.headers.setdefault('Accept-CH', 'ECT, Downlink, Save-Data')
+    return respuesta
+
+
+def init_app(app):
+    """
+    Crea la cola de transcodificación de la aplicación.
+
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    app.extensions['transcodificacion'] = ColaTranscodificacion(app)
+    app.after_request(_pedir_pistas_de_red)
+
+
+def cola_transcodificacion():
+    """Devuelve la cola de transcodificación de la aplicación actual."""
+    return current_app.extensions['transcodificacion']
@@ -0,0 +1,113 @@
+"""
+Uso de almacenamiento por usuario y cuota `limite_almacenamiento`.
+
+Cada vídeo guardado anota su tamaño (campo Tamano del VideoRespuesta o del
+Ejercicio) y suma esos bytes al contador UsoAlmacenamiento de su usuario
+(el paciente de la respuesta o el profesional que crea el ejercicio) en la
+misma transacción; la purga los descuenta al borrar. Así la cuota se
+comprueba con una lectura por clave primaria y el administrador ve el uso
+sin recorrer el almacén.
+
+Los contadores se actualizan con UPDATE ... SET Bytes = Bytes + n, de modo
+que varios workers pueden sumar a la vez sin perder actualizaciones. Dos
+subidas simultáneas del mismo usuario pueden pasar la comprobación a la vez
+y rebasar la cuota en una de ellas.
+"""
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+
+LIMITE_POR_DEFECTO_GB = 2
+
+
+def limite_bytes():
+    """Cuota por usuario en bytes (limite_almacenamiento, en GB, de la configuración del sistema)."""
+    from src.controladores.admin_controlador import cargar_configuracion
+
+    try:
+        gb = float(cargar_configuracion().get('limite_almacenamiento', LIMITE_POR_DEFECTO_GB))
+    except (TypeError, ValueError):
+        gb = LIMITE_POR_DEFECTO_GB
+    return int((gb if gb > 0 else LIMITE_POR_DEFECTO_GB) * 1024 ** 3)
+
+
+def uso_de(usuario_id):
+    """Bytes que ocupan los vídeos del usuario."""
+    from src.extensiones import db
+    from src.modelos import UsoAlmacenamiento
+
+    uso = db.session.get(UsoAlmacenamiento, usuario_id)
+    return uso.Bytes if uso is not None else 0
+
+
+def usos_de(usuario_ids):
+    """Contadores de varios usuarios de una vez ({usuario_id: UsoAlmacenamiento})."""
+    from src.modelos import UsoAlmacenamiento
+
+    if not usuario_ids:
+        return {}
+    usos = UsoAlmacenamiento.query.filter(UsoAlmacenamiento.Usuario_Id.in_(list(usuario_ids))).all()
+    return {uso.Usuario_Id: uso for uso in usos}
+
+
+def cuota_superada(usuario_id, tamano):
+    """Indica si `tamano` bytes más dejarían al usuario por encima de su cuota."""
+    return uso_de(usuario_id) + (tamano or 0) > limite_bytes()
+
+
+def sumar_uso(usuario_id, tamano, videos=1):
+    """
+    Suma (o resta, con valores negativos) bytes y vídeos al contador del
+    usuario, sin bajar de 0. No hace commit: se confirma junto con el vídeo
+    que lo motiva.
+    """
+    from src.extensiones import db
+    from src.modelos import UsoAlmacenamiento
+
+    tabla = UsoAlmacenamiento.__table__
+
+    def actualizar():
+        return db.session.execute(tabla.update().where(tabla.c.Usuario_Id == usuario_id).values(
+            Bytes=case((tabla.c.Bytes + tamano < 0, 0), else_=tabla.c.Bytes + tamano),
+            Videos=case((tabla.c.Videos + videos < 0, 0), else_=tabla.c.Videos + videos)
+        )).rowcount
+
+    if actualizar():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(tabla.insert().values(
+                Usuario_Id=usuario_id, Bytes=max(tamano, 0), Videos=max(videos, 0)
+            ))
+    except IntegrityError:
+        # Otro worker creó el contador entre el UPDATE y el INSERT
+        actualizar()
+
+
+def descontar_respuestas(ejercicio_sesion_ids):
+    """Resta a cada paciente los vídeos de respuesta que se van a borrar (sin commit)."""
+    from src.extensiones import db
+    from src.modelos import Ejercicio_Sesion, Sesion, VideoRespuesta
+
+    totales = db.session.query(
+        Sesion.Paciente_Id, func.sum(VideoRespuesta.Tamano), func.count(VideoRespuesta.Tamano)
+    ).join(
+        Ejercicio_Sesion, Ejercicio_Sesion.Id == VideoRespuesta.Ejercicio_Sesion_Id
+    ).join(
+        Sesion, Sesion.Id == Ejercicio_Sesion.Sesion_Id
+    ).filter(
+        VideoRespuesta.Ejercicio_Sesion_Id.in_(ejercicio_sesion_ids),
+        VideoRespuesta.Tamano.isnot(None)
+    ).group_by(Sesion.Paciente_Id).all()
+    for paciente_id, tamano, videos in totales:
+        sumar_uso(paciente_id, -int(tamano), -videos)
+
+
+def paciente_de(ejercicio_sesion_id):
+    """Usuario_Id del paciente de un ejercicio de sesión (None si no existe)."""
+    from src.extensiones import db
+    from src.modelos import Ejercicio_Sesion, Sesion
+
+    return db.session.query(Sesion.Paciente_Id).join(
+        Ejercicio_Sesion, Ejercicio_Sesion.Sesion_Id == Sesion.Id
+    ).filter(Ejercicio_Sesion.Id == ejercicio_sesion_id).scalar()
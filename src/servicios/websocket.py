@@ -0,0 +1,262 @@
+"""
+WebSocket (RFC 6455) mínimo sobre el socket del servidor WSGI.
+
+Gunicorn (workers sync/gthread) y el servidor de desarrollo de Werkzeug
+exponen el socket de la conexión en el environ ('gunicorn.socket' y
+'werkzeug.socket'). Tras responder al handshake, la vista conserva el hilo
+y habla el protocolo directamente, igual que el canal Server-Sent Events
+ocupa un hilo mientras dura el stream. Evita añadir una dependencia para
+los mensajes de texto pequeños que intercambian las sesiones guiadas.
+"""
+
+import base64
+import errno
+import hashlib
+import json
+import select
+import socket
+import struct
+
+from flask import Response
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Códigos de operación
+OP_CONTINUACION = 0x0
+OP_TEXTO = 0x1
+OP_BINARIO = 0x2
+OP_CIERRE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Códigos de cierre
+CIERRE_NORMAL = 1000
+CIERRE_PROTOCOLO = 1002
+CIERRE_DEMASIADO_GRANDE = 1009
+
+
+class WebSocketCerrado(Exception):
+    """La conexión se ha cerrado (por el cliente, por error o por el servidor)."""
+
+    def __init__(self, codigo=CIERRE_NORMAL, motivo=''):
+        super().__init__(codigo, motivo)
+        self.codigo = codigo
+        self.motivo = motivo
+
+
+def clave_aceptacion(clave):
+    """Calcula Sec-WebSocket-Accept a partir de Sec-WebSocket-Key."""
+    digest = hashlib.sha1((clave + GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def es_peticion_websocket(environ):
+    """Indica si la petición pide cambiar a WebSocket."""
+    conexion = environ.get('HTTP_CONNECTION', '').lower()
+    return (
+        environ.get('HTTP_UPGRADE', '').lower() == 'websocket' and
+        'upgrade' in [parte.strip() for parte in conexion.split(',')]
+    )
+
+
+def socket_de_servidor(environ):
+    """Socket crudo de la conexión si el servidor WSGI lo expone (o None)."""
+    return environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+
+
+class ConexionWebSocket:
+    """
+    Extremo servidor de una conexión WebSocket ya aceptada.
+    Solo gestiona mensajes de texto; responde a los ping y al cierre.
+    """
+
+    TAM_MAXIMO_MENSAJE = 64 * 1024
+    TIMEOUT_TRAMA = 30.0
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.cerrado = False
+
+    @classmethod
+    def aceptar(cls, environ):
+        """
+        Completa el handshake de apertura.
+
+        Args:
+            environ: environ WSGI de la petición
+
+        Returns:
+            ConexionWebSocket lista para usar
+
+        Raises:
+            ValueError: si la petición no es un handshake válido
+            RuntimeError: si el servidor no expone el socket de la conexión
+        """
+        clave = environ.get('HTTP_SEC_WEBSOCKET_KEY')
+        if not es_peticion_websocket(environ) or not clave:
+            raise ValueError('La petición no es un handshake WebSocket')
+        if environ.get('HTTP_SEC_WEBSOCKET_VERSION') != '13':
+            raise ValueError('Versión de WebSocket no soportada')
+        sock = socket_de_servidor(environ)
+        if sock is None:
+            raise RuntimeError('El servidor WSGI no permite WebSocket')
+
+        sock.settimeout(None)
+        sock.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {clave_aceptacion(clave)}\r\n'
+            '\r\n'
+        ).encode('ascii'))
+        return cls(sock)
+
+    # --- Escritura ---
+
+    def _enviar_trama(self, opcode, datos=b''):
+        cabecera = bytes([0x80 | opcode])
+        longitud = len(datos)
+        if longitud < 126:
+            cabecera += bytes([longitud])
+        elif longitud < 1 << 16:
+            cabecera += bytes([126]) + struct.pack('!H', longitud)
+        else:
+            cabecera += bytes([127]) + struct.pack('!Q', longitud)
+        try:
+            self.sock.sendall(cabecera + datos)
+        except OSError:
+            self.cerrado = True
+            raise WebSocketCerrado(motivo='Conexión perdida')
+
+    def enviar(self, texto):
+        """Envía un mensaje de texto."""
+        self._enviar_trama(OP_TEXTO, texto.encode('utf-8'))
+
+    def enviar_json(self, datos):
+        """Envía un objeto serializado como JSON."""
+        self.enviar(json.dumps(datos))
+
+    def ping(self, datos=b''):
+        self._enviar_trama(OP_PING, datos)
+
+    def cerrar(self, codigo=CIERRE_NORMAL, motivo=''):
+        """Envía la trama de cierre (una sola vez) y cierra el socket."""
+        if self.cerrado:
+            return
+        try:
+            self._enviar_trama(OP_CIERRE, struct.pack('!H', codigo) + motivo.encode('utf-8'))
+        except WebSocketCerrado:
+            pass
+        self.cerrado = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    # --- Lectura ---
+
+    def _leer_exacto(self, n):
+        partes = []
+        while n:
+            try:
+                bloque = self.sock.recv(n)
+            except OSError:
+                bloque = b''
+            if not bloque:
+                self.cerrado = True
+                raise WebSocketCerrado(motivo='Conexión perdida')
+            partes.append(bloque)
+            n -= len(bloque)
+        return b''.join(partes)
+
+    def _leer_trama(self):
+        b1, b2 = self._leer_exacto(2)
+        fin = bool(b1 & 0x80)
+        opcode = b1 & 0x0F
+        if b1 & 0x70 or not b2 & 0x80:
+            # Bits reservados sin extensión negociada o trama de cliente sin máscara
+            self.cerrar(CIERRE_PROTOCOLO)
+            raise WebSocketCerrado(CIERRE_PROTOCOLO, 'Trama no válida')
+
+        longitud = b2 & 0x7F
+        if longitud == 126:
+            longitud = struct.unpack('!H', self._leer_exacto(2))[0]
+        elif longitud == 127:
+            longitud = struct.unpack('!Q', self._leer_exacto(8))[0]
+        if longitud > self.TAM_MAXIMO_MENSAJE:
+            self.cerrar(CIERRE_DEMASIADO_GRANDE)
+            raise WebSocketCerrado(CIERRE_DEMASIADO_GRANDE, 'Mensaje demasiado grande')
+
+        mascara = self._leer_exacto(4)
+        datos = bytearray(self._leer_exacto(longitud))
+        for i in range(longitud):
+            datos[i] ^= mascara[i % 4]
+        return fin, opcode, bytes(datos)
+
+    def recibir(self, timeout=None):
+        """
+        Espera el siguiente mensaje de texto.
+
+        Args:
+            timeout: Segundos máximos de espera (None: sin límite)
+
+        Returns:
+            str con el mensaje, o None si venció el timeout
+
+        Raises:
+            WebSocketCerrado: si el cliente cerró la conexión o se perdió
+        """
+        if self.cerrado:
+            raise WebSocketCerrado()
+        fragmentos = []
+        while True:
+            if not fragmentos and timeout is not None:
+                listos, _, _ = select.select([self.sock], [], [], timeout)
+                if not listos:
+                    return None
+            # Una vez empezada una trama se lee entera, con un límite generoso
+            self.sock.settimeout(self.TIMEOUT_TRAMA)
+            try:
+                fin, opcode, datos = self._leer_trama()
+            finally:
+                if not self.cerrado:
+                    self.sock.settimeout(None)
+
+            if opcode == OP_PING:
+                self._enviar_trama(OP_PONG, datos)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CIERRE:
+                codigo = struct.unpack('!H', datos[:2])[0] if len(datos) >= 2 else CIERRE_NORMAL
+                self.cerrar(codigo if codigo < 5000 else CIERRE_PROTOCOLO)
+                raise WebSocketCerrado(codigo, datos[2:].decode('utf-8', 'replace'))
+
+            if opcode in (OP_TEXTO, OP_BINARIO) and not fragmentos:
+                fragmentos.append(datos)
+            elif opcode == OP_CONTINUACION and fragmentos:
+                fragmentos.append(datos)
+            else:
+                self.cerrar(CIERRE_PROTOCOLO)
+                raise WebSocketCerrado(CIERRE_PROTOCOLO, 'Secuencia de fragmentos no válida')
+
+            if sum(len(f) for f in fragmentos) > self.TAM_MAXIMO_MENSAJE:
+                self.cerrar(CIERRE_DEMASIADO_GRANDE)
+                raise WebSocketCerrado(CIERRE_DEMASIADO_GRANDE, 'Mensaje demasiado grande')
+            if fin:
+                return b''.join(fragmentos).decode('utf-8', 'replace')
+
+
+class RespuestaWebSocket(Response):
+    """
+    Respuesta que devuelve la vista cuando la conexión WebSocket ha terminado.
+
+    El servidor no debe escribir nada más en el socket, así que en lugar de
+    una respuesta HTTP se señala una conexión cerrada por el cliente, caso que
+    tanto gunicorn como Werkzeug tratan en silencio.
+    """
+
+    def __call__(self, environ, start_response):
+        raise ConnectionResetError(errno.ECONNRESET, 'Conexión WebSocket finalizada')
+
@@ -0,0 +1,65 @@
+// Previsualización de la posición al pasar el ratón por la barra de avance
+// de los <video data-sprite> (rejilla de miniaturas generada en el servidor).
+(function () {
+    // Alto aproximado de la barra de controles nativa
+    const ALTO_CONTROLES = 40;
+
+    function activar(video) {
+        const columnas = parseInt(video.dataset.spriteColumnas, 10);
+        const filas = parseInt(video.dataset.spriteFilas, 10);
+        const intervalo = parseFloat(video.dataset.spriteIntervalo);
+        const total = columnas * filas;
+        const sprite = new Image();
+        let anchoMiniatura = 0;
+        let altoMiniatura = 0;
+
+        const contenedor = document.createElement('div');
+        contenedor.className = 'position-relative';
+        video.parentNode.insertBefore(contenedor, video);
+        contenedor.appendChild(video);
+
+        const vista = document.createElement('div');
+        vista.className = 'position-absolute border border-light rounded shadow d-none';
+        vista.style.pointerEvents = 'none';
+        vista.style.backgroundImage = `url("${video.dataset.sprite}")`;
+        contenedor.appendChild(vista);
+
+        sprite.onload = function () {
+            anchoMiniatura = sprite.naturalWidth / columnas;
+            altoMiniatura = sprite.naturalHeight / filas;
+            vista.style.width = `${anchoMiniatura}px`;
+            vista.style.height = `${altoMiniatura}px`;
+        };
+
+        video.addEventListener('mousemove', function (evento) {
+            const caja = video.getBoundingClientRect();
+            const x = evento.clientX - caja.left;
+            if (caja.bottom - evento.clientY > ALTO_CONTROLES) {
+                vista.classList.add('d-none');
+                return;
+            }
+            // La rejilla se descarga la primera vez que se necesita
+            if (!sprite.src) {
+                sprite.src = video.dataset.sprite;
+            }
+            if (!anchoMiniatura) {
+                return;
+            }
+            const duracion = isFinite(video.duration) ? video.duration : total * intervalo;
+            const indice = Math.min(total - 1, Math.floor((x / caja.width) * duracion / intervalo));
+            vista.style.backgroundPosition =
+                `-${(indice % columnas) * anchoMiniatura}px -${Math.floor(indice / columnas) * altoMiniatura}px`;
+            vista.style.left = `${Math.max(0, Math.min(caja.width - anchoMiniatura, x - anchoMiniatura / 2))}px`;
+            vista.style.top = `${caja.height - ALTO_CONTROLES - altoMiniatura - 4}px`;
+            vista.classList.remove('d-none');
+        });
+
+        video.addEventListener('mouseleave', function () {
+            vista.classList.add('d-none');
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('video[data-sprite]').forEach(activar);
+    });
+})();
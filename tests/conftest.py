@@ -11,7 +11,7 @@ from flask_login import login_user
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """
     Crea una instancia de la aplicación Flask para testing.
     
@@ -19,6 +19,13 @@ def app():
         - Base de datos en memoria SQLite
         - Modo testing activado
         - CSRF deshabilitado para facilitar tests
+        - Vídeos subidos y ficheros temporales en el directorio del test
+          (nunca en src/static/uploads)
+        - Diario de sesiones sin hilo de volcado (se vuelca de forma explícita)
+        - Subidas de vídeo ejecutadas en el propio hilo de la petición
+        - Procesado de vídeos en el propio hilo de la petición, sin versiones
+          transcodificadas ni miniaturas (sus tests las activan)
+        - Sin purga programada de vídeos caducados
     
     Yields:
         Flask: Aplicación configurada para tests
@@ -27,6 +34,16 @@ def app():
     app.config["TESTING"] = True
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
     app.config["WTF_CSRF_ENABLED"] = False  # para que los formularios funcionen en tests
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path / "subidas")
+    app.config["DIARIO_SESIONES_SEGUNDO_PLANO"] = False
+    app.config["ESTADO_BARRIDO_SEGUNDO_PLANO"] = False
+    app.config["SUBIDAS_SEGUNDO_PLANO"] = False
+    app.config["PROCESADO_SEGUNDO_PLANO"] = False
+    app.config["TRANSCODIFICACION_SEGUNDO_PLANO"] = False
+    app.config["TRANSCODIFICACION_VERSIONES"] = ()
+    app.config["MINIATURAS_ACTIVAS"] = False
+    app.config["PURGA_VIDEOS_PROGRAMADA"] = False
     with app.app_context():
         db.create_all()
         yield app
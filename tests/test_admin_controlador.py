@@ -100,6 +100,29 @@ def test_cargar_configuracion_error_usa_default(monkeypatch, tmp_path):
     config = admin_controlador.cargar_configuracion()
     assert config["retencion_videos"] == "30"
 
+def test_cargar_configuracion_solo_relee_si_cambia(monkeypatch, tmp_path):
+    """Prueba que sistema.json no se vuelve a parsear mientras no cambie."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("config")
+    ruta = os.path.join("config", "sistema.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"limite_almacenamiento": "3"}, f)
+
+    lecturas = []
+    json_load = json.load
+    monkeypatch.setattr(admin_controlador.json, "load", lambda f: lecturas.append(f.name) or json_load(f))
+
+    assert admin_controlador.cargar_configuracion()["limite_almacenamiento"] == "3"
+    config = admin_controlador.cargar_configuracion()
+    config["limite_almacenamiento"] = "modificada"
+    assert admin_controlador.cargar_configuracion()["limite_almacenamiento"] == "3"
+    assert len(lecturas) == 1
+
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"limite_almacenamiento": "40"}, f)
+    assert admin_controlador.cargar_configuracion()["limite_almacenamiento"] == "40"
+    assert len(lecturas) == 2
+
 # Tests de rutas del dashboard
 
 def test_dashboard_admin(client, admin_user, login_admin):
@@ -358,10 +381,13 @@ def test_cambiar_estado_usuario_no_puede_su_cuenta(client, admin_user, login_adm
 def test_cambiar_estado_usuario_otro(client, admin_user, login_admin, user_factory):
     """Prueba activar/desactivar cuenta de otro usuario."""
     user = user_factory(Email="estado@example.com", Estado=1)
+    client.application.extensions["usuarios_activos"].registrar(user.Id, True)
     resp = client.get(f"/admin/cambiar_estado/{user.Id}", follow_redirects=False)
     assert resp.status_code == 302
     db.session.refresh(user)
     assert user.Estado == 0  
+    # La cuenta desactivada deja de darse por buena en este worker
+    assert client.application.extensions["usuarios_activos"].activo(user.Id) is None
 
 # Tests de crear_usuario
 
@@ -837,4 +863,13 @@ def test_configuracion_excepcion_muestra_flash(client, admin_user, login_admin,
         follow_redirects=True,
     )
     assert resp.status_code == 200
-    assert b"Error al procesar configuraci" in resp.data
\ No newline at end of file
+    assert b"Error al procesar configuraci" in resp.data
+# Tests de métricas del estado en tiempo real
+
+def test_metricas_estado_sesiones(client, admin_user, login_admin):
+    """Prueba el indicador de tamaño del almacén de estado de sesiones."""
+    resp = client.get("/admin/api/estado_sesiones")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert {"backend", "entradas", "bytes_aproximados", "caducidades_programadas"} <= set(data)
+    assert data["entradas"] >= 0
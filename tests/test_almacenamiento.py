@@ -0,0 +1,112 @@
+"""
+Tests de los almacenes de vídeos (local y Cloudinary).
+"""
+
+import io
+
+import pytest
+
+from src.servicios.almacenamiento import (
+    AlmacenCloudinary,
+    AlmacenLocal,
+    almacen_videos,
+    crear_almacen,
+)
+
+
+def test_local_guardar_leer_y_borrar(tmp_path):
+    """Prueba el ciclo completo en disco desde un stream y desde un fichero."""
+    almacen = AlmacenLocal(str(tmp_path / "videos"), "/static/uploads/videos")
+
+    assert almacen.guardar("a.mp4", io.BytesIO(b"0123456789")) == "/static/uploads/videos/a.mp4"
+    assert almacen.existe("a.mp4")
+    assert almacen.tamano("a.mp4") == 10
+    assert almacen.leer_rango("a.mp4", 2, 5) == b"2345"
+    with almacen.abrir("a.mp4") as f:
+        assert f.read() == b"0123456789"
+
+    origen = tmp_path / "subida.webm"
+    origen.write_bytes(b"webm")
+    almacen.guardar("sub/b.webm", str(origen))
+    assert not origen.exists()
+    assert (tmp_path / "videos" / "sub" / "b.webm").read_bytes() == b"webm"
+
+    almacen.borrar("a.mp4")
+    almacen.borrar("a.mp4")  # idempotente
+    assert not almacen.existe("a.mp4")
+    assert [p.name for p in (tmp_path / "videos").iterdir()] == ["sub"]
+
+
+def test_local_rechaza_claves_fuera_del_almacen(tmp_path):
+    """Prueba que una clave no puede escapar del directorio."""
+    almacen = AlmacenLocal(str(tmp_path))
+    for clave in ("../x.mp4", "/etc/passwd", "a/../../x.mp4", ".."):
+        with pytest.raises(ValueError):
+            almacen.ruta(clave)
+    assert almacen.url("a.mp4") is None
+
+
+def test_crear_almacen_desde_url(app, tmp_path):
+    """Prueba la selección del almacén por configuración."""
+    app.static_folder = str(tmp_path / "static")
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "static" / "uploads")
+
+    local = crear_almacen("local://ejercicios", app)
+    assert isinstance(local, AlmacenLocal)
+    assert local.raiz == str(tmp_path / "static" / "uploads" / "ejercicios")
+    assert local.url("e.mp4") == "/static/uploads/ejercicios/e.mp4"
+
+    # Fuera de la carpeta estática no hay URL directa
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "privado")
+    assert crear_almacen("local://ejercicios", app).url("e.mp4") is None
+
+    nube = crear_almacen("cloudinary://terapitrack/respuestas", app)
+    assert isinstance(nube, AlmacenCloudinary)
+    assert nube.public_id("respuesta_3.webm") == "terapitrack/respuestas/respuesta_3"
+
+    with pytest.raises(ValueError):
+        crear_almacen("ftp://servidor", app)
+
+
+def test_almacen_videos_por_tipo(app):
+    """Prueba que cada tipo de vídeo usa su URL de configuración."""
+    assert isinstance(almacen_videos("ejercicios"), AlmacenLocal)
+    assert isinstance(almacen_videos("respuestas"), AlmacenCloudinary)
+    app.config["ALMACEN_RESPUESTAS_URL"] = "local://respuestas"
+    assert isinstance(almacen_videos("respuestas"), AlmacenLocal)
+
+
+def test_cloudinary_guardar_url_y_borrar(monkeypatch):
+    """Prueba las llamadas a Cloudinary sin red."""
+    llamadas = []
+
+    def fake_upload(origen, **kwargs):
+        llamadas.append(("upload", origen, kwargs))
+        return {"secure_url": "https://res.example.com/v.webm"}
+
+    def fake_destroy(public_id, **kwargs):
+        llamadas.append(("destroy", public_id, kwargs))
+
+    monkeypatch.setattr("cloudinary.uploader.upload", fake_upload)
+    monkeypatch.setattr("cloudinary.uploader.destroy", fake_destroy)
+    almacen = AlmacenCloudinary("terapitrack/respuestas")
+
+    assert almacen.guardar("respuesta_7.webm", "/tmp/r.webm") == "https://res.example.com/v.webm"
+    _, origen, kwargs = llamadas[0]
+    assert origen == "/tmp/r.webm"
+    assert kwargs["folder"] == "terapitrack/respuestas"
+    assert kwargs["public_id"] == "respuesta_7"
+    assert kwargs["resource_type"] == "video"
+
+    almacen.borrar("respuesta_7.webm")
+    assert llamadas[1][:2] == ("destroy", "terapitrack/respuestas/respuesta_7")
+
+    import cloudinary
+    monkeypatch.setattr(cloudinary.config(), "cloud_name", "demo")
+    url = almacen.url("respuesta_7.webm")
+    assert url.startswith("https://res.cloudinary.com/demo/video/upload/")
+    assert url.endswith("terapitrack/respuestas/respuesta_7.webm")
+    assert almacen.url("respuesta_7_poster.jpg").startswith("https://res.cloudinary.com/demo/image/upload/")
+
+    almacen.guardar("respuesta_7_sprite.jpg", "/tmp/s.jpg")
+    assert llamadas[2][2]["resource_type"] == "image"
@@ -0,0 +1,49 @@
+"""
+Tests del tiempo de arranque de un worker.
+Importa la aplicación en un intérprete nuevo con `python -X importtime` y
+comprueba que no se cargan dependencias pesadas ni se supera el presupuesto.
+"""
+
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Paquetes que solo se cargan al usarlos (procesado de vídeo, Cloudinary)
+PAQUETES_DIFERIDOS = ("moviepy", "numpy", "imageio", "imageio_ffmpeg", "cloudinary")
+
+# Presupuesto de importación de `app` (incluye create_app); hoy ronda 0.7 s
+PRESUPUESTO_US = 3_000_000
+
+
+def _importtime(modulo):
+    """Ejecuta `import modulo` en frío y devuelve {módulo: tiempo acumulado en µs}."""
+    entorno = dict(os.environ, DATABASE_URL="sqlite://", PYTHONDONTWRITEBYTECODE="1")
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, timeout=120,
+    )
+    assert resultado.returncode == 0, resultado.stderr[-2000:]
+
+    tiempos = {}
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        if acumulado.strip().isdigit():
+            tiempos[nombre.strip()] = int(acumulado)
+    return tiempos
+
+
+def test_arranque_sin_dependencias_pesadas():
+    """Prueba que importar la aplicación no carga MoviePy ni Cloudinary."""
+    tiempos = _importtime("app")
+    cargados = sorted(m for m in tiempos if m.split(".")[0] in PAQUETES_DIFERIDOS)
+    assert cargados == []
+
+
+def test_arranque_dentro_del_presupuesto():
+    """Prueba que el arranque en frío no empeora por encima del presupuesto."""
+    tiempos = _importtime("app")
+    assert tiempos["app"] < PRESUPUESTO_US, f"import app: {tiempos['app'] / 1e6:.2f} s"
@@ -0,0 +1,29 @@
+"""
+Tests del cupo de conexiones de larga duración (eventos, WebSocket y long-poll).
+"""
+
+from src.servicios.conexiones_largas import CupoConexiones, cupo_conexiones
+
+
+def test_cupo_conexiones_ocupar_y_liberar():
+    """Prueba que el cupo no admite más conexiones que el máximo y recupera los huecos."""
+    cupo = CupoConexiones(2)
+    assert cupo.ocupar()
+    assert cupo.ocupar()
+    assert not cupo.ocupar()
+    assert cupo.abiertas == 2
+
+    cupo.liberar()
+    assert cupo.ocupar()
+    cupo.liberar()
+    cupo.liberar()
+    cupo.liberar()
+    assert cupo.abiertas == 0
+
+
+def test_cupo_conexiones_de_la_aplicacion(app):
+    """Prueba que init_app crea el cupo con CONEXIONES_LARGAS_MAXIMAS."""
+    with app.app_context():
+        cupo = cupo_conexiones()
+    assert cupo is app.extensions["conexiones_largas"]
+    assert cupo.maximo == app.config["CONEXIONES_LARGAS_MAXIMAS"]
@@ -0,0 +1,181 @@
+"""
+Tests del almacenamiento por contenido de los vídeos de ejercicios.
+"""
+
+import hashlib
+import io
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.ejercicio import Ejercicio
+from src.servicios.contenido_videos import (
+    clave_contenido,
+    es_clave_contenido,
+    liberar_video,
+    migrar_videos_ejercicios,
+    referencias,
+)
+from src.servicios.procesado_ejercicios import cola_procesado
+from tests.test_metadatos_video import video_mp4
+from tests.test_profesional_controlador import login_profesional, profesional_user  # noqa: F401
+
+VIDEO = video_mp4(duracion=33000)
+SHA = hashlib.sha256(VIDEO).hexdigest()
+CLAVE = f"{SHA[:2]}/{SHA[2:4]}/{SHA}.mp4"
+
+
+@pytest.fixture
+def almacen(app, tmp_path):
+    """Almacén local de ejercicios en un directorio temporal."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path / "subidas")
+    app.config["TRANSCODIFICACION_VERSIONES"] = (("360p", 360, 700),)
+    raiz = tmp_path / "uploads" / "ejercicios"
+    raiz.mkdir(parents=True)
+    return raiz
+
+
+def _ficheros(raiz):
+    return sorted(p.relative_to(raiz).as_posix() for p in raiz.rglob("*") if p.is_file())
+
+
+def _ejercicio(video, **campos):
+    ejercicio = Ejercicio(Nombre="E", Descripcion="D", Tipo="T", Video=video, Duracion=campos.pop("Duracion", 5),
+                          **campos)
+    db.session.add(ejercicio)
+    db.session.commit()
+    return ejercicio
+
+
+def test_claves_por_contenido():
+    """Prueba el reparto en subcarpetas y el reconocimiento de las claves."""
+    assert clave_contenido(SHA) == CLAVE
+    assert clave_contenido(SHA, ".webm").endswith(f"{SHA}.webm")
+    assert es_clave_contenido(CLAVE)
+    assert not es_clave_contenido("ejercicio_1700000000.0.mp4")
+    assert not es_clave_contenido(f"../{SHA[2:4]}/{SHA}.mp4")
+    assert not es_clave_contenido(None)
+
+
+def test_subidas_identicas_comparten_fichero(client, login_profesional, almacen, monkeypatch):
+    """Prueba que el segundo ejercicio con el mismo vídeo lo reutiliza sin procesarlo."""
+    def crear(nombre):
+        return client.post(
+            "/profesional/ejercicios/crear",
+            data={"nombre": nombre, "descripcion": "D", "tipo": "MOVILIDAD",
+                  "video": (io.BytesIO(VIDEO), "mismo.mp4")},
+            content_type="multipart/form-data",
+        )
+
+    assert crear("Primero").status_code == 302
+    primero = Ejercicio.query.filter_by(Nombre="Primero").one()
+    assert (primero.Video, primero.Duracion, primero.Procesando) == (CLAVE, 33, False)
+    primero.Versiones = "360p"
+    primero.Miniaturas = "5x4@1.7"
+    db.session.commit()
+
+    encolados = []
+    monkeypatch.setattr("src.servicios.procesado_ejercicios.ColaProcesado.encolar",
+                        lambda self, *args: encolados.append(args))
+    assert crear("Segundo").status_code == 302
+
+    segundo = Ejercicio.query.filter_by(Nombre="Segundo").one()
+    assert (segundo.Video, segundo.Duracion, segundo.Procesando) == (CLAVE, 33, False)
+    assert (segundo.Versiones, segundo.Miniaturas) == ("360p", "5x4@1.7")
+    assert encolados == []
+    assert _ficheros(almacen) == [CLAVE]
+    assert referencias(CLAVE) == 2
+    assert list((almacen.parent.parent / "subidas").glob("*.mp4")) == []
+
+
+def test_subida_identica_tras_fallar_el_guardado(client, login_profesional, almacen, monkeypatch):
+    """Prueba que un vídeo que no llegó al almacén no se reutiliza: la siguiente subida lo procesa."""
+    from src.servicios.almacenamiento import AlmacenLocal
+
+    def crear(nombre):
+        return client.post(
+            "/profesional/ejercicios/crear",
+            data={"nombre": nombre, "descripcion": "D", "tipo": "MOVILIDAD",
+                  "video": (io.BytesIO(VIDEO), "mismo.mp4")},
+            content_type="multipart/form-data",
+        )
+
+    guardar = AlmacenLocal.guardar
+
+    def fallar(self, *args):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(AlmacenLocal, "guardar", fallar)
+    assert crear("Primero").status_code == 302
+    db.session.expire_all()
+    assert Ejercicio.query.filter_by(Nombre="Primero").one().Procesando is False
+    assert _ficheros(almacen) == []
+
+    monkeypatch.setattr(AlmacenLocal, "guardar", guardar)
+    assert crear("Segundo").status_code == 302
+    segundo = Ejercicio.query.filter_by(Nombre="Segundo").one()
+    assert (segundo.Video, segundo.Duracion, segundo.Procesando) == (CLAVE, 33, False)
+    assert _ficheros(almacen) == [CLAVE]
+
+
+def test_liberar_video_solo_sin_referencias(app, almacen):
+    """Prueba que el vídeo y sus derivados solo se borran sin ejercicios que lo usen."""
+    destino = almacen / SHA[:2] / SHA[2:4]
+    destino.mkdir(parents=True)
+    for nombre in (f"{SHA}.mp4", f"{SHA}_360p.mp4", f"{SHA}_poster.jpg", f"{SHA}_sprite.jpg"):
+        (destino / nombre).write_bytes(b"x")
+    ejercicio = _ejercicio(CLAVE)
+
+    assert liberar_video(CLAVE) is False
+    assert len(_ficheros(almacen)) == 4
+
+    db.session.delete(ejercicio)
+    db.session.commit()
+    assert liberar_video(CLAVE) is True
+    assert _ficheros(almacen) == []
+    assert liberar_video("hombros.mp4") is False
+
+
+def test_procesado_de_ejercicio_borrado_libera_el_video(app, almacen, tmp_path):
+    """Prueba que el vídeo de un ejercicio borrado durante el procesado no queda huérfano."""
+    ejercicio = _ejercicio(CLAVE, Procesando=True)
+    ejercicio_id = ejercicio.Id
+    db.session.delete(ejercicio)
+    db.session.commit()
+    ruta = tmp_path / "subida.mp4"
+    ruta.write_bytes(VIDEO)
+
+    cola_procesado().encolar(ejercicio_id, str(ruta), CLAVE)
+
+    assert _ficheros(almacen) == []
+    assert not ruta.exists()
+
+
+def test_migracion_de_videos_planos(app, almacen):
+    """Prueba la migración, la deduplicación y que se puede repetir."""
+    (almacen / "ejercicio_1.mp4").write_bytes(VIDEO)
+    (almacen / "ejercicio_1_360p.mp4").write_bytes(b"version")
+    (almacen / "ejercicio_1_poster.jpg").write_bytes(b"poster")
+    (almacen / "ejercicio_2.mp4").write_bytes(VIDEO)
+    (almacen / "ejercicio_3.mp4").write_bytes(b"otro")
+    a = _ejercicio("ejercicio_1.mp4", Versiones="360p")
+    b = _ejercicio("ejercicio_1.mp4")
+    c = _ejercicio("ejercicio_2.mp4")
+    d = _ejercicio("ejercicio_3.mp4")
+    demo = _ejercicio("hombros.mp4")
+    perdido = _ejercicio("ejercicio_9.mp4")
+
+    assert migrar_videos_ejercicios() == {"migrados": 2, "duplicados": 1, "sin_fichero": 2}
+
+    otro = hashlib.sha256(b"otro").hexdigest()
+    assert _ficheros(almacen) == sorted([
+        CLAVE, f"{SHA[:2]}/{SHA[2:4]}/{SHA}_360p.mp4", f"{SHA[:2]}/{SHA[2:4]}/{SHA}_poster.jpg",
+        clave_contenido(otro),
+    ])
+    assert (almacen / CLAVE).read_bytes() == VIDEO
+    videos = {e.Id: db.session.get(Ejercicio, e.Id).Video for e in (a, b, c, d, demo, perdido)}
+    assert videos == {a.Id: CLAVE, b.Id: CLAVE, c.Id: CLAVE, d.Id: clave_contenido(otro),
+                      demo.Id: "hombros.mp4", perdido.Id: "ejercicio_9.mp4"}
+
+    assert migrar_videos_ejercicios() == {"migrados": 0, "duplicados": 0, "sin_fichero": 2}
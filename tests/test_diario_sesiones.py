@@ -0,0 +1,171 @@
+"""
+Tests del diario de eventos de sesión con escritura diferida.
+Prueba el búfer, el volcado por lotes, los reintentos y el cálculo de tiempos.
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.evento_sesion import EventoSesion
+from src.servicios.diario_sesiones import diario_sesiones, tiempos_por_ejercicio
+
+
+def _evento(tipo, segundos, **datos):
+    return SimpleNamespace(
+        Tipo=tipo,
+        Fecha=datetime(2025, 6, 1, 10, 0) + timedelta(seconds=segundos),
+        datos=lambda: datos,
+    )
+
+
+def test_registrar_no_escribe_hasta_volcar(app):
+    """Prueba que los eventos quedan en el búfer hasta el volcado."""
+    diario = diario_sesiones()
+    diario.registrar(1, 'EJERCICIO', ejercicio_sesion_id=7)
+    diario.registrar(1, 'GRABACION', activa=True)
+
+    assert diario.pendientes() == 2
+    assert EventoSesion.query.count() == 0
+
+    assert diario.volcar() == 2
+    assert diario.pendientes() == 0
+    eventos = EventoSesion.query.order_by(EventoSesion.Id).all()
+    assert [e.Tipo for e in eventos] == ['EJERCICIO', 'GRABACION']
+    assert eventos[0].datos() == {'ejercicio_sesion_id': 7}
+    assert diario.volcar() == 0
+
+
+def test_lote_lleno_se_vuelca(app):
+    """Prueba que, sin hilo de volcado, al llenarse el lote se escribe."""
+    app.config['DIARIO_SESIONES_LOTE'] = 3
+    diario = diario_sesiones()
+    for _ in range(3):
+        diario.registrar(2, 'TERMINADA')
+    assert diario.pendientes() == 0
+    assert EventoSesion.query.filter_by(Sesion_Id=2).count() == 3
+
+
+def test_capacidad_descarta_los_mas_antiguos(app):
+    """Prueba que el búfer no crece sin límite."""
+    app.config['DIARIO_SESIONES_CAPACIDAD'] = 2
+    diario = diario_sesiones()
+    for i in range(3):
+        diario.registrar(3, 'EJERCICIO', ejercicio_sesion_id=i)
+    assert diario.pendientes() == 2
+    diario.volcar()
+    ids = [e.datos()['ejercicio_sesion_id'] for e in EventoSesion.query.order_by(EventoSesion.Id)]
+    assert ids == [1, 2]
+
+
+def test_filas_fallidas_vuelven_al_bufer(app, monkeypatch):
+    """Prueba que un evento no válido no impide guardar el resto del lote."""
+    diario = diario_sesiones()
+    diario.registrar(4, 'EJERCICIO', ejercicio_sesion_id=1)
+    diario.registrar(4, 'DESCONOCIDO')  # viola el CHECK de Tipo
+    diario.registrar(4, 'FINALIZADA')
+
+    assert diario.volcar() == 2
+    assert diario.pendientes() == 1
+    assert EventoSesion.query.filter_by(Sesion_Id=4).count() == 2
+
+    # Tras MAX_INTENTOS se descarta
+    for _ in range(diario.MAX_INTENTOS):
+        diario.volcar()
+    assert diario.pendientes() == 0
+
+
+def test_hilo_de_volcado(app):
+    """Prueba que el hilo en segundo plano vuelca pasado el intervalo."""
+    import time
+
+    app.config['DIARIO_SESIONES_SEGUNDO_PLANO'] = True
+    app.config['DIARIO_SESIONES_INTERVALO'] = 0.05
+    diario = diario_sesiones()
+    diario.registrar(5, 'TERMINADA')
+
+    limite = time.monotonic() + 5
+    while diario.pendientes() and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert diario.pendientes() == 0
+    assert diario._hilo.is_alive()
+
+
+def test_hilo_vuelca_eventos_tras_un_volcado(app):
+    """Prueba que el intervalo también vuelca los eventos que llegan con el búfer ya vaciado."""
+    import time
+
+    app.config['DIARIO_SESIONES_SEGUNDO_PLANO'] = True
+    app.config['DIARIO_SESIONES_INTERVALO'] = 0.05
+    diario = diario_sesiones()
+
+    def esperar_volcado(eventos):
+        # pendientes() baja a 0 antes de que termine la inserción
+        limite = time.monotonic() + 1
+        while EventoSesion.query.count() < eventos and time.monotonic() < limite:
+            time.sleep(0.01)
+        return [e.Tipo for e in EventoSesion.query.order_by(EventoSesion.Id)]
+
+    diario.registrar(5, 'EJERCICIO', ejercicio_sesion_id=1)
+    assert esperar_volcado(1) == ['EJERCICIO']
+    diario.registrar(5, 'TERMINADA')
+    assert esperar_volcado(2) == ['EJERCICIO', 'TERMINADA']
+
+
+def test_tiempos_por_ejercicio():
+    """Prueba el cálculo de la duración de cada ejercicio."""
+    eventos = [
+        _evento('EJERCICIO', 0, ejercicio_sesion_id=1),
+        _evento('GRABACION', 5, activa=True),
+        _evento('EJERCICIO', 30, ejercicio_sesion_id=2),
+        _evento('TERMINADA', 75),
+        _evento('REANUDADA', 80),
+        _evento('EJERCICIO', 90, ejercicio_sesion_id=3),
+    ]
+    tramos = tiempos_por_ejercicio(eventos)
+    assert [(t['ejercicio_sesion_id'], t['segundos']) for t in tramos] == [
+        (1, 30.0), (2, 45.0), (3, None)
+    ]
+    assert tramos[0]['inicio'] == datetime(2025, 6, 1, 10, 0)
+
+
+def test_tiempos_ignora_ejercicio_nulo():
+    """Prueba que pasar a 'sin ejercicio' cierra el tramo sin abrir otro."""
+    eventos = [
+        _evento('EJERCICIO', 0, ejercicio_sesion_id=1),
+        _evento('EJERCICIO', 10, ejercicio_sesion_id=None),
+        _evento('FINALIZADA', 20),
+    ]
+    assert [(t['ejercicio_sesion_id'], t['segundos']) for t in tiempos_por_ejercicio(eventos)] == [(1, 10.0)]
+
+
+class TestEventoSesion:
+    """Suite de tests para el modelo EventoSesion."""
+
+    def test_creacion_y_serializacion(self, app):
+        """Prueba la creación, los datos JSON y to_dict."""
+        evento = EventoSesion(Sesion_Id=1, Tipo='GRABACION', Datos=json.dumps({'activa': False}))
+        db.session.add(evento)
+        db.session.commit()
+
+        assert evento.Fecha is not None
+        assert evento.datos() == {'activa': False}
+        datos = evento.to_dict()
+        assert datos['Tipo'] == 'GRABACION'
+        assert datos['Datos'] == {'activa': False}
+        assert datos['Fecha'] == evento.Fecha.isoformat()
+        assert 'EventoSesion' in repr(evento)
+
+    def test_check_constraint_tipo(self, app):
+        """Prueba la restricción CHECK de Tipo."""
+        db.session.add(EventoSesion(Sesion_Id=1, Tipo='OTRO'))
+        with pytest.raises(Exception):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_datos_vacios(self, app):
+        """Prueba que un evento sin datos devuelve un diccionario vacío."""
+        assert EventoSesion(Sesion_Id=1, Tipo='TERMINADA').datos() == {}
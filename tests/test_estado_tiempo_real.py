@@ -0,0 +1,558 @@
+"""
+Tests del almacén de estado en tiempo real de sesiones.
+Prueba los backends en memoria, mmap y protocolo Redis (con un servidor
+RESP mínimo en proceso) y las vistas dict/set de compatibilidad.
+"""
+
+import socketserver
+import threading
+import time
+
+import pytest
+
+from src.servicios.estado_tiempo_real import (
+    BORRAR,
+    BackendMemoria,
+    BackendMmap,
+    BackendRedis,
+    ClienteRESP,
+    EstadoTiempoReal,
+    crear_backend,
+)
+
+
+# Servidor RESP de pruebas
+
+class _ManejadorRESP(socketserver.StreamRequestHandler):
+    """Implementa el subconjunto de comandos Redis que usa el backend."""
+
+    def _leer_comando(self):
+        linea = self.rfile.readline()
+        if not linea:
+            return None
+        n = int(linea[1:-2])
+        args = []
+        for _ in range(n):
+            longitud = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(longitud + 2)[:-2])
+        return args
+
+    def _responder(self, valor):
+        if valor is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(valor, int):
+            self.wfile.write(b":%d\r\n" % valor)
+        elif isinstance(valor, bytes):
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(valor), valor))
+        elif isinstance(valor, list):
+            self.wfile.write(b"*%d\r\n" % len(valor))
+            for v in valor:
+                self._responder(v)
+        else:
+            self.wfile.write(b"+%s\r\n" % valor.encode())
+
+    def _ejecutar(self, cmd, resto):
+        """Ejecuta un comando con el lock del servidor tomado y devuelve la respuesta."""
+        datos = self.server.datos
+        if cmd in (b"HSET", b"HDEL", b"HINCRBY", b"DEL"):
+            # Versión por clave para WATCH
+            for clave in (resto if cmd == b"DEL" else resto[:1]):
+                self.server.cambios[clave] = self.server.cambios.get(clave, 0) + 1
+        if cmd == b"PING":
+            return "PONG"
+        if cmd == b"HSET":
+            h = datos.setdefault(resto[0], {})
+            nuevos = 0
+            for i in range(1, len(resto), 2):
+                nuevos += resto[i] not in h
+                h[resto[i]] = resto[i + 1]
+            return nuevos
+        if cmd == b"HGET":
+            return datos.get(resto[0], {}).get(resto[1])
+        if cmd == b"HMGET":
+            return [datos.get(resto[0], {}).get(c) for c in resto[1:]]
+        if cmd == b"HGETALL":
+            plano = []
+            for k, v in datos.get(resto[0], {}).items():
+                plano.extend([k, v])
+            return plano
+        if cmd == b"HDEL":
+            h = datos.get(resto[0], {})
+            borrados = sum(1 for c in resto[1:] if h.pop(c, None) is not None)
+            if not h:
+                datos.pop(resto[0], None)
+            return borrados
+        if cmd == b"HINCRBY":
+            h = datos.setdefault(resto[0], {})
+            valor = int(h.get(resto[1], b"0")) + int(resto[2])
+            h[resto[1]] = str(valor).encode()
+            return valor
+        if cmd == b"DEL":
+            return sum(1 for k in resto if datos.pop(k, None) is not None)
+        if cmd == b"SADD":
+            s = datos.setdefault(resto[0], set())
+            antes = len(s)
+            s.update(resto[1:])
+            return len(s) - antes
+        if cmd == b"SREM":
+            s = datos.get(resto[0], set())
+            antes = len(s)
+            s.difference_update(resto[1:])
+            return antes - len(s)
+        if cmd == b"SMEMBERS":
+            return sorted(datos.get(resto[0], set()))
+        return ValueError("comando desconocido")
+
+    def handle(self):
+        vigiladas = {}
+        cola = None
+        while True:
+            args = self._leer_comando()
+            if args is None:
+                return
+            cmd, resto = args[0].upper(), args[1:]
+            with self.server.lock:
+                if cmd == b"WATCH":
+                    for clave in resto:
+                        vigiladas[clave] = self.server.cambios.get(clave, 0)
+                    respuesta = "OK"
+                elif cmd == b"UNWATCH":
+                    vigiladas.clear()
+                    respuesta = "OK"
+                elif cmd == b"MULTI":
+                    cola = []
+                    respuesta = "OK"
+                elif cmd == b"EXEC":
+                    anulada = any(
+                        self.server.cambios.get(clave, 0) != version
+                        for clave, version in vigiladas.items()
+                    )
+                    respuesta = None if anulada else [self._ejecutar(c, r) for c, r in cola]
+                    vigiladas.clear()
+                    cola = None
+                elif cola is not None:
+                    cola.append((cmd, resto))
+                    respuesta = "QUEUED"
+                else:
+                    respuesta = self._ejecutar(cmd, resto)
+
+            if isinstance(respuesta, ValueError):
+                self.wfile.write(b"-ERR %s\r\n" % str(respuesta).encode())
+            else:
+                self._responder(respuesta)
+
+
+class _ServidorRESP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def servidor_resp():
+    """Arranca un servidor RESP en un puerto libre de localhost."""
+    servidor = _ServidorRESP(("127.0.0.1", 0), _ManejadorRESP)
+    servidor.datos = {}
+    servidor.cambios = {}
+    servidor.lock = threading.Lock()
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture(params=["memoria", "mmap", "redis"])
+def backend(request, tmp_path):
+    """Devuelve cada backend para ejecutar la misma batería de tests."""
+    if request.param == "memoria":
+        b = BackendMemoria()
+    elif request.param == "mmap":
+        b = BackendMmap(str(tmp_path / "estado.bin"), num_slots=64)
+    else:
+        servidor = request.getfixturevalue("servidor_resp")
+        host, port = servidor.server_address
+        b = BackendRedis(ClienteRESP(host, port))
+    yield b
+    b.cerrar()
+
+# Tests comunes a todos los backends
+
+def test_backend_leer_inexistente_devuelve_vacio(backend):
+    """Prueba que una sesión sin estado devuelve diccionario vacío."""
+    assert backend.leer(1) == {}
+    assert backend.ids() == []
+
+def test_backend_actualizar_mezcla_campos(backend):
+    """Prueba que actualizar mezcla campos sin borrar los anteriores."""
+    backend.actualizar(1, {"ejercicio_activo_id": 5})
+    backend.actualizar(1, {"terminada": True, "ultimo_cambio": 12.5})
+    assert backend.leer(1) == {
+        "ejercicio_activo_id": 5,
+        "terminada": True,
+        "ultimo_cambio": 12.5,
+        "version": 2,
+    }
+    assert backend.ids() == [1]
+
+def test_backend_leer_varios(backend):
+    """Prueba la lectura de varias sesiones en una sola operación."""
+    backend.actualizar(1, {"ejercicio_activo_id": 1})
+    backend.actualizar(3, {"terminada": True})
+    assert backend.leer_varios([3, 2, 1]) == {
+        3: {"terminada": True, "version": 1},
+        2: {},
+        1: {"ejercicio_activo_id": 1, "version": 1},
+    }
+    assert backend.leer_varios([]) == {}
+
+def test_backend_comparar_y_actualizar(backend):
+    """Prueba que la escritura condicional solo se aplica sobre la versión esperada."""
+    assert backend.comparar_y_actualizar(1, 0, {"terminada": True, "x": 1})
+    assert not backend.comparar_y_actualizar(1, 0, {"terminada": False})
+    assert backend.leer(1) == {"terminada": True, "x": 1, "version": 1}
+
+    assert backend.comparar_y_actualizar(1, 1, {"terminada": BORRAR, "x": 2})
+    assert backend.leer(1) == {"x": 2, "version": 2}
+
+def test_transicion_sin_actualizaciones_perdidas(backend):
+    """Prueba que hilos concurrentes no pierden incrementos (read-modify-write)."""
+    estado = EstadoTiempoReal()
+    estado._backend = backend
+
+    def incrementar(actual):
+        return {"contador": actual.get("contador", 0) + 1}, None
+
+    def trabajador():
+        barrera.wait()
+        for _ in range(10):
+            estado.transicion(1, incrementar, intentos=1000)
+
+    barrera = threading.Barrier(4)
+    hilos = [threading.Thread(target=trabajador) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert estado.leer(1)["contador"] == 40
+    assert estado.leer(1)["version"] == 40
+
+def test_transicion_sin_cambios_no_escribe(backend):
+    """Prueba que una decisión sin cambios devuelve el resultado sin tocar la versión."""
+    estado = EstadoTiempoReal()
+    estado._backend = backend
+    assert estado.transicion(1, lambda actual: ({}, "nada")) == "nada"
+    assert estado.leer(1) == {}
+
+def test_backend_admite_none_explicito(backend):
+    """Prueba que None se guarda como valor (ejercicio activo vacío)."""
+    backend.actualizar(2, {"ejercicio_activo_id": None})
+    assert backend.leer(2) == {"ejercicio_activo_id": None, "version": 1}
+
+def test_backend_quitar_y_eliminar(backend):
+    """Prueba quitar campos concretos y eliminar la sesión completa."""
+    backend.actualizar(3, {"ejercicio_activo_id": 7, "terminada": True})
+    backend.quitar(3, ("terminada",))
+    assert backend.leer(3) == {"ejercicio_activo_id": 7, "version": 2}
+
+    # La versión se conserva para que siga siendo monótona
+    backend.quitar(3, ("ejercicio_activo_id",))
+    assert backend.leer(3) == {"version": 3}
+
+    # Quitar un campo que no existe no es un cambio
+    backend.quitar(3, ("terminada",))
+    assert backend.leer(3) == {"version": 3}
+
+    backend.actualizar(3, {"ejercicio_activo_id": 8})
+    assert backend.leer(3)["version"] == 4
+    backend.eliminar(3)
+    assert backend.leer(3) == {}
+    assert backend.ids() == []
+
+# Tests específicos de backends
+
+def test_mmap_compartido_entre_instancias(tmp_path):
+    """Prueba que dos workers que mapean el mismo fichero ven el mismo estado."""
+    ruta = str(tmp_path / "compartido.bin")
+    worker_a = BackendMmap(ruta, num_slots=16)
+    worker_b = BackendMmap(ruta, num_slots=16)
+
+    worker_a.actualizar(10, {"ejercicio_activo_id": 3})
+    assert worker_b.leer(10) == {"ejercicio_activo_id": 3, "version": 1}
+
+    worker_b.actualizar(10, {"terminada": True})
+    assert worker_a.leer(10)["terminada"] is True
+
+    worker_a.cerrar()
+    worker_b.cerrar()
+
+def test_mmap_colisiones_y_reutilizacion_de_slots(tmp_path):
+    """Prueba el sondeo lineal con ids que colisionan y slots borrados."""
+    b = BackendMmap(str(tmp_path / "colision.bin"), num_slots=4)
+    b.actualizar(1, {"ejercicio_activo_id": 1})
+    b.actualizar(5, {"ejercicio_activo_id": 5})  # mismo slot inicial que 1
+    assert b.leer(5)["ejercicio_activo_id"] == 5
+
+    b.eliminar(1)
+    assert b.leer(5)["ejercicio_activo_id"] == 5
+
+    b.actualizar(9, {"ejercicio_activo_id": 9})  # reutiliza el slot borrado
+    assert sorted(b.ids()) == [5, 9]
+    b.cerrar()
+
+def test_mmap_lleno_y_estado_demasiado_grande(tmp_path):
+    """Prueba los errores por tabla llena y por estado que no cabe en el slot."""
+    b = BackendMmap(str(tmp_path / "lleno.bin"), num_slots=2)
+    b.actualizar(1, {"x": 1})
+    b.actualizar(2, {"x": 2})
+    with pytest.raises(RuntimeError):
+        b.actualizar(3, {"x": 3})
+    with pytest.raises(ValueError):
+        b.actualizar(1, {"x": "a" * 300})
+    with pytest.raises(ValueError):
+        b.leer(0)
+    b.cerrar()
+
+def test_mmap_fichero_invalido(tmp_path):
+    """Prueba que no se reutiliza un fichero que no es un almacén de estado."""
+    ruta = tmp_path / "otro.bin"
+    ruta.write_bytes(b"x" * 256)
+    with pytest.raises(ValueError):
+        BackendMmap(str(ruta))
+
+def test_redis_reconecta_tras_caida(servidor_resp):
+    """Prueba que el cliente RESP reconecta si se cerró el socket."""
+    host, port = servidor_resp.server_address
+    cliente = ClienteRESP(host, port)
+    assert cliente.ejecutar("PING") == "PONG"
+    cliente._sock.close()
+    assert cliente.ejecutar("PING") == "PONG"
+    cliente.cerrar()
+
+def test_redis_escribe_en_una_transaccion(servidor_resp, monkeypatch):
+    """Prueba que actualizar, quitar y eliminar envían MULTI/EXEC en un solo viaje."""
+    host, port = servidor_resp.server_address
+    b = BackendRedis(ClienteRESP(host, port))
+    envios = []
+    ejecutar_varios = b.cliente.ejecutar_varios
+    monkeypatch.setattr(b.cliente, "ejecutar_varios",
+                        lambda comandos, **kw: envios.append([c[0] for c in comandos]) or ejecutar_varios(comandos, **kw))
+
+    b.actualizar(1, {"ejercicio_activo_id": 4})
+    assert envios == [["MULTI", "HSET", "HINCRBY", "SADD", "EXEC"]]
+    assert b.leer(1) == {"ejercicio_activo_id": 4, "version": 1}
+    assert b.ids() == [1]
+
+    envios.clear()
+    b.quitar(1, ["ejercicio_activo_id"])
+    assert envios == [["WATCH"], ["HMGET"], ["MULTI", "HDEL", "HINCRBY", "EXEC"]]
+    assert b.leer(1) == {"version": 2}
+
+    # Sin ninguno de los campos no se escribe nada
+    envios.clear()
+    b.quitar(1, ["ejercicio_activo_id"])
+    assert envios == [["WATCH"], ["HMGET"], ["UNWATCH"]]
+    assert b.leer(1) == {"version": 2}
+
+    envios.clear()
+    b.eliminar(1)
+    assert envios == [["MULTI", "DEL", "SREM", "EXEC"]]
+    assert b.leer(1) == {} and b.ids() == []
+    b.cerrar()
+
+# Tests de configuración y vistas
+
+def test_crear_backend_por_url(tmp_path, servidor_resp):
+    """Prueba la selección de backend a partir de ESTADO_SESION_URL."""
+    assert isinstance(crear_backend("memoria://"), BackendMemoria)
+    assert isinstance(crear_backend(None), BackendMemoria)
+
+    b = crear_backend(f"mmap://{tmp_path}/url.bin?slots=8")
+    assert isinstance(b, BackendMmap)
+    assert b.num_slots == 8
+    b.cerrar()
+
+    host, port = servidor_resp.server_address
+    r = crear_backend(f"redis://{host}:{port}/0?prefijo=pruebas")
+    assert isinstance(r, BackendRedis)
+    assert r.prefijo == "pruebas"
+    r.cerrar()
+
+    with pytest.raises(ValueError):
+        crear_backend("desconocido://x")
+
+def test_vistas_de_compatibilidad():
+    """Prueba que las vistas dict/set reflejan el almacén subyacente."""
+    estado = EstadoTiempoReal(reloj=lambda: 50.0)
+    estado.configurar("memoria://")
+
+    estado.ejercicio_activo[1] = 4
+    estado.terminadas.add(2)
+    estado.ultimo_cambio[1] = 100.0
+
+    assert estado.ejercicio_activo.get(1) == 4
+    assert estado.ejercicio_activo.get(2) is None
+    assert dict(estado.ejercicio_activo) == {1: 4}
+    assert 2 in estado.terminadas and 1 not in estado.terminadas
+    assert len(estado.terminadas) == 1
+    assert estado.leer(1) == {
+        "ejercicio_activo_id": 4, "ultimo_cambio": 100.0, "actualizado": 50.0, "version": 2,
+    }
+
+    estado.terminadas.discard(2)
+    assert 2 not in estado.terminadas
+    del estado.ejercicio_activo[1]
+    assert 1 not in estado.ejercicio_activo
+    with pytest.raises(KeyError):
+        del estado.ejercicio_activo[1]
+
+def test_init_app_usa_configuracion(app, tmp_path):
+    """Prueba que init_app registra la extensión y cambia de backend."""
+    estado = EstadoTiempoReal()
+    app.config["ESTADO_SESION_URL"] = f"mmap://{tmp_path}/app.bin"
+    estado.init_app(app)
+    assert app.extensions["estado_tiempo_real"] is estado
+    assert isinstance(estado.backend, BackendMmap)
+
+    backend_anterior = estado.backend
+    estado.init_app(app)
+    assert estado.backend is backend_anterior
+
+    estado.configurar("memoria://")
+    assert isinstance(estado.backend, BackendMemoria)
+
+def test_esperar_cambio_despierta_al_actualizar():
+    """Prueba que esperar_cambio vuelve en cuanto otro hilo cambia el estado."""
+    estado = EstadoTiempoReal()
+    estado.configurar("memoria://")
+    estado.actualizar(1, ejercicio_activo_id=1)
+    conocido = estado.leer(1)
+
+    temporizador = threading.Timer(0.05, lambda: estado.actualizar(1, ejercicio_activo_id=2))
+    temporizador.start()
+    inicio = time.monotonic()
+    nuevo = estado.esperar_cambio(1, conocido, timeout=5, intervalo=5)
+    assert nuevo["ejercicio_activo_id"] == 2
+    assert time.monotonic() - inicio < 2
+
+def test_esperar_cambio_vence_timeout():
+    """Prueba que sin cambios esperar_cambio devuelve el mismo estado al vencer."""
+    estado = EstadoTiempoReal()
+    estado.configurar("memoria://")
+    assert estado.esperar_cambio(1, {}, timeout=0.05, intervalo=0.01) == {}
+
+def test_esperar_cambio_sin_relecturas_con_backend_en_memoria(monkeypatch):
+    """Prueba que con el backend del proceso se espera el aviso sin releer cada intervalo."""
+    estado = EstadoTiempoReal()
+    estado.configurar("memoria://")
+    lecturas = []
+    leer = estado.backend.leer
+    monkeypatch.setattr(estado.backend, "leer", lambda sid: lecturas.append(sid) or leer(sid))
+
+    assert estado.esperar_cambio(1, {}, timeout=0.2, intervalo=0.01) == {}
+    assert len(lecturas) <= 2
+
+# Tests de caducidad y métricas
+
+class _Reloj:
+    """Reloj manipulable para los tests de caducidad."""
+
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+@pytest.fixture
+def estado_con_reloj(backend):
+    """Fachada sobre cada backend con un reloj controlado por el test."""
+    reloj = _Reloj()
+    estado = EstadoTiempoReal(reloj=reloj)
+    estado._backend = backend
+    estado.ttl_terminada = 60
+    estado.ttl_inactiva = 600
+    return estado, reloj
+
+def test_caducan_terminadas_e_inactivas(estado_con_reloj):
+    """Prueba que las terminadas caducan antes que las simplemente inactivas."""
+    estado, reloj = estado_con_reloj
+    estado.actualizar(1, ejercicio_activo_id=3)
+    estado.actualizar(2, terminada=True)
+
+    reloj.ahora += 61
+    assert estado.purgar_caducadas() == 1
+    assert estado.leer(2) == {}
+    assert estado.leer(1)["ejercicio_activo_id"] == 3
+
+    reloj.ahora += 600
+    assert estado.purgar_caducadas() == 1
+    assert estado.ids() == []
+
+def test_escritura_reciente_aplaza_la_caducidad(estado_con_reloj):
+    """Prueba que una sesión que sigue cambiando no se elimina."""
+    estado, reloj = estado_con_reloj
+    estado.actualizar(1, ejercicio_activo_id=1)
+    reloj.ahora += 500
+    estado.actualizar(1, ejercicio_activo_id=2)
+    reloj.ahora += 500
+    assert estado.purgar_caducadas() == 0
+    assert estado.leer(1)["ejercicio_activo_id"] == 2
+    reloj.ahora += 101
+    assert estado.purgar_caducadas() == 1
+
+def test_barrido_elimina_escrituras_de_otros_procesos(estado_con_reloj):
+    """Prueba que el barrido completo limpia lo que el montículo no conoce."""
+    estado, reloj = estado_con_reloj
+    estado.backend.actualizar(7, {"terminada": True, "actualizado": reloj.ahora})
+    estado.actualizar(1, ejercicio_activo_id=1)
+    assert 7 in estado.ids()
+
+    reloj.ahora += 61
+    assert estado.purgar_caducadas() == 0  # solo lo que conoce el montículo
+    assert estado.barrer() == 1
+    assert estado.ids() == [1]
+
+def test_barrido_completo_fuera_de_las_escrituras(estado_con_reloj, monkeypatch):
+    """Prueba que las escrituras no recorren el backend y que lo hace el hilo de barrido."""
+    import time
+
+    estado, reloj = estado_con_reloj
+    estado.backend.actualizar(7, {"terminada": True, "actualizado": reloj.ahora - 61})
+    barrer = estado.barrer
+    monkeypatch.setattr(estado, "barrer", lambda *a: pytest.fail("barrido dentro de la escritura"))
+    estado.actualizar(1, ejercicio_activo_id=1)
+    assert estado._hilo_barrido is None
+
+    monkeypatch.setattr(estado, "barrer", barrer)
+    estado._config = {"ESTADO_BARRIDO_SEGUNDO_PLANO": True}
+    estado.intervalo_barrido = 0.05
+    estado.actualizar(1, ejercicio_activo_id=2)
+    limite = time.monotonic() + 5
+    while 7 in estado.ids() and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert estado.ids() == [1]
+    assert estado._hilo_barrido.is_alive()
+    estado.detener_barrido()
+    assert not estado._hilo_barrido.is_alive()
+
+def test_monticulo_se_compacta():
+    """Prueba que las escrituras repetidas no hacen crecer el montículo sin límite."""
+    reloj = _Reloj()
+    estado = EstadoTiempoReal(reloj=reloj)
+    estado.configurar("memoria://")
+    for i in range(1000):
+        reloj.ahora += 1
+        estado.actualizar(1, ejercicio_activo_id=i)
+    assert len(estado._monticulo) <= 2 * len(estado._caducidades) + 64 + 1
+
+def test_metricas(estado_con_reloj):
+    """Prueba el indicador de entradas y bytes aproximados."""
+    estado, _ = estado_con_reloj
+    vacio = estado.metricas()
+    assert vacio["entradas"] == 0
+
+    estado.actualizar(1, ejercicio_activo_id=1)
+    estado.actualizar(2, ejercicio_activo_id=2)
+    metricas = estado.metricas()
+    assert metricas["entradas"] == 2
+    assert metricas["bytes_aproximados"] > vacio["bytes_aproximados"]
+    assert metricas["caducidades_programadas"] == 2
@@ -0,0 +1,107 @@
+"""
+Tests de la recepción en streaming de ficheros de formularios.
+"""
+
+import hashlib
+import io
+from collections import namedtuple
+
+import pytest
+from flask import request
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from src.servicios.ficheros_subidos import (
+    EspacioInsuficiente,
+    FicheroEntrante,
+    PeticionTerapiTrack,
+    guardar_fichero_subido,
+)
+
+
+def test_fichero_entrante_calcula_tamano_y_sha256(tmp_path):
+    """Prueba la escritura por bloques y el movimiento a su destino."""
+    fichero = FicheroEntrante(str(tmp_path / "subidas"))
+    for bloque in (b"abc", b"def"):
+        fichero.write(bloque)
+    fichero.seek(0)
+    assert fichero.read() == b"abcdef"
+    assert fichero.tamano == 6
+    assert fichero.sha256 == hashlib.sha256(b"abcdef").hexdigest()
+
+    destino = tmp_path / "final.webm"
+    fichero.mover(str(destino))
+    assert destino.read_bytes() == b"abcdef"
+    assert list((tmp_path / "subidas").iterdir()) == []
+    fichero.close()
+    assert destino.exists()
+
+
+def test_fichero_entrante_sin_mover_se_borra(tmp_path):
+    """Prueba que al cerrar sin usarlo no queda nada en disco."""
+    fichero = FicheroEntrante(str(tmp_path))
+    fichero.write(b"x")
+    fichero.close()
+    fichero.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fichero_entrante_tamano_maximo(tmp_path):
+    """Prueba que el límite se aplica según llegan los datos."""
+    fichero = FicheroEntrante(str(tmp_path), tam_maximo=4)
+    fichero.write(b"1234")
+    with pytest.raises(RequestEntityTooLarge):
+        fichero.write(b"5")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fichero_entrante_espacio_minimo(tmp_path, monkeypatch):
+    """Prueba que se deja de recibir si el disco se queda sin espacio."""
+    Uso = namedtuple("Uso", "total used free")
+    libre = [10 ** 9]
+    monkeypatch.setattr(
+        "src.servicios.ficheros_subidos.shutil.disk_usage", lambda ruta: Uso(0, 0, libre[0])
+    )
+    fichero = FicheroEntrante(str(tmp_path), espacio_minimo=1000)
+    fichero.INTERVALO_ESPACIO = 2
+    fichero.write(b"ab")
+    libre[0] = 10
+    with pytest.raises(EspacioInsuficiente):
+        fichero.write(b"cd")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_guardar_fichero_subido_sin_fichero_entrante(tmp_path):
+    """Prueba la copia por bloques para ficheros recibidos de otra forma."""
+    destino = tmp_path / "v.mp4"
+    tamano, resumen = guardar_fichero_subido(FileStorage(io.BytesIO(b"video"), "v.mp4"), str(destino))
+    assert (tamano, resumen) == (5, hashlib.sha256(b"video").hexdigest())
+    assert destino.read_bytes() == b"video"
+
+
+def test_peticion_recibe_ficheros_en_disco(app, tmp_path):
+    """Prueba que los ficheros del formulario llegan como FicheroEntrante."""
+    assert app.request_class is PeticionTerapiTrack
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+
+    with app.test_request_context(
+        "/", method="POST",
+        data={"video": (io.BytesIO(b"contenido"), "v.webm")},
+        content_type="multipart/form-data",
+    ):
+        stream = request.files["video"].stream
+        assert isinstance(stream, FicheroEntrante)
+        assert stream.tamano == 9
+        assert stream.ruta.startswith(str(tmp_path))
+        request.close()
+    assert list(tmp_path.iterdir()) == []
+
+    app.config["SUBIDAS_TAM_MAXIMO_FICHERO"] = 4
+    with app.test_request_context(
+        "/", method="POST",
+        data={"video": (io.BytesIO(b"contenido"), "v.webm")},
+        content_type="multipart/form-data",
+    ):
+        with pytest.raises(RequestEntityTooLarge):
+            request.files
+    assert list(tmp_path.iterdir()) == []
@@ -20,3 +20,4 @@ def test_register_blueprints():
     assert 'admin' in app.blueprints
     assert 'paciente' in app.blueprints
     assert 'profesional' in app.blueprints
+    assert 'videos' in app.blueprints
@@ -0,0 +1,123 @@
+"""
+Tests del lector de metadatos de vídeos MP4 y WebM.
+"""
+
+import io
+import struct
+
+import pytest
+
+from src.servicios.metadatos_video import (
+    VideoNoValido,
+    leer_metadatos,
+    validar_grabacion,
+)
+
+
+def _caja(tipo, *contenido):
+    datos = b"".join(contenido)
+    return struct.pack(">I4s", 8 + len(datos), tipo) + datos
+
+
+def video_mp4(escala=1000, duracion=12345, version=0, ancho=640, alto=480, mdat=b"", mdat_al_principio=False):
+    """MP4 mínimo: ftyp, moov (mvhd, pista de audio y de vídeo H.264) y mdat."""
+    if version == 1:
+        mvhd = _caja(b"mvhd", b"\x01\x00\x00\x00", bytes(16), struct.pack(">IQ", escala, duracion), bytes(80))
+    else:
+        mvhd = _caja(b"mvhd", bytes(4), bytes(8), struct.pack(">II", escala, duracion), bytes(80))
+    audio = _caja(b"trak", _caja(b"mdia", _caja(b"hdlr", bytes(8), b"soun", bytes(13))))
+    entrada = _caja(b"avc1", bytes(6), b"\x00\x01", bytes(16), struct.pack(">HH", ancho, alto), bytes(50))
+    video = _caja(b"trak", _caja(b"tkhd", bytes(84)), _caja(
+        b"mdia",
+        _caja(b"hdlr", bytes(8), b"vide", bytes(13)),
+        _caja(b"minf", _caja(b"stbl", _caja(b"stsd", bytes(4), b"\x00\x00\x00\x01", entrada))),
+    ))
+    moov = _caja(b"moov", mvhd, audio, video)
+    cajas = [_caja(b"ftyp", b"isom", bytes(4)), _caja(b"mdat", mdat), moov]
+    if not mdat_al_principio:
+        cajas[1], cajas[2] = cajas[2], cajas[1]
+    return b"".join(cajas)
+
+
+def _ebml(id_elemento, *contenido, desconocido=False):
+    datos = b"".join(contenido)
+    cabecera = id_elemento.to_bytes((id_elemento.bit_length() + 7) // 8, "big")
+    tam = b"\x01\xff\xff\xff\xff\xff\xff\xff" if desconocido else b"\x01" + len(datos).to_bytes(7, "big")
+    return cabecera + tam + datos
+
+
+def video_webm(duracion=None, doctype=b"webm", con_video=True):
+    """WebM mínimo como los de MediaRecorder: segmento y cluster de tamaño desconocido."""
+    info = [_ebml(0x2AD7B1, (1000000).to_bytes(3, "big"))]
+    if duracion is not None:
+        info.append(_ebml(0x4489, struct.pack(">d", duracion)))
+    pistas = [_ebml(0xAE, _ebml(0x83, b"\x02"), _ebml(0x86, b"A_OPUS"))]
+    if con_video:
+        pistas.append(_ebml(0xAE, _ebml(0x83, b"\x01"), _ebml(0x86, b"V_VP8"),
+                            _ebml(0xE0, _ebml(0xB0, b"\x05\x00"), _ebml(0xBA, b"\x02\xd0"))))
+    return (
+        _ebml(0x1A45DFA3, _ebml(0x4286, b"\x01"), _ebml(0x4282, doctype))
+        + _ebml(0x18538067,
+                _ebml(0x1549A966, *info),
+                _ebml(0x1654AE6B, *pistas),
+                _ebml(0x1F43B675, _ebml(0xE7, b"\x00"), bytes(1000), desconocido=True),
+                desconocido=True)
+    )
+
+
+def test_mp4_con_moov_al_final(tmp_path):
+    """Prueba duración, resolución y códec saltando un mdat grande."""
+    ruta = tmp_path / "v.mp4"
+    ruta.write_bytes(video_mp4(mdat=bytes(1024 * 1024), mdat_al_principio=True))
+
+    metadatos = leer_metadatos(str(ruta))
+    assert metadatos.to_dict() == {
+        "formato": "mp4", "duracion_ms": 12345, "ancho": 640, "alto": 480, "codec": "avc1"
+    }
+
+
+def test_mp4_version_1_y_duracion_desconocida():
+    """Prueba mvhd de 64 bits y la duración sin definir."""
+    metadatos = leer_metadatos(io.BytesIO(video_mp4(escala=90000, duracion=90000 * 3600, version=1)))
+    assert metadatos.duracion_ms == 3600 * 1000
+    assert leer_metadatos(io.BytesIO(video_mp4(duracion=0xFFFFFFFF))).duracion_ms is None
+
+
+def test_webm_con_duracion():
+    """Prueba Segment/Info/Duration y la pista de vídeo tras una de audio."""
+    metadatos = leer_metadatos(io.BytesIO(video_webm(duracion=8500.0)))
+    assert metadatos.to_dict() == {
+        "formato": "webm", "duracion_ms": 8500, "ancho": 1280, "alto": 720, "codec": "V_VP8"
+    }
+    assert leer_metadatos(io.BytesIO(video_webm(doctype=b"matroska"))).formato == "matroska"
+
+
+def test_webm_de_mediarecorder_sin_duracion(tmp_path):
+    """Prueba una grabación en directo: segmento y clusters de tamaño desconocido."""
+    ruta = tmp_path / "r.webm"
+    ruta.write_bytes(video_webm())
+    metadatos = validar_grabacion(str(ruta))
+    assert metadatos.duracion_ms is None
+    assert metadatos.codec == "V_VP8"
+
+
+@pytest.mark.parametrize("contenido", [
+    b"",
+    b"fake webm",
+    video_mp4()[:40],
+    _caja(b"ftyp", b"isom") + _caja(b"mdat", b"x"),
+    video_webm(doctype=b"otro"),
+    video_webm()[:20],
+])
+def test_ficheros_no_validos(contenido):
+    """Prueba que lo que no es un MP4/WebM legible se rechaza."""
+    with pytest.raises(VideoNoValido):
+        leer_metadatos(io.BytesIO(contenido))
+
+
+def test_validar_grabacion_exige_pista_de_video(tmp_path):
+    """Prueba que una grabación solo de audio no se acepta."""
+    ruta = tmp_path / "audio.webm"
+    ruta.write_bytes(video_webm(con_video=False))
+    with pytest.raises(VideoNoValido):
+        validar_grabacion(str(ruta))
@@ -0,0 +1,163 @@
+"""
+Tests de las portadas y rejillas de miniaturas de los vídeos.
+"""
+
+import subprocess
+from datetime import date
+
+import pytest
+
+from src.controladores.videos_controlador import miniaturas_ejercicio, miniaturas_respuesta
+from src.extensiones import db
+from src.modelos.ejercicio import Ejercicio
+from src.modelos.videoRespuesta import VideoRespuesta
+from src.servicios import transcodificacion
+from src.servicios.miniaturas import (
+    clave_poster,
+    clave_sprite,
+    comando_sprite,
+    datos_rejilla,
+    intervalo_rejilla,
+)
+from src.servicios.transcodificacion import cola_transcodificacion
+from tests.test_metadatos_video import video_mp4, video_webm
+from tests.test_profesional_controlador import login_profesional, profesional_user  # noqa: F401
+
+
+@pytest.fixture
+def ffmpeg_falso(app, tmp_path, monkeypatch):
+    """Activa las miniaturas con un ffmpeg que escribe el filtro usado en el destino."""
+    app.config["MINIATURAS_ACTIVAS"] = True
+    app.config["TRANSCODIFICACION_FFMPEG"] = "ffmpeg-falso"
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path / "subidas")
+    llamadas = []
+
+    def run(comando, **kwargs):
+        llamadas.append(comando)
+        with open(comando[-1], "wb") as f:
+            f.write(comando[comando.index("-vf") + 1].encode())
+        return subprocess.CompletedProcess(comando, 0, b"", b"")
+
+    monkeypatch.setattr(transcodificacion.subprocess, "run", run)
+    monkeypatch.setattr("src.servicios.miniaturas.subprocess.run", run)
+    return llamadas
+
+
+def _ejercicio_en_almacen(tmp_path, contenido):
+    ejercicio = Ejercicio(Nombre="Puente", Descripcion="D", Tipo="T", Video="ejercicio_1.mp4", Duracion=60)
+    db.session.add(ejercicio)
+    db.session.commit()
+    almacen = tmp_path / "uploads" / "ejercicios"
+    almacen.mkdir(parents=True)
+    (almacen / "ejercicio_1.mp4").write_bytes(contenido)
+    return ejercicio, almacen
+
+
+def test_claves_rejilla_y_comando():
+    """Prueba los nombres de las imágenes, el campo Miniaturas y el filtro de la rejilla."""
+    assert clave_poster("ejercicio_1.5.mp4") == "ejercicio_1.5_poster.jpg"
+    assert clave_sprite("respuesta_3.webm") == "respuesta_3_sprite.jpg"
+
+    assert datos_rejilla("5x4@1.5") == {"columnas": 5, "filas": 4, "intervalo": 1.5}
+    assert datos_rejilla(None) is None
+    assert datos_rejilla("5x4") is None
+
+    comando = comando_sprite("ffmpeg", "in.mp4", "out.jpg", 2.5, 160, 5, 4)
+    assert "fps=1/2.5,scale=160:-2,tile=5x4" in comando
+
+
+def test_intervalo_segun_la_duracion(tmp_path):
+    """Prueba que las miniaturas se reparten por el vídeo o usan el intervalo por defecto."""
+    ruta = tmp_path / "v.mp4"
+    ruta.write_bytes(video_mp4(duracion=60000))
+    assert intervalo_rejilla(str(ruta), 20, 3.0) == 3.0
+    ruta.write_bytes(video_mp4(duracion=100000))
+    assert intervalo_rejilla(str(ruta), 20, 3.0) == 5.0
+    ruta.write_bytes(video_mp4(duracion=4000))
+    assert intervalo_rejilla(str(ruta), 20, 3.0) == 1.0
+
+    ruta.write_bytes(video_webm())
+    assert intervalo_rejilla(str(ruta), 20, 3.0) == 3.0
+
+
+def test_miniaturas_de_un_ejercicio(app, ffmpeg_falso, tmp_path):
+    """Prueba que la portada y la rejilla se guardan junto al vídeo y se anotan."""
+    ejercicio, almacen = _ejercicio_en_almacen(tmp_path, video_mp4(duracion=40000))
+
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+
+    assert (almacen / "ejercicio_1_poster.jpg").read_bytes() == b"thumbnail,scale=640:-2"
+    assert (almacen / "ejercicio_1_sprite.jpg").read_bytes() == b"fps=1/2,scale=160:-2,tile=5x4"
+    db.session.expire_all()
+    ejercicio = db.session.get(Ejercicio, ejercicio.Id)
+    assert ejercicio.Miniaturas == "5x4@2"
+    assert ejercicio.Versiones is None
+    assert list((tmp_path / "subidas").iterdir()) == []
+
+    with app.test_request_context():
+        assert miniaturas_ejercicio(ejercicio) == {
+            "columnas": 5, "filas": 4, "intervalo": 2.0,
+            "poster": "/videos/ejercicio_1_poster.jpg",
+            "sprite": "/videos/ejercicio_1_sprite.jpg",
+        }
+
+
+def test_miniaturas_con_fallo_de_ffmpeg(app, ffmpeg_falso, tmp_path, monkeypatch):
+    """Prueba que si falla una imagen no se anota ni se guarda ninguna."""
+    ejercicio, almacen = _ejercicio_en_almacen(tmp_path, b"mp4")
+
+    def run(comando, **kwargs):
+        if "tile" in comando[comando.index("-vf") + 1]:
+            return subprocess.CompletedProcess(comando, 1, b"", b"Invalid data")
+        with open(comando[-1], "wb") as f:
+            f.write(b"jpg")
+        return subprocess.CompletedProcess(comando, 0, b"", b"")
+    monkeypatch.setattr("src.servicios.miniaturas.subprocess.run", run)
+
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+
+    db.session.expire_all()
+    assert db.session.get(Ejercicio, ejercicio.Id).Miniaturas is None
+    assert sorted(p.name for p in almacen.iterdir()) == ["ejercicio_1.mp4"]
+    assert list((tmp_path / "subidas").iterdir()) == []
+
+
+def test_miniaturas_de_una_respuesta(app, ffmpeg_falso, tmp_path):
+    """Prueba las imágenes de una grabación sin duración en la cabecera."""
+    app.config["ALMACEN_RESPUESTAS_URL"] = "local://respuestas"
+    db.session.add(VideoRespuesta(Ejercicio_Sesion_Id=3, Ruta_Almacenamiento="/static/r.webm",
+                                  Fecha_Expiracion=date.today()))
+    db.session.commit()
+    almacen = tmp_path / "uploads" / "respuestas"
+    almacen.mkdir(parents=True)
+    (almacen / "respuesta_3.webm").write_bytes(video_webm())
+
+    cola_transcodificacion().encolar("respuestas", 3, "respuesta_3.webm")
+
+    assert sorted(p.name for p in almacen.iterdir()) == [
+        "respuesta_3.webm", "respuesta_3_poster.jpg", "respuesta_3_sprite.jpg"
+    ]
+    db.session.expire_all()
+    video = db.session.get(VideoRespuesta, 3)
+    assert video.Miniaturas == "5x4@3"
+    with app.test_request_context():
+        assert miniaturas_respuesta(video)["intervalo"] == 3.0
+
+
+def test_biblioteca_usa_portadas_sin_precargar(app, client, login_profesional, tmp_path):
+    """Prueba que la biblioteca muestra la portada y no precarga los vídeos."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    _, almacen = _ejercicio_en_almacen(tmp_path, b"mp4")
+    (almacen / "ejercicio_1_poster.jpg").write_bytes(b"jpg")
+    (almacen / "ejercicio_1_sprite.jpg").write_bytes(b"jpg")
+    db.session.get(Ejercicio, 1).Miniaturas = "5x4@3"
+    db.session.add(Ejercicio(Nombre="Hombro", Descripcion="D", Tipo="T", Video="hombros.mp4", Duracion=60))
+    db.session.commit()
+
+    html = client.get("/profesional/ejercicios").get_data(as_text=True)
+    assert html.count('preload="none"') == 2
+    assert html.count('poster="/videos/ejercicio_1_poster.jpg"') == 1
+    assert '<img src="/videos/ejercicio_1_poster.jpg"' in html
+    assert 'data-sprite="/videos/ejercicio_1_sprite.jpg" data-sprite-columnas="5" data-sprite-filas="4"' in html
+    assert "js/vista_previa_video.js" in html
@@ -289,11 +289,12 @@ def test_get_video_path_usa_uploads_si_existe(app, tmp_path):
     uploads_dir.mkdir(parents=True)
     (uploads_dir / video_name).write_bytes(b"")
 
-    with app.app_context():
+    with app.test_request_context():
         app.static_folder = str(static_dir)
+        app.config["UPLOAD_FOLDER"] = str(static_dir / "uploads")
         path = get_video_path(video_name)
 
-    assert path == f"/static/uploads/ejercicios/{video_name}"
+    assert path == f"/videos/{video_name}"
 
 def test_get_video_path_usa_videos_si_no_hay_uploads(app, tmp_path):
     """Prueba que get_video_path() detecta videos en videos/ como fallback."""
@@ -305,8 +306,8 @@ def test_get_video_path_usa_videos_si_no_hay_uploads(app, tmp_path):
     videos_dir.mkdir(parents=True)
     (videos_dir / video_name).write_bytes(b"")
 
-    with app.app_context():
+    with app.test_request_context():
         app.static_folder = str(static_dir)
         path = get_video_path(video_name)
 
-    assert path == f"/static/videos/{video_name}"
\ No newline at end of file
+    assert path == f"/videos/{video_name}"
\ No newline at end of file
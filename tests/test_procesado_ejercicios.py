@@ -0,0 +1,101 @@
+"""
+Tests del procesado en segundo plano de los vídeos de ejercicios.
+"""
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.ejercicio import Ejercicio
+from src.servicios import procesado_ejercicios
+from src.servicios.procesado_ejercicios import calcular_duracion, cola_procesado
+from tests.test_metadatos_video import video_mp4
+
+
+class ClipFalso:
+    def __init__(self, ruta):
+        self.duration = 42.7
+        self.cerrado = False
+
+    def close(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def pendiente(app, tmp_path):
+    """Ejercicio recién creado y su vídeo temporal."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    ruta = tmp_path / "ejercicio_1.mp4"
+    ruta.write_bytes(b"mp4")
+    ejercicio = Ejercicio(Nombre="E", Descripcion="D", Tipo="T", Video="ejercicio_1.mp4",
+                          Duracion=0, Procesando=True)
+    db.session.add(ejercicio)
+    db.session.commit()
+    return ejercicio, ruta
+
+
+def test_calcular_duracion(monkeypatch):
+    """Prueba la duración con MoviePy y el valor 0 si no está o falla."""
+    monkeypatch.setattr(procesado_ejercicios, "VideoFileClip", ClipFalso)
+    assert calcular_duracion("v.mp4") == 42
+
+    def falla(ruta):
+        raise OSError("ffmpeg")
+    monkeypatch.setattr(procesado_ejercicios, "VideoFileClip", falla)
+    assert calcular_duracion("v.mp4") == 0
+
+    monkeypatch.setattr(procesado_ejercicios, "VideoFileClip", None)
+    assert calcular_duracion("v.mp4") == 0
+
+
+def test_calcular_duracion_desde_la_cabecera(tmp_path, monkeypatch):
+    """Prueba que con la duración en la cabecera no se usa MoviePy."""
+    def no_usar(ruta):
+        raise AssertionError("MoviePy no debería abrirse")
+    monkeypatch.setattr(procesado_ejercicios, "VideoFileClip", no_usar)
+    ruta = tmp_path / "v.mp4"
+    ruta.write_bytes(video_mp4(escala=600, duracion=600 * 75 + 599))
+    assert calcular_duracion(str(ruta)) == 75
+
+
+def test_procesado_en_segundo_plano(app, pendiente, tmp_path, monkeypatch):
+    """Prueba que el hilo completa el ejercicio y mueve el vídeo al almacén."""
+    monkeypatch.setattr(procesado_ejercicios, "VideoFileClip", ClipFalso)
+    app.config["PROCESADO_SEGUNDO_PLANO"] = True
+    ejercicio, ruta = pendiente
+
+    cola = cola_procesado()
+    cola.encolar(ejercicio.Id, str(ruta), ejercicio.Video)
+    cola._ejecutor.shutdown(wait=True)
+
+    db.session.expire_all()
+    ejercicio = db.session.get(Ejercicio, ejercicio.Id)
+    assert ejercicio.Procesando is False
+    assert ejercicio.Duracion == 42
+    assert not ruta.exists()
+    assert (tmp_path / "uploads" / "ejercicios" / "ejercicio_1.mp4").read_bytes() == b"mp4"
+
+
+def test_procesado_con_error_no_deja_el_ejercicio_pendiente(app, pendiente, monkeypatch):
+    """Prueba que un fallo del almacén libera el ejercicio y borra el temporal."""
+    ejercicio, ruta = pendiente
+
+    def guardar_falla(self, clave, origen):
+        raise OSError("disco lleno")
+    monkeypatch.setattr("src.servicios.almacenamiento.AlmacenLocal.guardar", guardar_falla)
+
+    cola_procesado().encolar(ejercicio.Id, str(ruta), ejercicio.Video)
+
+    db.session.expire_all()
+    assert db.session.get(Ejercicio, ejercicio.Id).Procesando is False
+    assert not ruta.exists()
+
+
+def test_procesado_de_ejercicio_borrado(app, pendiente):
+    """Prueba que no falla si el ejercicio se borró mientras se procesaba."""
+    ejercicio, ruta = pendiente
+    ejercicio_id = ejercicio.Id
+    db.session.delete(ejercicio)
+    db.session.commit()
+
+    cola_procesado().encolar(ejercicio_id, str(ruta), "ejercicio_1.mp4")
+    assert not ruta.exists()
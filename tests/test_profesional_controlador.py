@@ -4,8 +4,13 @@ Prueba dashboard, gestión de pacientes, ejercicios, sesiones,
 evaluaciones, API de estado en tiempo real y gestión de videos.
 """
 
+import base64
+import hashlib
 import io
 import json
+import os
+import socket
+import threading
 from datetime import datetime, timedelta
 
 import pytest
@@ -22,8 +27,17 @@ from src.modelos.ejercicio_sesion import Ejercicio_Sesion
 from src.modelos.evaluacion import Evaluacion
 from src.modelos.videoRespuesta import VideoRespuesta
 from src.modelos.asociaciones import Paciente_Profesional, Ejercicio_Profesional
+from src.modelos.subida_respuesta import SubidaRespuesta
 from src.controladores import profesional_controlador
 from src.config import Config
+from src.servicios.contenido_videos import clave_contenido
+from src.servicios.websocket import OP_CIERRE, OP_TEXTO
+from tests.test_metadatos_video import video_webm
+from tests.test_websocket import leer_trama_servidor, trama_cliente
+from werkzeug.serving import make_server
+
+# Grabación como la de MediaRecorder (cabecera WebM válida)
+WEBM = video_webm()
 
 # Fixtures
 
@@ -249,7 +263,7 @@ def test_crear_ejercicio_ok(client, profesional_user, login_profesional, monkeyp
     assert assoc is not None
 
 def test_crear_ejercicio_calcula_duracion(client, login_profesional, monkeypatch):
-    """Prueba cálculo automático de duración con MoviePy."""
+    """Prueba cálculo automático de duración con MoviePy (procesado en línea en tests)."""
     class DummyClip:
         def __init__(self, path):
             self.duration = 12  
@@ -258,7 +272,7 @@ def test_crear_ejercicio_calcula_duracion(client, login_profesional, monkeypatch
             pass
 
     monkeypatch.setattr(
-        profesional_controlador, "VideoFileClip", DummyClip, raising=True
+        "src.servicios.procesado_ejercicios.VideoFileClip", DummyClip, raising=True
     )
 
     video_bytes = io.BytesIO(b"fake-video-content")
@@ -282,6 +296,42 @@ def test_crear_ejercicio_calcula_duracion(client, login_profesional, monkeypatch
     ejercicio = Ejercicio.query.order_by(Ejercicio.Id.desc()).first()
     assert ejercicio is not None
     assert ejercicio.Duracion == 12
+    assert ejercicio.Procesando is False
+
+
+def test_crear_ejercicio_procesa_video_en_segundo_plano(client, login_profesional, monkeypatch, app, tmp_path):
+    """Prueba que la petición no espera a MoviePy y el ejercicio queda como Procesando."""
+    app.config["PROCESADO_SEGUNDO_PLANO"] = True
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    encolados = []
+    monkeypatch.setattr(
+        "src.servicios.procesado_ejercicios.ColaProcesado.encolar",
+        lambda self, ejercicio_id, ruta, clave: encolados.append((ejercicio_id, ruta, clave))
+    )
+
+    resp = client.post(
+        "/profesional/ejercicios/crear",
+        data={
+            "nombre": "Pendiente",
+            "descripcion": "Desc",
+            "tipo": "MOVILIDAD",
+            "video": (io.BytesIO(b"fake-video-content"), "test.mp4"),
+        },
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 302
+
+    ejercicio = Ejercicio.query.filter_by(Nombre="Pendiente").one()
+    assert ejercicio.Procesando is True
+    assert ejercicio.Duracion == 0
+    [(ejercicio_id, ruta, clave)] = encolados
+    assert (ejercicio_id, clave) == (ejercicio.Id, ejercicio.Video)
+    assert clave == clave_contenido(hashlib.sha256(b"fake-video-content").hexdigest())
+    assert os.path.dirname(ruta) == str(tmp_path)
+    assert open(ruta, "rb").read() == b"fake-video-content"
+
+    resp = client.get("/profesional/ejercicios")
+    assert "Procesando vídeo".encode() in resp.data
 
 def _crear_ejercicios_para_profesional(profesional_id):
     """Helper: crea ejercicios de prueba asociados a un profesional."""
@@ -996,6 +1046,643 @@ def test_estado_sesion_marcar_terminada_desde_api(client, profesional_user, paci
     assert data["terminada"] is True
     assert ses.Id in profesional_controlador.estado_sesion_terminada
 
+def test_estado_sesion_compartido_entre_workers(client, profesional_user, paciente_user, login_profesional, tmp_path):
+    """Prueba que el estado escrito por un worker lo lee otro con backend mmap."""
+    from src.servicios.estado_tiempo_real import BackendMmap, estado_tiempo_real
+
+    ses = Sesion(
+        Paciente_Id=paciente_user.Id,
+        Profesional_Id=profesional_user.Id,
+        Fecha_Asignacion=datetime.now(),
+        Fecha_Programada=datetime.now(),
+        Estado="PENDIENTE",
+    )
+    db.session.add(ses)
+    db.session.commit()
+
+    ruta = str(tmp_path / "estado.bin")
+    estado_tiempo_real.configurar(f"mmap://{ruta}")
+    try:
+        resp = client.post(
+            f"/profesional/api/sesion/{ses.Id}/estado",
+            data=json.dumps({"ejercicio_activo_id": 42}),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+        otro_worker = BackendMmap(ruta)
+        assert otro_worker.leer(ses.Id)["ejercicio_activo_id"] == 42
+        otro_worker.actualizar(ses.Id, {"terminada": True})
+        otro_worker.cerrar()
+
+        resp = client.get(f"/profesional/api/sesion/{ses.Id}/estado")
+        data = json.loads(resp.data)
+        assert data["ejercicio_activo_id"] == 42
+        assert data["terminada"] is True
+    finally:
+        estado_tiempo_real.configurar("memoria://")
+
+def test_estado_sesion_antirebote_atomico_entre_hilos(app, profesional_user, paciente_user):
+    """Prueba que cambios simultáneos no superan a la vez el anti-rebote."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    profesional_controlador.estado_tiempo_real.actualizar(
+        sesion_id, ejercicio_activo_id=1, ultimo_cambio=time.time() - 60
+    )
+
+    barrera = threading.Barrier(8)
+    resultados = []
+
+    def cambiar(ejercicio_id):
+        with app.app_context():
+            barrera.wait()
+            resultados.append(profesional_controlador._aplicar_cambio_estado(
+                sesion_id, {"ejercicio_activo_id": ejercicio_id}
+            ))
+
+    hilos = [threading.Thread(target=cambiar, args=(i,)) for i in range(10, 18)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    aceptados = [r for r in resultados if r["ok"]]
+    assert len(aceptados) == 1
+    estado = profesional_controlador.estado_tiempo_real.leer(sesion_id)
+    assert estado["ejercicio_activo_id"] == aceptados[0]["ejercicio_activo_id"]
+    assert estado["version"] == 2
+    assert app.extensions["diario_sesiones"].pendientes() == 1
+
+# Tests de versiones, 304 y long-polling de estado_sesion
+
+def _crear_sesion_pendiente(paciente_id, profesional_id):
+    """Helper: crea una sesión pendiente con estado en tiempo real limpio."""
+    ses = Sesion(
+        Paciente_Id=paciente_id,
+        Profesional_Id=profesional_id,
+        Fecha_Asignacion=datetime.now(),
+        Fecha_Programada=datetime.now(),
+        Estado="PENDIENTE",
+    )
+    db.session.add(ses)
+    db.session.commit()
+    profesional_controlador.estado_tiempo_real.eliminar(ses.Id)
+    return ses
+
+def test_estado_sesion_version_y_etag(client, profesional_user, paciente_user, login_profesional):
+    """Prueba que cada cambio incrementa la versión y se expone como ETag."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado")
+    assert json.loads(resp.data)["version"] == 0
+    assert resp.headers["ETag"] == '"0"'
+    assert resp.headers["Cache-Control"] == "no-cache"
+
+    client.post(
+        f"/profesional/api/sesion/{sesion_id}/estado",
+        data=json.dumps({"ejercicio_activo_id": 10}),
+        content_type="application/json",
+    )
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado")
+    data = json.loads(resp.data)
+    assert data["version"] == 1
+    assert resp.headers["ETag"] == '"1"'
+
+def test_estado_sesion_if_none_match_devuelve_304(client, profesional_user, paciente_user, login_profesional):
+    """Prueba la petición condicional: 304 sin cuerpo si la versión no cambió."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    profesional_controlador.estado_tiempo_real.actualizar(sesion_id, ejercicio_activo_id=4)
+
+    resp = client.get(
+        f"/profesional/api/sesion/{sesion_id}/estado",
+        headers={"If-None-Match": '"1"'},
+    )
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    resp = client.get(
+        f"/profesional/api/sesion/{sesion_id}/estado",
+        headers={"If-None-Match": '"0"'},
+    )
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["ejercicio_activo_id"] == 4
+
+def test_estado_sesion_long_poll_since(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que ?since espera al cambio de versión y devuelve 304 al vencer."""
+    import threading
+
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    estado = profesional_controlador.estado_tiempo_real
+    estado.actualizar(sesion_id, ejercicio_activo_id=1)
+
+    # Versión desactualizada: responde al instante con el estado nuevo
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado?since=0")
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["version"] == 1
+
+    # Sin cambios: espera acotada y 304
+    inicio = time.monotonic()
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado?since=1&espera=0.1")
+    assert resp.status_code == 304
+    assert time.monotonic() - inicio >= 0.1
+
+    # Un cambio durante la espera despierta la petición
+    threading.Timer(0.05, lambda: estado.actualizar(sesion_id, ejercicio_activo_id=2)).start()
+    inicio = time.monotonic()
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado?since=1&espera=5")
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["ejercicio_activo_id"] == 2
+    assert time.monotonic() - inicio < 4
+
+    # La espera pedida por el cliente no supera el máximo configurado
+    app.config["ESTADO_LONG_POLL_MAXIMO"] = 0.05
+    inicio = time.monotonic()
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado?since=2&espera=60")
+    assert resp.status_code == 304
+    assert time.monotonic() - inicio < 4
+
+def test_estado_sesion_long_poll_sin_cupo_no_espera(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que con el cupo de conexiones largas lleno el long-poll responde sin esperar."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    profesional_controlador.estado_tiempo_real.eliminar(ses.Id)
+    app.extensions["conexiones_largas"].maximo = 0
+
+    inicio = time.monotonic()
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/estado?since=0&espera=5")
+    assert resp.status_code == 304
+    assert time.monotonic() - inicio < 2
+
+def test_estado_sesion_retry_after_ms(client, profesional_user, paciente_user, login_profesional, monkeypatch):
+    """Prueba el intervalo de sondeo sugerido según la actividad de la sesión."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    url = f"/profesional/api/sesion/{ses.Id}/estado"
+    estado = profesional_controlador.estado_tiempo_real
+
+    def reintento(params=""):
+        resp = client.get(url + params)
+        assert resp.headers["X-Retry-After-Ms"]
+        return int(resp.headers["X-Retry-After-Ms"]), resp
+
+    # Sin empezar: retroceso exponencial a partir del intervalo anterior
+    ms, resp = reintento()
+    assert ms == 2000 and resp.get_json()["retry_after_ms"] == 2000
+    assert reintento("?reintento=2000")[0] == 4000
+    assert reintento("?reintento=8000")[0] == 15000
+    assert reintento("?reintento=15000")[0] == 15000
+
+    # Cambiando de ejercicio: mínimo, también en los 304
+    estado.actualizar(ses.Id, ejercicio_activo_id=1, ultimo_cambio=time.time())
+    ms, resp = reintento("?since=1&espera=0&reintento=15000")
+    assert resp.status_code == 304 and ms == 500
+
+    # Inactiva tras la ventana: vuelve a la base y retrocede
+    estado.actualizar(ses.Id, ultimo_cambio=time.time() - 120)
+    assert reintento("?reintento=500")[0] == 2000
+    assert reintento("?reintento=2000")[0] == 4000
+
+    # Terminada: máximo
+    estado.actualizar(ses.Id, terminada=True)
+    assert reintento()[0] == 15000
+
+def test_estado_sesiones_lote_retry_after_ms(client, profesional_user, paciente_user, login_profesional):
+    """Prueba que el lote sugiere el menor intervalo de sus sesiones."""
+    activa = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id).Id
+    terminada = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id).Id
+    estado = profesional_controlador.estado_tiempo_real
+    estado.actualizar(terminada, terminada=True)
+
+    resp = client.get(f"/profesional/api/sesiones/estado?ids={terminada}")
+    assert resp.get_json()["retry_after_ms"] == 15000
+
+    estado.actualizar(activa, ejercicio_activo_id=3, ultimo_cambio=time.time())
+    resp = client.get(f"/profesional/api/sesiones/estado?ids={activa},{terminada}&reintento=8000")
+    assert resp.get_json()["retry_after_ms"] == 500
+
+# Tests de la ruta caliente sin base de datos de estado_sesion
+
+@pytest.fixture
+def contador_sql(app):
+    """Cuenta las sentencias SQL ejecutadas mientras está activo."""
+    from sqlalchemy import event
+
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, *args):
+        sentencias.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _registrar)
+    yield sentencias
+    event.remove(db.engine, "before_cursor_execute", _registrar)
+
+def test_estado_sesion_get_sin_consultas_tras_abrir_sesion(client, app, profesional_user, paciente_user, contador_sql):
+    """Prueba que, abierta la sesión, el GET de estado no toca la base de datos."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id, paciente_id = ses.Id, paciente_user.Id
+    app.extensions["sesiones_activas"].registrar(ses)
+    app.extensions["usuarios_activos"].registrar(paciente_id, True)
+
+    # Usuario autenticado solo mediante la cookie de sesión firmada
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(paciente_id)
+        sess["_fresh"] = True
+
+    contador_sql.clear()
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado")
+    assert resp.status_code == 200
+    assert contador_sql == []
+
+def test_estado_sesion_get_rellena_cache_al_fallar(client, app, profesional_user, paciente_user, login_profesional, contador_sql):
+    """Prueba que un fallo de caché consulta la BD una vez y la rellena."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    cache = app.extensions["sesiones_activas"]
+    assert sesion_id not in cache
+
+    contador_sql.clear()
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 200
+    assert len(contador_sql) >= 1
+    assert cache.participantes(sesion_id) == (paciente_user.Id, profesional_user.Id)
+
+    contador_sql.clear()
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 200
+    assert contador_sql == []
+
+def test_estado_sesion_completada_sin_estado_en_tiempo_real(client, profesional_user, paciente_user, login_profesional):
+    """Prueba que, caducado su estado en tiempo real, una sesión completada se informa como terminada."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    ses.Estado = "COMPLETADA"
+    db.session.commit()
+
+    # Ni 304 ni long-poll aunque la versión (0) coincida
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/estado?since=0", headers={"If-None-Match": '"0"'})
+    assert resp.status_code == 200
+    assert resp.get_json()["terminada"] is True
+
+    cuerpo = client.get(f"/profesional/api/sesion/{sesion_id}/eventos").get_data(as_text=True)
+    assert json.loads(cuerpo.split("data: ")[1].split("\n")[0])["terminada"] is True
+
+def test_estado_sesion_get_rechaza_cuenta_desactivada_o_borrada(client, app, profesional_user, paciente_user, contador_sql):
+    """Prueba que la cookie de una cuenta desactivada o borrada no autoriza el GET de estado."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id, paciente_id = ses.Id, paciente_user.Id
+    app.extensions["sesiones_activas"].registrar(ses)
+    usuarios = app.extensions["usuarios_activos"]
+
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(paciente_id)
+        sess["_fresh"] = True
+
+    # Primera lectura: comprueba la cuenta una vez y la recuerda
+    contador_sql.clear()
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 200
+    assert len(contador_sql) == 1
+    assert usuarios.activo(paciente_id) is True
+
+    paciente_user.Estado = 0
+    db.session.commit()
+    usuarios.invalidar(paciente_id)
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 401
+    assert usuarios.activo(paciente_id) is False
+
+    # Cookie de un usuario que no existe
+    with client.session_transaction() as sess:
+        sess["_user_id"] = "999999"
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 401
+
+def test_estado_sesion_get_cache_desactivada(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que con ESTADO_CACHE_AUTORIZACION=False no se rellena la caché."""
+    app.config["ESTADO_CACHE_AUTORIZACION"] = False
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 200
+    assert sesion_id not in app.extensions["sesiones_activas"]
+
+def test_estado_sesion_get_sin_permiso_y_sin_login(client, app, profesional_user, paciente_user, user_factory):
+    """Prueba 401 sin usuario, 403 para ajenos a la sesión y 404 si no existe."""
+    otro = user_factory(Rol_Id=2, Email="otropro_cache@example.com")
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id, otro_id = ses.Id, otro.Id
+
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 401
+
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(otro_id)
+    assert client.get(f"/profesional/api/sesion/{sesion_id}/estado").status_code == 403
+    assert client.get("/profesional/api/sesion/99999/estado").status_code == 404
+
+def test_ejecutar_y_finalizar_sesion_gestionan_cache(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que ejecutar_sesion registra la sesión y finalizar_sesion la retira."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    ej = Ejercicio(Nombre="E", Descripcion="D", Tipo="T", Video="v.mp4", Duracion=5)
+    db.session.add(ej)
+    db.session.commit()
+    db.session.add(Ejercicio_Sesion(Sesion_Id=ses.Id, Ejercicio_Id=ej.Id))
+    db.session.commit()
+    sesion_id = ses.Id
+    cache = app.extensions["sesiones_activas"]
+
+    assert client.get(f"/profesional/sesion/ejecutar/{sesion_id}").status_code == 200
+    assert sesion_id in cache
+
+    client.post(f"/profesional/sesion/finalizar/{sesion_id}")
+    assert sesion_id not in cache
+
+# Tests de canal SSE eventos_sesion
+
+def test_eventos_sesion_emite_estado_y_cierra_al_terminar(client, profesional_user, paciente_user, login_profesional):
+    """Prueba que el stream SSE envía el estado y se cierra si la sesión terminó."""
+    ses = Sesion(
+        Paciente_Id=paciente_user.Id,
+        Profesional_Id=profesional_user.Id,
+        Fecha_Asignacion=datetime.now(),
+        Fecha_Programada=datetime.now(),
+        Estado="PENDIENTE",
+    )
+    db.session.add(ses)
+    db.session.commit()
+
+    profesional_controlador.estado_sesiones_tiempo_real[ses.Id] = 7
+    profesional_controlador.estado_sesion_terminada.add(ses.Id)
+
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/eventos")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    cuerpo = resp.get_data(as_text=True)
+    assert "event: estado" in cuerpo
+    evento = cuerpo.split("data: ")[1].split("\n")[0]
+    datos = json.loads(evento)
+    assert datos["ejercicio_activo_id"] == 7
+    assert datos["terminada"] is True
+    assert f"id: {datos['version']}" in cuerpo
+
+def test_eventos_sesion_empuja_cambios(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que un cambio de ejercicio se empuja por el stream sin polling."""
+    ses = Sesion(
+        Paciente_Id=paciente_user.Id,
+        Profesional_Id=profesional_user.Id,
+        Fecha_Asignacion=datetime.now(),
+        Fecha_Programada=datetime.now(),
+        Estado="PENDIENTE",
+    )
+    db.session.add(ses)
+    db.session.commit()
+    app.config["SSE_KEEPALIVE"] = 0.05
+    app.config["SSE_DURACION_MAXIMA"] = 5
+
+    profesional_controlador.estado_tiempo_real.eliminar(ses.Id)
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/eventos", buffered=False)
+    trozos = iter(resp.response)
+    assert next(trozos).startswith(b"retry:")
+    primero = next(trozos).decode()
+    assert '"ejercicio_activo_id": null' in primero
+
+    # Sin cambios: keepalive
+    assert next(trozos).startswith(b": keepalive")
+
+    profesional_controlador.estado_tiempo_real.actualizar(ses.Id, ejercicio_activo_id=3)
+    siguiente = next(trozos).decode()
+    assert '"ejercicio_activo_id": 3' in siguiente
+
+    profesional_controlador.estado_tiempo_real.actualizar(ses.Id, terminada=True)
+    ultimo = next(trozos).decode()
+    assert '"terminada": true' in ultimo
+    with pytest.raises(StopIteration):
+        next(trozos)
+    resp.close()
+
+def test_eventos_sesion_cupo_de_conexiones(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que el stream ocupa un hueco del cupo, lo libera al cerrarse y responde 503 si está lleno."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    cupo = app.extensions["conexiones_largas"]
+    cupo.maximo = 1
+    app.config["SSE_DURACION_MAXIMA"] = 5
+
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/eventos", buffered=False)
+    assert resp.status_code == 200
+    assert cupo.abiertas == 1
+
+    lleno = client.get(f"/profesional/api/sesion/{ses.Id}/eventos")
+    assert lleno.status_code == 503
+    assert lleno.headers["Retry-After"] == str(app.config["CONEXIONES_LARGAS_REINTENTO"])
+
+    resp.close()
+    assert cupo.abiertas == 0
+
+def test_eventos_sesion_sin_permiso(client, profesional_user, paciente_user, user_factory, login_profesional):
+    """Prueba que solo paciente y profesional de la sesión abren el stream."""
+    otro = user_factory(Rol_Id=2, Email="otropro_sse@example.com")
+    ses = Sesion(
+        Paciente_Id=paciente_user.Id,
+        Profesional_Id=otro.Id,
+        Fecha_Asignacion=datetime.now(),
+        Fecha_Programada=datetime.now(),
+        Estado="PENDIENTE",
+    )
+    db.session.add(ses)
+    db.session.commit()
+
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/eventos")
+    assert resp.status_code == 403
+
+# Tests del estado en lote estado_sesiones_lote
+
+def test_estado_sesiones_lote_una_sola_consulta(client, profesional_user, paciente_user, user_factory, login_profesional, contador_sql):
+    """Prueba que el lote devuelve solo sesiones propias con una única consulta."""
+    propias = [_crear_sesion_pendiente(paciente_user.Id, profesional_user.Id).Id for _ in range(3)]
+    otro = user_factory(Rol_Id=2, Email="otropro_lote@example.com")
+    ajena = _crear_sesion_pendiente(paciente_user.Id, otro.Id).Id
+    profesional_controlador.estado_tiempo_real.actualizar(propias[1], ejercicio_activo_id=4)
+
+    ids = [propias[2], ajena, propias[0], 9999, propias[1], propias[0]]
+    contador_sql.clear()
+    resp = client.get("/profesional/api/sesiones/estado?ids=" + ",".join(map(str, ids)))
+    assert resp.status_code == 200
+    assert len([q for q in contador_sql if 'FROM "Sesion"' in q]) == 1
+
+    data = resp.get_json()
+    assert [e["sesion_id"] for e in data["sesiones"]] == [propias[2], propias[0], propias[1]]
+    assert data["sesiones"][2]["ejercicio_activo_id"] == 4
+    assert data["sesiones"][0]["version"] == 0
+    assert data["no_autorizadas"] == [ajena, 9999]
+
+def test_estado_sesiones_lote_parametros(client, app, profesional_user, login_profesional):
+    """Prueba lista vacía, ids no numéricos y exceso de sesiones."""
+    resp = client.get("/profesional/api/sesiones/estado")
+    assert resp.get_json() == {"sesiones": [], "no_autorizadas": [], "retry_after_ms": 2000}
+
+    resp = client.get("/profesional/api/sesiones/estado?ids=1,a")
+    assert resp.status_code == 400
+
+    app.config["ESTADO_LOTE_MAXIMO"] = 2
+    resp = client.get("/profesional/api/sesiones/estado?ids=1,2,3")
+    assert resp.status_code == 400
+
+# Tests del canal WebSocket websocket_sesion
+
+@pytest.fixture
+def servidor_ws(app):
+    """Servidor Werkzeug real en un hilo (el cliente de test no admite WebSocket)."""
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+
+def _abrir_ws(app, servidor, sesion_id, usuario, origen=None):
+    """Helper: handshake con la cookie de sesión de `usuario`; devuelve (socket, status)."""
+    cookie = app.session_interface.get_signing_serializer(app).dumps(
+        {"_user_id": str(usuario.Id), "_fresh": True}
+    )
+    sock = socket.create_connection(servidor.server_address, timeout=5)
+    cabeceras = [
+        f"GET /profesional/api/sesion/{sesion_id}/ws HTTP/1.1",
+        f"Host: 127.0.0.1:{servidor.server_port}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {base64.b64encode(os.urandom(16)).decode()}",
+        "Sec-WebSocket-Version: 13",
+        f"Cookie: {app.config['SESSION_COOKIE_NAME']}={cookie}",
+    ]
+    if origen:
+        cabeceras.append(f"Origin: {origen}")
+    sock.sendall(("\r\n".join(cabeceras) + "\r\n\r\n").encode())
+    respuesta = b""
+    while not respuesta.endswith(b"\r\n\r\n"):
+        respuesta += sock.recv(1)
+    return sock, int(respuesta.split()[1])
+
+def _mensaje_ws(sock):
+    """Helper: siguiente mensaje JSON del servidor."""
+    opcode, datos = leer_trama_servidor(sock)
+    assert opcode == OP_TEXTO
+    return json.loads(datos)
+
+def test_websocket_sesion_profesional_controla_la_sesion(app, servidor_ws, profesional_user, paciente_user):
+    """Prueba que el profesional cambia ejercicio, grabación y fin de sesión por el canal."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sock, status = _abrir_ws(app, servidor_ws, ses.Id, profesional_user)
+    assert status == 101
+
+    inicial = _mensaje_ws(sock)
+    assert inicial["tipo"] == "estado"
+    assert inicial["ejercicio_activo_id"] is None
+
+    sock.sendall(trama_cliente(OP_TEXTO, json.dumps({"ejercicio_activo_id": 5}).encode()))
+    respuesta = _mensaje_ws(sock)
+    assert respuesta == {
+        "tipo": "respuesta", "ok": True, "sesion_id": ses.Id,
+        "ejercicio_activo_id": 5, "terminada": False,
+    }
+    assert _mensaje_ws(sock)["ejercicio_activo_id"] == 5
+
+    sock.sendall(trama_cliente(OP_TEXTO, json.dumps({"grabacion": False}).encode()))
+    assert _mensaje_ws(sock)["tipo"] == "respuesta"
+    assert _mensaje_ws(sock)["grabacion"] is False
+
+    sock.sendall(trama_cliente(OP_TEXTO, json.dumps({"terminada": True}).encode()))
+    assert _mensaje_ws(sock)["terminada"] is True
+    final = _mensaje_ws(sock)
+    assert final["tipo"] == "estado" and final["terminada"] is True
+    assert leer_trama_servidor(sock)[0] == OP_CIERRE
+    sock.close()
+
+def test_websocket_sesion_paciente_recibe_cambios(app, servidor_ws, profesional_user, paciente_user):
+    """Prueba que el paciente recibe los cambios y no puede modificar el estado."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sock, status = _abrir_ws(app, servidor_ws, ses.Id, paciente_user)
+    assert status == 101
+    assert _mensaje_ws(sock)["version"] == 0
+
+    sock.sendall(trama_cliente(OP_TEXTO, json.dumps({"terminada": True}).encode()))
+    assert _mensaje_ws(sock) == {"tipo": "error", "error": "Sin permisos"}
+
+    profesional_controlador.estado_tiempo_real.actualizar(ses.Id, ejercicio_activo_id=8)
+    assert _mensaje_ws(sock)["ejercicio_activo_id"] == 8
+
+    sock.sendall(trama_cliente(OP_CIERRE, b"\x03\xe8"))
+    assert leer_trama_servidor(sock)[0] == OP_CIERRE
+    sock.close()
+
+def test_websocket_sesion_rechazos(app, client, servidor_ws, profesional_user, paciente_user, user_factory, login_profesional):
+    """Prueba los rechazos: sin handshake, otro origen y usuario ajeno a la sesión."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+
+    resp = client.get(f"/profesional/api/sesion/{ses.Id}/ws")
+    assert resp.status_code == 400
+
+    sock, status = _abrir_ws(app, servidor_ws, ses.Id, profesional_user, origen="https://otro.example")
+    assert status == 403
+    sock.close()
+
+    otro = user_factory(Rol_Id=2, Email="otropro_ws@example.com")
+    sock, status = _abrir_ws(app, servidor_ws, ses.Id, otro)
+    assert status == 403
+    sock.close()
+
+# Tests del diario de eventos de sesión
+
+def test_websocket_sesion_cupo_lleno(app, servidor_ws, profesional_user, paciente_user):
+    """Prueba que con el cupo de conexiones largas lleno el canal responde 503."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    cupo = app.extensions["conexiones_largas"]
+    cupo.maximo = 0
+
+    sock, status = _abrir_ws(app, servidor_ws, ses.Id, profesional_user)
+    assert status == 503
+    sock.close()
+    assert cupo.abiertas == 0
+
+def test_estado_sesion_anota_eventos_sin_escribir_en_bd(client, app, profesional_user, paciente_user, login_profesional, contador_sql, monkeypatch):
+    """Prueba que los cambios de estado se anotan en el diario sin INSERT en la petición."""
+    monkeypatch.setattr(profesional_controlador, "MIN_INTERVAL_CAMBIO", 0)
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    sesion_id = ses.Id
+    url = f"/profesional/api/sesion/{sesion_id}/estado"
+
+    contador_sql.clear()
+    for payload in (
+        {"ejercicio_activo_id": 1, "grabacion": True},
+        {"ejercicio_activo_id": 1},  # sin cambios: no se anota
+        {"ejercicio_activo_id": 2, "grabacion": False},
+        {"terminada": True},
+        {"terminada": False},
+    ):
+        client.post(url, data=json.dumps(payload), content_type="application/json")
+    assert not [s for s in contador_sql if "Evento_Sesion" in s]
+    assert app.extensions["diario_sesiones"].pendientes() == 6
+
+    resp = client.get(f"/profesional/api/sesion/{sesion_id}/diario")
+    assert resp.status_code == 200
+    data = json.loads(resp.data)
+    assert [e["Tipo"] for e in data["eventos"]] == [
+        "EJERCICIO", "GRABACION", "EJERCICIO", "GRABACION", "TERMINADA", "REANUDADA"
+    ]
+    assert [(t["ejercicio_sesion_id"], t["segundos"] is not None) for t in data["tiempos"]] == [
+        (1, True), (2, True)
+    ]
+    assert app.extensions["diario_sesiones"].pendientes() == 0
+
+def test_finalizar_sesion_anota_evento(client, app, profesional_user, paciente_user, login_profesional):
+    """Prueba que finalizar la sesión queda en el diario."""
+    ses = _crear_sesion_pendiente(paciente_user.Id, profesional_user.Id)
+    client.post(f"/profesional/sesion/finalizar/{ses.Id}")
+
+    data = json.loads(client.get(f"/profesional/api/sesion/{ses.Id}/diario").data)
+    assert [e["Tipo"] for e in data["eventos"]] == ["FINALIZADA"]
+    assert data["tiempos"] == []
+
+def test_diario_sesion_sin_permiso(client, profesional_user, paciente_user, user_factory, login_profesional):
+    """Prueba que solo el profesional de la sesión ve su diario."""
+    otro = user_factory(Rol_Id=2, Email="otropro_diario@example.com")
+    ses = _crear_sesion_pendiente(paciente_user.Id, otro.Id)
+    assert client.get(f"/profesional/api/sesion/{ses.Id}/diario").status_code == 403
+
 # Helper para tests de evaluación
 
 def _crear_sesion_completada_con_video(paciente_id, profesional_id, puntuacion=None):
@@ -1165,24 +1852,29 @@ def test_guardar_video_ok(client, profesional_user, paciente_user, login_user_fi
 
     # Mock de Cloudinary para evitar llamadas reales
     monkeypatch.setattr(
-        "src.controladores.profesional_controlador.cloudinary.uploader.upload",
+        "cloudinary.uploader.upload",
         lambda *args, **kwargs: {"secure_url": "https://example.com/video.mp4"},
     )
 
     data = {
-        "video": (io.BytesIO(b"fake webm"), "test.webm"),
+        "video": (io.BytesIO(WEBM), "test.webm"),
     }
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
         content_type="multipart/form-data",
     )
-    assert resp.status_code == 200
+    assert resp.status_code == 202
     data_json = json.loads(resp.data)
     assert data_json["success"] is True
+    assert resp.headers["Location"] == data_json["url_estado"]
     vr = VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=es.Id).first()
     assert vr is not None
 
+    estado = json.loads(client.get(data_json["url_estado"]).data)
+    assert estado["estado"] == "COMPLETADO"
+    assert estado["mensaje"] == "Video guardado correctamente"
+
 def test_guardar_video_sin_archivo(client, profesional_user, paciente_user, login_user_fixture):
     """Prueba que guardar_video sin archivo devuelve error 400."""
     ses = Sesion(
@@ -1288,7 +1980,7 @@ def test_guardar_video_ya_existente(client, profesional_user, paciente_user, log
 
     login_user_fixture(paciente_user)
 
-    data = {"video": (io.BytesIO(b"fake"), "test.webm")}
+    data = {"video": (io.BytesIO(WEBM), "test.webm")}
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
@@ -1328,19 +2020,20 @@ def test_guardar_video_sin_url_cloudinary(client, profesional_user, paciente_use
     login_user_fixture(paciente_user)
 
     monkeypatch.setattr(
-        "src.controladores.profesional_controlador.cloudinary.uploader.upload",
+        "cloudinary.uploader.upload",
         lambda *args, **kwargs: {},
     )
 
-    data = {"video": (io.BytesIO(b"fake"), "test.webm")}
+    data = {"video": (io.BytesIO(WEBM), "test.webm")}
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
         content_type="multipart/form-data",
     )
-    assert resp.status_code == 500
-    data_json = json.loads(resp.data)
+    assert resp.status_code == 202
+    data_json = json.loads(client.get(json.loads(resp.data)["url_estado"]).data)
     assert data_json["success"] is False
+    assert data_json["estado"] == "ERROR"
     assert "No se obtuvo URL del video" in data_json["error"]
 
 def test_guardar_video_integrity_error(client, profesional_user, paciente_user, login_user_fixture, monkeypatch):
@@ -1351,7 +2044,7 @@ def test_guardar_video_integrity_error(client, profesional_user, paciente_user,
     login_user_fixture(paciente_user)
 
     monkeypatch.setattr(
-        "src.controladores.profesional_controlador.cloudinary.uploader.upload",
+        "cloudinary.uploader.upload",
         lambda *args, **kwargs: {"secure_url": "https://example.com/video.mp4"},
     )
 
@@ -1362,7 +2055,7 @@ def test_guardar_video_integrity_error(client, profesional_user, paciente_user,
         "src.controladores.profesional_controlador.db.session.commit", fake_commit
     )
 
-    data = {"video": (io.BytesIO(b"fake"), "test.webm")}
+    data = {"video": (io.BytesIO(WEBM), "test.webm")}
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
@@ -1400,7 +2093,7 @@ def test_guardar_video_integrity_error_race(client, profesional_user, paciente_u
     login_user_fixture(paciente_user)
 
     monkeypatch.setattr(
-        "src.controladores.profesional_controlador.cloudinary.uploader.upload",
+        "cloudinary.uploader.upload",
         lambda *args, **kwargs: {"secure_url": "https://example.com/video.mp4"},
     )
 
@@ -1413,7 +2106,7 @@ def test_guardar_video_integrity_error_race(client, profesional_user, paciente_u
         "src.controladores.profesional_controlador.db.session.commit", fake_commit
     )
 
-    data = {"video": (io.BytesIO(b"fake"), "test.webm")}
+    data = {"video": (io.BytesIO(WEBM), "test.webm")}
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
@@ -1424,9 +2117,10 @@ def test_guardar_video_integrity_error_race(client, profesional_user, paciente_u
         "src.controladores.profesional_controlador.db.session.commit", original_commit
     )
 
-    assert resp.status_code == 200
-    data_json = json.loads(resp.data)
+    assert resp.status_code == 202
+    data_json = json.loads(client.get(json.loads(resp.data)["url_estado"]).data)
     assert data_json["success"] is True
+    assert data_json["estado"] == "COMPLETADO"
     assert "ya existente" in data_json["mensaje"]
 
 def test_guardar_video_excepcion_generica(client, profesional_user, paciente_user, login_user_fixture, monkeypatch):
@@ -1459,21 +2153,324 @@ def test_guardar_video_excepcion_generica(client, profesional_user, paciente_use
         raise RuntimeError("fallo cloudinary")
 
     monkeypatch.setattr(
-        "src.controladores.profesional_controlador.cloudinary.uploader.upload",
+        "cloudinary.uploader.upload",
         fake_upload,
     )
 
-    data = {"video": (io.BytesIO(b"fake"), "test.webm")}
+    data = {"video": (io.BytesIO(WEBM), "test.webm")}
     resp = client.post(
         f"/profesional/guardar_video/{es.Id}",
         data=data,
         content_type="multipart/form-data",
     )
-    assert resp.status_code == 500
-    data_json = json.loads(resp.data)
+    assert resp.status_code == 202
+    data_json = json.loads(client.get(json.loads(resp.data)["url_estado"]).data)
     assert data_json["success"] is False
+    assert data_json["estado"] == "ERROR"
     assert "fallo cloudinary" in data_json["error"]
 
+def _crear_ejercicio_sesion(paciente_id, profesional_id):
+    """Helper: crea una sesión pendiente con un ejercicio y devuelve su Ejercicio_Sesion."""
+    ses = _crear_sesion_pendiente(paciente_id, profesional_id)
+    ej = Ejercicio(Nombre="VideoEj", Descripcion="Desc", Tipo="Test", Video="v.mp4", Duracion=10)
+    db.session.add(ej)
+    db.session.commit()
+    es = Ejercicio_Sesion(Sesion_Id=ses.Id, Ejercicio_Id=ej.Id)
+    db.session.add(es)
+    db.session.commit()
+    return es
+
+def test_guardar_video_en_segundo_plano(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba que la petición no espera a la subida remota y el estado la refleja."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_SEGUNDO_PLANO"] = True
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+
+    continuar = threading.Event()
+    subidos = []
+
+    def fake_upload(ruta, **kwargs):
+        continuar.wait(5)
+        with open(ruta, "rb") as f:
+            subidos.append(f.read())
+        return {"secure_url": "https://example.com/video.mp4"}
+
+    monkeypatch.setattr(
+        "cloudinary.uploader.upload", fake_upload
+    )
+
+    resp = client.post(
+        f"/profesional/guardar_video/{es_id}",
+        data={"video": (io.BytesIO(WEBM), "test.webm")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 202
+    data_json = json.loads(resp.data)
+    assert data_json["estado"] in ("PENDIENTE", "SUBIENDO")
+
+    # Una segunda subida del mismo ejercicio reutiliza el trabajo en curso
+    resp2 = client.post(
+        f"/profesional/guardar_video/{es_id}",
+        data={"video": (io.BytesIO(WEBM + b"otra"), "test.webm")},
+        content_type="multipart/form-data",
+    )
+    assert json.loads(resp2.data)["trabajo_id"] == data_json["trabajo_id"]
+
+    continuar.set()
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        estado = json.loads(client.get(data_json["url_estado"]).data)
+        if estado["estado"] == "COMPLETADO":
+            break
+        time.sleep(0.02)
+    assert estado["estado"] == "COMPLETADO"
+    assert subidos == [WEBM]
+    assert list(tmp_path.iterdir()) == []
+    assert VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=es_id).count() == 1
+
+def test_guardar_video_rechaza_lo_que_no_es_video(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba que una subida sin cabecera MP4/WebM de vídeo se rechaza con 415 sin encolarla."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    monkeypatch.setattr(
+        "cloudinary.uploader.upload",
+        lambda *a, **k: pytest.fail("no debería subirse"),
+    )
+
+    resp = client.post(
+        f"/profesional/guardar_video/{es_id}",
+        data={"video": (io.BytesIO(b"<html>no es un video</html>"), "test.webm")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 415
+    assert resp.get_json()["success"] is False
+    assert list(tmp_path.iterdir()) == []
+
+    # Igual al finalizar una subida por fragmentos
+    url = client.post(f"/profesional/guardar_video/{es_id}/subidas", json={}).get_json()["url"]
+    client.put(f"{url}?offset=0", data=b"RIFF....AVI ", content_type="application/octet-stream")
+    assert client.post(f"{url}/finalizar").status_code == 415
+    assert VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=es_id).count() == 0
+    assert [p.name for p in tmp_path.iterdir()] == ["parciales"]
+    assert list((tmp_path / "parciales").iterdir()) == []
+
+def test_guardar_video_supera_tamano_maximo(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path):
+    """Prueba que el límite por fichero corta la recepción con 413 sin dejar restos."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    app.config["SUBIDAS_TAM_MAXIMO_FICHERO"] = 4
+
+    resp = client.post(
+        f"/profesional/guardar_video/{es_id}",
+        data={"video": (io.BytesIO(b"demasiado grande"), "test.webm")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+    assert VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=es_id).count() == 0
+
+def test_estado_subida_video_desconocido_y_sin_permiso(client, app, profesional_user, paciente_user, login_user_fixture):
+    """Prueba el estado de trabajos de otro worker y el control de permisos."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    url = f"/profesional/guardar_video/{es_id}/trabajos/otro"
+
+    login_user_fixture(profesional_user)
+    assert client.get(url).status_code == 403
+
+    login_user_fixture(paciente_user)
+    assert client.get(url).status_code == 404
+
+    # Subido por otro worker: se deduce del VideoRespuesta
+    db.session.add(VideoRespuesta(
+        Ejercicio_Sesion_Id=es_id,
+        Ruta_Almacenamiento="https://example.com/v.mp4",
+        Fecha_Expiracion=datetime.now() + timedelta(days=30),
+    ))
+    db.session.commit()
+    data_json = json.loads(client.get(url).data)
+    assert data_json["estado"] == "COMPLETADO"
+
+def test_guardar_video_en_curso_en_otro_worker(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba que una subida registrada por otro worker se comparte sin recibir ni subir el vídeo."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: pytest.fail("no debería subirse"))
+    db.session.add(SubidaRespuesta(Ejercicio_Sesion_Id=es_id, Trabajo_Id="a" * 32, Estado="SUBIENDO",
+                                   Actualizado=datetime.now()))
+    db.session.commit()
+
+    # Sin cuerpo: se responde con el trabajo en curso antes de leerlo
+    resp = client.post(f"/profesional/guardar_video/{es_id}")
+    assert resp.status_code == 202
+    assert resp.get_json()["trabajo_id"] == "a" * 32
+    assert resp.get_json()["estado"] == "SUBIENDO"
+
+    resp = client.post(f"/profesional/guardar_video/{es_id}/subidas", json={"tamano": len(WEBM)})
+    assert resp.status_code == 202
+    assert client.get(resp.get_json()["url_estado"]).get_json()["estado"] == "SUBIENDO"
+    assert list(tmp_path.iterdir()) == []
+
+def test_guardar_video_registra_la_subida_antes_de_leer_el_cuerpo(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba que la subida queda registrada antes de recibir el vídeo y se libera si no llega."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: {"secure_url": "https://example.com/video.webm"})
+
+    # Sin archivo: el registro reservado se libera para permitir reintentos
+    resp = client.post(f"/profesional/guardar_video/{es_id}", data={}, content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert db.session.get(SubidaRespuesta, es_id) is None
+
+    registrados = []
+    guardar = profesional_controlador.guardar_fichero_subido
+
+    def guardar_con_registro(fichero, ruta):
+        registrados.append(db.session.get(SubidaRespuesta, es_id).Trabajo_Id)
+        return guardar(fichero, ruta)
+
+    monkeypatch.setattr(profesional_controlador, "guardar_fichero_subido", guardar_con_registro)
+    resp = client.post(
+        f"/profesional/guardar_video/{es_id}",
+        data={"video": (io.BytesIO(WEBM), "test.webm")},
+        content_type="multipart/form-data",
+        headers={"Idempotency-Key": "grabacion-1"},
+    )
+    assert resp.status_code == 202
+    assert registrados == [resp.get_json()["trabajo_id"]]
+
+def test_guardar_video_idempotency_key(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba que un reintento con la misma clave recibe el trabajo original y no vuelve a subir."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    subidas = []
+    monkeypatch.setattr(
+        "cloudinary.uploader.upload",
+        lambda ruta, **k: subidas.append(ruta) or {"secure_url": "https://example.com/video.webm"},
+    )
+
+    def subir(clave):
+        url = client.post(f"/profesional/guardar_video/{es_id}/subidas", json={},
+                          headers={"Idempotency-Key": clave})
+        if url.status_code != 201:
+            return url
+        url = url.get_json()["url"]
+        client.put(f"{url}?offset=0", data=WEBM, content_type="application/octet-stream")
+        return client.post(f"{url}/finalizar")
+
+    primera = subir("grabacion-1")
+    assert primera.status_code == 202
+    trabajo_id = primera.get_json()["trabajo_id"]
+    registro = db.session.get(SubidaRespuesta, es_id)
+    assert (registro.Trabajo_Id, registro.Estado, registro.Clave_Idempotencia) == (trabajo_id, "COMPLETADO", "grabacion-1")
+
+    reintento = client.post(f"/profesional/guardar_video/{es_id}", headers={"Idempotency-Key": "grabacion-1"})
+    assert reintento.status_code == 202
+    assert reintento.get_json()["trabajo_id"] == trabajo_id
+    assert reintento.get_json()["estado"] == "COMPLETADO"
+
+    otra = subir("grabacion-2")
+    assert otra.status_code == 200
+    assert "ya existente" in otra.get_json()["mensaje"]
+    assert len(subidas) == 1
+
+# Tests de subida reanudable por fragmentos
+
+def test_subida_reanudable_completa(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Prueba iniciar, enviar fragmentos (con un reenvío desfasado) y finalizar."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+
+    subidos = []
+
+    def fake_upload(ruta, **kwargs):
+        with open(ruta, "rb") as f:
+            subidos.append(f.read())
+        return {"secure_url": "https://example.com/video.mp4"}
+
+    monkeypatch.setattr(
+        "cloudinary.uploader.upload", fake_upload
+    )
+
+    resp = client.post(f"/profesional/guardar_video/{es_id}/subidas", json={"tamano": len(WEBM)})
+    assert resp.status_code == 201
+    url = resp.get_json()["url"]
+    assert resp.headers["Location"] == url
+
+    octet = "application/octet-stream"
+    assert client.put(f"{url}?offset=0", data=WEBM[:4], content_type=octet).get_json()["offset"] == 4
+
+    # Reintento de un fragmento ya recibido: 409 con el offset correcto
+    resp = client.put(f"{url}?offset=0", data=WEBM[:4], content_type=octet)
+    assert resp.status_code == 409
+    assert resp.get_json()["offset"] == 4
+    assert client.get(url).get_json()["offset"] == 4
+
+    # Finalizar antes de tiempo
+    assert client.post(f"{url}/finalizar").status_code == 409
+
+    assert client.put(f"{url}?offset=4", data=WEBM[4:], content_type=octet).get_json()["offset"] == len(WEBM)
+    resp = client.post(f"{url}/finalizar")
+    assert resp.status_code == 202
+    estado = client.get(resp.get_json()["url_estado"]).get_json()
+    assert estado["estado"] == "COMPLETADO"
+    assert subidos == [WEBM]
+    assert VideoRespuesta.query.filter_by(Ejercicio_Sesion_Id=es_id).count() == 1
+    assert client.get(url).status_code == 404
+
+    # Con el vídeo ya guardado no se abren más subidas
+    resp = client.post(f"/profesional/guardar_video/{es_id}/subidas", json={})
+    assert resp.status_code == 200
+    assert "ya existente" in resp.get_json()["mensaje"]
+
+def test_subida_reanudable_errores(client, app, profesional_user, paciente_user, user_factory, login_user_fixture, tmp_path):
+    """Prueba permisos, parámetros y límites de la subida por fragmentos."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    es_id = es.Id
+    base = f"/profesional/guardar_video/{es_id}/subidas"
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+
+    login_user_fixture(profesional_user)
+    assert client.post(base, json={}).status_code == 403
+
+    login_user_fixture(paciente_user)
+    assert client.post(base, json={"tamano": "x"}).status_code == 400
+    app.config["SUBIDAS_TAM_MAXIMO"] = 4
+    assert client.post(base, json={"tamano": 5}).status_code == 413
+
+    url = client.post(base, json={}).get_json()["url"]
+    assert client.put(url).status_code == 400
+    assert client.put(f"{url}?offset=0", data=b"12345").status_code == 413
+    assert client.get(f"{base}/{'0' * 32}").status_code == 404
+
+    # Finalizar sin datos: archivo vacío y subida descartada
+    assert client.post(f"{url}/finalizar").status_code == 400
+    assert client.get(url).status_code == 404
+
+    # Otro paciente no puede continuar la subida
+    url = client.post(base, json={}).get_json()["url"]
+    otro = user_factory(Rol_Id=1, Email="otropaciente_subida@example.com")
+    login_user_fixture(otro)
+    assert client.get(url).status_code == 403
+
+    login_user_fixture(paciente_user)
+    assert client.delete(url).get_json()["success"] is True
+    assert client.get(url).status_code == 404
+
 # Tests de ver_evaluacion
 
 def test_ver_evaluacion_ok(client, profesional_user, paciente_user, login_profesional):
@@ -0,0 +1,105 @@
+"""
+Tests de la purga de los vídeos de respuesta caducados.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.subida_respuesta import SubidaRespuesta
+from src.modelos.videoRespuesta import VideoRespuesta
+from src.servicios.almacenamiento import AlmacenLocal
+from src.servicios.purga_videos import claves_respuesta, dias_retencion, fecha_expiracion, purgar_videos_caducados
+
+HOY = date(2025, 6, 30)
+
+
+@pytest.fixture
+def almacen(app, tmp_path):
+    """Almacén de respuestas local en un directorio temporal."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    app.config["ALMACEN_RESPUESTAS_URL"] = "local://respuestas"
+    directorio = tmp_path / "respuestas"
+    directorio.mkdir()
+    return directorio
+
+
+def _video(almacen, es_id, expiracion, versiones=None, miniaturas=None):
+    video = VideoRespuesta(Ejercicio_Sesion_Id=es_id, Ruta_Almacenamiento=f"/r/{es_id}.webm",
+                           Fecha_Expiracion=expiracion, Versiones=versiones, Miniaturas=miniaturas)
+    db.session.add(video)
+    db.session.commit()
+    for clave in claves_respuesta(video):
+        (almacen / clave).write_bytes(b"video")
+    return video
+
+
+def test_retencion_de_la_configuracion(monkeypatch):
+    """Prueba que la expiración usa retencion_videos y cae a 30 días si no es válida."""
+    monkeypatch.setattr("src.controladores.admin_controlador.cargar_configuracion",
+                        lambda: {"retencion_videos": "90"})
+    assert dias_retencion() == 90
+    assert fecha_expiracion(HOY) == HOY + timedelta(days=90)
+
+    for valor in ("nunca", "0", None):
+        monkeypatch.setattr("src.controladores.admin_controlador.cargar_configuracion",
+                            lambda: {"retencion_videos": valor})
+        assert dias_retencion() == 30
+
+
+def test_purga_por_lotes(app, almacen):
+    """Prueba que se borran los caducados con sus derivados y se conservan los vigentes."""
+    app.config["PURGA_VIDEOS_LOTE"] = 2
+    _video(almacen, 1, HOY - timedelta(days=3), versiones="360p", miniaturas="5x4@3")
+    _video(almacen, 2, HOY)
+    _video(almacen, 3, HOY - timedelta(days=1))
+    _video(almacen, 4, HOY + timedelta(days=1))
+    db.session.add(SubidaRespuesta(Ejercicio_Sesion_Id=1, Trabajo_Id="a" * 32, Estado="COMPLETADO"))
+    db.session.commit()
+
+    resultado = purgar_videos_caducados(HOY)
+
+    assert resultado == {"videos": 3, "ficheros": 6, "errores": 0}
+    assert [v.Ejercicio_Sesion_Id for v in VideoRespuesta.query.all()] == [4]
+    assert sorted(p.name for p in almacen.iterdir()) == ["respuesta_4.webm"]
+    assert db.session.get(SubidaRespuesta, 1) is None
+    assert purgar_videos_caducados(HOY) == {"videos": 0, "ficheros": 0, "errores": 0}
+
+
+def test_purga_conserva_los_que_fallan(app, almacen, monkeypatch):
+    """Prueba que un vídeo que no se pudo borrar del almacén se reintenta en la siguiente pasada."""
+    _video(almacen, 1, HOY, versiones="360p,720p")
+    _video(almacen, 2, HOY)
+    borrar = AlmacenLocal.borrar
+
+    def borrar_con_fallo(self, clave):
+        if clave == "respuesta_1_720p.mp4":
+            raise OSError("sin permiso")
+        borrar(self, clave)
+    monkeypatch.setattr(AlmacenLocal, "borrar", borrar_con_fallo)
+
+    assert purgar_videos_caducados(HOY) == {"videos": 1, "ficheros": 3, "errores": 1}
+    assert [v.Ejercicio_Sesion_Id for v in VideoRespuesta.query.all()] == [1]
+
+    monkeypatch.setattr(AlmacenLocal, "borrar", borrar)
+    assert purgar_videos_caducados(HOY)["videos"] == 1
+    assert list(almacen.iterdir()) == []
+
+
+def test_purga_programada_con_la_primera_peticion(app, client):
+    """Prueba que el programador solo arranca si está activado y una sola vez."""
+    purga = app.extensions["purga_videos"]
+    client.get("/login")
+    assert purga._programador is None
+
+    app.config["PURGA_VIDEOS_PROGRAMADA"] = True
+    client.get("/login")
+    programador = purga._programador
+    try:
+        client.get("/login")
+        assert purga._programador is programador
+        trabajo = programador.get_job("purga_videos")
+        assert trabajo.trigger.interval == timedelta(seconds=app.config["PURGA_VIDEOS_INTERVALO"])
+    finally:
+        purga.detener()
@@ -0,0 +1,100 @@
+"""
+Tests de la caché de autorización de sesiones activas.
+"""
+
+from types import SimpleNamespace
+
+from src.servicios.sesiones_activas import (
+    CacheSesionesActivas,
+    CacheUsuariosActivos,
+    cache_sesiones_activas,
+    cache_usuarios_activos,
+)
+
+
+def test_registrar_consultar_e_invalidar():
+    """Prueba el ciclo de vida de una entrada de la caché."""
+    cache = CacheSesionesActivas()
+    sesion = SimpleNamespace(Id=3, Paciente_Id=10, Profesional_Id=20)
+
+    assert cache.participantes(3) is None
+    cache.registrar(sesion)
+    assert cache.participantes(3) == (10, 20)
+    assert 3 in cache and len(cache) == 1
+
+    cache.invalidar(3)
+    cache.invalidar(3)  # idempotente
+    assert 3 not in cache
+
+    cache.registrar(sesion)
+    cache.limpiar()
+    assert len(cache) == 0
+
+
+def test_capacidad_descarta_las_mas_antiguas():
+    """Prueba que la caché no crece por encima de su capacidad."""
+    cache = CacheSesionesActivas(capacidad=2)
+    for i in (1, 2, 3):
+        cache.registrar(SimpleNamespace(Id=i, Paciente_Id=i, Profesional_Id=i))
+    assert len(cache) == 2
+    assert 1 not in cache and 3 in cache
+
+
+def test_una_cache_por_aplicacion(app):
+    """Prueba que cada aplicación tiene su propia caché."""
+    assert cache_sesiones_activas() is app.extensions["sesiones_activas"]
+
+
+def test_usuarios_activos_caducan_y_se_invalidan():
+    """Prueba que el estado de una cuenta se recuerda durante el TTL y se puede retirar."""
+    ahora = [0.0]
+    cache = CacheUsuariosActivos(ttl=60, reloj=lambda: ahora[0])
+
+    assert cache.activo(7) is None
+    cache.registrar(7, True)
+    cache.registrar(8, False)
+    assert cache.activo(7) is True
+    assert cache.activo(8) is False
+
+    ahora[0] = 60
+    assert cache.activo(7) is None
+
+    cache.registrar(7, True)
+    cache.invalidar(7)
+    assert cache.activo(7) is None
+
+
+def test_usuarios_activos_capacidad():
+    """Prueba que la caché de usuarios no crece por encima de su capacidad."""
+    cache = CacheUsuariosActivos(capacidad=2)
+    for i in (1, 2, 3):
+        cache.registrar(i, True)
+    assert len(cache) == 2
+    assert cache.activo(1) is None and cache.activo(3) is True
+
+
+def test_una_cache_de_usuarios_por_aplicacion(app):
+    """Prueba que cada aplicación tiene su propia caché de usuarios activos."""
+    assert cache_usuarios_activos() is app.extensions["usuarios_activos"]
+
+
+def test_lecturas_esperan_a_las_escrituras():
+    """Prueba que las consultas toman el lock que usan las escrituras de otros hilos."""
+    import threading
+
+    sesiones = CacheSesionesActivas()
+    sesiones.registrar(SimpleNamespace(Id=1, Paciente_Id=2, Profesional_Id=3))
+    usuarios = CacheUsuariosActivos()
+    usuarios.registrar(2, True)
+
+    for cache, consulta, esperado in ((sesiones, lambda: sesiones.participantes(1), (2, 3)),
+                                      (sesiones, lambda: 1 in sesiones, True),
+                                      (usuarios, lambda: usuarios.activo(2), True)):
+        resultado = []
+        with cache._lock:
+            hilo = threading.Thread(target=lambda: resultado.append(consulta()))
+            hilo.start()
+            hilo.join(0.05)
+            assert hilo.is_alive() and resultado == []
+        hilo.join()
+        assert resultado == [esperado]
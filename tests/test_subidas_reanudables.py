@@ -0,0 +1,173 @@
+"""
+Tests de las subidas reanudables por fragmentos.
+Prueba el fichero parcial en disco, los desplazamientos y la caducidad.
+"""
+
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from src.servicios.subidas_reanudables import (
+    DesfaseSubida,
+    SubidaDemasiadoGrande,
+    SubidaNoEncontrada,
+    SubidasReanudables,
+    fcntl,
+    subidas_reanudables,
+)
+
+
+class LectorLimitado(io.BytesIO):
+    """Cuerpo de petición que registra el tamaño máximo pedido en cada lectura."""
+
+    def __init__(self, datos):
+        super().__init__(datos)
+        self.lecturas = []
+
+    def read(self, n=-1):
+        self.lecturas.append(n)
+        return super().read(n)
+
+
+@pytest.fixture
+def subidas(app, tmp_path):
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    return subidas_reanudables()
+
+
+def test_subida_completa_en_fragmentos(subidas, tmp_path):
+    """Prueba iniciar, añadir fragmentos en orden y finalizar."""
+    subida_id = subidas.iniciar(7, 1, tamano=10)["subida_id"]
+    assert subidas.anexar(subida_id, 0, io.BytesIO(b"01234")) == 5
+    assert subidas.info(subida_id)["offset"] == 5
+    assert subidas.anexar(subida_id, 5, io.BytesIO(b"56789")) == 10
+
+    destino = tmp_path / "completo.webm"
+    info = subidas.finalizar(subida_id, str(destino))
+    assert info["ejercicio_sesion_id"] == 7 and info["usuario_id"] == 1
+    assert destino.read_bytes() == b"0123456789"
+    with pytest.raises(SubidaNoEncontrada):
+        subidas.info(subida_id)
+
+
+def test_lee_el_cuerpo_por_bloques(subidas):
+    """Prueba que el fragmento no se lee entero en memoria."""
+    subidas.TAM_BLOQUE = 4
+    subida_id = subidas.iniciar(1, 1)["subida_id"]
+    cuerpo = LectorLimitado(b"x" * 10)
+    assert subidas.anexar(subida_id, 0, cuerpo) == 10
+    assert set(cuerpo.lecturas) == {4}
+
+
+def test_desfase_y_reanudacion(subidas):
+    """Prueba que un offset incorrecto indica desde dónde continuar."""
+    subida_id = subidas.iniciar(1, 1)["subida_id"]
+    subidas.anexar(subida_id, 0, io.BytesIO(b"abc"))
+
+    with pytest.raises(DesfaseSubida) as exc:
+        subidas.anexar(subida_id, 0, io.BytesIO(b"abc"))
+    assert exc.value.offset == 3
+    assert subidas.anexar(subida_id, exc.value.offset, io.BytesIO(b"d")) == 4
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock no disponible")
+def test_fragmentos_de_otro_worker_se_serializan(subidas, app, tmp_path):
+    """Prueba que el offset se vuelve a comprobar tras esperar el bloqueo de otro worker."""
+    subida_id = subidas.iniciar(1, 1)["subida_id"]
+    parcial = tmp_path / "parciales" / f"{subida_id}.part"
+    otro_worker = SubidasReanudables(app)
+    resultado = {}
+
+    def anexar():
+        try:
+            resultado["offset"] = otro_worker.anexar(subida_id, 0, io.BytesIO(b"zzz"))
+        except DesfaseSubida as e:
+            resultado["desfase"] = e.offset
+
+    with open(parcial, "ab") as f:
+        # Este worker tiene el parcial bloqueado mientras recibe su fragmento
+        fcntl.flock(f, fcntl.LOCK_EX)
+        hilo = threading.Thread(target=anexar)
+        hilo.start()
+        hilo.join(0.2)
+        assert hilo.is_alive()
+        f.write(b"abc")
+    hilo.join(5)
+
+    assert resultado == {"desfase": 3}
+    assert parcial.read_bytes() == b"abc"
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock no disponible")
+def test_fragmento_tras_finalizar_en_otro_worker(subidas, app, tmp_path):
+    """Prueba que un fragmento que esperaba el bloqueo no se añade a una subida ya finalizada."""
+    subida_id = subidas.iniciar(1, 1)["subida_id"]
+    subidas.anexar(subida_id, 0, io.BytesIO(b"abc"))
+    parcial = tmp_path / "parciales" / f"{subida_id}.part"
+    destino = tmp_path / "completo.webm"
+    resultado = []
+
+    def anexar():
+        try:
+            SubidasReanudables(app).anexar(subida_id, 3, io.BytesIO(b"def"))
+        except SubidaNoEncontrada:
+            resultado.append("no encontrada")
+
+    with open(parcial, "rb") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        hilo = threading.Thread(target=anexar)
+        hilo.start()
+        hilo.join(0.2)
+        os.replace(parcial, destino)
+    hilo.join(5)
+
+    assert resultado == ["no encontrada"]
+    assert destino.read_bytes() == b"abc"
+
+
+def test_limites_de_tamano(subidas, app, tmp_path):
+    """Prueba el tamaño anunciado y el máximo configurado."""
+    app.config["SUBIDAS_TAM_MAXIMO"] = 8
+    with pytest.raises(SubidaDemasiadoGrande):
+        subidas.iniciar(1, 1, tamano=9)
+
+    subida_id = subidas.iniciar(1, 1, tamano=4)["subida_id"]
+    subidas.anexar(subida_id, 0, io.BytesIO(b"ab"))
+    with pytest.raises(SubidaDemasiadoGrande):
+        subidas.anexar(subida_id, 2, io.BytesIO(b"cde"))
+    assert subidas.info(subida_id)["offset"] == 2
+
+    # Finalizar antes de recibir todo lo anunciado
+    with pytest.raises(DesfaseSubida):
+        subidas.finalizar(subida_id, str(tmp_path / "x.webm"))
+
+
+def test_ids_no_validos(subidas):
+    """Prueba que un id arbitrario no se usa como ruta."""
+    for subida_id in ("../../etc/passwd", "", "abc"):
+        with pytest.raises(SubidaNoEncontrada):
+            subidas.info(subida_id)
+
+
+def test_cancelar_y_caducidad(subidas, app):
+    """Prueba que las subidas abandonadas se borran."""
+    cancelada = subidas.iniciar(1, 1)["subida_id"]
+    subidas.cancelar(cancelada)
+    subidas.cancelar(cancelada)  # idempotente
+    with pytest.raises(SubidaNoEncontrada):
+        subidas.info(cancelada)
+
+    vieja = subidas.iniciar(1, 1)["subida_id"]
+    reciente = subidas.iniciar(2, 1)["subida_id"]
+    hace_dos_dias = time.time() - 2 * 24 * 3600
+    for nombre in os.listdir(subidas.directorio):
+        if nombre.startswith(vieja):
+            os.utime(os.path.join(subidas.directorio, nombre), (hace_dos_dias, hace_dos_dias))
+
+    assert subidas.limpiar_caducadas() == 1
+    with pytest.raises(SubidaNoEncontrada):
+        subidas.info(vieja)
+    assert subidas.info(reciente)["offset"] == 0
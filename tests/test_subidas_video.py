@@ -0,0 +1,160 @@
+"""
+Tests de la cola de subidas de vídeos de respuesta en segundo plano.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.subida_respuesta import SubidaRespuesta
+from src.servicios.subidas_video import (
+    COMPLETADO,
+    ERROR,
+    PENDIENTE,
+    SUBIENDO,
+    ColaSubidas,
+    TrabajoSubida,
+    cola_subidas,
+)
+
+
+@pytest.fixture
+def cola(app, tmp_path):
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    return cola_subidas()
+
+
+def _fichero(cola, ejercicio_sesion_id, contenido=b"webm"):
+    ruta = cola.ruta_temporal(ejercicio_sesion_id)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    return ruta
+
+
+def test_trabajo_nuevo():
+    """Prueba el estado inicial y la serialización de un trabajo."""
+    trabajo = TrabajoSubida(3, "/tmp/x.webm")
+    assert trabajo.estado == PENDIENTE and not trabajo.terminado
+    assert trabajo.to_dict()["ejercicio_sesion_id"] == 3
+    assert TrabajoSubida(3, "/tmp/x.webm").id != trabajo.id
+
+
+def test_error_borra_el_fichero(cola, tmp_path, monkeypatch):
+    """Prueba que un fallo de la subida deja el trabajo en ERROR y limpia el disco."""
+    def fake_upload(*args, **kwargs):
+        raise RuntimeError("sin red")
+
+    monkeypatch.setattr("cloudinary.uploader.upload", fake_upload)
+    trabajo = cola.encolar(1, _fichero(cola, 1))
+
+    assert trabajo.estado == ERROR
+    assert trabajo.error == "sin red"
+    assert cola.consultar(trabajo.id) is trabajo
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_historial_olvida_los_terminados_mas_antiguos(cola, app, monkeypatch):
+    """Prueba que la cola no guarda trabajos terminados sin límite."""
+    app.config["SUBIDAS_HISTORIAL"] = 2
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: {})
+
+    trabajos = [cola.encolar(i, _fichero(cola, i)) for i in range(1, 4)]
+    cola.encolar(4, _fichero(cola, 4))
+
+    assert cola.consultar(trabajos[0].id) is None
+    assert cola.consultar(trabajos[1].id) is None
+    assert cola.consultar(trabajos[2].id) is trabajos[2]
+
+
+def test_en_curso_reutiliza_el_trabajo(cola, tmp_path):
+    """Prueba que no se encolan dos subidas del mismo ejercicio a la vez."""
+    trabajo = TrabajoSubida(5, "/tmp/x.webm")
+    cola._trabajos[trabajo.id] = trabajo
+
+    ruta = _fichero(cola, 5)
+    assert cola.encolar(5, ruta) is trabajo
+    assert list(tmp_path.iterdir()) == []
+
+    trabajo.estado = COMPLETADO
+    assert cola.en_curso(5) is None
+
+
+def test_registro_compartido_entre_workers(cola, app, tmp_path, monkeypatch):
+    """Prueba que otro worker recibe el trabajo registrado y no sube el vídeo otra vez."""
+    otro_worker = ColaSubidas(app)
+    db.session.add(SubidaRespuesta(Ejercicio_Sesion_Id=6, Trabajo_Id="b" * 32, Estado=SUBIENDO,
+                                   Clave_Idempotencia="k", Actualizado=datetime.now()))
+    db.session.commit()
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: pytest.fail("no debería subirse"))
+
+    trabajo = otro_worker.encolar(6, _fichero(otro_worker, 6))
+    assert (trabajo.id, trabajo.estado, trabajo.clave_idempotencia) == ("b" * 32, SUBIENDO, "k")
+    assert otro_worker.trabajo_de(6).id == "b" * 32
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_registro_caducado_se_releva(cola, app, monkeypatch):
+    """Prueba que la subida de un worker caído no bloquea el ejercicio para siempre."""
+    app.config["SUBIDAS_RECLAMACION_TTL"] = 60
+    db.session.add(SubidaRespuesta(Ejercicio_Sesion_Id=7, Trabajo_Id="c" * 32, Estado=SUBIENDO,
+                                   Actualizado=datetime.now() - timedelta(minutes=5)))
+    db.session.commit()
+    assert cola.trabajo_de(7) is None
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: {"secure_url": "https://x/r.webm"})
+
+    trabajo = cola.encolar(7, _fichero(cola, 7), "nueva")
+
+    assert trabajo.id != "c" * 32 and trabajo.estado == COMPLETADO
+    db.session.expire_all()
+    registro = db.session.get(SubidaRespuesta, 7)
+    assert (registro.Trabajo_Id, registro.Estado, registro.Clave_Idempotencia) == (trabajo.id, COMPLETADO, "nueva")
+
+
+def test_error_libera_el_registro(cola, monkeypatch):
+    """Prueba que tras un error se puede volver a intentar la subida."""
+    def fake_upload(*args, **kwargs):
+        raise RuntimeError("sin red")
+    monkeypatch.setattr("cloudinary.uploader.upload", fake_upload)
+
+    assert cola.encolar(8, _fichero(cola, 8)).estado == ERROR
+    assert db.session.get(SubidaRespuesta, 8) is None
+    assert cola.trabajo_de(8) is None
+
+
+def test_reclamar_antes_de_recibir_la_grabacion(cola, tmp_path, monkeypatch):
+    """Prueba que el trabajo reclamado bloquea otras subidas hasta lanzarlo o abandonarlo."""
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: {"secure_url": "https://x/r.webm"})
+
+    trabajo, reclamado = cola.reclamar(9, "k")
+    assert reclamado and trabajo.ruta is None
+    assert db.session.get(SubidaRespuesta, 9).Trabajo_Id == trabajo.id
+    assert cola.reclamar(9) == (trabajo, False)
+    assert ColaSubidas(cola.app).reclamar(9)[0].id == trabajo.id
+
+    cola.abandonar(trabajo)
+    assert trabajo.estado == ERROR
+    assert db.session.get(SubidaRespuesta, 9) is None
+
+    trabajo, reclamado = cola.reclamar(9, "k")
+    assert reclamado
+    cola.lanzar(trabajo, _fichero(cola, 9))
+    assert trabajo.estado == COMPLETADO
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reclamar_no_bloquea_la_cola_durante_el_registro(cola, monkeypatch):
+    """Prueba que el INSERT del registro se hace sin el lock de la cola."""
+    import src.servicios.subidas_video as subidas_video
+
+    reclamar = subidas_video._reclamar
+    bloqueado = []
+
+    def registrar(trabajo):
+        bloqueado.append(cola._lock.locked())
+        return reclamar(trabajo)
+
+    monkeypatch.setattr(subidas_video, "_reclamar", registrar)
+    trabajo, reclamado = cola.reclamar(11)
+    assert reclamado and bloqueado == [False]
+    assert cola.consultar(trabajo.id) is trabajo
@@ -0,0 +1,220 @@
+"""
+Tests de la transcodificación de vídeos a una escalera de versiones.
+"""
+
+import subprocess
+from datetime import datetime
+
+import pytest
+
+from src.controladores.videos_controlador import url_version_respuesta, url_video_ejercicio
+from src.extensiones import db
+from src.modelos.ejercicio import Ejercicio
+from src.modelos.videoRespuesta import VideoRespuesta
+from src.servicios import transcodificacion
+from src.servicios.procesado_ejercicios import cola_procesado
+from src.servicios.transcodificacion import (
+    clave_version,
+    cola_transcodificacion,
+    comando_ffmpeg,
+    elegir_version,
+    versiones_a_generar,
+)
+from tests.test_metadatos_video import video_mp4
+
+ESCALERA = (("360p", 360, 700), ("720p", 720, 2000))
+
+
+@pytest.fixture
+def ffmpeg_falso(app, tmp_path, monkeypatch):
+    """Activa la escalera con un ffmpeg que escribe el destino y registra las llamadas."""
+    app.config["TRANSCODIFICACION_VERSIONES"] = ESCALERA
+    app.config["TRANSCODIFICACION_FFMPEG"] = "ffmpeg-falso"
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path / "subidas")
+    llamadas = []
+
+    def run(comando, **kwargs):
+        llamadas.append(comando)
+        with open(comando[-1], "wb") as f:
+            f.write(b"version " + comando[comando.index("-b:v") + 1].encode())
+        return subprocess.CompletedProcess(comando, 0, b"", b"")
+
+    monkeypatch.setattr(transcodificacion.subprocess, "run", run)
+    return llamadas
+
+
+def _ejercicio(video="ejercicio_1.mp4", versiones=None):
+    ejercicio = Ejercicio(Nombre="E", Descripcion="D", Tipo="T", Video=video, Duracion=5, Versiones=versiones)
+    db.session.add(ejercicio)
+    db.session.commit()
+    return ejercicio
+
+
+def test_claves_y_comando():
+    """Prueba el nombre de cada versión y los argumentos de ffmpeg."""
+    assert clave_version("ejercicio_1.5.mp4", "360p") == "ejercicio_1.5_360p.mp4"
+    assert clave_version("sub/respuesta_3.webm", "720p") == "sub/respuesta_3_720p.mp4"
+
+    comando = comando_ffmpeg("ffmpeg", "in.webm", "out.mp4", 360, 700)
+    assert comando[0] == "ffmpeg" and comando[-1] == "out.mp4"
+    assert "scale=-2:'min(360,ih)'" in comando
+    assert comando[comando.index("-bufsize") + 1] == "1400k"
+    assert "+faststart" in comando
+
+
+def test_versiones_a_generar_sin_ampliar(tmp_path):
+    """Prueba que no se generan versiones iguales o mayores que el original."""
+    ruta = tmp_path / "v.mp4"
+    ruta.write_bytes(video_mp4(ancho=854, alto=480))
+    assert [v[0] for v in versiones_a_generar(str(ruta), ESCALERA)] == ["360p"]
+
+    ruta.write_bytes(b"sin cabecera")
+    assert [v[0] for v in versiones_a_generar(str(ruta), ESCALERA)] == ["360p", "720p"]
+
+
+@pytest.mark.parametrize("cabeceras, esperada", [
+    ({}, "720p"),
+    ({"Save-Data": "on"}, "360p"),
+    ({"ECT": "3g"}, "360p"),
+    ({"ECT": "4g", "Downlink": "0.8"}, "360p"),
+    ({"ECT": "4g", "Downlink": "10"}, "720p"),
+    ({"Downlink": "rápido"}, "720p"),
+])
+def test_elegir_version_segun_la_conexion(app, cabeceras, esperada):
+    """Prueba la elección por Save-Data, ECT y Downlink."""
+    with app.test_request_context(headers=cabeceras):
+        assert elegir_version("360p,720p") == esperada
+        # Sin 720p (original de 720p o menos) se sirve el original salvo en conexiones lentas
+        assert elegir_version("360p") == ("360p" if esperada == "360p" else None)
+        assert elegir_version(None) is None
+
+
+def test_elegir_version_sin_version_por_defecto(app):
+    """Prueba que sin TRANSCODIFICACION_VERSION_POR_DEFECTO se sirve la mayor disponible."""
+    app.config["TRANSCODIFICACION_VERSION_POR_DEFECTO"] = None
+    with app.test_request_context():
+        assert elegir_version("360p,720p") == "720p"
+        assert elegir_version("360p") == "360p"
+
+
+def test_original_de_720p_se_sirve_sin_rebajar(app, ffmpeg_falso, tmp_path):
+    """Prueba que un original de 720p solo genera 360p y se sirve el original por defecto."""
+    ejercicio = _ejercicio()
+    almacen = tmp_path / "uploads" / "ejercicios"
+    almacen.mkdir(parents=True)
+    (almacen / "ejercicio_1.mp4").write_bytes(video_mp4(ancho=1280, alto=720))
+
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+
+    db.session.expire_all()
+    versiones = db.session.get(Ejercicio, ejercicio.Id).Versiones
+    assert versiones == "360p"
+    with app.test_request_context():
+        assert url_video_ejercicio("ejercicio_1.mp4", versiones) == "/videos/ejercicio_1.mp4"
+    with app.test_request_context(headers={"Save-Data": "on"}):
+        assert url_video_ejercicio("ejercicio_1.mp4", versiones) == "/videos/ejercicio_1_360p.mp4"
+
+
+def test_transcodificar_ejercicio_local(app, ffmpeg_falso, tmp_path):
+    """Prueba que las versiones se guardan junto al original y se anotan en el ejercicio."""
+    ejercicio = _ejercicio()
+    almacen = tmp_path / "uploads" / "ejercicios"
+    almacen.mkdir(parents=True)
+    (almacen / "ejercicio_1.mp4").write_bytes(video_mp4(ancho=1920, alto=1080))
+
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+
+    assert [c[c.index("-i") + 1] for c in ffmpeg_falso] == [str(almacen / "ejercicio_1.mp4")] * 2
+    assert (almacen / "ejercicio_1_360p.mp4").read_bytes() == b"version 700k"
+    assert (almacen / "ejercicio_1_720p.mp4").read_bytes() == b"version 2000k"
+    db.session.expire_all()
+    assert db.session.get(Ejercicio, ejercicio.Id).Versiones == "360p,720p"
+    assert list((tmp_path / "subidas").iterdir()) == []
+
+    with app.test_request_context(headers={"Save-Data": "on"}):
+        assert url_video_ejercicio("ejercicio_1.mp4", "360p,720p") == "/videos/ejercicio_1_360p.mp4"
+    with app.test_request_context():
+        assert url_video_ejercicio("ejercicio_1.mp4", "360p,720p") == "/videos/ejercicio_1_720p.mp4"
+        assert url_video_ejercicio("ejercicio_1.mp4") == "/videos/ejercicio_1.mp4"
+
+
+def test_transcodificar_respuesta_remota(app, ffmpeg_falso, tmp_path, monkeypatch):
+    """Prueba que un vídeo de un almacén remoto se descarga y las versiones se suben."""
+    es_id = 7
+    db.session.add(VideoRespuesta(Ejercicio_Sesion_Id=es_id, Ruta_Almacenamiento="https://x/r.webm",
+                                  Fecha_Expiracion=datetime.now()))
+    db.session.commit()
+    subidas = {}
+
+    class AlmacenRemoto:
+        def abrir(self, clave):
+            import io
+            return io.BytesIO(b"webm original")
+
+        def guardar(self, clave, origen):
+            with open(origen, "rb") as f:
+                subidas[clave] = f.read()
+
+        def url(self, clave):
+            return f"https://cdn.example.com/{clave}"
+
+    monkeypatch.setattr("src.servicios.almacenamiento.almacen_videos", lambda tipo: AlmacenRemoto())
+    monkeypatch.setattr("src.controladores.videos_controlador.almacen_videos", lambda tipo: AlmacenRemoto())
+
+    cola_transcodificacion().encolar("respuestas", es_id, f"respuesta_{es_id}.webm")
+
+    assert sorted(subidas) == ["respuesta_7_360p.mp4", "respuesta_7_720p.mp4"]
+    db.session.expire_all()
+    video = db.session.get(VideoRespuesta, es_id)
+    assert video.Versiones == "360p,720p"
+    assert list((tmp_path / "subidas").iterdir()) == []
+    with app.test_request_context(headers={"ECT": "2g"}):
+        assert url_version_respuesta(video) == "https://cdn.example.com/respuesta_7_360p.mp4"
+    video.Versiones = None
+    with app.test_request_context():
+        assert url_version_respuesta(video) is None
+
+
+def test_transcodificar_con_fallo_o_sin_ffmpeg(app, ffmpeg_falso, tmp_path, monkeypatch):
+    """Prueba que un fallo de ffmpeg o su ausencia no anotan versiones."""
+    ejercicio = _ejercicio()
+    almacen = tmp_path / "uploads" / "ejercicios"
+    almacen.mkdir(parents=True)
+    (almacen / "ejercicio_1.mp4").write_bytes(b"mp4")
+
+    monkeypatch.setattr(
+        transcodificacion.subprocess, "run",
+        lambda comando, **kwargs: subprocess.CompletedProcess(comando, 1, b"", b"Invalid data")
+    )
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+    assert db.session.get(Ejercicio, ejercicio.Id).Versiones is None
+
+    app.config["TRANSCODIFICACION_FFMPEG"] = None
+    monkeypatch.setattr(transcodificacion, "ejecutable_ffmpeg", lambda app: None)
+    cola_transcodificacion().encolar("ejercicios", ejercicio.Id, "ejercicio_1.mp4")
+    assert sorted(p.name for p in almacen.iterdir()) == ["ejercicio_1.mp4"]
+
+
+def test_ejercicio_nuevo_se_transcodifica_tras_procesarlo(app, ffmpeg_falso, tmp_path):
+    """Prueba que el procesado del ejercicio encola sus versiones."""
+    ejercicio = _ejercicio()
+    ejercicio.Procesando = True
+    db.session.commit()
+    ruta = tmp_path / "subida.mp4"
+    ruta.write_bytes(video_mp4(ancho=640, alto=480))
+
+    cola_procesado().encolar(ejercicio.Id, str(ruta), "ejercicio_1.mp4")
+
+    db.session.expire_all()
+    ejercicio = db.session.get(Ejercicio, ejercicio.Id)
+    assert ejercicio.Procesando is False
+    assert ejercicio.Duracion == 12
+    assert ejercicio.Versiones == "360p"
+
+
+def test_paginas_piden_pistas_de_red(client):
+    """Prueba que las páginas HTML piden ECT, Downlink y Save-Data."""
+    resp = client.get("/login")
+    assert resp.mimetype == "text/html"
+    assert resp.headers["Accept-CH"] == "ECT, Downlink, Save-Data"
@@ -0,0 +1,176 @@
+"""
+Tests del uso de almacenamiento por usuario y su límite.
+"""
+
+import io
+from datetime import date
+
+import pytest
+
+from src.extensiones import db
+from src.modelos.ejercicio import Ejercicio
+from src.modelos.uso_almacenamiento import UsoAlmacenamiento
+from src.modelos.videoRespuesta import VideoRespuesta
+from src.servicios.purga_videos import purgar_videos_caducados
+from src.servicios.uso_almacenamiento import cuota_superada, limite_bytes, sumar_uso, uso_de
+from tests.test_admin_controlador import admin_user, login_admin  # noqa: F401
+from tests.test_profesional_controlador import (  # noqa: F401
+    WEBM,
+    _crear_ejercicio_sesion,
+    login_profesional,
+    paciente_user,
+    profesional_user,
+)
+
+
+@pytest.fixture
+def limite(monkeypatch):
+    """Fija el límite por usuario en bytes."""
+    def fijar(num_bytes):
+        monkeypatch.setattr("src.servicios.uso_almacenamiento.limite_bytes", lambda: num_bytes)
+    return fijar
+
+
+@pytest.fixture
+def subida_respuesta(client, app, profesional_user, paciente_user, login_user_fixture, tmp_path, monkeypatch):
+    """Ejercicio de sesión del paciente logueado, con Cloudinary simulado."""
+    es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+    login_user_fixture(paciente_user)
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *a, **k: {"secure_url": "https://x/r.webm"})
+    return es.Id
+
+
+def test_limite_de_la_configuracion(monkeypatch):
+    """Prueba que limite_almacenamiento se lee en GB y cae a 2 GB si no es válido."""
+    for valor, esperado in (("5", 5 * 1024 ** 3), ("0.5", 512 * 1024 ** 2), ("mucho", 2 * 1024 ** 3)):
+        monkeypatch.setattr("src.controladores.admin_controlador.cargar_configuracion",
+                            lambda: {"limite_almacenamiento": valor})
+        assert limite_bytes() == esperado
+
+
+def test_contador_transaccional(app, profesional_user, limite):
+    """Prueba que el contador se crea, suma, resta sin bajar de 0 y sigue a la transacción."""
+    usuario_id = profesional_user.Id
+    sumar_uso(usuario_id, 300)
+    sumar_uso(usuario_id, 200)
+    db.session.commit()
+    assert uso_de(usuario_id) == 500
+    assert db.session.get(UsoAlmacenamiento, usuario_id).Videos == 2
+
+    sumar_uso(usuario_id, 1000)
+    db.session.rollback()
+    assert uso_de(usuario_id) == 500
+
+    limite(600)
+    assert not cuota_superada(usuario_id, 100)
+    assert cuota_superada(usuario_id, 101)
+
+    sumar_uso(usuario_id, -800, -3)
+    db.session.commit()
+    db.session.expire_all()
+    uso = db.session.get(UsoAlmacenamiento, usuario_id)
+    assert (uso.Bytes, uso.Videos) == (0, 0)
+
+
+def test_respuesta_suma_al_paciente(client, paciente_user, subida_respuesta, limite):
+    """Prueba que la respuesta anota su tamaño y lo suma al paciente."""
+    limite(10 * len(WEBM))
+    resp = client.post(f"/profesional/guardar_video/{subida_respuesta}",
+                       data={"video": (io.BytesIO(WEBM), "r.webm")}, content_type="multipart/form-data")
+    assert resp.status_code == 202
+
+    assert db.session.get(VideoRespuesta, subida_respuesta).Tamano == len(WEBM)
+    assert uso_de(paciente_user.Id) == len(WEBM)
+
+
+def test_respuesta_sin_cuota(client, app, paciente_user, subida_respuesta, limite, tmp_path):
+    """Prueba que una subida que no cabe se rechaza con 413 y sin guardar nada."""
+    sumar_uso(paciente_user.Id, 1000)
+    db.session.commit()
+    limite(1000 + len(WEBM) - 1)
+
+    resp = client.post(f"/profesional/guardar_video/{subida_respuesta}",
+                       data={"video": (io.BytesIO(WEBM), "r.webm")}, content_type="multipart/form-data")
+    assert resp.status_code == 413
+    assert resp.get_json()["error"] == "Límite de almacenamiento superado"
+
+    resp = client.post(f"/profesional/guardar_video/{subida_respuesta}/subidas", json={"tamano": len(WEBM)})
+    assert resp.status_code == 413
+
+    # Sin tamaño declarado se comprueba al finalizar
+    url = client.post(f"/profesional/guardar_video/{subida_respuesta}/subidas", json={}).get_json()["url"]
+    client.put(f"{url}?offset=0", data=WEBM, content_type="application/octet-stream")
+    assert client.post(f"{url}/finalizar").status_code == 413
+
+    assert db.session.get(VideoRespuesta, subida_respuesta) is None
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+def test_crear_ejercicio_cuenta_y_limita(app, client, profesional_user, login_profesional, limite, tmp_path):
+    """Prueba que el vídeo del ejercicio cuenta para el profesional y se rechaza si no cabe."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path / "subidas")
+    limite(2048)
+
+    def crear(nombre, contenido):
+        return client.post("/profesional/ejercicios/crear", content_type="multipart/form-data", data={
+            "nombre": nombre, "descripcion": "D", "tipo": "Fuerza", "video": (io.BytesIO(contenido), "v.mp4")
+        })
+
+    assert crear("Cabe", b"0123456789").status_code == 302
+    assert Ejercicio.query.filter_by(Nombre="Cabe").one().Tamano == 10
+    assert uso_de(profesional_user.Id) == 10
+
+    resp = crear("No cabe", b"x" * 2048)
+    assert resp.status_code == 200
+    assert "límite de almacenamiento" in resp.get_data(as_text=True)
+    assert Ejercicio.query.filter_by(Nombre="No cabe").first() is None
+    assert uso_de(profesional_user.Id) == 10
+    assert list((tmp_path / "subidas").iterdir()) == []
+
+
+def test_crear_ejercicio_rechaza_sin_leer_el_cuerpo(app, client, profesional_user, login_profesional, limite,
+                                                    monkeypatch, tmp_path):
+    """Prueba que un vídeo que no cabe por su Content-Length se rechaza antes de guardarlo."""
+    app.config["SUBIDAS_DIRECTORIO"] = str(tmp_path)
+    limite(1024)
+
+    def no_leer(*args):
+        raise AssertionError("no debe guardar el vídeo")
+
+    monkeypatch.setattr("src.controladores.profesional_controlador.guardar_fichero_subido", no_leer)
+    resp = client.post("/profesional/ejercicios/crear", content_type="multipart/form-data", data={
+        "nombre": "Grande", "descripcion": "D", "tipo": "Fuerza", "video": (io.BytesIO(b"x" * 4096), "v.mp4")
+    })
+
+    assert resp.status_code == 200
+    assert "límite de almacenamiento" in resp.get_data(as_text=True)
+    assert Ejercicio.query.filter_by(Nombre="Grande").first() is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_purga_descuenta_y_admin_ve_el_uso(app, client, paciente_user, profesional_user, login_admin, monkeypatch,
+                                           tmp_path):
+    """Prueba que la purga descuenta el uso y que el listado de usuarios lo muestra."""
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    app.config["ALMACEN_RESPUESTAS_URL"] = "local://respuestas"
+    monkeypatch.setattr("src.controladores.admin_controlador.cargar_configuracion",
+                        lambda: {"limite_almacenamiento": "2"})
+    for tamano in (3 * 1024 ** 2, 1024 ** 2):
+        es = _crear_ejercicio_sesion(paciente_user.Id, profesional_user.Id)
+        db.session.add(VideoRespuesta(Ejercicio_Sesion_Id=es.Id, Ruta_Almacenamiento="/r.webm",
+                                      Fecha_Expiracion=date.today() if tamano > 1024 ** 2 else date.max,
+                                      Tamano=tamano))
+        sumar_uso(paciente_user.Id, tamano)
+    db.session.commit()
+
+    assert "4.0 MB / 2.0 GB" in client.get("/admin/usuarios").get_data(as_text=True)
+
+    assert purgar_videos_caducados()["videos"] == 1
+    db.session.expire_all()
+    uso = db.session.get(UsoAlmacenamiento, paciente_user.Id)
+    assert (uso.Bytes, uso.Videos) == (1024 ** 2, 1)
+    html = client.get("/admin/usuarios").get_data(as_text=True)
+    assert "1.0 MB / 2.0 GB" in html
+    assert "0 B / 2.0 GB" in html
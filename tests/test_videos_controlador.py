@@ -0,0 +1,204 @@
+"""
+Tests del controlador de envío de vídeos de ejercicios.
+Prueba peticiones Range, ETag, caché y envío delegado al proxy.
+"""
+
+import pytest
+
+from src.controladores.videos_controlador import ruta_video_ejercicio
+
+CONTENIDO = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def login_paciente(user_factory, login_user_fixture):
+    """Loguea un paciente (la ruta solo requiere sesión iniciada)."""
+    return login_user_fixture(user_factory(Rol_Id=1, Email="videos@example.com"))
+
+
+@pytest.fixture
+def carpetas_video(app, tmp_path):
+    """Carpeta estática y de subidas temporales con un vídeo en cada origen."""
+    static_dir = tmp_path / "static"
+    (static_dir / "videos").mkdir(parents=True)
+    (static_dir / "videos" / "demo.mp4").write_bytes(CONTENIDO)
+    (static_dir / "uploads" / "ejercicios").mkdir(parents=True)
+    (static_dir / "uploads" / "ejercicios" / "ejercicio_1.mp4").write_bytes(CONTENIDO)
+    app.static_folder = str(static_dir)
+    app.config["UPLOAD_FOLDER"] = str(static_dir / "uploads")
+    return static_dir
+
+
+def test_ruta_video_ejercicio(app, carpetas_video):
+    """Prueba la búsqueda en el almacén de ejercicios y en los de ejemplo."""
+    origen, ruta = ruta_video_ejercicio("ejercicio_1.mp4")
+    assert origen == "ejercicios"
+    assert ruta == str(carpetas_video / "uploads" / "ejercicios" / "ejercicio_1.mp4")
+    assert ruta_video_ejercicio("demo.mp4")[0] == "demo"
+    assert ruta_video_ejercicio("no_existe.mp4") is None
+    assert ruta_video_ejercicio("../videos/demo.mp4") is None
+
+
+def test_indice_sin_consultar_el_disco(app, carpetas_video, monkeypatch):
+    """Prueba que tras el primer recorrido cada nombre se resuelve sin llamadas al sistema de ficheros."""
+    assert ruta_video_ejercicio("demo.mp4")[0] == "demo"
+    assert ruta_video_ejercicio("falta.mp4") is None
+
+    def sin_disco(*args, **kwargs):
+        pytest.fail("no debería consultar el disco")
+    monkeypatch.setattr("src.servicios.indice_videos.os.path.isfile", sin_disco)
+    monkeypatch.setattr("src.servicios.indice_videos.os.walk", sin_disco)
+    for _ in range(3):
+        assert ruta_video_ejercicio("ejercicio_1.mp4")[0] == "ejercicios"
+        assert ruta_video_ejercicio("demo.mp4")[0] == "demo"
+        assert ruta_video_ejercicio("falta.mp4") is None
+
+
+def test_indice_se_actualiza(client, app, login_paciente, carpetas_video):
+    """Prueba los vídeos nuevos, el recorrido periódico y los borrados después de indexarlos."""
+    ejercicios = carpetas_video / "uploads" / "ejercicios"
+    assert ruta_video_ejercicio("ejercicio_1.mp4")[0] == "ejercicios"
+
+    (ejercicios / "ab" / "cd").mkdir(parents=True)
+    (ejercicios / "ab" / "cd" / "nuevo.mp4").write_bytes(CONTENIDO)
+    assert ruta_video_ejercicio("ab/cd/nuevo.mp4")[0] == "ejercicios"
+
+    # Borrado después de indexarlo: 404 en lugar de un error
+    (ejercicios / "ejercicio_1.mp4").unlink()
+    assert client.get("/videos/ejercicio_1.mp4").status_code == 404
+    assert ruta_video_ejercicio("ejercicio_1.mp4") is None
+
+    (ejercicios / "ejercicio_1.mp4").write_bytes(CONTENIDO)
+    assert ruta_video_ejercicio("ejercicio_1.mp4") is None
+    app.config["VIDEOS_INDICE_TTL"] = 0
+    assert ruta_video_ejercicio("ejercicio_1.mp4")[0] == "ejercicios"
+
+
+def test_indice_limita_los_ausentes(app, carpetas_video):
+    """Prueba que los nombres sin vídeo recordados no crecen sin límite."""
+    app.config["VIDEOS_INDICE_AUSENTES"] = 2
+    indice = app.extensions["indice_videos"]
+    for nombre in ("a.mp4", "b.mp4", "c.mp4"):
+        assert ruta_video_ejercicio(nombre) is None
+    assert list(indice._ausentes) == ["b.mp4", "c.mp4"]
+
+    # Guardado después de pedirlo: olvidar() hace que se vea en la siguiente búsqueda
+    (carpetas_video / "videos" / "c.mp4").write_bytes(CONTENIDO)
+    indice.olvidar("c.mp4")
+    assert ruta_video_ejercicio("c.mp4")[0] == "demo"
+
+
+def test_indice_recorre_fuera_del_lock(app, carpetas_video, monkeypatch):
+    """Prueba que el recorrido se hace sin el lock y que, caducado, se sigue usando el anterior."""
+    import threading
+
+    from src.servicios.indice_videos import IndiceVideos
+
+    indice = app.extensions["indice_videos"]
+    assert ruta_video_ejercicio("demo.mp4")[0] == "demo"
+
+    recorrer = IndiceVideos._recorrer
+    dentro, seguir = threading.Event(), threading.Event()
+
+    def recorrer_lento(raices):
+        assert not indice._lock.locked()
+        dentro.set()
+        seguir.wait(5)
+        return recorrer(raices)
+
+    monkeypatch.setattr(IndiceVideos, "_recorrer", staticmethod(recorrer_lento))
+    app.config["VIDEOS_INDICE_TTL"] = 0
+    hilo = threading.Thread(target=lambda: app.app_context().push() or ruta_video_ejercicio("demo.mp4"))
+    hilo.start()
+    assert dentro.wait(5)
+    # Mientras otro hilo recorre, la búsqueda usa el índice anterior sin esperar
+    assert ruta_video_ejercicio("ejercicio_1.mp4")[0] == "ejercicios"
+    seguir.set()
+    hilo.join(5)
+    assert not hilo.is_alive()
+
+
+def test_video_completo_con_cache_y_etag(client, login_paciente, carpetas_video):
+    """Prueba la respuesta completa y la revalidación con If-None-Match."""
+    resp = client.get("/videos/demo.mp4")
+    assert resp.status_code == 200
+    assert resp.data == CONTENIDO
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert resp.mimetype == "video/mp4"
+    assert "max-age=2592000" in resp.headers["Cache-Control"]
+    assert "public" in resp.headers["Cache-Control"]
+    etag = resp.headers["ETag"]
+    assert not etag.startswith("W/")
+
+    resp = client.get("/videos/demo.mp4", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+
+def test_video_por_rangos(client, login_paciente, carpetas_video):
+    """Prueba las respuestas 206 y 416 y la condición If-Range."""
+    resp = client.get("/videos/ejercicio_1.mp4", headers={"Range": "bytes=100-199"})
+    assert resp.status_code == 206
+    assert resp.data == CONTENIDO[100:200]
+    assert resp.headers["Content-Range"] == f"bytes 100-199/{len(CONTENIDO)}"
+    etag = resp.headers["ETag"]
+
+    resp = client.get("/videos/ejercicio_1.mp4", headers={"Range": "bytes=1000-"})
+    assert resp.status_code == 206
+    assert resp.data == CONTENIDO[1000:]
+
+    resp = client.get("/videos/ejercicio_1.mp4", headers={"Range": "bytes=5000-6000"})
+    assert resp.status_code == 416
+
+    # Si el vídeo cambió (otro ETag) se envía entero
+    resp = client.get("/videos/ejercicio_1.mp4", headers={"Range": "bytes=0-9", "If-Range": '"otro"'})
+    assert resp.status_code == 200
+    assert resp.data == CONTENIDO
+    resp = client.get("/videos/ejercicio_1.mp4", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert resp.status_code == 206
+
+
+def test_video_no_encontrado_o_sin_sesion(client, app, carpetas_video, login_user_fixture, user_factory):
+    """Prueba el 404 y que sin sesión no se sirve el vídeo."""
+    resp = client.get("/videos/demo.mp4")
+    assert resp.status_code in (302, 401)
+
+    login_user_fixture(user_factory(Rol_Id=2, Email="pro@example.com"))
+    assert client.get("/videos/no_existe.mp4").status_code == 404
+    assert client.get("/videos/../config.py").status_code == 404
+
+
+def test_video_remoto_redirige_al_almacen(client, app, login_paciente, carpetas_video, monkeypatch):
+    """Prueba que sin copia en disco se redirige a la URL del almacén remoto."""
+    import cloudinary
+    monkeypatch.setattr(cloudinary.config(), "cloud_name", "demo")
+    app.config["ALMACEN_EJERCICIOS_URL"] = "cloudinary://terapitrack/ejercicios"
+
+    resp = client.get("/videos/ejercicio_2.mp4")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].startswith("https://res.cloudinary.com/demo/video/upload/")
+
+    # Los de ejemplo siguen saliendo de disco
+    assert client.get("/videos/demo.mp4").status_code == 200
+
+
+@pytest.mark.parametrize("modo, cabecera, valor", [
+    ("x-sendfile", "X-Sendfile", "videos/demo.mp4"),
+    ("x-accel-redirect", "X-Accel-Redirect", "/_videos/demo/demo.mp4"),
+])
+def test_video_delegado_al_proxy(client, app, login_paciente, carpetas_video, modo, cabecera, valor):
+    """Prueba que con VIDEOS_ENVIO el cuerpo lo envía el proxy inverso."""
+    app.config["VIDEOS_ENVIO"] = modo
+
+    resp = client.get("/videos/demo.mp4", headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 200
+    assert resp.data == b""
+    assert resp.headers[cabecera].endswith(valor)
+    assert resp.mimetype == "video/mp4"
+    assert resp.headers["ETag"]
+    assert "max-age" in resp.headers["Cache-Control"]
+
+    app.config["VIDEOS_ACCEL_PREFIJO"] = "/interno/"
+    resp = client.get("/videos/ejercicio_1.mp4")
+    if modo == "x-accel-redirect":
+        assert resp.headers[cabecera] == "/interno/ejercicios/ejercicio_1.mp4"
@@ -0,0 +1,184 @@
+"""
+Tests del WebSocket mínimo (RFC 6455) usado por el canal de sesiones.
+Prueba el handshake y el tramado sobre un par de sockets conectados.
+"""
+
+import os
+import socket
+import struct
+
+import pytest
+
+from src.servicios.websocket import (
+    CIERRE_DEMASIADO_GRANDE,
+    CIERRE_NORMAL,
+    OP_CIERRE,
+    OP_CONTINUACION,
+    OP_PING,
+    OP_PONG,
+    OP_TEXTO,
+    ConexionWebSocket,
+    RespuestaWebSocket,
+    WebSocketCerrado,
+    clave_aceptacion,
+    es_peticion_websocket,
+)
+
+
+def trama_cliente(opcode, datos=b"", fin=True):
+    """Construye una trama enmascarada como las que envía un navegador."""
+    mascara = os.urandom(4)
+    cabecera = bytes([(0x80 if fin else 0) | opcode])
+    if len(datos) < 126:
+        cabecera += bytes([0x80 | len(datos)])
+    elif len(datos) < 1 << 16:
+        cabecera += bytes([0x80 | 126]) + struct.pack("!H", len(datos))
+    else:
+        cabecera += bytes([0x80 | 127]) + struct.pack("!Q", len(datos))
+    enmascarado = bytes(b ^ mascara[i % 4] for i, b in enumerate(datos))
+    return cabecera + mascara + enmascarado
+
+
+def _recibir_exacto(sock, n):
+    datos = b""
+    while len(datos) < n:
+        bloque = sock.recv(n - len(datos))
+        if not bloque:
+            raise ConnectionError("Conexión cerrada")
+        datos += bloque
+    return datos
+
+
+def leer_trama_servidor(sock):
+    """Lee una trama (sin máscara) enviada por el servidor."""
+    b1, b2 = _recibir_exacto(sock, 2)
+    longitud = b2 & 0x7F
+    if longitud == 126:
+        longitud = struct.unpack("!H", _recibir_exacto(sock, 2))[0]
+    return b1 & 0x0F, _recibir_exacto(sock, longitud)
+
+
+@pytest.fixture
+def par():
+    """Conexión WebSocket del lado servidor y socket del cliente."""
+    servidor, cliente = socket.socketpair()
+    yield ConexionWebSocket(servidor), cliente
+    cliente.close()
+    servidor.close()
+
+
+def test_clave_aceptacion_ejemplo_rfc():
+    """Prueba el ejemplo de handshake de la RFC 6455."""
+    assert clave_aceptacion("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+
+def test_aceptar_handshake():
+    """Prueba que el handshake responde 101 con la clave calculada."""
+    servidor, cliente = socket.socketpair()
+    environ = {
+        "HTTP_UPGRADE": "websocket",
+        "HTTP_CONNECTION": "keep-alive, Upgrade",
+        "HTTP_SEC_WEBSOCKET_KEY": "dGhlIHNhbXBsZSBub25jZQ==",
+        "HTTP_SEC_WEBSOCKET_VERSION": "13",
+        "werkzeug.socket": servidor,
+    }
+    assert es_peticion_websocket(environ)
+    ConexionWebSocket.aceptar(environ)
+    respuesta = cliente.recv(1024).decode()
+    assert respuesta.startswith("HTTP/1.1 101")
+    assert "Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=" in respuesta
+    servidor.close()
+    cliente.close()
+
+
+def test_aceptar_rechaza_peticiones_no_validas():
+    """Prueba los errores del handshake."""
+    with pytest.raises(ValueError):
+        ConexionWebSocket.aceptar({})
+    environ = {
+        "HTTP_UPGRADE": "websocket",
+        "HTTP_CONNECTION": "Upgrade",
+        "HTTP_SEC_WEBSOCKET_KEY": "x",
+        "HTTP_SEC_WEBSOCKET_VERSION": "13",
+    }
+    with pytest.raises(RuntimeError):
+        ConexionWebSocket.aceptar(environ)
+
+
+def test_recibir_texto_y_timeout(par):
+    """Prueba la recepción de mensajes y el timeout sin datos."""
+    ws, cliente = par
+    assert ws.recibir(timeout=0.01) is None
+    cliente.sendall(trama_cliente(OP_TEXTO, "¡hola!".encode()))
+    assert ws.recibir(timeout=1) == "¡hola!"
+
+
+def test_recibir_fragmentado_y_largo(par):
+    """Prueba mensajes en varias tramas y con longitud extendida."""
+    ws, cliente = par
+    largo = b"a" * 300
+    cliente.sendall(
+        trama_cliente(OP_TEXTO, largo[:100], fin=False) +
+        trama_cliente(OP_CONTINUACION, largo[100:])
+    )
+    assert ws.recibir(timeout=1) == largo.decode()
+
+
+def test_ping_responde_pong(par):
+    """Prueba que los ping del cliente se contestan sin entregar mensaje."""
+    ws, cliente = par
+    cliente.sendall(trama_cliente(OP_PING, b"x") + trama_cliente(OP_TEXTO, b"m"))
+    assert ws.recibir(timeout=1) == "m"
+    assert leer_trama_servidor(cliente) == (OP_PONG, b"x")
+
+
+def test_enviar_json(par):
+    """Prueba el envío de mensajes de texto del servidor."""
+    ws, cliente = par
+    ws.enviar_json({"tipo": "estado"})
+    assert leer_trama_servidor(cliente) == (OP_TEXTO, b'{"tipo": "estado"}')
+    ws.enviar("b" * 200)
+    assert leer_trama_servidor(cliente) == (OP_TEXTO, b"b" * 200)
+
+
+def test_cierre_del_cliente(par):
+    """Prueba que el cierre del cliente se contesta y se notifica."""
+    ws, cliente = par
+    cliente.sendall(trama_cliente(OP_CIERRE, struct.pack("!H", CIERRE_NORMAL)))
+    with pytest.raises(WebSocketCerrado) as exc:
+        ws.recibir(timeout=1)
+    assert exc.value.codigo == CIERRE_NORMAL
+    assert leer_trama_servidor(cliente)[0] == OP_CIERRE
+    with pytest.raises(WebSocketCerrado):
+        ws.recibir(timeout=1)
+
+
+def test_conexion_perdida(par):
+    """Prueba que un socket cerrado se traduce en WebSocketCerrado."""
+    ws, cliente = par
+    cliente.close()
+    with pytest.raises(WebSocketCerrado):
+        ws.recibir(timeout=1)
+
+
+def test_trama_sin_mascara_o_demasiado_grande(par):
+    """Prueba que se cierra la conexión ante tramas no válidas."""
+    ws, cliente = par
+    cliente.sendall(bytes([0x80 | OP_TEXTO, 1]) + b"x")  # sin máscara
+    with pytest.raises(WebSocketCerrado):
+        ws.recibir(timeout=1)
+
+    servidor, cliente2 = socket.socketpair()
+    ws2 = ConexionWebSocket(servidor)
+    ws2.TAM_MAXIMO_MENSAJE = 10
+    cliente2.sendall(trama_cliente(OP_TEXTO, b"x" * 11))
+    with pytest.raises(WebSocketCerrado) as exc:
+        ws2.recibir(timeout=1)
+    assert exc.value.codigo == CIERRE_DEMASIADO_GRANDE
+    cliente2.close()
+
+
+def test_respuesta_websocket_senala_conexion_cerrada():
+    """Prueba que la respuesta final no deja escribir nada en el socket."""
+    with pytest.raises(ConnectionResetError):
+        RespuestaWebSocket()({}, lambda *a: None)